@@ -6,23 +6,16 @@ from .tools.sub_agents import get_current_sub_agents
 from .prompt import agent_instruction
 # Import the module, not the variable, so we get the updated global reference
 
-def create_agent_with_model(model_info: dict = None, available_files: list = None) -> LlmAgent:
+def build_agent_instruction(available_files: list = None) -> str:
     """
-    Create an AgAnswers agent with a specific model configuration.
+    Build the orchestrator instruction, including the available files context.
     
     Args:
-        model_info (dict): Model configuration from frontend with keys:
-            - id: Model identifier (e.g., "openai/gpt-5-mini-2025-08-07")
-            - name: Display name
-            - tokenLimit: Token limit
-            - enabled: Whether model is enabled
         available_files (list): List of available file names for context
     
     Returns:
-        LlmAgent: Configured agent instance
+        str: Instruction for the root agent
     """
-    
-    # Build instruction with available files context
     instruction = agent_instruction
     if available_files and len(available_files) > 0:
         files_list = "\n".join([f"  - {file}" for file in available_files])
@@ -35,8 +28,33 @@ The following files are currently available for analysis:
 
 When the user asks about data, reports, or analysis, you should use the file_agent tool to access and analyze these files.
 """
+    return instruction
+
+
+def create_agent_with_model(model_info: dict = None, available_files: list = None, sub_agents: list = None) -> LlmAgent:
+    """
+    Create an AgAnswers agent with a specific model configuration.
+    
+    Args:
+        model_info (dict): Model configuration from frontend with keys:
+            - id: Model identifier (e.g., "openai/gpt-5-mini-2025-08-07")
+            - name: Display name
+            - tokenLimit: Token limit
+            - enabled: Whether model is enabled
+        available_files (list): List of available file names for context
+        sub_agents (list): Optional sub-agents to attach. Defaults to get_current_sub_agents().
+            An ADK agent can only have one parent, so callers that keep agents alive
+            (see agent_pool.py) must pass freshly built sub-agents.
+    
+    Returns:
+        LlmAgent: Configured agent instance
+    """
+    
+    # Build instruction with available files context
+    instruction = build_agent_instruction(available_files)
     # tools = get_current_tools()
-    sub_agents = get_current_sub_agents()
+    if sub_agents is None:
+        sub_agents = get_current_sub_agents()
     if not model_info or not model_info.get("id"):
         print("No model info provided, using default gemini-2.5-flash")
         return LlmAgent(
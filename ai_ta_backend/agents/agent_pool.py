@@ -0,0 +1,92 @@
+"""
+Process-wide pool of ready-to-run ADK agents.
+
+Building the root LlmAgent, its LiteLlm wrapper, the file sub-agent and the
+Runner on every /Chat request adds time-to-first-byte and throws away the
+LiteLLM HTTP client connections. Pooled entries are keyed on everything that
+shapes the agent, so a hit is interchangeable with a freshly built one:
+
+    (model id, hash of root instruction, fingerprint of the file-agent dataframes)
+
+Entries are evicted LRU-style (ADK_AGENT_POOL_SIZE, default 32).
+"""
+
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from ai_ta_backend.agents.agent import build_agent_instruction, create_agent_with_model
+from ai_ta_backend.agents.tools.file.agent import build_file_agent
+from ai_ta_backend.agents.tools.file.code_executor import generate_dataframes_info
+from ai_ta_backend.service.adk_llm_service import ADKLLMService
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def files_fingerprint(dataframes: Optional[Dict[str, Any]]) -> str:
+    """
+    Fingerprint the dataframes as the file agent's prompt sees them
+    (names, types, shapes, columns, geometry/CRS), which is all the
+    pooled agent depends on. The frames themselves are bound per request.
+    """
+    return _sha256(generate_dataframes_info(dataframes or {}))
+
+
+class AgentPool:
+    """LRU pool of ADKLLMService (agent + runner) instances."""
+
+    def __init__(self, max_size: int = 32):
+        self._cache = LRUCache(max_items=max_size)
+        # Serialize building so concurrent misses for the same key build once.
+        self._build_lock = threading.Lock()
+
+    def _key(self, model_info: Optional[dict], available_files: Optional[list],
+             dataframes: Optional[Dict[str, Any]]) -> Tuple[str, str, str]:
+        model_id = (model_info or {}).get("id") or ""
+        instruction_hash = _sha256(build_agent_instruction(available_files))
+        return (model_id, instruction_hash, files_fingerprint(dataframes))
+
+    def get_service(self,
+                    model_info: Optional[dict] = None,
+                    available_files: Optional[list] = None,
+                    dataframes: Optional[Dict[str, Any]] = None) -> ADKLLMService:
+        """Return a pooled ADKLLMService for this model/file set, building it on a miss."""
+        key = self._key(model_info, available_files, dataframes)
+        service = self._cache.get(key)
+        if service is not None:
+            print(f"Reusing pooled agent for model: {key[0] or 'default'}")
+            return service
+
+        with self._build_lock:
+            service = self._cache.get(key)
+            if service is not None:
+                return service
+            # Each root agent needs its own file agent instance: ADK agents can only have one parent.
+            agent = create_agent_with_model(model_info, available_files, sub_agents=[build_file_agent(dataframes or {})])
+            service = ADKLLMService(agent)
+            self._cache.set(key, service)
+            return service
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+_agent_pool: Optional[AgentPool] = None
+_agent_pool_lock = threading.Lock()
+
+
+def get_agent_pool() -> AgentPool:
+    """Return the process-wide agent pool."""
+    global _agent_pool
+    if _agent_pool is None:
+        with _agent_pool_lock:
+            if _agent_pool is None:
+                _agent_pool = AgentPool(max_size=int(os.environ.get('ADK_AGENT_POOL_SIZE', 32)))
+    return _agent_pool
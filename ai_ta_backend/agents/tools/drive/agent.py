@@ -10,6 +10,8 @@ from google.adk.agents import Agent
 from google.adk.tools import FunctionTool
 
 from ai_ta_backend.integrations.google_groups import GoogleGroupsService
+from ai_ta_backend.agents.tools.file.frame_cache import get_frame_cache
+from ai_ta_backend.agents.tools.file.lazy_frame import LazyFrame
 from ai_ta_backend.agents.tools.file.code_executor import (
     setup_execution_environment,
     run_code,
@@ -18,16 +20,30 @@ from ai_ta_backend.agents.tools.file.code_executor import (
 )
 
 
-def load_drive_files_for_project(project_name: str, group_email: str) -> Dict[str, pd.DataFrame]:
+def _download_drive_frame(groups_service: GoogleGroupsService, file_id: str, mime_type: str) -> Optional[pd.DataFrame]:
+    """Download a Drive spreadsheet/CSV and parse it into a DataFrame."""
+    # Download file content
+    content = groups_service.get_file_content(file_id, mime_type)
+    if not content:
+        return None
+    
+    # Google Sheets are exported as CSV
+    return pd.read_csv(io.BytesIO(content))
+
+
+def load_drive_files_for_project(project_name: str, group_email: str) -> Dict[str, Any]:
     """
     Load Google Drive files shared with a project's group into DataFrames.
     
+    Files whose shape and columns are known from an earlier load of the same
+    revision are returned as LazyFrames and only downloaded when used.
+    
     Args:
         project_name: Name of the project
         group_email: Google Group email for the project
         
     Returns:
-        Dictionary mapping filename to DataFrame for supported file types
+        Dictionary mapping filename to DataFrame (or LazyFrame) for supported file types
     """
     dataframes = {}
     
@@ -45,19 +61,22 @@ def load_drive_files_for_project(project_name: str, group_email: str) -> Dict[st
             # Only process spreadsheet files
             if 'spreadsheet' in mime_type or mime_type == 'text/csv':
                 try:
-                    # Download file content
-                    content = groups_service.get_file_content(file_id, mime_type)
+                    # Download and parse only when the file changed since it was cached
+                    key = ('drive', file_id)
+                    version = file_data.get('modifiedTime')
                     
-                    if content:
-                        # Convert to DataFrame
-                        if 'spreadsheet' in mime_type:
-                            # Google Sheets exported as CSV
-                            df = pd.read_csv(io.BytesIO(content))
-                        elif mime_type == 'text/csv':
-                            df = pd.read_csv(io.BytesIO(content))
-                        else:
-                            continue
-                        
+                    def loader(key=key, version=version, file_id=file_id, mime_type=mime_type):
+                        return get_frame_cache().get_versioned(
+                            key, version, lambda: _download_drive_frame(groups_service, file_id, mime_type))
+                    
+                    description = get_frame_cache().describe(key, version)
+                    if description:
+                        shape, columns = description
+                        df = LazyFrame(file_name, loader, shape, columns, source=(key, version))
+                    else:
+                        df = loader()
+                    
+                    if df is not None:
                         # Use filename as key (without extension for cleaner variable names)
                         clean_name = file_name.rsplit('.', 1)[0] if '.' in file_name else file_name
                         # Sanitize for Python variable naming
@@ -65,7 +84,8 @@ def load_drive_files_for_project(project_name: str, group_email: str) -> Dict[st
                         clean_name = ''.join(c for c in clean_name if c.isalnum() or c == '_')
                         
                         dataframes[clean_name] = df
-                        print(f"✅ Loaded {file_name} as DataFrame '{clean_name}' ({len(df)} rows)")
+                        state = "Loaded" if not isinstance(df, LazyFrame) else "Registered (lazy)"
+                        print(f"✅ {state} {file_name} as DataFrame '{clean_name}' ({df.shape[0]} rows)")
                         
                 except Exception as e:
                     print(f"⚠️  Failed to load file {file_name}: {e}")
@@ -14,9 +14,11 @@ from .code_executor import (
     set_supabase_client,
     generate_dataframes_info
 )
+from .sandbox import get_sandbox_manager
 
 
-# Global dataframes storage for the file agent
+# Global dataframes storage for the file agent, used when no conversation is
+# given. Per-conversation dataframes live in that conversation's sandbox.
 _file_agent_dataframes = {}
 
 
@@ -38,47 +40,68 @@ def clear_dataframes():
     _file_agent_dataframes = {}
 
 
-def get_current_dataframes():
-    """Get current dataframes."""
+def get_current_dataframes(conversation_id: Optional[str] = None):
+    """Get current dataframes (for a conversation's sandbox if conversation_id is given)."""
     global _file_agent_dataframes
+    if conversation_id:
+        sandbox = get_sandbox_manager().get(conversation_id)
+        return sandbox.dataframes if sandbox else {}
     return _file_agent_dataframes
 
 
-def create_file_agent(conversation_id: Optional[str] = None) -> Agent:
+def build_file_agent(dataframes: Optional[Dict[str, Union[pd.DataFrame, Any]]] = None) -> Agent:
     """
-    Create a new file agent instance with current dataframes.
+    Build a file agent whose prompt describes the given dataframes.
+    
+    Unlike create_file_agent this has no side effects on the execution
+    environment, so it can be used to build independent agent instances
+    (an ADK agent can only be attached to one parent).
     
     Args:
-        conversation_id: Optional conversation ID for organizing outputs
+        dataframes: Dataframes to describe in the prompt (defaults to the current ones)
     
     Returns:
         Configured Agent instance
     """
-    global _file_agent_dataframes
-    
-    # Setup the execution environment with current dataframes
-    setup_execution_environment(_file_agent_dataframes)
-    
-    # Set plot directory if conversation_id provided
-    if conversation_id:
-        plot_dir = f"plots/{conversation_id}"
-        set_plot_directory(plot_dir)
+    if dataframes is None:
+        dataframes = _file_agent_dataframes
     
     # Get the prompt with dataframe information
-    instruction = get_agent_prompt(_file_agent_dataframes)
+    instruction = get_agent_prompt(dataframes)
     
     # Create the run_code tool
     run_code_tool = FunctionTool(run_code)
     
     # Create and return the ADK agent
-    agent = Agent(
+    return Agent(
         model="gemini-2.5-flash",
         name="file_agent",
         instruction=instruction,
         tools=[run_code_tool]
     )
+
+
+def create_file_agent(conversation_id: Optional[str] = None) -> Agent:
+    """
+    Create a new file agent instance with current dataframes.
+    
+    Args:
+        conversation_id: Optional conversation ID for organizing outputs
     
-    return agent
+    Returns:
+        Configured Agent instance
+    """
+    global _file_agent_dataframes
+    
+    # Setup the execution environment with current dataframes
+    setup_execution_environment(_file_agent_dataframes)
+    
+    # Set plot directory if conversation_id provided
+    if conversation_id:
+        plot_dir = f"plots/{conversation_id}"
+        set_plot_directory(plot_dir)
+    
+    return build_file_agent(_file_agent_dataframes)
 
 
 # Create the default file agent instance
@@ -91,6 +114,9 @@ def prepare_file_agent(dataframes: Dict[str, Union[pd.DataFrame, Any]],
     """
     Prepare the file agent with new dataframes and settings.
     
+    With a conversation_id the dataframes are loaded into that conversation's
+    isolated sandbox; without one the global (default) environment is replaced.
+    
     Args:
         dataframes: Dictionary of dataframes to load
         conversation_id: Optional conversation ID
@@ -101,13 +127,17 @@ def prepare_file_agent(dataframes: Dict[str, Union[pd.DataFrame, Any]],
     """
     global file_agent, _file_agent_dataframes
     
-    # Update dataframes
-    _file_agent_dataframes = dataframes
-    
     # Set Supabase client if provided
     if supabase_client:
         set_supabase_client(supabase_client)
     
+    if conversation_id:
+        get_sandbox_manager().prepare(conversation_id, dataframes, f"plots/{conversation_id}")
+        return build_file_agent(dataframes)
+    
+    # Update dataframes
+    _file_agent_dataframes = dataframes
+    
     # Create new agent instance
     file_agent = create_file_agent(conversation_id)
     
@@ -6,11 +6,13 @@ import os
 import io
 import sys
 import contextlib
+import threading
 import traceback
 import re
+import uuid
 import base64
 from datetime import datetime
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, Union
 import pandas as pd
 import numpy as np
 import requests
@@ -46,71 +48,300 @@ try:
 except ImportError:
     fiona = None
 
+from google.adk.tools.tool_context import ToolContext
 from supabase import create_client, Client
 
+from .lazy_frame import LazyFrame, referenced_names
 
-# Global execution environment
+
+# Default execution environment, used when run_code is called without a
+# conversation (e.g. by the drive agent). Per-conversation environments live
+# in sandbox.SandboxManager.
+_default_sandbox = None
 _execution_globals = None
 _execution_locals = None
 _plot_directory = "plots"
 _supabase_client = None
 
 
+class _ThreadLocalStream:
+    """sys.stdout/sys.stderr proxy that sends writes from a capturing thread to that thread's buffer."""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def _target(self):
+        return getattr(self._local, 'buffer', None) or self._stream
+    
+    def write(self, data):
+        return self._target().write(data)
+    
+    def flush(self):
+        return self._target().flush()
+    
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+_capture_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def capture_output(buffer: io.StringIO):
+    """
+    Capture stdout/stderr of the current thread only.
+    
+    contextlib.redirect_stdout swaps sys.stdout process-wide, so output from
+    concurrent runs (and unrelated request logging) would leak into each other.
+    """
+    with _capture_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStream):
+            sys.stdout = _ThreadLocalStream(sys.stdout)
+        if not isinstance(sys.stderr, _ThreadLocalStream):
+            sys.stderr = _ThreadLocalStream(sys.stderr)
+        out, err = sys.stdout, sys.stderr
+    out._local.buffer = buffer
+    err._local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        out._local.buffer = None
+        err._local.buffer = None
+
+
+def dataframe_variable_name(filename: str, df: Union[pd.DataFrame, Any]) -> str:
+    """Variable name a preloaded file is exposed as (df_<name> or gdf_<name>)."""
+    # Create clean variable name from filename
+    var_name = os.path.splitext(os.path.basename(filename))[0]
+    var_name = re.sub(r'[^a-zA-Z0-9_]', '_', var_name)
+    
+    # Add prefix based on file type
+    if gpd and isinstance(df, gpd.GeoDataFrame):
+        return f"gdf_{var_name}"
+    return f"df_{var_name}"
+
+
+def describe_frame(df: Any) -> tuple:
+    """(type name, shape, columns) of a preloaded frame, without loading lazy ones that are described."""
+    if isinstance(df, LazyFrame):
+        return df.kind, df.shape, list(df.columns)
+    df_type = "GeoDataFrame" if gpd and isinstance(df, gpd.GeoDataFrame) else "DataFrame"
+    return df_type, df.shape, list(df.columns)
+
+
+def _same_frame(a: Any, b: Any) -> bool:
+    if a is b:
+        return True
+    return (isinstance(a, LazyFrame) and isinstance(b, LazyFrame) and
+            a.source is not None and a.source == b.source)
+
+
+def dataframe_memory_bytes(df: Any) -> int:
+    """Deep memory footprint of a DataFrame (0 for anything else)."""
+    try:
+        if isinstance(df, pd.DataFrame):
+            return int(df.memory_usage(deep=True).sum())
+    except Exception:
+        pass
+    return 0
+
+
+class ExecutionSandbox:
+    """
+    Isolated execution environment for one conversation.
+    
+    Holds its own namespace (globals/locals), the registry of preloaded
+    dataframes and the plot directory, so concurrent conversations on the
+    same worker can't clobber each other. Runs within a sandbox are
+    serialized by its lock.
+    
+    Note: matplotlib's pyplot state is process-global; figures are attributed
+    to a run by figure number, so only figures created during the run are saved.
+    """
+    
+    def __init__(self,
+                 conversation_id: Optional[str] = None,
+                 dataframes: Optional[Dict[str, Union[pd.DataFrame, Any]]] = None,
+                 plot_directory: str = "plots"):
+        self.conversation_id = conversation_id
+        self.plot_directory = plot_directory
+        # Unique per instance; identifies the sandbox's namespace in worker processes
+        self.sandbox_id = uuid.uuid4().hex
+        # Bumped whenever the preloaded dataframes change
+        self.version = 0
+        self.lock = threading.RLock()
+        self.dataframes: Dict[str, Any] = {}
+        self._dataframe_vars: Dict[str, str] = {}
+        # id(obj) -> (obj, bytes); holding obj keeps ids stable while cached
+        self._memory_cache: Dict[int, tuple] = {}
+        self.globals = self._build_globals()
+        self.locals: Dict[str, Any] = {}
+        if dataframes:
+            self.load_dataframes(dataframes)
+    
+    def _build_globals(self) -> Dict[str, Any]:
+        return {
+            "pd": pd,
+            "np": np,
+            "gpd": gpd,
+            "plt": plt,
+            "Figure": Figure if Figure else None,
+            "shapely": shapely,
+            "pyproj": pyproj,
+            "fiona": fiona,
+            "os": os,
+            "re": re,
+            "json": json,
+            "datetime": datetime,
+            "__builtins__": __builtins__,
+            # Add helper functions
+            "get_weather": get_weather,
+            "get_coordinates": get_coordinates,
+            "sheet_to_df": sheet_to_df,
+            "current_date": lambda: datetime.now().strftime("%Y-%m-%d"),
+            "current_datetime": lambda: datetime.now().isoformat(),
+            "save_plot": lambda filename=None, fmt='png', dpi=300: save_plot(filename, fmt, dpi, sandbox=self),
+            "list_dataframes": lambda: list_dataframes(sandbox=self),
+            "data_info": lambda name: data_info(name, sandbox=self),
+        }
+    
+    def load_dataframes(self, dataframes: Dict[str, Union[pd.DataFrame, Any]]):
+        """
+        Replace the preloaded dataframes. Variables created by earlier runs are
+        kept, so analysis state persists across turns of the conversation.
+        
+        Frames may be LazyFrame proxies; they are loaded by run() when code
+        refers to them.
+        """
+        with self.lock:
+            if (self._dataframe_vars and dataframes.keys() == self.dataframes.keys() and
+                    all(_same_frame(dataframes[k], self.dataframes[k]) for k in dataframes)):
+                # Same frames as last turn (e.g. served from the frame cache); keep the
+                # version so worker processes don't reload them.
+                return
+            for var_name in self._dataframe_vars.values():
+                self.globals.pop(var_name, None)
+            # Keep proxies (and whatever they already loaded) that still point at the same file version
+            self.dataframes = {
+                filename: self.dataframes[filename]
+                if filename in self.dataframes and _same_frame(df, self.dataframes[filename]) else df
+                for filename, df in dataframes.items()
+            }
+            self.version += 1
+            self._dataframe_vars = {}
+            for filename, df in self.dataframes.items():
+                var_name = dataframe_variable_name(filename, df)
+                self._dataframe_vars[filename] = var_name
+                if isinstance(df, LazyFrame) and df.loaded:
+                    df = df.load()
+                self.globals[var_name] = self._exposed(df)
+    
+    @staticmethod
+    def _exposed(df: Any) -> Any:
+        # Frames may be shared with the worker-level frame cache, so expose a shallow
+        # copy: column assignments and in-place ops like drop(inplace=True) don't leak
+        # into other conversations.
+        if isinstance(df, pd.DataFrame):
+            return df.copy(deep=False)
+        return df
+    
+    def materialize(self, code: str) -> List[str]:
+        """Load the lazy dataframes the code refers to; returns the filenames that were loaded."""
+        names = referenced_names(code)
+        loaded = []
+        with self.lock:
+            for filename, var_name in self._dataframe_vars.items():
+                proxy = self.dataframes.get(filename)
+                if (var_name not in names or not isinstance(proxy, LazyFrame) or
+                        var_name in self.locals or self.globals.get(var_name) is not proxy):
+                    continue
+                print(f"[Code Execution] Loading {filename}")
+                self.globals[var_name] = self._exposed(proxy.load())
+                loaded.append(filename)
+        return loaded
+    
+    def loaded_frames(self) -> Dict[str, Any]:
+        """Preloaded dataframes that are in memory (lazy ones only once loaded)."""
+        frames = {}
+        for filename, df in self.dataframes.items():
+            if isinstance(df, LazyFrame):
+                if not df.loaded:
+                    continue
+                df = df.load()
+            frames[filename] = df
+        return frames
+    
+    def set_frame(self, filename: str, df: Any):
+        """Replace a lazy placeholder with its loaded frame (used by worker processes)."""
+        with self.lock:
+            var_name = self._dataframe_vars.get(filename)
+            if var_name is None:
+                return
+            placeholder = self.dataframes.get(filename)
+            self.dataframes[filename] = df
+            if self.globals.get(var_name) is placeholder:
+                self.globals[var_name] = df
+    
+    def variables(self) -> Dict[str, Any]:
+        all_vars = dict(self.globals)
+        all_vars.update(self.locals)
+        return all_vars
+    
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the sandbox's DataFrames."""
+        total = 0
+        live = {}
+        for var in list(self.globals.values()) + list(self.locals.values()):
+            if not isinstance(var, pd.DataFrame) or id(var) in live:
+                continue
+            cached = self._memory_cache.get(id(var))
+            size = cached[1] if cached and cached[0] is var else dataframe_memory_bytes(var)
+            live[id(var)] = (var, size)
+            total += size
+        self._memory_cache = live
+        return total
+    
+    def close(self):
+        """Drop all references held by the sandbox."""
+        self.globals.clear()
+        self.locals.clear()
+        self.dataframes = {}
+        self._dataframe_vars = {}
+        self._memory_cache = {}
+    
+    def run(self, code: str) -> str:
+        """
+        Execute code in this sandbox and return the formatted output.
+        Runs in a warm worker process when the worker pool is enabled.
+        """
+        with self.lock:
+            try:
+                self.materialize(code)
+            except Exception as e:
+                return f"```python\n{code}\n```\n\nError:\nCould not load data: {e}"
+            from .worker_pool import get_worker_pool
+            pool = get_worker_pool()
+            if pool is not None:
+                return pool.run(self, code)
+            return _execute(self, code)
+
+
 def setup_execution_environment(preloaded_dataframes: Optional[Dict[str, Union[pd.DataFrame, Any]]] = None):
     """
-    Set up the persistent execution environment with preloaded dataframes.
+    Set up the default execution environment with preloaded dataframes.
     
     Args:
         preloaded_dataframes: Dictionary mapping filenames to pandas DataFrames or geopandas GeoDataFrames
     """
-    global _execution_globals, _execution_locals
+    global _default_sandbox, _execution_globals, _execution_locals
     
     # Initialize Supabase client if environment variables are available
     initialize_supabase_client()
     
-    # Initialize execution environment with libraries and helper functions
-    _execution_globals = {
-        "pd": pd,
-        "np": np,
-        "gpd": gpd,
-        "plt": plt,
-        "Figure": Figure if Figure else None,
-        "shapely": shapely,
-        "pyproj": pyproj,
-        "fiona": fiona,
-        "os": os,
-        "re": re,
-        "json": json,
-        "datetime": datetime,
-        "__builtins__": __builtins__,
-        # Add helper functions
-        "get_weather": get_weather,
-        "get_coordinates": get_coordinates,
-        "sheet_to_df": sheet_to_df,
-        "current_date": lambda: datetime.now().strftime("%Y-%m-%d"),
-        "current_datetime": lambda: datetime.now().isoformat(),
-        "save_plot": save_plot,
-        "list_dataframes": list_dataframes,
-        "data_info": data_info,
-    }
-    
-    _execution_locals = {}
-    
-    # Add preloaded dataframes to execution environment
-    if preloaded_dataframes:
-        for filename, df in preloaded_dataframes.items():
-            # Create clean variable name from filename
-            var_name = os.path.splitext(os.path.basename(filename))[0]
-            var_name = re.sub(r'[^a-zA-Z0-9_]', '_', var_name)
-            
-            # Add prefix based on file type
-            if gpd and isinstance(df, gpd.GeoDataFrame):
-                var_name = f"gdf_{var_name}"
-            else:
-                var_name = f"df_{var_name}"
-            
-            # Add to execution environment
-            _execution_globals[var_name] = df
+    _default_sandbox = ExecutionSandbox(None, preloaded_dataframes, _plot_directory)
+    _execution_globals = _default_sandbox.globals
+    _execution_locals = _default_sandbox.locals
 
 
 def get_coordinates(location: str) -> tuple[float, float]:
@@ -203,9 +434,12 @@ def sheet_to_df(url_or_id: str, gid: Optional[str] = None, **read_csv_kwargs) ->
     return pd.read_csv(csv_url, **read_csv_kwargs)
 
 
-def save_plot(filename: Optional[str] = None, fmt: str = 'png', dpi: int = 300) -> str:
+def save_plot(filename: Optional[str] = None, fmt: str = 'png', dpi: int = 300,
+              sandbox: Optional[ExecutionSandbox] = None) -> str:
     """Save the current matplotlib figure to Supabase storage and return the public URL."""
-    global _plot_directory, _supabase_client
+    global _supabase_client
+    
+    plot_directory = sandbox.plot_directory if sandbox else _plot_directory
     
     if not plt:
         return "Matplotlib not available"
@@ -218,8 +452,8 @@ def save_plot(filename: Optional[str] = None, fmt: str = 'png', dpi: int = 300)
         filename = f'{filename}.{fmt}'
     
     # Save locally first
-    os.makedirs(_plot_directory, exist_ok=True)
-    filepath = os.path.join(_plot_directory, filename)
+    os.makedirs(plot_directory, exist_ok=True)
+    filepath = os.path.join(plot_directory, filename)
     
     plt.savefig(filepath, dpi=dpi, bbox_inches='tight')
     plt.close()
@@ -260,21 +494,17 @@ def save_plot(filename: Optional[str] = None, fmt: str = 'png', dpi: int = 300)
         return f'Plot saved locally as {filepath} (Supabase client not available)'
 
 
-def list_dataframes() -> str:
+def list_dataframes(sandbox: Optional[ExecutionSandbox] = None) -> str:
     """List all available dataframes in the execution environment."""
-    global _execution_globals, _execution_locals
+    sandbox = sandbox or _default_sandbox
     
     dataframes = []
-    all_vars = {}
-    if _execution_globals:
-        all_vars.update(_execution_globals)
-    if _execution_locals:
-        all_vars.update(_execution_locals)
+    all_vars = sandbox.variables() if sandbox else {}
     
     for name, var in all_vars.items():
-        if isinstance(var, pd.DataFrame) and not name.startswith("_"):
-            df_type = "GeoDataFrame" if gpd and isinstance(var, gpd.GeoDataFrame) else "DataFrame"
-            dataframes.append(f"- {name}: {df_type} ({var.shape[0]} rows × {var.shape[1]} columns)")
+        if isinstance(var, (pd.DataFrame, LazyFrame)) and not name.startswith("_"):
+            df_type, shape, _ = describe_frame(var)
+            dataframes.append(f"- {name}: {df_type} ({shape[0]} rows × {shape[1]} columns)")
     
     if dataframes:
         return "Available dataframes:\n" + "\n".join(dataframes)
@@ -282,29 +512,26 @@ def list_dataframes() -> str:
         return "No dataframes available in the execution environment."
 
 
-def data_info(name: str) -> str:
+def data_info(name: str, sandbox: Optional[ExecutionSandbox] = None) -> str:
     """Get detailed information about a specific dataframe."""
-    global _execution_globals, _execution_locals
+    sandbox = sandbox or _default_sandbox
     
-    all_vars = {}
-    if _execution_globals:
-        all_vars.update(_execution_globals)
-    if _execution_locals:
-        all_vars.update(_execution_locals)
+    all_vars = sandbox.variables() if sandbox else {}
     
     if name not in all_vars:
         return f"Dataset '{name}' not found."
     
     df = all_vars[name]
-    if not isinstance(df, pd.DataFrame):
+    if not isinstance(df, (pd.DataFrame, LazyFrame)):
         return f"'{name}' is not a DataFrame."
     
     is_gdf = bool(gpd and isinstance(df, gpd.GeoDataFrame))
+    df_type, shape, columns = describe_frame(df)
     info = []
     info.append(f"Dataset: {name}")
-    info.append(f"Type: {'GeoDataFrame' if is_gdf else 'DataFrame'}")
-    info.append(f"Shape: {df.shape}")
-    info.append(f"Columns: {list(df.columns)}")
+    info.append(f"Type: {df_type}")
+    info.append(f"Shape: {shape}")
+    info.append(f"Columns: {columns}")
     if is_gdf and hasattr(df, 'crs'):
         info.append(f"CRS: {df.crs}")
     
@@ -312,9 +539,11 @@ def data_info(name: str) -> str:
 
 
 def set_plot_directory(directory: str):
-    """Set the directory for saving plots."""
+    """Set the directory for saving plots in the default execution environment."""
     global _plot_directory
     _plot_directory = directory
+    if _default_sandbox is not None:
+        _default_sandbox.plot_directory = directory
     os.makedirs(directory, exist_ok=True)
 
 
@@ -347,7 +576,20 @@ def initialize_supabase_client():
         return None
 
 
-def run_code(reasoning: str, code: str) -> str:
+def _conversation_id_from_context(tool_context: Optional[ToolContext]) -> Optional[str]:
+    """Conversation the tool call belongs to (session state, falling back to the session id)."""
+    if tool_context is None:
+        return None
+    try:
+        conversation_id = tool_context.state.get('conversation_id')
+        if conversation_id:
+            return conversation_id
+        return tool_context._invocation_context.session.id
+    except Exception:
+        return None
+
+
+def run_code(reasoning: str, code: str, tool_context: Optional[ToolContext] = None) -> str:
     """
     Execute Python code in the persistent environment and return results.
     
@@ -361,36 +603,54 @@ def run_code(reasoning: str, code: str) -> str:
     Returns:
         String containing execution output, results, and any error messages
     """
-    global _execution_globals, _execution_locals, _plot_directory, _supabase_client
-    
-    if _execution_globals is None:
+    sandbox = _default_sandbox
+    conversation_id = _conversation_id_from_context(tool_context)
+    if conversation_id:
+        from .sandbox import get_sandbox_manager
+        manager = get_sandbox_manager()
+        sandbox = manager.get(conversation_id)
+        if sandbox is None:
+            return "Error: Execution environment for this conversation has expired. Please resend your message."
+    
+    if sandbox is None:
         return "Error: Execution environment not initialized. Please contact support."
     
     print(f"[Code Execution] Reasoning: {reasoning}")
     
+    result = sandbox.run(code)
+    if conversation_id:
+        # Variables created by the run count against the sandbox memory budget
+        manager.resize(conversation_id)
+    return result
+
+
+def _execute(sandbox: ExecutionSandbox, code: str) -> str:
+    """Execute code in the sandbox's namespace, saving any figures it creates."""
+    global _supabase_client
+    
     # Capture stdout and stderr
     stdout_buffer = io.StringIO()
+    figures_before = set(plt.get_fignums()) if plt else set()
     
     try:
         # Execute the code
-        with (
-            contextlib.redirect_stdout(stdout_buffer),
-            contextlib.redirect_stderr(stdout_buffer),
-        ):
-            exec(code, _execution_globals, _execution_locals)
+        with capture_output(stdout_buffer):
+            exec(code, sandbox.globals, sandbox.locals)
             
             # Handle figure outputs
             figure_count = 0
             
-            # Check for any matplotlib figures
+            # Check for matplotlib figures created by this run
             if plt:
                 for fig_num in plt.get_fignums():
+                    if fig_num in figures_before:
+                        continue
                     figure_count += 1
                     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                     filename = f"figure_{timestamp}_{figure_count}.png"
                     
-                    os.makedirs(_plot_directory, exist_ok=True)
-                    filepath = os.path.join(_plot_directory, filename)
+                    os.makedirs(sandbox.plot_directory, exist_ok=True)
+                    filepath = os.path.join(sandbox.plot_directory, filename)
                     
                     plt.figure(fig_num)
                     plt.savefig(filepath, dpi=150, bbox_inches='tight')
@@ -427,7 +687,7 @@ def run_code(reasoning: str, code: str) -> str:
         # If no output, show some key variables from the last execution
         if not output.strip():
             result_vars = []
-            for var_name, var_value in _execution_locals.items() if _execution_locals else {}:
+            for var_name, var_value in sandbox.locals.items():
                 if var_name.startswith("_") or callable(var_value):
                     continue
                     
@@ -458,7 +718,10 @@ def run_code(reasoning: str, code: str) -> str:
         
     finally:
         if plt:
-            plt.close("all")
+            # Only close figures left open by this run; other sandboxes may be plotting concurrently
+            for fig_num in plt.get_fignums():
+                if fig_num not in figures_before:
+                    plt.close(fig_num)
         stdout_buffer.close()
 
 
@@ -480,29 +743,23 @@ def generate_dataframes_info(preloaded_dataframes: dict) -> str:
     result.append("")
     
     for filename, df in preloaded_dataframes.items():
-        # Create clean variable name from filename
-        var_name = os.path.splitext(os.path.basename(filename))[0]
-        var_name = re.sub(r'[^a-zA-Z0-9_]', '_', var_name)
+        var_name = dataframe_variable_name(filename, df)
         
-        # Add prefix based on file type
         if gpd and isinstance(df, gpd.GeoDataFrame):
-            var_name = f"gdf_{var_name}"
-            df_type = "GeoDataFrame"
             geometry_info = str(df.geometry.geom_type.value_counts().to_dict()) if hasattr(df, 'geometry') else "N/A"
             crs_info = f"CRS: {df.crs}" if hasattr(df, 'crs') else "CRS: N/A"
         else:
-            var_name = f"df_{var_name}"
-            df_type = "DataFrame" 
             geometry_info = "N/A"
             crs_info = "N/A"
+        df_type, shape, columns = describe_frame(df)
         
         result.append(f"* **{filename}** → `{var_name}`")
         result.append(f"  - Type: {df_type}")
-        result.append(f"  - Shape: {df.shape[0]} rows × {df.shape[1]} columns")
-        if isinstance(df, pd.DataFrame):
-            result.append(f"  - Columns: {', '.join(list(df.columns)[:10])}")
-            if len(df.columns) > 10:
-                result.append(f"    ... and {len(df.columns) - 10} more columns")
+        result.append(f"  - Shape: {shape[0]} rows × {shape[1]} columns")
+        if isinstance(df, (pd.DataFrame, LazyFrame)):
+            result.append(f"  - Columns: {', '.join(str(c) for c in columns[:10])}")
+            if len(columns) > 10:
+                result.append(f"    ... and {len(columns) - 10} more columns")
         if gpd and isinstance(df, gpd.GeoDataFrame):
             result.append(f"  - Geometry Types: {geometry_info}")
             result.append(f"  - {crs_info}")
@@ -0,0 +1,164 @@
+"""
+Worker-level cache of parsed DataFrames for the file agent.
+
+Every /Chat request prepares the file agent, which used to re-download and
+re-parse every course CSV, Drive sheet and DigiDocs table. Frames are now
+cached per source and version and evicted LRU-style within a memory budget:
+
+* R2 objects are keyed by (bucket, s3_path) and versioned by ETag. Within a
+  short freshness window a cached frame is returned as-is; after that it is
+  revalidated with a conditional GET (If-None-Match), which costs one round
+  trip and no transfer when the object is unchanged.
+* Sources that carry their own version in a listing (Drive modifiedTime,
+  documents row id/created_at) are only reloaded when that version changes.
+  Their shape and columns are remembered per version even after the frame is
+  evicted, so lazy frames can be described without loading them.
+
+Configuration:
+    FILE_AGENT_FRAME_CACHE_MAX_BYTES      memory budget (default 1 GiB)
+    FILE_AGENT_FRAME_CACHE_MAX_ITEMS      max cached frames (default 256)
+    FILE_AGENT_FRAME_CACHE_FRESH_SECONDS  skip revalidation for this long (default 30)
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+from .code_executor import dataframe_memory_bytes
+
+
+@dataclass
+class CachedFrame:
+    df: Any
+    version: Optional[str]
+    validated_at: float
+
+
+class DataFrameCache:
+    """Thread-safe, memory-bounded cache of DataFrames keyed by source and version."""
+
+    def __init__(self,
+                 max_bytes: Optional[int] = 1024**3,
+                 max_items: int = 256,
+                 fresh_seconds: float = 30):
+        self.fresh_seconds = fresh_seconds
+        self._frames = LRUCache(
+            max_items=max_items,
+            max_bytes=max_bytes,
+            sizeof=lambda entry: dataframe_memory_bytes(entry.df),
+        )
+        # key -> (version, shape, columns); small, so it outlives evicted frames
+        self._descriptions = LRUCache(max_items=max_items * 16)
+        self.revalidations = 0
+        self.not_modified = 0
+        self._stats_lock = threading.Lock()
+
+    def peek(self, key: Hashable, version: Optional[str]) -> Any:
+        """Return the cached frame for key if it was loaded at this version, else None."""
+        entry = self._frames.get(key)
+        if entry is not None and version is not None and entry.version == version:
+            return entry.df
+        return None
+
+    def put(self, key: Hashable, version: Optional[str], df: Any):
+        if df is not None and version is not None:
+            self._frames.set(key, CachedFrame(df, version, time.monotonic()))
+            if hasattr(df, 'shape') and hasattr(df, 'columns'):
+                self._descriptions.set(key, (version, tuple(df.shape), [str(c) for c in df.columns]))
+
+    def describe(self, key: Hashable, version: Optional[str]) -> Optional[Tuple[Tuple[int, int], List[str]]]:
+        """(shape, columns) of the frame last loaded for key at this version, if known."""
+        entry = self._descriptions.get(key)
+        if entry is not None and version is not None and entry[0] == version:
+            return entry[1], entry[2]
+        return None
+
+    def get_versioned(self, key: Hashable, version: Optional[str], loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached frame for key if it was loaded at this version,
+        otherwise load it with loader() and cache it. Pass version=None to
+        always reload.
+        """
+        df = self.peek(key, version)
+        if df is None:
+            df = loader()
+            self.put(key, version, df)
+        return df
+
+    def get_r2_frame(self,
+                     r2_client,
+                     bucket: str,
+                     s3_path: str,
+                     parse: Callable[[Any], Any],
+                     stream: bool = False) -> Any:
+        """
+        Return the parsed frame for an R2/S3 object, revalidating by ETag.
+        parse(body_bytes) builds the frame on a miss or when the object changed;
+        with stream=True parse gets the streaming body instead, so the raw object
+        is never held in memory as a whole.
+        """
+        key = ('r2', bucket, s3_path)
+        entry = self._frames.get(key)
+        if entry is not None and time.monotonic() - entry.validated_at < self.fresh_seconds:
+            return entry.df
+
+        request = {'Bucket': bucket, 'Key': s3_path}
+        if entry is not None and entry.version:
+            request['IfNoneMatch'] = entry.version
+            with self._stats_lock:
+                self.revalidations += 1
+
+        try:
+            response = r2_client.get_object(**request)
+        except ClientError as e:
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+            code = str(e.response.get('Error', {}).get('Code', ''))
+            if entry is not None and (status == 304 or code in ('304', 'NotModified')):
+                with self._stats_lock:
+                    self.not_modified += 1
+                entry.validated_at = time.monotonic()
+                self._frames.touch(key)
+                return entry.df
+            raise
+
+        body = response['Body']
+        df = parse(body if stream else body.read())
+        if df is not None:
+            self._frames.set(key, CachedFrame(df, response.get('ETag'), time.monotonic()))
+        return df
+
+    def invalidate(self, key: Hashable):
+        self._frames.pop(key)
+
+    def clear(self):
+        self._frames.clear()
+        self._descriptions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._frames.stats()
+        stats.update({'revalidations': self.revalidations, 'not_modified': self.not_modified})
+        return stats
+
+
+_frame_cache: Optional[DataFrameCache] = None
+_frame_cache_lock = threading.Lock()
+
+
+def get_frame_cache() -> DataFrameCache:
+    """Return the process-wide DataFrame cache."""
+    global _frame_cache
+    if _frame_cache is None:
+        with _frame_cache_lock:
+            if _frame_cache is None:
+                _frame_cache = DataFrameCache(
+                    max_bytes=int(os.environ.get('FILE_AGENT_FRAME_CACHE_MAX_BYTES', 1024**3)),
+                    max_items=int(os.environ.get('FILE_AGENT_FRAME_CACHE_MAX_ITEMS', 256)),
+                    fresh_seconds=float(os.environ.get('FILE_AGENT_FRAME_CACHE_FRESH_SECONDS', 30)),
+                )
+    return _frame_cache
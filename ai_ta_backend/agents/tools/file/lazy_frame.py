@@ -0,0 +1,128 @@
+"""
+Lazy stand-ins for the file agent's preloaded dataframes.
+
+Preparing the file agent used to download and parse every CSV, Drive sheet
+and DigiDocs table of a course on every request, although most conversations
+touch zero or one of them. A LazyFrame carries what the prompt needs (shape
+and columns, taken from the documents row or remembered by the frame cache)
+plus a loader, and the frame is only fetched when code actually uses it:
+
+* ExecutionSandbox.run materializes the frames a snippet refers to by name
+  before executing it (see referenced_names).
+* Any other attribute access on the proxy loads the frame and delegates to it.
+"""
+
+import ast
+import threading
+from typing import Any, Callable, Hashable, List, Optional, Set, Tuple
+
+
+class LazyFrame:
+    """Placeholder for a DataFrame that is loaded on first use."""
+
+    def __init__(self,
+                 name: str,
+                 loader: Optional[Callable[[], Any]],
+                 shape: Optional[Tuple[int, int]] = None,
+                 columns: Optional[List[str]] = None,
+                 source: Optional[Hashable] = None,
+                 kind: str = "DataFrame"):
+        """
+        Args:
+            name: Filename the frame is registered under
+            loader: Returns the DataFrame (or None if it can't be loaded)
+            shape: (rows, columns) if known without loading
+            columns: Column names if known without loading
+            source: Identifies the underlying file and version; proxies with the
+                same source are interchangeable across requests
+            kind: Type name shown to the agent
+        """
+        self.name = name
+        self.source = source
+        self.kind = kind
+        self._loader = loader
+        self._shape = tuple(shape) if shape is not None else None
+        self._columns = list(columns) if columns is not None else None
+        self._df = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._df is not None
+
+    @property
+    def described(self) -> bool:
+        """Whether shape and columns are known without loading the frame."""
+        return self._df is not None or (self._shape is not None and self._columns is not None)
+
+    def load(self) -> Any:
+        """Materialize the frame (once) and return it."""
+        if self._df is not None:
+            return self._df
+        with self._lock:
+            if self._df is None:
+                if self._loader is None:
+                    raise RuntimeError(
+                        f"'{self.name}' is not loaded here; refer to its variable by name in the code")
+                df = self._loader()
+                if df is None:
+                    raise RuntimeError(f"Could not load '{self.name}'")
+                self._shape = tuple(df.shape)
+                self._columns = [str(c) for c in df.columns]
+                self._df = df
+        return self._df
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        if self._shape is None:
+            self.load()
+        return self._shape
+
+    @property
+    def columns(self) -> List[str]:
+        if self._columns is None:
+            self.load()
+        return self._columns
+
+    def metadata(self) -> Tuple[Optional[Tuple[int, int]], Optional[List[str]], str]:
+        """(shape, columns, kind) without loading; worker processes get these for unloaded frames."""
+        return self._shape, self._columns, self.kind
+
+    def __getattr__(self, attr: str) -> Any:
+        # Only called for attributes the proxy doesn't have itself
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __repr__(self) -> str:
+        if self._df is not None:
+            return repr(self._df)
+        shape = f"{self._shape[0]} rows × {self._shape[1]} columns" if self._shape else "shape unknown"
+        return f"<{self.kind} '{self.name}' ({shape}, not loaded)>"
+
+
+def referenced_names(code: str) -> Set[str]:
+    """
+    Names a code snippet may refer to: identifiers plus string literals
+    (for globals()['df_x'] or data_info('df_x')).
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.isidentifier():
+            names.add(node.value)
+    return names
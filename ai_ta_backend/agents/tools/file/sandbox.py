@@ -0,0 +1,106 @@
+"""
+Per-conversation execution sandboxes for the file agent.
+
+Each conversation gets its own ExecutionSandbox (namespace, dataframe registry
+and plot directory) so concurrent /Chat requests on the same worker don't
+clobber each other. Idle sandboxes are evicted LRU-style, after a TTL, or when
+the DataFrames held by all sandboxes exceed the memory budget.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Union
+
+import pandas as pd
+
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+from .code_executor import ExecutionSandbox, initialize_supabase_client
+
+
+class SandboxManager:
+    """Process-wide registry of ExecutionSandbox instances keyed by conversation_id."""
+
+    def __init__(self,
+                 max_sandboxes: int = 64,
+                 ttl_seconds: Optional[float] = 30 * 60,
+                 max_bytes: Optional[int] = 2 * 1024**3):
+        self._sandboxes = LRUCache(
+            max_items=max_sandboxes,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+            sizeof=lambda sandbox: sandbox.memory_bytes(),
+            on_evict=self._on_evict,
+        )
+        self._lock = threading.Lock()
+
+    def _on_evict(self, conversation_id: str, sandbox: ExecutionSandbox):
+        print(f"Evicting execution sandbox for conversation {conversation_id}")
+        self._close(sandbox)
+
+    def _close(self, sandbox: ExecutionSandbox):
+        sandbox.close()
+        from .worker_pool import get_worker_pool
+        pool = get_worker_pool(start=False)
+        if pool is not None:
+            # The sandbox's worker may be busy with another job; don't block the caller on it
+            threading.Thread(target=pool.drop, args=(sandbox.sandbox_id,), daemon=True).start()
+
+    def prepare(self,
+                conversation_id: str,
+                dataframes: Dict[str, Union[pd.DataFrame, Any]],
+                plot_directory: Optional[str] = None) -> ExecutionSandbox:
+        """
+        Create the conversation's sandbox, or refresh the dataframes of an existing one
+        (variables from earlier turns are kept).
+        """
+        initialize_supabase_client()
+        plot_directory = plot_directory or f"plots/{conversation_id}"
+        with self._lock:
+            sandbox = self._sandboxes.get(conversation_id)
+            if sandbox is None:
+                sandbox = ExecutionSandbox(conversation_id, dataframes, plot_directory)
+                self._sandboxes.set(conversation_id, sandbox)
+            else:
+                sandbox.load_dataframes(dataframes)
+                sandbox.plot_directory = plot_directory
+                self._sandboxes.touch(conversation_id)
+                self._sandboxes.resize(conversation_id)
+        return sandbox
+
+    def get(self, conversation_id: str) -> Optional[ExecutionSandbox]:
+        sandbox = self._sandboxes.get(conversation_id)
+        if sandbox is not None:
+            # Using a sandbox keeps it alive for another TTL period
+            self._sandboxes.touch(conversation_id)
+        return sandbox
+
+    def resize(self, conversation_id: str):
+        """Re-measure a sandbox after a run and enforce the memory budget."""
+        self._sandboxes.resize(conversation_id)
+
+    def drop(self, conversation_id: str):
+        sandbox = self._sandboxes.pop(conversation_id)
+        if sandbox is not None:
+            self._close(sandbox)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._sandboxes.stats()
+
+
+_sandbox_manager: Optional[SandboxManager] = None
+_sandbox_manager_lock = threading.Lock()
+
+
+def get_sandbox_manager() -> SandboxManager:
+    """Return the process-wide sandbox manager."""
+    global _sandbox_manager
+    if _sandbox_manager is None:
+        with _sandbox_manager_lock:
+            if _sandbox_manager is None:
+                _sandbox_manager = SandboxManager(
+                    max_sandboxes=int(os.environ.get('FILE_AGENT_SANDBOX_MAX', 64)),
+                    ttl_seconds=float(os.environ.get('FILE_AGENT_SANDBOX_TTL_SECONDS', 30 * 60)),
+                    max_bytes=int(os.environ.get('FILE_AGENT_SANDBOX_MAX_BYTES', 2 * 1024**3)),
+                )
+    return _sandbox_manager
@@ -0,0 +1,419 @@
+"""
+Out-of-process execution of the file agent's run_code.
+
+A small pool of pre-warmed worker processes (pandas, numpy, matplotlib/Agg,
+geopandas and pyarrow already imported) executes code so heavy snippets don't
+block Flask threads or contend for the GIL, and output capture stays inside
+the worker.
+
+* Routing is sticky: a sandbox always runs on the same worker, which keeps its
+  namespace (variables persist across run_code calls like the inline path).
+* Preloaded dataframes are exported once per sandbox version as Arrow IPC files
+  (under /dev/shm when available) and memory-mapped by the worker; frames
+  Arrow can't represent fall back to pickle. Lazy frames that haven't been
+  loaded yet are sent as metadata-only placeholders and shipped once the
+  parent loads them.
+* Each job runs with a CPU-time limit (RLIMIT_CPU + SIGXCPU) and an address
+  space limit (RLIMIT_AS) relative to the worker's current usage. A job that
+  exceeds the wall-clock timeout gets its worker killed and respawned.
+
+Configuration:
+    FILE_AGENT_WORKERS              number of workers, 0 runs code inline (default: min(4, cpus))
+    FILE_AGENT_JOB_CPU_SECONDS      CPU seconds per job (default 60)
+    FILE_AGENT_JOB_MEMORY_BYTES     additional address space per job (default 2 GiB)
+    FILE_AGENT_JOB_TIMEOUT_SECONDS  wall-clock seconds per job (default 120)
+"""
+
+import atexit
+import multiprocessing
+import os
+import pickle
+import shutil
+import signal
+import tempfile
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Set in worker processes so nested lookups never start a pool of their own.
+_IN_WORKER_ENV = 'FILE_AGENT_IN_WORKER'
+
+
+class CPUTimeLimitExceeded(Exception):
+    pass
+
+
+# ----- worker process -----
+
+def _on_cpu_limit(signum, frame):
+    raise CPUTimeLimitExceeded("CPU time limit exceeded for this code execution")
+
+
+def _address_space_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return 0
+
+
+def _set_soft_limit(limit: int, soft: int):
+    hard = resource.getrlimit(limit)[1]
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(limit, (soft, hard))
+
+
+def _set_job_limits(cpu_seconds: Optional[float], memory_bytes: Optional[int]):
+    """Limit the next job relative to what the worker has already used."""
+    if resource is None:
+        return
+    if cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _set_soft_limit(resource.RLIMIT_CPU, int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1)
+    if memory_bytes:
+        current = _address_space_bytes()
+        if current:
+            _set_soft_limit(resource.RLIMIT_AS, current + memory_bytes)
+
+
+def _clear_job_limits():
+    if resource is None:
+        return
+    for limit in (resource.RLIMIT_CPU, resource.RLIMIT_AS):
+        resource.setrlimit(limit, (resource.getrlimit(limit)[1], resource.getrlimit(limit)[1]))
+
+
+def _read_frame(filename: str, fmt: str, path: Any):
+    import pandas as pd
+    if fmt == 'lazy':
+        from ai_ta_backend.agents.tools.file.lazy_frame import LazyFrame
+        shape, columns, kind = path
+        return LazyFrame(filename, None, shape, columns, kind=kind)
+    if fmt == 'arrow':
+        import pyarrow as pa
+        with pa.memory_map(path, 'r') as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    if fmt == 'geoarrow':
+        import geopandas as gpd
+        return gpd.read_feather(path)
+    return pd.read_pickle(path)
+
+
+def _worker_main(conn):
+    os.environ[_IN_WORKER_ENV] = '1'
+    # Warm imports: code_executor pulls in pandas, numpy, matplotlib (Agg), geopandas, ...
+    from ai_ta_backend.agents.tools.file import code_executor
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        pass
+    code_executor.initialize_supabase_client()
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'SIGXCPU'):
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    sandboxes: Dict[str, Any] = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        op = message[0]
+        try:
+            if op == 'load':
+                _, sandbox_id, frames, plot_directory = message
+                dataframes = {filename: _read_frame(filename, fmt, path) for filename, (fmt, path) in frames.items()}
+                sandbox = sandboxes.get(sandbox_id)
+                if sandbox is None:
+                    sandboxes[sandbox_id] = code_executor.ExecutionSandbox(sandbox_id, dataframes, plot_directory)
+                else:
+                    sandbox.load_dataframes(dataframes)
+                conn.send(('ok', None))
+            elif op == 'frames':
+                _, sandbox_id, frames = message
+                sandbox = sandboxes.get(sandbox_id)
+                if sandbox is None:
+                    conn.send(('missing', None))
+                    continue
+                for filename, (fmt, path) in frames.items():
+                    sandbox.set_frame(filename, _read_frame(filename, fmt, path))
+                conn.send(('ok', None))
+            elif op == 'run':
+                _, sandbox_id, code, plot_directory, cpu_seconds, memory_bytes = message
+                sandbox = sandboxes.get(sandbox_id)
+                if sandbox is None:
+                    conn.send(('missing', None))
+                    continue
+                sandbox.plot_directory = plot_directory
+                try:
+                    _set_job_limits(cpu_seconds, memory_bytes)
+                    result = code_executor._execute(sandbox, code)
+                finally:
+                    _clear_job_limits()
+                conn.send(('ok', result))
+            elif op == 'drop':
+                sandbox = sandboxes.pop(message[1], None)
+                if sandbox is not None:
+                    sandbox.close()
+                conn.send(('ok', None))
+            elif op == 'stop':
+                break
+        except BaseException as e:
+            try:
+                conn.send(('error', f"{type(e).__name__}: {e}"))
+            except Exception:
+                break
+
+
+# ----- parent process -----
+
+class _Worker:
+
+    def __init__(self, context):
+        self.context = context
+        self.lock = threading.Lock()
+        # sandbox_id -> (dataframe version, filenames of the frames loaded in the worker)
+        self.sandboxes: Dict[str, Tuple[int, Set[str]]] = {}
+        self._start()
+
+    def _start(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.sandboxes = {}
+
+    def restart(self):
+        self.kill()
+        self._start()
+
+    def kill(self):
+        try:
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join(timeout=5)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def call(self, message: tuple, timeout: Optional[float]) -> Tuple[str, Any]:
+        """Send a message and wait for the reply; kills and respawns the worker on timeout or crash."""
+        if not self.process.is_alive():
+            self.restart()
+        try:
+            self.conn.send(message)
+            if not self.conn.poll(timeout):
+                print(f"Code worker {self.process.pid} exceeded {timeout}s, restarting it")
+                self.restart()
+                return ('timeout', None)
+            return self.conn.recv()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            print(f"Code worker {self.process.pid} died ({e}), restarting it")
+            self.restart()
+            return ('crashed', None)
+
+
+class CodeWorkerPool:
+    """Pool of warm worker processes executing file agent code with sticky sandbox routing."""
+
+    def __init__(self,
+                 num_workers: int = 2,
+                 cpu_seconds: Optional[float] = 60,
+                 memory_bytes: Optional[int] = 2 * 1024**3,
+                 timeout_seconds: Optional[float] = 120):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.timeout_seconds = timeout_seconds
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = [_Worker(self._context) for _ in range(num_workers)]
+        self._routes: Dict[str, _Worker] = {}
+        self._routes_lock = threading.Lock()
+
+        shm = '/dev/shm'
+        base = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else tempfile.gettempdir()
+        self._export_root = tempfile.mkdtemp(prefix='aganswers-frames-', dir=base)
+        # sandbox_id -> (version, {filename: (format, path)} written for that version)
+        self._exports: Dict[str, Tuple[int, Dict[str, Tuple[str, str]]]] = {}
+        self._exports_lock = threading.Lock()
+
+    def _route(self, sandbox_id: str) -> _Worker:
+        with self._routes_lock:
+            worker = self._routes.get(sandbox_id)
+            if worker is None:
+                load = {w: 0 for w in self._workers}
+                for routed in self._routes.values():
+                    load[routed] += 1
+                worker = min(self._workers, key=lambda w: load[w])
+                self._routes[sandbox_id] = worker
+            return worker
+
+    def _export(self, sandbox, frames: Dict[str, Any]) -> Dict[str, Tuple[str, str]]:
+        """Write the given frames of the sandbox to Arrow IPC files, once per sandbox version."""
+        with self._exports_lock:
+            previous = self._exports.get(sandbox.sandbox_id)
+            if previous and previous[0] == sandbox.version:
+                written = previous[1]
+                previous = None
+            else:
+                written = {}
+                self._exports[sandbox.sandbox_id] = (sandbox.version, written)
+        if previous:
+            shutil.rmtree(os.path.join(self._export_root, sandbox.sandbox_id, str(previous[0])), ignore_errors=True)
+
+        directory = os.path.join(self._export_root, sandbox.sandbox_id, str(sandbox.version))
+        os.makedirs(directory, exist_ok=True)
+        exported = {}
+        for filename, df in frames.items():
+            if filename not in written:
+                index = list(sandbox.dataframes).index(filename)
+                written[filename] = _write_frame(df, os.path.join(directory, f"{index}.arrow"))
+            exported[filename] = written[filename]
+        return exported
+
+    def _sync(self, worker: _Worker, sandbox) -> Tuple[str, Any]:
+        """Bring the worker's copy of the sandbox's dataframes up to date."""
+        loaded = sandbox.loaded_frames()
+        state = worker.sandboxes.get(sandbox.sandbox_id)
+        if state is None or state[0] != sandbox.version:
+            frames = self._export(sandbox, loaded)
+            for filename, df in sandbox.dataframes.items():
+                if filename not in frames:
+                    frames[filename] = ('lazy', df.metadata())
+            status, payload = worker.call(
+                ('load', sandbox.sandbox_id, frames, sandbox.plot_directory), self.timeout_seconds)
+            if status == 'ok':
+                worker.sandboxes[sandbox.sandbox_id] = (sandbox.version, set(loaded))
+            return status, payload
+
+        pending = {filename: df for filename, df in loaded.items() if filename not in state[1]}
+        if not pending:
+            return 'ok', None
+        status, payload = worker.call(
+            ('frames', sandbox.sandbox_id, self._export(sandbox, pending)), self.timeout_seconds)
+        if status == 'ok':
+            state[1].update(pending)
+        elif status == 'missing':
+            worker.sandboxes.pop(sandbox.sandbox_id, None)
+            return self._sync(worker, sandbox)
+        return status, payload
+
+    def run(self, sandbox, code: str) -> str:
+        worker = self._route(sandbox.sandbox_id)
+        with worker.lock:
+            for _ in range(2):
+                status, payload = self._sync(worker, sandbox)
+                if status != 'ok':
+                    return _error(code, f"Could not load data into the execution worker ({payload or status})")
+
+                status, payload = worker.call(
+                    ('run', sandbox.sandbox_id, code, sandbox.plot_directory, self.cpu_seconds, self.memory_bytes),
+                    self.timeout_seconds)
+                if status == 'missing':
+                    # Worker was restarted since the sandbox was loaded; load it again
+                    worker.sandboxes.pop(sandbox.sandbox_id, None)
+                    continue
+                break
+
+        if status == 'ok':
+            return payload
+        if status == 'timeout':
+            return _error(code, f"Execution timed out after {self.timeout_seconds}s. "
+                          "Variables from earlier runs were lost; the preloaded files are still available.")
+        if status == 'crashed':
+            return _error(code, "The execution worker crashed (possibly out of memory). "
+                          "Variables from earlier runs were lost; the preloaded files are still available.")
+        return _error(code, payload or status)
+
+    def drop(self, sandbox_id: str):
+        """Forget a sandbox: free its namespace in the worker and its exported files."""
+        with self._routes_lock:
+            worker = self._routes.pop(sandbox_id, None)
+        if worker is not None and sandbox_id in worker.sandboxes:
+            with worker.lock:
+                worker.sandboxes.pop(sandbox_id, None)
+                worker.call(('drop', sandbox_id), self.timeout_seconds)
+        with self._exports_lock:
+            self._exports.pop(sandbox_id, None)
+        shutil.rmtree(os.path.join(self._export_root, sandbox_id), ignore_errors=True)
+
+    def shutdown(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(('stop',))
+            except Exception:
+                pass
+            worker.kill()
+        shutil.rmtree(self._export_root, ignore_errors=True)
+
+
+def _write_frame(df, path: str) -> Tuple[str, str]:
+    try:
+        try:
+            import geopandas as gpd
+        except ImportError:
+            gpd = None
+        if gpd and isinstance(df, gpd.GeoDataFrame):
+            df.to_feather(path)
+            return ('geoarrow', path)
+
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return ('arrow', path)
+    except Exception as e:
+        print(f"Arrow export failed for {path}, falling back to pickle: {e}")
+        path = os.path.splitext(path)[0] + '.pkl'
+        with open(path, 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return ('pickle', path)
+
+
+def _error(code: str, message: str) -> str:
+    return f"```python\n{code}\n```\n\nError:\n{message}"
+
+
+_worker_pool: Optional[CodeWorkerPool] = None
+_worker_pool_failed = False
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool(start: bool = True) -> Optional[CodeWorkerPool]:
+    """
+    Return the process-wide worker pool, or None when code should run inline
+    (disabled, inside a worker, or the pool could not be started).
+    """
+    global _worker_pool, _worker_pool_failed
+    if _worker_pool is not None or not start or _worker_pool_failed or os.environ.get(_IN_WORKER_ENV):
+        return _worker_pool
+
+    num_workers = int(os.environ.get('FILE_AGENT_WORKERS', min(4, os.cpu_count() or 1)))
+    if num_workers <= 0:
+        return None
+
+    with _worker_pool_lock:
+        if _worker_pool is None and not _worker_pool_failed:
+            try:
+                _worker_pool = CodeWorkerPool(
+                    num_workers=num_workers,
+                    cpu_seconds=float(os.environ.get('FILE_AGENT_JOB_CPU_SECONDS', 60)),
+                    memory_bytes=int(os.environ.get('FILE_AGENT_JOB_MEMORY_BYTES', 2 * 1024**3)),
+                    timeout_seconds=float(os.environ.get('FILE_AGENT_JOB_TIMEOUT_SECONDS', 120)),
+                )
+                atexit.register(_worker_pool.shutdown)
+                print(f"Started file agent code worker pool with {num_workers} workers")
+            except Exception as e:
+                print(f"Could not start code worker pool, running code inline: {e}")
+                _worker_pool_failed = True
+    return _worker_pool
@@ -10,8 +10,11 @@ This script parallelizes requests to the OpenAI API while throttling to stay und
 
 Features:
 - Streams requests from file, to avoid running out of memory for giant jobs
-- Makes requests concurrently, to maximize throughput
-- Throttles request and token usage, to stay under rate limits
+- Makes requests concurrently over one pooled HTTP session, to maximize throughput
+- Packs many embeddings inputs into each request (up to max_inputs_per_request / max_tokens_per_request),
+  and splits each response back into one result per input
+- Throttles request and token usage, to stay under rate limits, lowering the limits to the
+  x-ratelimit-* values the API reports
 - Retries failed requests up to {max_attempts} times, to avoid missing data
 - Logs errors, to diagnose problems with requests
 
@@ -96,6 +99,7 @@ The script is structured as follows:
 # import tempfile
 # from langchain.llms import OpenAI
 import asyncio
+import functools
 import json
 import logging
 
@@ -105,7 +109,7 @@ import time
 
 # for storing API inputs, outputs, and metadata
 from dataclasses import dataclass, field
-from typing import Any, List
+from typing import Any, Iterator, List, Optional, Tuple
 
 import aiohttp  # for making API calls concurrently
 import tiktoken  # for counting tokens
@@ -117,8 +121,18 @@ import tiktoken  # for counting tokens
 
 class OpenAIAPIProcessor:
 
-  def __init__(self, input_prompts_list, request_url, api_key, max_requests_per_minute, max_tokens_per_minute,
-               token_encoding_name, max_attempts, logging_level):
+  def __init__(self,
+               input_prompts_list,
+               request_url,
+               api_key,
+               max_requests_per_minute,
+               max_tokens_per_minute,
+               token_encoding_name,
+               max_attempts,
+               logging_level,
+               max_inputs_per_request: int = 2048,
+               max_tokens_per_request: int = 100_000,
+               max_connections: int = 50):
     self.request_url = request_url
     self.api_key = api_key
     self.max_requests_per_minute = max_requests_per_minute
@@ -126,14 +140,42 @@ class OpenAIAPIProcessor:
     self.token_encoding_name = token_encoding_name
     self.max_attempts = max_attempts
     self.logging_level = logging_level
+    # embeddings requests pack up to this many inputs / tokens into one API call
+    self.max_inputs_per_request = max_inputs_per_request
+    self.max_tokens_per_request = min(max_tokens_per_request, max_tokens_per_minute)
+    self.max_connections = max_connections
     self.input_prompts_list: List[dict] = input_prompts_list
+    # one [request_json, response] (or [request_json, response, metadata]) per input prompt
     self.results = []
     self.cleaned_results: List[str] = []
 
+  def _requests(self, api_endpoint: str) -> Iterator[Tuple[dict, List[dict], int]]:
+    """
+    Yield (request_json, items, token_consumption). Consecutive embeddings prompts with the same
+    parameters are packed into one request with a list input; other prompts are sent one by one.
+    """
+    batch: List[dict] = []
+    batch_key = None
+    batch_tokens = 0
+    for request_json in self.input_prompts_list:
+      tokens = num_tokens_consumed_from_request(request_json, api_endpoint, self.token_encoding_name)
+      if api_endpoint != "embeddings" or not isinstance(request_json.get("input"), str):
+        yield request_json, [], tokens
+        continue
+      key = json.dumps({k: v for k, v in request_json.items() if k not in ("input", "metadata")}, sort_keys=True)
+      if batch and (key != batch_key or len(batch) >= self.max_inputs_per_request or
+                    batch_tokens + tokens > self.max_tokens_per_request):
+        yield _batched_request(batch), batch, batch_tokens
+        batch, batch_tokens = [], 0
+      batch.append(request_json)
+      batch_key = key
+      batch_tokens += tokens
+    if batch:
+      yield _batched_request(batch), batch, batch_tokens
+
   async def process_api_requests_from_file(self):
     """Processes API requests in parallel, throttling to stay under rate limits."""
     # constants
-    seconds_to_pause_after_rate_limit_error = 15
     seconds_to_sleep_each_loop = 0.001  # 1 ms limits max throughput to 1,000 requests per second
 
     # initialize logging
@@ -150,120 +192,151 @@ class OpenAIAPIProcessor:
     status_tracker = StatusTracker()  # single instance to track a collection of variables
     next_request = None  # variable to hold the next request to call
 
-    # initialize available capacity counts
-    available_request_capacity = self.max_requests_per_minute
-    available_token_capacity = self.max_tokens_per_minute
+    # initialize available capacity counts; the limits are lowered to the ones the API reports
+    max_requests_per_minute = self.max_requests_per_minute
+    max_tokens_per_minute = self.max_tokens_per_minute
+    available_request_capacity = max_requests_per_minute
+    available_token_capacity = max_tokens_per_minute
     last_update_time = time.time()
 
     # initialize flags
     file_not_finished = True  # after file is empty, we'll skip reading it
     logging.debug("Initialization complete.")
 
-    requests = self.input_prompts_list.__iter__()
+    requests = self._requests(api_endpoint)
 
     logging.debug("File opened. Entering main loop")
 
     task_list = []
 
-    while True:
-      # get next request (if one is not already waiting for capacity)
-      if next_request is None:
-        if not queue_of_requests_to_retry.empty():
-          next_request = queue_of_requests_to_retry.get_nowait()
-          logging.debug(f"Retrying request {next_request.task_id}: {next_request}")
-        elif file_not_finished:
-          try:
-            # get new request
-            # request_json = json.loads(next(requests))
-            request_json = next(requests)
-
-            next_request = APIRequest(task_id=next(task_id_generator),
-                                      request_json=request_json,
-                                      token_consumption=num_tokens_consumed_from_request(
-                                          request_json, api_endpoint, self.token_encoding_name),
-                                      attempts_left=self.max_attempts,
-                                      metadata=request_json.pop("metadata", None))
-            status_tracker.num_tasks_started += 1
-            status_tracker.num_tasks_in_progress += 1
-            logging.debug(f"Reading request {next_request.task_id}: {next_request}")
-          except StopIteration:
-            # if file runs out, set flag to stop reading it
-            logging.debug("Read file exhausted")
-            file_not_finished = False
-
-      # update available capacity
-      current_time = time.time()
-      seconds_since_update = current_time - last_update_time
-      available_request_capacity = min(
-          available_request_capacity + self.max_requests_per_minute * seconds_since_update / 60.0,
-          self.max_requests_per_minute,
-      )
-      available_token_capacity = min(
-          available_token_capacity + self.max_tokens_per_minute * seconds_since_update / 60.0,
-          self.max_tokens_per_minute,
-      )
-      last_update_time = current_time
-
-      # if enough capacity available, call API
-      if next_request:
-        next_request_tokens = next_request.token_consumption
-        if (available_request_capacity >= 1 and available_token_capacity >= next_request_tokens):
-          # update counters
-          available_request_capacity -= 1
-          available_token_capacity -= next_request_tokens
-          next_request.attempts_left -= 1
-
-          # call API
-          # TODO: NOT SURE RESPONSE WILL WORK HERE
-          task = asyncio.create_task(
-              next_request.call_api(
-                  request_url=self.request_url,
-                  request_header=request_header,
-                  retry_queue=queue_of_requests_to_retry,
-                  status_tracker=status_tracker,
-              ))
-          task_list.append(task)
-          next_request = None  # reset next_request to empty
-
-          # print("status_tracker.num_tasks_in_progress", status_tracker.num_tasks_in_progress)
-          # one_task_result = task.result()
-          # print("one_task_result", one_task_result)
-
-      # if all tasks are finished, break
-      if status_tracker.num_tasks_in_progress == 0:
-        break
-
-      # main loop sleeps briefly so concurrent tasks can run
-      await asyncio.sleep(seconds_to_sleep_each_loop)
-
-      # if a rate limit error was hit recently, pause to cool down
-      seconds_since_rate_limit_error = (time.time() - status_tracker.time_of_last_rate_limit_error)
-      if seconds_since_rate_limit_error < seconds_to_pause_after_rate_limit_error:
-        remaining_seconds_to_pause = (seconds_to_pause_after_rate_limit_error - seconds_since_rate_limit_error)
-        await asyncio.sleep(remaining_seconds_to_pause)
-        # ^e.g., if pause is 15 seconds and final limit was hit 5 seconds ago
-        logging.warn(
-            f"Pausing to cool down until {time.ctime(status_tracker.time_of_last_rate_limit_error + seconds_to_pause_after_rate_limit_error)}"
+    # one pooled session for every request, instead of a new connection per call
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections)) as session:
+      while True:
+        # get next request (if one is not already waiting for capacity)
+        if next_request is None:
+          if not queue_of_requests_to_retry.empty():
+            next_request = queue_of_requests_to_retry.get_nowait()
+            logging.debug(f"Retrying request {next_request.task_id}: {next_request}")
+          elif file_not_finished:
+            try:
+              # get new request
+              request_json, items, token_consumption = next(requests)
+
+              next_request = APIRequest(task_id=next(task_id_generator),
+                                        request_json=request_json,
+                                        token_consumption=token_consumption,
+                                        attempts_left=self.max_attempts,
+                                        metadata=request_json.pop("metadata", None),
+                                        items=items)
+              status_tracker.num_tasks_started += 1
+              status_tracker.num_tasks_in_progress += 1
+              logging.debug(f"Reading request {next_request.task_id}: {len(items) or 1} inputs")
+            except StopIteration:
+              # if file runs out, set flag to stop reading it
+              logging.debug("Read file exhausted")
+              file_not_finished = False
+
+        # adapt to the rate limits reported in the latest response headers
+        if status_tracker.rate_limit_headers_updated:
+          status_tracker.rate_limit_headers_updated = False
+          if status_tracker.rate_limit_limit_requests:
+            max_requests_per_minute = min(self.max_requests_per_minute, status_tracker.rate_limit_limit_requests)
+          if status_tracker.rate_limit_limit_tokens:
+            max_tokens_per_minute = min(self.max_tokens_per_minute, status_tracker.rate_limit_limit_tokens)
+          if status_tracker.rate_limit_remaining_requests is not None:
+            available_request_capacity = min(available_request_capacity, status_tracker.rate_limit_remaining_requests)
+          if status_tracker.rate_limit_remaining_tokens is not None:
+            available_token_capacity = min(available_token_capacity, status_tracker.rate_limit_remaining_tokens)
+
+        # update available capacity
+        current_time = time.time()
+        seconds_since_update = current_time - last_update_time
+        available_request_capacity = min(
+            available_request_capacity + max_requests_per_minute * seconds_since_update / 60.0,
+            max_requests_per_minute,
         )
-
-    # after finishing, log final status
-    logging.info("""Parallel processing complete. About to return.""")
-    if status_tracker.num_tasks_failed > 0:
-      logging.warning(f"{status_tracker.num_tasks_failed} / {status_tracker.num_tasks_started} requests failed.")
-    if status_tracker.num_rate_limit_errors > 0:
-      logging.warning(
-          f"{status_tracker.num_rate_limit_errors} rate limit errors received. Consider running at a lower rate.")
-
-    # asyncio wait for task_list
-    await asyncio.wait(task_list)
+        available_token_capacity = min(
+            available_token_capacity + max_tokens_per_minute * seconds_since_update / 60.0,
+            max_tokens_per_minute,
+        )
+        last_update_time = current_time
+
+        # if enough capacity available, call API
+        if next_request:
+          # a request bigger than the whole per-minute budget waits for a full bucket instead of forever
+          next_request_tokens = min(next_request.token_consumption, max_tokens_per_minute)
+          if (available_request_capacity >= 1 and available_token_capacity >= next_request_tokens):
+            # update counters
+            available_request_capacity -= 1
+            available_token_capacity -= next_request_tokens
+            next_request.attempts_left -= 1
+
+            # call API
+            task = asyncio.create_task(
+                next_request.call_api(
+                    session=session,
+                    request_url=self.request_url,
+                    request_header=request_header,
+                    retry_queue=queue_of_requests_to_retry,
+                    status_tracker=status_tracker,
+                ))
+            task_list.append(task)
+            next_request = None  # reset next_request to empty
+
+        # if all tasks are finished, break
+        if status_tracker.num_tasks_in_progress == 0:
+          break
+
+        # main loop sleeps briefly so concurrent tasks can run
+        await asyncio.sleep(seconds_to_sleep_each_loop)
+
+        # if a rate limit error was hit recently, pause to cool down
+        seconds_since_rate_limit_error = (time.time() - status_tracker.time_of_last_rate_limit_error)
+        if seconds_since_rate_limit_error < status_tracker.seconds_to_pause_after_rate_limit_error:
+          remaining_seconds_to_pause = (status_tracker.seconds_to_pause_after_rate_limit_error -
+                                        seconds_since_rate_limit_error)
+          await asyncio.sleep(remaining_seconds_to_pause)
+          # ^e.g., if pause is 15 seconds and final limit was hit 5 seconds ago
+          logging.warning(
+              f"Pausing to cool down until {time.ctime(status_tracker.time_of_last_rate_limit_error + status_tracker.seconds_to_pause_after_rate_limit_error)}"
+          )
+
+      # after finishing, log final status
+      logging.info("""Parallel processing complete. About to return.""")
+      if status_tracker.num_tasks_failed > 0:
+        logging.warning(f"{status_tracker.num_tasks_failed} / {status_tracker.num_tasks_started} requests failed.")
+      if status_tracker.num_rate_limit_errors > 0:
+        logging.warning(
+            f"{status_tracker.num_rate_limit_errors} rate limit errors received. Consider running at a lower rate.")
+
+      # asyncio wait for task_list
+      if task_list:
+        await asyncio.wait(task_list)
 
     for task in task_list:
-      openai_completion = task.result()
-      self.results.append(openai_completion)
+      # attempts that were queued for a retry return None
+      if task.result() is not None:
+        self.results.extend(task.result())
 
     self.cleaned_results: List[str] = extract_context_from_results(self.results)
 
 
+def _batched_request(items: List[dict]) -> dict:
+  """One embeddings request for several single-input prompts with the same parameters."""
+  request_json = {k: v for k, v in items[0].items() if k not in ("input", "metadata")}
+  request_json["input"] = [item["input"] for item in items]
+  return request_json
+
+
+def _duration_seconds(value: Optional[str]) -> Optional[float]:
+  """Seconds in an x-ratelimit-reset-* header value such as "20ms", "1s" or "6m0s"."""
+  if not value:
+    return None
+  units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+  parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+  return sum(float(amount) * units[unit] for amount, unit in parts) if parts else None
+
+
 def extract_context_from_results(results: List[Any]) -> List[str]:
   assistant_contents = []
   total_prompt_tokens = 0
@@ -298,21 +371,82 @@ class StatusTracker:
   num_api_errors: int = 0  # excluding rate limit errors, counted above
   num_other_errors: int = 0
   time_of_last_rate_limit_error: float = 0  # used to cool off after hitting rate limits
+  seconds_to_pause_after_rate_limit_error: float = 15  # lowered to the reported reset time when there is one
+  # latest x-ratelimit-* response headers
+  rate_limit_limit_requests: Optional[int] = None
+  rate_limit_limit_tokens: Optional[int] = None
+  rate_limit_remaining_requests: Optional[int] = None
+  rate_limit_remaining_tokens: Optional[int] = None
+  rate_limit_reset_seconds: Optional[float] = None
+  rate_limit_headers_updated: bool = False
+
+  def update_rate_limits(self, headers) -> None:
+    """Record the rate limit headers of a response, for the main loop to apply."""
+
+    def header_int(name: str) -> Optional[int]:
+      try:
+        return int(float(headers[name]))
+      except (KeyError, TypeError, ValueError):
+        return None
+
+    if "x-ratelimit-remaining-requests" not in headers and "x-ratelimit-remaining-tokens" not in headers:
+      return
+    self.rate_limit_limit_requests = header_int("x-ratelimit-limit-requests")
+    self.rate_limit_limit_tokens = header_int("x-ratelimit-limit-tokens")
+    self.rate_limit_remaining_requests = header_int("x-ratelimit-remaining-requests")
+    self.rate_limit_remaining_tokens = header_int("x-ratelimit-remaining-tokens")
+    resets = [
+        seconds for seconds in (_duration_seconds(headers.get("x-ratelimit-reset-requests")),
+                                _duration_seconds(headers.get("x-ratelimit-reset-tokens"))) if seconds is not None
+    ]
+    self.rate_limit_reset_seconds = max(resets) if resets else None
+    self.rate_limit_headers_updated = True
 
 
 @dataclass
 class APIRequest:
-  """Stores an API request's inputs, outputs, and other metadata. Contains a method to make an API call."""
+  """
+  Stores an API request's inputs, outputs, and other metadata. Contains a method to make an API call.
+  A batched embeddings request keeps its single-input prompts in items, and its response is split
+  back into one result per prompt.
+  """
 
   task_id: int
   request_json: dict
   token_consumption: int
   attempts_left: int
   metadata: dict
+  items: List[dict] = field(default_factory=list)
   result: list = field(default_factory=list)
 
+  def _missing_inputs(self, response: dict) -> List[int]:
+    """Positions of a batched request's inputs that have no data entry in response."""
+    returned = {datum.get("index") for datum in response.get("data") or []}
+    return [i for i in range(len(self.items)) if i not in returned]
+
+  def _results(self, response) -> List[list]:
+    """[request_json, response(, metadata)] per prompt; response is the list of errors on failure."""
+    if not self.items:
+      return [[self.request_json, response, self.metadata] if self.metadata else [self.request_json, response]]
+    data = {}
+    if isinstance(response, dict):
+      data = {datum["index"]: datum for datum in response.get("data", [])}
+    results = []
+    for i, item in enumerate(self.items):
+      metadata = item.pop("metadata", None)
+      if i in data:
+        item_response = {**response, "data": [data[i]]}
+      elif isinstance(response, dict):
+        # Never hand out the whole response: its data belongs to the other inputs
+        item_response = [f"Response of request {self.task_id} has no embedding for input {i}"]
+      else:
+        item_response = response
+      results.append([item, item_response, metadata] if metadata else [item, item_response])
+    return results
+
   async def call_api(
       self,
+      session: aiohttp.ClientSession,
       request_url: str,
       request_header: dict,
       retry_queue: asyncio.Queue,
@@ -322,17 +456,26 @@ class APIRequest:
     # logging.info(f"Starting request #{self.task_id}")
     error = None
     try:
-      async with aiohttp.ClientSession() as session:
-        async with session.post(url=request_url, headers=request_header, json=self.request_json) as response:
-          response = await response.json()
+      async with session.post(url=request_url, headers=request_header, json=self.request_json) as response:
+        status_tracker.update_rate_limits(response.headers)
+        response = await response.json()
       if "error" in response:
         logging.warning(f"Request {self.task_id} failed with error {response['error']}")
         status_tracker.num_api_errors += 1
         error = response
         if "Rate limit" in response["error"].get("message", ""):
           status_tracker.time_of_last_rate_limit_error = time.time()
+          if status_tracker.rate_limit_reset_seconds is not None:
+            status_tracker.seconds_to_pause_after_rate_limit_error = min(15, status_tracker.rate_limit_reset_seconds)
           status_tracker.num_rate_limit_errors += 1
           status_tracker.num_api_errors -= 1  # rate limit errors are counted separately
+      elif self.items:
+        missing = self._missing_inputs(response)
+        if missing:
+          # Retried like an API error rather than giving these inputs another input's embedding
+          logging.warning(f"Request {self.task_id} returned no embeddings for inputs {missing}")
+          status_tracker.num_api_errors += 1
+          error = f"Response has no embeddings for inputs {missing}"
 
     except Exception as e:  # catching naked exceptions is bad practice, but in this case we'll log & save them
       logging.warning(f"Request {self.task_id} failed with Exception {e}")
@@ -343,22 +486,19 @@ class APIRequest:
       if self.attempts_left:
         retry_queue.put_nowait(self)
       else:
-        logging.error(f"Request {self.request_json} failed after all attempts. Saving errors: {self.result}")
-        data = ([self.request_json, [str(e) for e in self.result], self.metadata]
-                if self.metadata else [self.request_json, [str(e) for e in self.result]])
+        logging.error(
+            f"Request {self.task_id} ({len(self.items) or 1} inputs) failed after all attempts. Saving errors: {self.result}")
         #append_to_jsonl(data, save_filepath)
         status_tracker.num_tasks_in_progress -= 1
         status_tracker.num_tasks_failed += 1
-        return data
+        return self._results([str(e) for e in self.result])
     else:
-      data = ([self.request_json, response, self.metadata] if self.metadata else [self.request_json, response]
-             )  # type: ignore
       #append_to_jsonl(data, save_filepath)
       status_tracker.num_tasks_in_progress -= 1
       status_tracker.num_tasks_succeeded += 1
       # logging.debug(f"Request {self.task_id} saved to {save_filepath}")
 
-      return data
+      return self._results(response)
 
 
 # functions
@@ -380,13 +520,19 @@ def append_to_jsonl(data, filename: str) -> None:
     f.write(json_string + "\n")
 
 
+@functools.lru_cache(maxsize=None)
+def get_encoding(token_encoding_name: str) -> tiktoken.Encoding:
+  """tiktoken encoding, loaded once per process."""
+  return tiktoken.get_encoding(token_encoding_name)
+
+
 def num_tokens_consumed_from_request(
     request_json: dict,
     api_endpoint: str,
     token_encoding_name: str,
 ):
   """Count the number of tokens in the request. Only supports completion and embedding requests."""
-  encoding = tiktoken.get_encoding(token_encoding_name)
+  encoding = get_encoding(token_encoding_name)
   # if completions request, tokens = prompt + n * max_tokens
   if api_endpoint.endswith("completions"):
     max_tokens = request_json.get("max_tokens", 15)
@@ -55,7 +55,8 @@ def loader():
       aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
   )
   canvas_client = Canvas("https://canvas.illinois.edu", os.getenv('CANVAS_ACCESS_TOKEN'))
-  posthog = Posthog(sync_mode=True, project_api_key=os.environ['POSTHOG_API_KEY'], host='https://app.posthog.com')
+  # Async mode: the client's own background consumer batches events
+  posthog = Posthog(sync_mode=False, project_api_key=os.environ['POSTHOG_API_KEY'], host='https://app.posthog.com')
 
   sentry_sdk.init(
       dsn="https://examplePublicKey@o0.ingest.sentry.io/0",
@@ -0,0 +1,212 @@
+"""
+Content-addressed embedding cache for the Beam ingest.
+
+Embeddings are stored under (model, sha256(text)), so a chunk text that was
+embedded once (boilerplate headers, a re-upload to another course, the
+cropwizard mirror, a repeated crawl) is never sent to the embeddings API again.
+split_and_upload looks every chunk up first and only embeds the misses.
+
+Vectors are stored as float32 little-endian bytes, like document_chunks.
+
+Backends, chosen by EMBEDDING_CACHE_BACKEND:
+    none       no caching (default)
+    sqlite     a local SQLite file at EMBEDDING_CACHE_PATH
+    lmdb       a local LMDB environment at EMBEDDING_CACHE_PATH (needs the `lmdb` package)
+    supabase   the embedding_cache table (migrations/add_embedding_cache.sql), shared by all workers
+
+The local backends only help within one container unless EMBEDDING_CACHE_PATH
+is on a mounted volume. A cache error is logged and treated as a miss; it never
+fails an ingest.
+"""
+
+import array
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+def text_hash(text: str) -> str:
+  return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def encode_vector(embedding: Iterable[float]) -> bytes:
+  values = array.array('f', embedding)
+  if sys.byteorder != 'little':
+    values.byteswap()
+  return values.tobytes()
+
+
+def decode_vector(data: bytes) -> List[float]:
+  values = array.array('f')
+  values.frombytes(data)
+  if sys.byteorder != 'little':
+    values.byteswap()
+  return values.tolist()
+
+
+class EmbeddingCache(ABC):
+  """(model, sha256(text)) -> embedding. Subclasses implement _get and _put on hashes."""
+
+  def __init__(self):
+    self.hits = 0
+    self.misses = 0
+
+  @abstractmethod
+  def _get(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+    """hash -> embedding for the hashes that are stored."""
+
+  @abstractmethod
+  def _put(self, model: str, vectors: Dict[str, List[float]]):
+    """Store hash -> embedding."""
+
+  def get_many(self, model: str, texts: List[str]) -> Dict[str, List[float]]:
+    """text -> cached embedding, for the texts that are cached."""
+    by_hash = {text_hash(text): text for text in texts}
+    try:
+      found = self._get(model, list(by_hash))
+    except Exception as e:
+      print(f"Embedding cache read failed, embedding everything: {e}")
+      found = {}
+    self.hits += len(found)
+    self.misses += len(by_hash) - len(found)
+    return {by_hash[h]: embedding for h, embedding in found.items() if h in by_hash}
+
+  def put_many(self, model: str, embeddings: Dict[str, List[float]]):
+    if not embeddings:
+      return
+    try:
+      self._put(model, {text_hash(text): embedding for text, embedding in embeddings.items()})
+    except Exception as e:
+      print(f"Embedding cache write failed: {e}")
+
+  def embed(self, model: str, texts: List[str],
+            embed_fn: Callable[[List[str]], Dict[str, List[float]]]) -> Dict[str, List[float]]:
+    """text -> embedding for all texts; only the cache misses are passed to embed_fn, and then cached."""
+    texts = list(dict.fromkeys(texts))
+    embeddings = self.get_many(model, texts)
+    missing = [text for text in texts if text not in embeddings]
+    print(f"Embedding cache: {len(embeddings)} hits, {len(missing)} misses")
+    if missing:
+      embedded = embed_fn(missing)
+      self.put_many(model, embedded)
+      embeddings.update(embedded)
+    return embeddings
+
+
+class SQLiteEmbeddingCache(EmbeddingCache):
+
+  def __init__(self, path: str):
+    super().__init__()
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self._lock = threading.Lock()
+    with self._lock, self._conn:
+      self._conn.execute('PRAGMA journal_mode=WAL')
+      self._conn.execute('CREATE TABLE IF NOT EXISTS embedding_cache ('
+                         'model TEXT NOT NULL, text_hash TEXT NOT NULL, embedding BLOB NOT NULL, '
+                         'PRIMARY KEY (model, text_hash)) WITHOUT ROWID')
+
+  def _get(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+    found = {}
+    with self._lock:
+      for start in range(0, len(hashes), 500):
+        batch = hashes[start:start + 500]
+        rows = self._conn.execute(
+            f"SELECT text_hash, embedding FROM embedding_cache WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+            [model, *batch]).fetchall()
+        found.update((h, decode_vector(data)) for h, data in rows)
+    return found
+
+  def _put(self, model: str, vectors: Dict[str, List[float]]):
+    with self._lock, self._conn:
+      self._conn.executemany('INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding) VALUES (?, ?, ?)',
+                             [(model, h, encode_vector(embedding)) for h, embedding in vectors.items()])
+
+
+class LMDBEmbeddingCache(EmbeddingCache):
+
+  def __init__(self, path: str, map_size: int = 8 * 1024**3):
+    super().__init__()
+    import lmdb  # optional dependency, only needed for this backend
+
+    self._env = lmdb.open(path, map_size=map_size, subdir=True, lock=True)
+
+  @staticmethod
+  def _key(model: str, h: str) -> bytes:
+    return f"{model}:{h}".encode('utf-8')
+
+  def _get(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+    found = {}
+    with self._env.begin() as txn:
+      for h in hashes:
+        data = txn.get(self._key(model, h))
+        if data is not None:
+          found[h] = decode_vector(data)
+    return found
+
+  def _put(self, model: str, vectors: Dict[str, List[float]]):
+    with self._env.begin(write=True) as txn:
+      for h, embedding in vectors.items():
+        txn.put(self._key(model, h), encode_vector(embedding))
+
+
+class SupabaseEmbeddingCache(EmbeddingCache):
+  """The embedding_cache table; embeddings go through PostgREST as hex BYTEA."""
+
+  def __init__(self, supabase_client, table: str = 'embedding_cache'):
+    super().__init__()
+    self.supabase_client = supabase_client
+    self.table = table
+
+  def _get(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+    found = {}
+    # Hashes are 64 characters; keep the IN list well under PostgREST's URL limit
+    for start in range(0, len(hashes), 100):
+      rows = self.supabase_client.table(self.table).select('text_hash, embedding').eq('model', model).in_(
+          'text_hash', hashes[start:start + 100]).execute().data or []
+      for row in rows:
+        value = row['embedding']
+        found[row['text_hash']] = decode_vector(bytes.fromhex(value[2:] if value.startswith('\\x') else value))
+    return found
+
+  def _put(self, model: str, vectors: Dict[str, List[float]]):
+    rows = [{
+        'model': model,
+        'text_hash': h,
+        'embedding': '\\x' + encode_vector(embedding).hex()
+    } for h, embedding in vectors.items()]
+    for start in range(0, len(rows), 200):
+      self.supabase_client.table(self.table).upsert(rows[start:start + 200], on_conflict='model,text_hash').execute()
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(supabase_client=None) -> Optional[EmbeddingCache]:
+  """The process-wide cache configured by EMBEDDING_CACHE_BACKEND, or None when caching is off."""
+  global _embedding_cache
+  backend = os.getenv('EMBEDDING_CACHE_BACKEND', 'none').lower()
+  if backend in ('', 'none'):
+    return None
+  if _embedding_cache is None:
+    with _embedding_cache_lock:
+      if _embedding_cache is None:
+        try:
+          if backend == 'sqlite':
+            _embedding_cache = SQLiteEmbeddingCache(os.getenv('EMBEDDING_CACHE_PATH', '/tmp/embedding_cache.sqlite'))
+          elif backend == 'lmdb':
+            _embedding_cache = LMDBEmbeddingCache(os.getenv('EMBEDDING_CACHE_PATH', '/tmp/embedding_cache.lmdb'))
+          elif backend == 'supabase' and supabase_client is not None:
+            _embedding_cache = SupabaseEmbeddingCache(supabase_client,
+                                                      os.getenv('EMBEDDING_CACHE_TABLE', 'embedding_cache'))
+          else:
+            print(f"Unknown EMBEDDING_CACHE_BACKEND {backend!r}, embedding without a cache")
+            return None
+        except Exception as e:
+          print(f"Could not open the {backend} embedding cache, embedding without it: {e}")
+          return None
+  return _embedding_cache
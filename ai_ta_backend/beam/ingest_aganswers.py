@@ -17,14 +17,18 @@ from beam import QueueDepthAutoscaler  # RequestLatencyAutoscaler,
 if beam.env.is_remote():
   # Only import these in the Cloud container, not when building the container.
   import asyncio
+  import atexit
+  import datetime
   import inspect
   import json
   import logging
   import mimetypes
   import os
+  import queue
   import re
   import shutil
   import subprocess
+  import threading
   import time
   import traceback
   import uuid
@@ -36,6 +40,7 @@ if beam.env.is_remote():
   import boto3
   import fitz
   import openai
+  import pandas as pd
   import pdfplumber
   import pytesseract
   import sentry_sdk
@@ -55,9 +60,11 @@ if beam.env.is_remote():
   from langchain.schema import Document
   from langchain.text_splitter import RecursiveCharacterTextSplitter
   from langchain.vectorstores import Qdrant
+  from embedding_cache import get_embedding_cache
   from OpenaiEmbeddings import OpenAIAPIProcessor
   from PIL import Image
-  from posthog import Posthog
+  from posthog.request import batch_post
+  from posthog.utils import clean
   from pydub import AudioSegment
   from qdrant_client import QdrantClient, models
   from qdrant_client.models import PointStruct
@@ -76,6 +83,7 @@ if beam.env.is_remote():
 requirements = [
     "openai<1.0",
     "pandas",
+    "pyarrow",
     "supabase==2.5.3",
     "tiktoken==0.5.1",
     "boto3==1.28.79",
@@ -112,6 +120,71 @@ autoscaler = QueueDepthAutoscaler(tasks_per_container=300, max_containers=3)
 
 
 
+class AnalyticsDispatcher:
+  """
+  Queue-backed stand-in for a Posthog client's capture(), so ingest never waits on analytics.
+  Events go on a bounded queue (dropped when it is full) and a daemon thread sends them to
+  PostHog in batches; queued events are flushed at exit.
+  Mirrors ai_ta_backend/utils/analytics_dispatcher.py (this module is deployed standalone).
+  """
+
+  def __init__(self, api_key: str, max_queue_size: int = 10_000, batch_size: int = 100, flush_interval: float = 1.0):
+    self.api_key = api_key
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self._queue = queue.Queue(maxsize=max_queue_size)
+    self.dropped = 0
+    threading.Thread(target=self._run, daemon=True).start()
+    atexit.register(self.flush, 10.0)
+
+  def capture(self, distinct_id: str, event: str, properties: Optional[Dict[str, Any]] = None) -> bool:
+    message = {
+        'type': 'capture',
+        'event': event,
+        'distinct_id': distinct_id,
+        'properties': {
+            **(properties or {}), '$lib': 'posthog-python'
+        },
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'uuid': str(uuid.uuid4()),
+    }
+    try:
+      self._queue.put_nowait(message)
+      return True
+    except queue.Full:
+      self.dropped += 1
+      return False
+
+  def _run(self):
+    while True:
+      batch = [self._queue.get()]
+      deadline = time.monotonic() + self.flush_interval
+      while len(batch) < self.batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          break
+        try:
+          batch.append(self._queue.get(timeout=remaining))
+        except queue.Empty:
+          break
+      try:
+        batch_post(self.api_key, host='https://app.posthog.com', timeout=15, batch=[clean(m) for m in batch])
+      except Exception as e:
+        print(f"Failed to send {len(batch)} analytics events: {e}")
+      finally:
+        for _ in batch:
+          self._queue.task_done()
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
+    """Wait until every queued event was sent (or failed); False on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while self._queue.unfinished_tasks:
+      if deadline is not None and time.monotonic() >= deadline:
+        return False
+      time.sleep(0.05)
+    return True
+
+
 def loader():
   """
   The loader function will run once for each worker that starts up. https://docs.beam.cloud/deployment/loaders
@@ -148,7 +221,7 @@ def loader():
       supabase_key=os.environ['AGANSWERS_SUPABASE_API_KEY'],
       options=ClientOptions(postgrest_client_timeout=60,))
 
-  posthog = Posthog(sync_mode=True, project_api_key=os.environ['AGANSWERS_POSTHOG_API_KEY'], host='https://app.posthog.com')
+  posthog = AnalyticsDispatcher(os.environ['AGANSWERS_POSTHOG_API_KEY'])
 
   return qdrant_client, vectorstore, s3_client, supabase_client, posthog
 
@@ -870,6 +943,8 @@ class Ingest():
         loader = UnstructuredExcelLoader(tmpfile.name, mode="elements")
         # loader = SRTLoader(tmpfile.name)
         documents = loader.load()
+        tabular_metadata = self._write_tabular_sidecar(tmpfile.name, s3_path, os.getenv('AGANSWERS_S3_BUCKET_NAME'),
+                                                       'xlsx')
 
         texts = [doc.page_content for doc in documents]
         metadatas: List[Dict[str, Any]] = [{
@@ -883,7 +958,7 @@ class Ingest():
             'base_url': kwargs.get('base_url', ''),
         } for doc in documents]
 
-        self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
+        self.split_and_upload(texts=texts, metadatas=metadatas, tabular_metadata=tabular_metadata, **kwargs)
         return "Success"
     except Exception as e:
       err = f"❌❌ Error in (Excel/xlsx ingest): `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
@@ -937,6 +1012,8 @@ class Ingest():
 
         loader = CSVLoader(file_path=tmpfile.name)
         documents = loader.load()
+        tabular_metadata = self._write_tabular_sidecar(tmpfile.name, s3_path, os.getenv('AGANSWERS_S3_BUCKET_NAME'),
+                                                       'csv')
 
         texts = [doc.page_content for doc in documents]
         metadatas: List[Dict[str, Any]] = [{
@@ -950,7 +1027,7 @@ class Ingest():
             'base_url': kwargs.get('base_url', ''),
         } for doc in documents]
 
-        self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
+        self.split_and_upload(texts=texts, metadatas=metadatas, tabular_metadata=tabular_metadata, **kwargs)
         return "Success"
     except Exception as e:
       err = f"❌❌ Error in (CSV ingest): `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
@@ -1241,6 +1318,23 @@ class Ingest():
       contexts: List[Document] = text_splitter.create_documents(texts=texts, metadatas=metadatas)
       input_texts = [{'input': context.page_content, 'model': 'text-embedding-ada-002'} for context in contexts]
 
+      # A changed version of a document stored with chunk hashes is updated chunk by chunk
+      if os.getenv('INCREMENTAL_REINGEST', 'false').lower() == 'true':
+        status = self._incremental_reingest(contexts, metadatas, **kwargs)
+        if status is not None:
+          self.posthog.capture('distinct_id_of_the_user',
+                               event='split_and_upload_succeeded',
+                               properties={
+                                   'course_name': metadatas[0].get('course_name', None),
+                                   's3_path': metadatas[0].get('s3_path', None),
+                                   'readable_filename': metadatas[0].get('readable_filename', None),
+                                   'url': metadatas[0].get('url', None),
+                                   'base_url': metadatas[0].get('base_url', None),
+                                   'is_duplicate': status == 'duplicate',
+                                   'is_incremental': True,
+                               })
+          return "Success"
+
       # check for duplicates
       is_duplicate = self.check_for_duplicates(input_texts, metadatas)
       if is_duplicate:
@@ -1262,33 +1356,21 @@ class Ingest():
         context.metadata['chunk_index'] = i
         context.metadata['doc_groups'] = kwargs.get('groups', [])
 
-      openai_embeddings_key = os.getenv('AGANSWERS_OPENAI_KEY')
-
-      print("Starting to call embeddings API")
-      embeddings_start_time = time.monotonic()
-      oai = OpenAIAPIProcessor(
-          input_prompts_list=input_texts,
-          request_url='https://api.openai.com/v1/embeddings',
-          api_key=openai_embeddings_key,
-          max_requests_per_minute=10_000,
-          max_tokens_per_minute=10_000_000,
-          max_attempts=1_000,
-          logging_level=logging.INFO,
-          token_encoding_name='cl100k_base')
-      asyncio.run(oai.process_api_requests_from_file())
-      print(f"⏰ embeddings runtime: {(time.monotonic() - embeddings_start_time):.2f} seconds")
-      # parse results into dict of shape page_content -> embedding
-      embeddings_dict: dict[str, List[float]] = {
-          item[0]['input']: item[1]['data'][0]['embedding'] for item in oai.results
-      }
+      embeddings_dict = self._embed_texts([context.page_content for context in contexts])
 
       ### BULK upload to Qdrant ###
+      # Hash-derived point ids let a later re-ingest update this document chunk by chunk
+      hash_columns = self._document_hash_columns(contexts[0].metadata.get('s3_path'), contexts[0].metadata.get('url'),
+                                                 [context.page_content for context in contexts])
+      point_ids = (self._chunk_point_ids(metadatas[0].get('course_name'), hash_columns['source_key'],
+                                         hash_columns['chunk_hashes'])
+                   if hash_columns else [str(uuid.uuid4()) for _ in contexts])
       vectors: list[PointStruct] = []
-      for context in contexts:
+      for point_id, context in zip(point_ids, contexts):
         # !DONE: Updated the payload so each key is top level (no more payload.metadata.course_name. Instead, use payload.course_name), great for creating indexes.
         upload_metadata = {**context.metadata, "page_content": context.page_content}
         vectors.append(
-            PointStruct(id=str(uuid.uuid4()), vector=embeddings_dict[context.page_content], payload=upload_metadata))
+            PointStruct(id=point_id, vector=embeddings_dict[context.page_content], payload=upload_metadata))
 
       try:
         self.qdrant_client.upsert(
@@ -1315,49 +1397,32 @@ class Ingest():
           "embedding": embeddings_dict[context.page_content]
       } for context in contexts]
 
+      # With the chunk store, chunks go to document_chunks instead of the contexts array
+      use_chunk_store = os.getenv('DOCUMENT_CHUNK_STORE', 'false').lower() == 'true'
       document = {
           "course_name": contexts[0].metadata.get('course_name'),
           "s3_path": contexts[0].metadata.get('s3_path'),
           "readable_filename": contexts[0].metadata.get('readable_filename'),
           "url": contexts[0].metadata.get('url'),
           "base_url": contexts[0].metadata.get('base_url'),
-          "contexts": contexts_for_supa,
+          "contexts": [] if use_chunk_store else contexts_for_supa,
+          # Parquet sidecar fields for CSV/Excel (see _write_tabular_sidecar)
+          **kwargs.get('tabular_metadata', {}),
+          **hash_columns,
       }
 
-      # Calculate the size of the document object in MB
-      document_size_mb = len(json.dumps(document).encode('utf-8')) / (1024 * 1024)
-      print(f"Document size: {document_size_mb:.2f} MB")
-
       response = self.supabase_client.table(DOCUMENTS_TABLE).insert(document).execute()  # type: ignore
+      if use_chunk_store and len(response.data) > 0:
+        self._write_document_chunks(response.data[0]['id'], document['course_name'], contexts_for_supa)
 
       # need to update Supabase tables with doc group info
       if len(response.data) > 0:
         # get groups from kwargs
         groups = kwargs.get('groups', '')
         if groups:
-          # call the supabase function to add the document to the group
-          if contexts[0].metadata.get('url'):
-            data, count = self.supabase_client.rpc(
-                'add_document_to_group_url', {
-                    "p_course_name": contexts[0].metadata.get('course_name'),
-                    "p_s3_path": contexts[0].metadata.get('s3_path'),
-                    "p_url": contexts[0].metadata.get('url'),
-                    "p_readable_filename": contexts[0].metadata.get('readable_filename'),
-                    "p_doc_groups": groups,
-                }).execute()
-          else:
-            data, count = self.supabase_client.rpc(
-                'add_document_to_group', {
-                    "p_course_name": contexts[0].metadata.get('course_name'),
-                    "p_s3_path": contexts[0].metadata.get('s3_path'),
-                    "p_url": contexts[0].metadata.get('url'),
-                    "p_readable_filename": contexts[0].metadata.get('readable_filename'),
-                    "p_doc_groups": groups,
-                }).execute()
-
-          if len(data) == 0:
-            print("Error in adding to doc groups")
-            raise ValueError("Error in adding to doc groups")
+          self._add_to_doc_groups(contexts[0].metadata, groups)
+
+      self._bump_retrieval_generation(document['course_name'])
 
       self.posthog.capture('distinct_id_of_the_user',
                            event='split_and_upload_succeeded',
@@ -1378,6 +1443,254 @@ class Ingest():
       sentry_sdk.flush(timeout=20)
       raise Exception(err)
 
+  def _embed_texts(self, texts: List[str]) -> Dict[str, List[float]]:
+    """
+    text -> embedding. With EMBEDDING_CACHE_BACKEND set, texts embedded before (by any course)
+    come from the embedding cache and only the misses are sent to the API.
+    """
+    cache = get_embedding_cache(self.supabase_client)
+    if cache is None:
+      return self._call_embeddings_api(texts)
+    return cache.embed('text-embedding-ada-002', texts, self._call_embeddings_api)
+
+  def _call_embeddings_api(self, texts: List[str]) -> Dict[str, List[float]]:
+    """Embed texts through the OpenAI embeddings API; returns text -> embedding."""
+    if not texts:
+      return {}
+    openai_embeddings_key = os.getenv('AGANSWERS_OPENAI_KEY')
+
+    print("Starting to call embeddings API")
+    embeddings_start_time = time.monotonic()
+    oai = OpenAIAPIProcessor(
+        input_prompts_list=[{'input': text, 'model': 'text-embedding-ada-002'} for text in dict.fromkeys(texts)],
+        request_url='https://api.openai.com/v1/embeddings',
+        api_key=openai_embeddings_key,
+        max_requests_per_minute=10_000,
+        max_tokens_per_minute=10_000_000,
+        max_attempts=1_000,
+        logging_level=logging.INFO,
+        token_encoding_name='cl100k_base')
+    asyncio.run(oai.process_api_requests_from_file())
+    print(f"⏰ embeddings runtime: {(time.monotonic() - embeddings_start_time):.2f} seconds")
+    # parse results into dict of shape page_content -> embedding
+    return {item[0]['input']: item[1]['data'][0]['embedding'] for item in oai.results}
+
+  def _chunk_point_ids(self, course_name: str, source_key: Optional[str], chunk_hashes: List[str]) -> List[str]:
+    """
+    Qdrant point id of each chunk, derived from (course, source_key, chunk hash, occurrence), so
+    an unchanged chunk keeps its point across re-ingests of the same file.
+    """
+    seen: Dict[str, int] = {}
+    point_ids = []
+    for chunk_hash in chunk_hashes:
+      occurrence = seen.get(chunk_hash, 0)
+      seen[chunk_hash] = occurrence + 1
+      point_ids.append(str(uuid.uuid5(uuid.NAMESPACE_URL, f"{course_name}/{source_key}/{chunk_hash}/{occurrence}")))
+    return point_ids
+
+  def _add_to_doc_groups(self, metadata: Dict[str, Any], groups: List[str]):
+    # call the supabase function to add the document to the group
+    data, count = self.supabase_client.rpc(
+        'add_document_to_group_url' if metadata.get('url') else 'add_document_to_group', {
+            "p_course_name": metadata.get('course_name'),
+            "p_s3_path": metadata.get('s3_path'),
+            "p_url": metadata.get('url'),
+            "p_readable_filename": metadata.get('readable_filename'),
+            "p_doc_groups": groups,
+        }).execute()
+
+    if len(data) == 0:
+      print("Error in adding to doc groups")
+      raise ValueError("Error in adding to doc groups")
+
+  def _delete_tabular_sidecar(self, bucket: str, s3_path: str):
+    """
+    Delete the Parquet sidecar written next to a CSV/Excel file (see _write_tabular_sidecar).
+    Mirrors ai_ta_backend/utils/tabular_sidecar.py.
+    """
+    if not s3_path or not s3_path.lower().endswith(('.csv', '.xlsx', '.xls')):
+      return
+    try:
+      self.s3_client.delete_object(Bucket=bucket, Key=s3_path + '.parquet')
+    except Exception as e:
+      print("Error in deleting Parquet sidecar from s3:", e)
+      sentry_sdk.capture_exception(e)
+
+  def _write_tabular_sidecar(self, local_path: str, s3_path: str, bucket: str, file_type: str) -> Dict[str, Any]:
+    """
+    Write a typed Parquet copy of a CSV/Excel file next to the original (`<s3_path>.parquet`)
+    and return the documents-row fields describing it, so readers don't re-parse the raw file.
+    Mirrors ai_ta_backend/utils/tabular_sidecar.py (this module is deployed standalone).
+    Returns {} unless DOCUMENT_TABULAR_SIDECARS=true (migrations/add_tabular_sidecar_columns.sql applied).
+    """
+    if os.getenv('DOCUMENT_TABULAR_SIDECARS', 'false').lower() != 'true':
+      return {}
+    try:
+      import io
+      import math
+
+      if file_type in ('xlsx', 'xls'):
+        df = pd.read_excel(local_path)
+      else:
+        df = pd.read_csv(local_path)
+
+      def json_safe(value):
+        if hasattr(value, 'item'):
+          value = value.item()
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+          return None
+        return value if isinstance(value, (int, float, bool, str)) or value is None else str(value)
+
+      column_stats = {}
+      for name in df.columns:
+        series = df[name]
+        col = {'dtype': str(series.dtype), 'null_count': int(series.isna().sum())}
+        try:
+          col['distinct_count'] = int(series.nunique(dropna=True))
+        except TypeError:
+          pass
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+          col.update(min=json_safe(series.min()), max=json_safe(series.max()), mean=json_safe(series.mean()))
+        column_stats[str(name)] = col
+
+      table_df = df.copy(deep=False)
+      table_df.columns = [str(c) for c in table_df.columns]
+      for name in table_df.columns:
+        if table_df[name].dtype == object and pd.api.types.infer_dtype(table_df[name],
+                                                                       skipna=True) not in ('string', 'empty'):
+          table_df[name] = table_df[name].astype('string')
+
+      buffer = io.BytesIO()
+      table_df.to_parquet(buffer, engine='pyarrow', index=False, compression='zstd')
+      buffer.seek(0)
+      sidecar_s3_path = s3_path + '.parquet'
+      self.s3_client.upload_fileobj(buffer,
+                                    bucket,
+                                    sidecar_s3_path,
+                                    ExtraArgs={'ContentType': 'application/vnd.apache.parquet'})
+      print(f"Wrote Parquet sidecar: {sidecar_s3_path}")
+
+      return {
+          'sidecar_s3_path': sidecar_s3_path,
+          'sidecar_schema': [{
+              'name': str(name),
+              'type': str(dtype)
+          } for name, dtype in table_df.dtypes.items()],
+          'row_count': int(len(df)),
+          'column_headers': [str(c) for c in df.columns],
+          'column_stats': column_stats,
+      }
+    except Exception as e:
+      print(f"Could not write Parquet sidecar for {s3_path}: {e}")
+      return {}
+
+  def _write_document_chunks(self,
+                             document_id: int,
+                             course_name: str,
+                             contexts: List[Dict[str, Any]],
+                             chunk_count: Optional[int] = None):
+    """
+    Store a document's chunks in document_chunks, embeddings as float32 BYTEA, and set chunk_count
+    (pass it when contexts are only the changed chunks of a longer document).
+    Mirrors ai_ta_backend/database/chunk_store.py (this module is deployed standalone).
+    """
+    import array
+    import sys
+
+    rows = []
+    for i, context in enumerate(contexts):
+      embedding = None
+      if context.get('embedding') is not None:
+        values = array.array('f', context['embedding'])
+        if sys.byteorder != 'little':
+          values.byteswap()
+        embedding = '\\x' + values.tobytes().hex()
+      chunk_index = context.get('chunk_index')
+      pagenumber = context.get('pagenumber')
+      rows.append({
+          'document_id': document_id,
+          'course_name': course_name,
+          'chunk_index': chunk_index if isinstance(chunk_index, int) else i,
+          'text': context.get('text') or '',
+          'pagenumber': '' if pagenumber is None else str(pagenumber),
+          'metadata': {
+              k: v for k, v in context.items() if k not in ('text', 'chunk_index', 'pagenumber', 'embedding')
+          },
+          'embedding': embedding,
+      })
+    for start in range(0, len(rows), 200):
+      self.supabase_client.table('document_chunks').upsert(rows[start:start + 200],
+                                                           on_conflict='document_id,chunk_index').execute()
+    self.supabase_client.table(DOCUMENTS_TABLE).update({
+        'chunk_count': len(rows) if chunk_count is None else chunk_count
+    }).eq('id', document_id).execute()
+    print(f"Stored {len(rows)} chunks for document {document_id}")
+
+  def _bump_retrieval_generation(self, course_name: str):
+    """
+    Invalidate the backend's cached retrieval results and local vector index for
+    course_name by bumping its generation counter in Upstash Redis. Mirrors
+    ai_ta_backend/utils/retrieval_cache.py.
+    """
+    import urllib.parse
+
+    import requests
+
+    url = os.getenv('UPSTASH_REDIS_REST_URL')
+    token = os.getenv('UPSTASH_REDIS_REST_TOKEN')
+    if not url or not token:
+      return
+    key = urllib.parse.quote(f"retrieval_generation:{course_name}", safe='')
+    try:
+      requests.post(f"{url.rstrip('/')}/incr/{key}", headers={'Authorization': f"Bearer {token}"},
+                    timeout=5).raise_for_status()
+    except Exception as e:
+      print(f"Could not bump retrieval generation of {course_name}: {e}")
+
+  def _source_key(self, s3_path: Optional[str], url: Optional[str]) -> Optional[str]:
+    """S3 filename without its "<uuid4>-" upload prefix, or the URL."""
+    if s3_path:
+      filename = s3_path.split('/')[-1]
+      uuid4 = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}', re.I)
+      return filename[37:] if uuid4.search(filename) else filename
+    return url or None
+
+  def _document_hash_columns(self, s3_path: Optional[str], url: Optional[str], chunk_texts: List[str]) -> Dict[str, Any]:
+    """
+    source_key / content_hash / chunk_hashes of a document, or {} unless DOCUMENT_CONTENT_HASHES=true.
+    Mirrors ai_ta_backend/utils/content_hashes.py (this module is deployed standalone).
+    """
+    import hashlib
+
+    if os.getenv('DOCUMENT_CONTENT_HASHES', 'false').lower() != 'true':
+      return {}
+
+    def sha256(text: str) -> str:
+      return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    return {
+        'source_key': self._source_key(s3_path, url),
+        'content_hash': sha256(''.join(chunk_texts)),
+        'chunk_hashes': [sha256(text) for text in chunk_texts],
+    }
+
+  def _stored_text(self, record: Dict[str, Any]) -> str:
+    """Concatenated chunk texts of a stored document, from its contexts or from document_chunks."""
+    if 'contexts' not in record:
+      rows = self.supabase_client.table(DOCUMENTS_TABLE).select('contexts').eq('id', record['id']).execute().data
+      record = {**record, 'contexts': rows[0]['contexts'] if rows else []}
+    if record.get('contexts'):
+      return ''.join(context['text'] for context in record['contexts'])
+    texts = []
+    offset = 0
+    while True:
+      rows = self.supabase_client.table('document_chunks').select('text').eq('document_id', record['id']) \
+          .order('chunk_index').range(offset, offset + 999).execute().data or []
+      texts.extend(row['text'] for row in rows)
+      if len(rows) < 1000:
+        return ''.join(texts)
+      offset += 1000
+
   def check_for_duplicates(self, texts: List[Dict], metadatas: List[Dict[str, Any]]) -> bool:
     """
     For given metadata, fetch docs from Supabase based on S3 path or URL.
@@ -1388,6 +1701,9 @@ class Ingest():
     incoming_s3_path = metadatas[0]['s3_path']
     url = metadatas[0]['url']
 
+    if os.getenv('DOCUMENT_CONTENT_HASHES', 'false').lower() == 'true':
+      return self._check_for_duplicates_by_hash(texts, course_name, incoming_s3_path, url)
+
     if incoming_s3_path:
       # check if uuid exists in s3_path -- not all s3_paths have uuids!
       incoming_filename = incoming_s3_path.split('/')[-1]
@@ -1402,7 +1718,7 @@ class Ingest():
         original_filename = incoming_filename
       print(f"Filename after removing uuid: {original_filename}")
 
-      supabase_contents = self.supabase_client.table(doc_table).select('id', 'contexts', 's3_path').eq(
+      supabase_contents = self.supabase_client.table(doc_table).select('id', 's3_path').eq(
           'course_name', course_name).like('s3_path', '%' + original_filename + '%').order('id', desc=True).execute()
       supabase_contents = supabase_contents.data
       print(f"No. of S3 path based records retrieved: {len(supabase_contents)}"
@@ -1410,7 +1726,7 @@ class Ingest():
 
     elif url:
       original_filename = url
-      supabase_contents = self.supabase_client.table(doc_table).select('id', 'contexts', 'url').eq(
+      supabase_contents = self.supabase_client.table(doc_table).select('id', 'url').eq(
           'course_name', course_name).eq('url', url).order('id', desc=True).execute()
       supabase_contents = supabase_contents.data
       print(f"No. of URL-based records retrieved: {len(supabase_contents)}")
@@ -1447,8 +1763,7 @@ class Ingest():
 
       if exact_doc_exists:
         # concatenate og texts
-        for text in supabase_contexts['contexts']:
-          supabase_whole_text += text['text']
+        supabase_whole_text = self._stored_text(supabase_contexts)
 
         current_whole_text = ""
         for text in texts:
@@ -1477,6 +1792,219 @@ class Ingest():
       print(f"NOT a duplicate! 📄s3_path: {original_filename}")
       return False
 
+  def _check_for_duplicates_by_hash(self, texts: List[Dict], course_name: str, incoming_s3_path: Optional[str],
+                                    url: Optional[str]) -> bool:
+    """
+    check_for_duplicates with content hashes: one indexed (course_name, source_key) lookup of the
+    latest stored version, compared by content_hash. An updated file's older version is deleted.
+    """
+    source_key = self._source_key(incoming_s3_path, url)
+    if not source_key:
+      print(f"NOT a duplicate! 📄s3_path: {source_key}")
+      return False
+
+    incoming = self._document_hash_columns(incoming_s3_path, url, [text['input'] for text in texts])
+    records = self.supabase_client.table(DOCUMENTS_TABLE).select('id, s3_path, url, content_hash').eq(
+        'course_name', course_name).eq('source_key', source_key).order('id', desc=True).limit(1).execute().data
+    if not records:
+      print(f"NOT a duplicate! 📄s3_path: {source_key}")
+      return False
+
+    record = records[0]
+    # Rows written before the hash columns existed (and not backfilled) are compared by text
+    stored_hash = record.get('content_hash') or self._document_hash_columns(
+        None, None, [self._stored_text(record)]).get('content_hash')
+    if stored_hash == incoming['content_hash']:
+      print(f"Duplicate ingested! 📄 s3_path/url: {source_key}.")
+      return True
+
+    print(f"Updated file detected! Same filename, new contents. 📄s3_path/url: {source_key}")
+    if incoming_s3_path:
+      delete_status = self.delete_data(course_name, record['s3_path'], '')
+    else:
+      delete_status = self.delete_data(course_name, '', url)
+    print("delete_status: ", delete_status)
+    return False
+
+  def _stored_embeddings(self, previous: Dict[str, Any], indices: List[int]) -> Dict[int, List[float]]:
+    """chunk index -> stored embedding of a document, from document_chunks or its contexts."""
+    import array
+    import sys
+
+    wanted = set(indices)
+    if not wanted:
+      return {}
+    embeddings: Dict[int, List[float]] = {}
+    if previous.get('chunk_count') is not None:
+      offset = 0
+      while True:
+        rows = self.supabase_client.table('document_chunks').select('chunk_index, embedding').eq(
+            'document_id', previous['id']).order('chunk_index').range(offset, offset + 999).execute().data or []
+        for row in rows:
+          value = row.get('embedding')
+          if row['chunk_index'] not in wanted or not value:
+            continue
+          values = array.array('f')
+          values.frombytes(bytes.fromhex(value[2:] if value.startswith('\\x') else value))
+          if sys.byteorder != 'little':
+            values.byteswap()
+          embeddings[row['chunk_index']] = values.tolist()
+        if len(rows) < 1000:
+          return embeddings
+        offset += 1000
+
+    rows = self.supabase_client.table(DOCUMENTS_TABLE).select('contexts').eq('id', previous['id']).execute().data
+    for i, context in enumerate((rows[0]['contexts'] or []) if rows else []):
+      if i in wanted and context.get('embedding'):
+        embeddings[i] = context['embedding']
+    return embeddings
+
+  def _incremental_reingest(self, contexts: List[Any], metadatas: List[Dict[str, Any]], **kwargs) -> Optional[str]:
+    """
+    Update a re-ingested file in place, chunk by chunk, against the chunk hashes of its stored
+    version: only new chunk texts are embedded, only new or moved Qdrant points are upserted and
+    only removed ones deleted, and the Supabase row keeps its id with only the changed
+    document_chunks rows rewritten.
+
+    Returns "duplicate" or "updated", or None when there is nothing to diff against (a new file,
+    or a stored version without chunk hashes) and the regular ingest should run.
+    """
+    use_chunk_store = os.getenv('DOCUMENT_CHUNK_STORE', 'false').lower() == 'true'
+    course_name = metadatas[0].get('course_name')
+    metadata = contexts[0].metadata
+    hash_columns = self._document_hash_columns(metadata.get('s3_path'), metadata.get('url'),
+                                               [context.page_content for context in contexts])
+    if not hash_columns or not hash_columns['source_key']:
+      return None
+
+    records = self.supabase_client.table(DOCUMENTS_TABLE).select(
+        'id, s3_path, url, content_hash, chunk_hashes' + (', chunk_count' if use_chunk_store else '')).eq(
+            'course_name', course_name).eq('source_key', hash_columns['source_key']).order(
+                'id', desc=True).limit(1).execute().data
+    if not records or not records[0].get('chunk_hashes'):
+      return None
+    previous = records[0]
+    if previous.get('content_hash') == hash_columns['content_hash']:
+      print(f"Duplicate ingested! 📄 s3_path/url: {hash_columns['source_key']}.")
+      return 'duplicate'
+
+    old_hashes: List[str] = previous['chunk_hashes']
+    new_hashes: List[str] = hash_columns['chunk_hashes']
+    old_ids = self._chunk_point_ids(course_name, hash_columns['source_key'], old_hashes)
+    new_ids = self._chunk_point_ids(course_name, hash_columns['source_key'], new_hashes)
+    old_index = {point_id: i for i, point_id in enumerate(old_ids)}
+    kept_ids = set(new_ids)
+    removed_ids = [point_id for point_id in old_ids if point_id not in kept_ids]
+
+    # Retained chunks keep their stored embeddings; only new chunk texts are embedded
+    stored = self._stored_embeddings(previous, [old_index[point_id] for point_id in new_ids if point_id in old_index])
+    embeddings: List[Optional[List[float]]] = [
+        stored.get(old_index[point_id]) if point_id in old_index else None for point_id in new_ids
+    ]
+    embedded = self._embed_texts(
+        [context.page_content for context, embedding in zip(contexts, embeddings) if embedding is None])
+    embeddings = [
+        embedding if embedding is not None else embedded[context.page_content]
+        for context, embedding in zip(contexts, embeddings)
+    ]
+
+    for i, context in enumerate(contexts):
+      context.metadata['chunk_index'] = i
+      context.metadata['doc_groups'] = kwargs.get('groups', [])
+
+    ### Qdrant ###
+    collection = os.environ['AGANSWERS_QDRANT_COLLECTION_NAME']
+    points = [
+        PointStruct(id=point_id, vector=embedding, payload={
+            **context.metadata, "page_content": context.page_content
+        }) for point_id, embedding, context in zip(new_ids, embeddings, contexts)
+    ]
+    try:
+      existing = self.qdrant_client.retrieve(collection_name=collection,
+                                             ids=old_ids,
+                                             with_payload=False,
+                                             with_vectors=False)
+      if len(existing) == len(old_ids):
+        # Unchanged chunks stay in place; only their document-level payload is refreshed
+        changed = [point for i, point in enumerate(points) if old_index.get(point.id) != i]
+        retained = [point.id for i, point in enumerate(points) if old_index.get(point.id) == i]
+        if changed:
+          self.qdrant_client.upsert(collection_name=collection, points=changed)
+        if retained:
+          payload = {key: metadata.get(key) for key in ('s3_path', 'readable_filename', 'url', 'base_url')}
+          payload['doc_groups'] = kwargs.get('groups', [])
+          self.qdrant_client.set_payload(collection_name=collection, payload=payload, points=retained)
+        if removed_ids:
+          self.qdrant_client.delete(collection_name=collection,
+                                    points_selector=models.PointIdsList(points=removed_ids))
+        upserted = len(changed)
+      else:
+        # Stored before point ids were derived from chunk hashes: replace the points by filter
+        key, value = ('s3_path', previous['s3_path']) if previous.get('s3_path') else ('url', previous['url'])
+        self.qdrant_client.delete(
+            collection_name=collection,
+            points_selector=models.Filter(must=[models.FieldCondition(key=key, match=models.MatchValue(value=value))]))
+        self.qdrant_client.upsert(collection_name=collection, points=points)
+        upserted = len(points)
+    except Exception as e:
+      logging.error("Error in QDRANT upload: ", exc_info=True)
+      err = f"Error in QDRANT upload: {e}"
+      if "timed out" in str(e):
+        # timed out error is fine, task will continue in background
+        upserted = len(points)
+      else:
+        print(err)
+        sentry_sdk.capture_exception(e)
+        raise Exception(err) from e
+
+    ### Supabase SQL ###
+    contexts_for_supa = [{
+        "text": context.page_content,
+        "pagenumber": context.metadata.get('pagenumber'),
+        "timestamp": context.metadata.get('timestamp'),
+        "chunk_index": context.metadata.get('chunk_index'),
+        "embedding": embedding
+    } for context, embedding in zip(contexts, embeddings)]
+    in_chunk_store = previous.get('chunk_count') is not None
+    self.supabase_client.table(DOCUMENTS_TABLE).update({
+        "s3_path": metadata.get('s3_path'),
+        "readable_filename": metadata.get('readable_filename'),
+        "url": metadata.get('url'),
+        "base_url": metadata.get('base_url'),
+        "contexts": [] if use_chunk_store else contexts_for_supa,
+        **kwargs.get('tabular_metadata', {}),
+        **hash_columns,
+    }).eq('id', previous['id']).execute()
+    if in_chunk_store:
+      # Rewrite only the rows whose chunk changed, then drop the rows past the new end
+      self._write_document_chunks(previous['id'],
+                                  course_name, [
+                                      context for i, context in enumerate(contexts_for_supa)
+                                      if i >= len(old_hashes) or old_hashes[i] != new_hashes[i]
+                                  ],
+                                  chunk_count=len(contexts_for_supa))
+      self.supabase_client.table('document_chunks').delete().eq('document_id', previous['id']).gte(
+          'chunk_index', len(contexts_for_supa)).execute()
+    elif use_chunk_store:
+      self._write_document_chunks(previous['id'], course_name, contexts_for_supa)
+
+    if previous.get('s3_path') and previous['s3_path'] != metadata.get('s3_path'):
+      try:
+        self.s3_client.delete_object(Bucket=os.getenv('AGANSWERS_S3_BUCKET_NAME'), Key=previous['s3_path'])
+      except Exception as e:
+        print("Error in deleting file from s3:", e)
+        sentry_sdk.capture_exception(e)
+      self._delete_tabular_sidecar(os.getenv('AGANSWERS_S3_BUCKET_NAME'), previous['s3_path'])
+
+    groups = kwargs.get('groups', '')
+    if groups:
+      self._add_to_doc_groups(metadata, groups)
+
+    self._bump_retrieval_generation(course_name)
+    print(f"Updated file incrementally 📄s3_path/url: {hash_columns['source_key']}. "
+          f"Embedded {len(embedded)} chunks, upserted {upserted}, removed {len(removed_ids)} of {len(old_hashes)}.")
+    return 'updated'
+
   def delete_data(self, course_name: str, s3_path: str, source_url: str):
     """Delete file from S3, Qdrant, and Supabase."""
     print(f"Deleting {s3_path} from S3, Qdrant, and Supabase for course {course_name}")
@@ -1492,6 +2020,7 @@ class Ingest():
         except Exception as e:
           print("Error in deleting file from s3:", e)
           sentry_sdk.capture_exception(e)
+        self._delete_tabular_sidecar(bucket_name, s3_path)
         # Delete from Qdrant
         try:
           self.qdrant_client.delete(
@@ -1550,6 +2079,7 @@ class Ingest():
           sentry_sdk.capture_exception(e)
 
       # Delete from Supabase
+      self._bump_retrieval_generation(course_name)
       return "Success"
     except Exception as e:
       err: str = f"ERROR IN delete_data: Traceback: {traceback.extract_tb(e.__traceback__)}❌❌ Error in {inspect.currentframe().f_code.co_name}:{e}"  # type: ignore
@@ -0,0 +1,191 @@
+"""
+Chunk-level document storage (the `document_chunks` table).
+
+Documents used to keep every chunk, embedding included, in one
+`documents.contexts` JSONB array, so any reader (padding, duplicate checks,
+DigiDocs frames, vector index builds) had to download the whole document.
+Chunks now live one row per (document_id, chunk_index), with the text and
+metadata in ordinary columns and the embedding as a float32 BYTEA, and can be
+read by chunk range with or without vectors.
+
+Documents written in this layout have `documents.chunk_count` set and an empty
+`contexts`; older documents keep their `contexts` until backfilled (see
+ai_ta_backend/utils/backfill_document_chunks.py). Readers go through
+ChunkStore.get_contexts, which handles both.
+
+See migrations/add_document_chunks.sql.
+
+NOTE: ai_ta_backend/beam/ingest*.py are deployed standalone and keep their own
+copy of the writer; keep the formats in sync.
+"""
+
+import array
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+from injector import inject
+
+from ai_ta_backend.database.sql import SQLDatabase
+
+CHUNKS_TABLE = 'document_chunks'
+# Context keys stored in their own columns; everything else goes to `metadata`
+_COLUMN_KEYS = ('text', 'chunk_index', 'pagenumber', 'embedding')
+# PostgREST returns at most this many rows per request
+_PAGE_SIZE = 1000
+
+
+def chunk_store_enabled() -> bool:
+  """Whether new documents are written to document_chunks (DOCUMENT_CHUNK_STORE)."""
+  return os.environ.get('DOCUMENT_CHUNK_STORE', 'false').lower() == 'true'
+
+
+def encode_embedding(embedding: Optional[Iterable[float]]) -> Optional[str]:
+  """float32 little-endian bytes, in the hex form PostgREST accepts for BYTEA."""
+  if embedding is None:
+    return None
+  values = array.array('f', embedding)
+  if sys.byteorder != 'little':
+    values.byteswap()
+  return '\\x' + values.tobytes().hex()
+
+
+def decode_embedding(value: Optional[str]) -> Optional[List[float]]:
+  if not value:
+    return None
+  values = array.array('f')
+  values.frombytes(bytes.fromhex(value[2:] if value.startswith('\\x') else value))
+  if sys.byteorder != 'little':
+    values.byteswap()
+  return values.tolist()
+
+
+def chunk_rows(document_id: int, course_name: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+  """document_chunks rows for a document's contexts array."""
+  rows = []
+  for i, context in enumerate(contexts):
+    chunk_index = context.get('chunk_index')
+    pagenumber = context.get('pagenumber')
+    rows.append({
+        'document_id': document_id,
+        'course_name': course_name,
+        'chunk_index': chunk_index if isinstance(chunk_index, int) else i,
+        'text': context.get('text') or '',
+        'pagenumber': '' if pagenumber is None else str(pagenumber),
+        'metadata': {key: value for key, value in context.items() if key not in _COLUMN_KEYS},
+        'embedding': encode_embedding(context.get('embedding')),
+    })
+  return rows
+
+
+def row_to_context(row: Dict[str, Any]) -> Dict[str, Any]:
+  """A document_chunks row in the legacy contexts-entry shape."""
+  context = dict(row.get('metadata') or {})
+  context['text'] = row.get('text') or ''
+  context['chunk_index'] = row.get('chunk_index')
+  context['pagenumber'] = row.get('pagenumber') or ''
+  if 'embedding' in row:
+    context['embedding'] = decode_embedding(row['embedding'])
+  return context
+
+
+class ChunkStore:
+  """Reads and writes document chunks."""
+
+  @inject
+  def __init__(self, sql_db: SQLDatabase):
+    self.supabase_client = sql_db.supabase_client
+    self.documents_table = os.environ.get('SUPABASE_DOCUMENTS_TABLE', 'documents')
+
+  @staticmethod
+  def _columns(with_vectors: bool) -> str:
+    columns = 'document_id, chunk_index, text, pagenumber, metadata'
+    return columns + ', embedding' if with_vectors else columns
+
+  def write_chunks(self, document_id: int, course_name: str, contexts: List[Dict[str, Any]],
+                   batch_size: int = 200) -> int:
+    """Upsert a document's chunks and record chunk_count on the document."""
+    rows = chunk_rows(document_id, course_name, contexts)
+    for start in range(0, len(rows), batch_size):
+      self.supabase_client.table(CHUNKS_TABLE).upsert(rows[start:start + batch_size],
+                                                      on_conflict='document_id,chunk_index').execute()
+    self.supabase_client.table(self.documents_table).update({
+        'chunk_count': len(rows)
+    }).eq('id', document_id).execute()
+    return len(rows)
+
+  def get_chunks(self,
+                 document_id: int,
+                 first: Optional[int] = None,
+                 last: Optional[int] = None,
+                 with_vectors: bool = False) -> List[Dict[str, Any]]:
+    """Chunks first..last (inclusive, either end open) of one document, in order, as contexts entries."""
+    query = self.supabase_client.table(CHUNKS_TABLE).select(self._columns(with_vectors)).eq('document_id', document_id)
+    if first is not None:
+      query = query.gte('chunk_index', first)
+    if last is not None:
+      query = query.lte('chunk_index', last)
+    rows = query.order('chunk_index').execute().data or []
+    return [row_to_context(row) for row in rows]
+
+  def get_contexts(self, document_ids: List[int], with_vectors: bool = False) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    document id -> its contexts entries, from document_chunks, or from
+    documents.contexts for documents that haven't been migrated.
+    """
+    contexts: Dict[int, List[Dict[str, Any]]] = {}
+    if not document_ids:
+      return contexts
+    offset = 0
+    while True:
+      rows = self.supabase_client.table(CHUNKS_TABLE).select(self._columns(with_vectors)) \
+          .in_('document_id', document_ids) \
+          .order('document_id').order('chunk_index') \
+          .range(offset, offset + _PAGE_SIZE - 1) \
+          .execute().data or []
+      for row in rows:
+        contexts.setdefault(row['document_id'], []).append(row_to_context(row))
+      if len(rows) < _PAGE_SIZE:
+        break
+      offset += _PAGE_SIZE
+
+    legacy = [document_id for document_id in document_ids if document_id not in contexts]
+    if legacy:
+      rows = self.supabase_client.table(self.documents_table).select('id, contexts') \
+          .in_('id', legacy).execute().data or []
+      for row in rows:
+        entries = row.get('contexts') or []
+        if not with_vectors:
+          entries = [{key: value for key, value in entry.items() if key != 'embedding'} for entry in entries]
+        contexts[row['id']] = entries
+    return contexts
+
+  def with_contexts(self, documents: List[Dict[str, Any]], with_vectors: bool = False) -> List[Dict[str, Any]]:
+    """
+    Document rows with `contexts` filled in from get_contexts; rows that
+    already carry a non-empty contexts array are returned as they are.
+    """
+    missing = [document['id'] for document in documents if not document.get('contexts')]
+    contexts = self.get_contexts(missing, with_vectors=with_vectors)
+    return [
+        document if document.get('contexts') else {
+            **document, 'contexts': contexts.get(document['id'], [])
+        } for document in documents
+    ]
+
+  def get_text(self, document_id: int) -> str:
+    """The document's chunk texts concatenated in order."""
+    contexts = self.get_contexts([document_id]).get(document_id) or []
+    return ''.join(context.get('text') or '' for context in contexts)
+
+  def delete_chunks(self, document_id: int):
+    """Chunks are also removed by ON DELETE CASCADE when the document row is deleted."""
+    self.supabase_client.table(CHUNKS_TABLE).delete().eq('document_id', document_id).execute()
+
+  def migrate_document(self, document: Dict[str, Any], clear_contexts: bool = False) -> int:
+    """Copy a document's contexts array into document_chunks (optionally emptying contexts afterwards)."""
+    contexts = document.get('contexts') or []
+    written = self.write_chunks(document['id'], document['course_name'], contexts)
+    if clear_contexts:
+      self.supabase_client.table(self.documents_table).update({'contexts': []}).eq('id', document['id']).execute()
+    return written
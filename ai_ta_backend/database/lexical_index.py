@@ -0,0 +1,156 @@
+"""
+BM25 inverted index over a course's chunk texts.
+
+Dense search does poorly on exact identifiers (product names, pesticide and
+EPA registration codes, cultivar IDs). CourseIndex keeps one of these next to
+its vectors over the same chunk texts, and LocalVectorDatabase fuses both
+rankings with reciprocal-rank fusion (see reciprocal_rank_fusion). Chunks
+ingested through LocalVectorDatabase are indexed as they are added; chunks Beam
+ingests out of process only arrive when the course index is rebuilt after
+their retrieval generation bump (see local_vector.py).
+
+Postings are stored as flat arrays (row ids int32, term frequencies uint16,
+per-term offsets) so the index persists compactly and is memory-mapped on load.
+"""
+
+import json
+import math
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Identifiers like "2,4-D", "Bt-11", "100-1234" and "NK603" stay one token,
+# and their alphanumeric parts are indexed as well
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-./,][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or that the their this to was were '
+    'what when where which who will with how does do can should would'.split())
+
+
+def tokenize(text: str) -> List[str]:
+  tokens = []
+  for token in _TOKEN.findall(text.lower()):
+    if token in _STOPWORDS:
+      continue
+    tokens.append(token)
+    parts = _PART.findall(token)
+    if len(parts) > 1:
+      tokens.extend(part for part in parts if part not in _STOPWORDS)
+  return tokens
+
+
+class LexicalIndex:
+  """Append-only BM25 index; rows are the owning CourseIndex's row numbers."""
+
+  def __init__(self, k1: float = 1.2, b: float = 0.75):
+    self.k1 = k1
+    self.b = b
+    self.doc_len = np.zeros(0, dtype=np.int32)
+    # term -> (rows, tfs) for frozen postings; new postings wait in _pending until the next search
+    self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    self._pending: Dict[str, List[Tuple[int, int]]] = {}
+    self._pending_len: List[int] = []
+
+  def __len__(self) -> int:
+    return len(self.doc_len) + len(self._pending_len)
+
+  def add(self, texts: Sequence[str]):
+    """Index texts as the next rows."""
+    row = len(self)
+    for text in texts:
+      counts: Dict[str, int] = {}
+      for token in tokenize(text or ''):
+        counts[token] = counts.get(token, 0) + 1
+      for token, tf in counts.items():
+        self._pending.setdefault(token, []).append((row, min(tf, 65535)))
+      self._pending_len.append(sum(counts.values()))
+      row += 1
+
+  def _freeze(self):
+    if not self._pending_len:
+      return
+    for token, postings in self._pending.items():
+      rows = np.fromiter((p[0] for p in postings), dtype=np.int32, count=len(postings))
+      tfs = np.fromiter((p[1] for p in postings), dtype=np.uint16, count=len(postings))
+      if token in self._postings:
+        old_rows, old_tfs = self._postings[token]
+        rows, tfs = np.concatenate([old_rows, rows]), np.concatenate([old_tfs, tfs])
+      self._postings[token] = (rows, tfs)
+    self.doc_len = np.concatenate([self.doc_len, np.asarray(self._pending_len, dtype=np.int32)])
+    self._pending = {}
+    self._pending_len = []
+
+  def search(self, query: str, mask: np.ndarray, top_n: int) -> List[Tuple[int, float]]:
+    """Top (row, BM25 score) pairs among the rows selected by mask."""
+    self._freeze()
+    terms = [term for term in dict.fromkeys(tokenize(query)) if term in self._postings]
+    n = len(self.doc_len)
+    if not terms or n == 0 or top_n <= 0:
+      return []
+    avg_len = float(self.doc_len.mean()) or 1.0
+    norm = self.k1 * (1 - self.b + self.b * self.doc_len / avg_len)
+    scores = np.zeros(n, dtype=np.float32)
+    for term in terms:
+      rows, tfs = self._postings[term]
+      idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+      tf = tfs.astype(np.float32)
+      scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm[rows])
+
+    scores[~mask[:n]] = 0
+    candidates = np.flatnonzero(scores)
+    if candidates.size == 0:
+      return []
+    k = min(top_n, candidates.size)
+    top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    top = top[np.argsort(-scores[top])]
+    return [(int(row), float(scores[row])) for row in top]
+
+  # ----- persistence -----
+
+  def save(self, directory: str):
+    self._freeze()
+    terms = list(self._postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+      offsets[i + 1] = offsets[i] + len(self._postings[term][0])
+    rows = np.concatenate([self._postings[t][0] for t in terms]) if terms else np.zeros(0, dtype=np.int32)
+    tfs = np.concatenate([self._postings[t][1] for t in terms]) if terms else np.zeros(0, dtype=np.uint16)
+    np.save(os.path.join(directory, 'lexical_rows.npy'), rows)
+    np.save(os.path.join(directory, 'lexical_tfs.npy'), tfs)
+    np.save(os.path.join(directory, 'lexical_offsets.npy'), offsets)
+    np.save(os.path.join(directory, 'lexical_doc_len.npy'), self.doc_len)
+    with open(os.path.join(directory, 'lexical_terms.json'), 'w') as f:
+      json.dump(terms, f)
+
+  @classmethod
+  def load(cls, directory: str) -> Optional['LexicalIndex']:
+    """None if the directory has no lexical index (saved before it existed)."""
+    terms_path = os.path.join(directory, 'lexical_terms.json')
+    if not os.path.exists(terms_path):
+      return None
+    with open(terms_path) as f:
+      terms = json.load(f)
+    rows = np.load(os.path.join(directory, 'lexical_rows.npy'), mmap_mode='r')
+    tfs = np.load(os.path.join(directory, 'lexical_tfs.npy'), mmap_mode='r')
+    offsets = np.load(os.path.join(directory, 'lexical_offsets.npy'))
+    index = cls()
+    index.doc_len = np.load(os.path.join(directory, 'lexical_doc_len.npy'))
+    index._postings = {term: (rows[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]]) for i, term in enumerate(terms)}
+    return index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[object, float]]:
+  """
+  Fuse ranked lists of keys: score(key) = sum over lists of weight / (k + rank).
+  Returns (key, fused score) pairs, best first.
+  """
+  fused: Dict[object, float] = {}
+  for i, ranking in enumerate(rankings):
+    weight = weights[i] if weights else 1.0
+    for rank, key in enumerate(ranking, start=1):
+      fused[key] = fused.get(key, 0.0) + weight / (k + rank)
+  return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,919 @@
+"""
+Embedded vector index, served through the VectorDatabase interface RetrievalService uses.
+
+Every search used to be a network round trip to Qdrant. This backend keeps a
+per-course index in process, built from the embeddings already stored in
+`documents.contexts[].embedding`:
+
+* Courses below LOCAL_VECTOR_HNSW_THRESHOLD points are searched by exact
+  NumPy brute force (cosine similarity on normalized float32 vectors). Larger
+  courses use an HNSW graph when hnswlib is installed, falling back to exact
+  search over the filtered subset when a filter leaves few candidates.
+* Each course index also keeps a BM25 index of its chunk texts; when
+  HYBRID_SEARCH is on (default) the vector and lexical rankings are fused with
+  reciprocal-rank fusion, so exact identifiers (product names, pesticide
+  codes, cultivar IDs) are found without raising top_n.
+* With LOCAL_VECTOR_QUANTIZATION=int8 or binary, exact search first scores
+  a compact quantized copy of the vectors (see quantization.py) and rescans
+  only the best top_n * LOCAL_VECTOR_RESCORE_FACTOR candidates against the
+  float32 vectors, which stay memory-mapped on disk.
+* Filters follow the Qdrant filter RetrievalService used to build: the
+  course's own points (optionally restricted to doc_groups), OR points of
+  enabled public doc groups shared from other courses, minus points in
+  admin-disabled doc groups.
+* Documents ingested or deleted through this backend are applied to the index
+  in place. Ingests and deletes elsewhere (Beam split_and_upload, update by
+  replace, incremental re-ingest) bump the course's retrieval generation (see
+  utils/retrieval_cache.py); an index built at an older generation, or older
+  than LOCAL_VECTOR_MAX_AGE_SECONDS, keeps serving while it is rebuilt from
+  Supabase on a background thread.
+* Indexes are persisted under LOCAL_VECTOR_INDEX_DIR as .npy files that are
+  memory-mapped on load, so workers on a host share the pages. Each saved
+  generation has an append-only journal of the changes made since; workers
+  append to it under an fcntl lock and replay what other workers appended. The
+  journal is folded into a new generation once it grows past
+  LOCAL_VECTOR_JOURNAL_MAX_MB, and a worker reloads when the generation changes.
+* The HNSW graph is built on a background thread; searches use the exact scan
+  until it is ready.
+
+This backend is opt-in (VECTOR_DB_BACKEND=local, see vector.py).
+
+Configuration:
+    LOCAL_VECTOR_INDEX_DIR          persistence directory (default: local_vector_index)
+    LOCAL_VECTOR_HNSW_THRESHOLD     points above which HNSW is used (default 20000)
+    LOCAL_VECTOR_STALENESS_CHECK_SECONDS  how often a course's generation is compared (default 30)
+    LOCAL_VECTOR_MAX_AGE_SECONDS    rebuild an index older than this (default 3600, 0 disables)
+    LOCAL_VECTOR_JOURNAL_MAX_MB     journal size that triggers a new generation (default 64)
+    LOCAL_VECTOR_QUANTIZATION       none | int8 | binary (default none)
+    LOCAL_VECTOR_RESCORE_FACTOR     candidates rescored exactly per result (default 4)
+    HYBRID_SEARCH                   fuse BM25 with vector results (default true)
+    HYBRID_RRF_K                    reciprocal-rank fusion constant (default 60)
+    HYBRID_LEXICAL_WEIGHT           weight of the BM25 ranking in the fusion (default 1.0)
+"""
+
+import base64
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from injector import inject
+
+from ai_ta_backend.database.chunk_store import ChunkStore
+from ai_ta_backend.database.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from ai_ta_backend.database import quantization
+from ai_ta_backend.database.sql import SQLDatabase
+from ai_ta_backend.utils.doc_group_cache import DocGroupFilter
+from ai_ta_backend.utils.retrieval_cache import get_course_generations
+
+try:
+  import hnswlib
+except ImportError:
+  hnswlib = None
+
+# Context fields that aren't part of a search result payload
+_CONTEXT_SKIP_FIELDS = ('embedding', 'text')
+# Document row fields copied into every point's payload
+_DOCUMENT_FIELDS = ('s3_path', 'readable_filename', 'url', 'base_url')
+# Changes made since a generation was saved, one JSON op per line
+JOURNAL_FILE = 'journal.jsonl'
+
+
+@dataclass
+class ScoredChunk:
+  """A search hit, shaped like qdrant_client's ScoredPoint (id, score, payload)."""
+  id: str
+  score: float
+  payload: Dict[str, Any] = field(default_factory=dict)
+  vector_score: Optional[float] = None
+  lexical_score: Optional[float] = None
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+  norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+  norms[norms == 0] = 1.0
+  return (vectors / norms).astype(np.float32, copy=False)
+
+
+def _encode_vector(vector) -> str:
+  return base64.b64encode(np.asarray(vector, dtype='<f4').tobytes()).decode('ascii')
+
+
+def _decode_vector(data: str) -> np.ndarray:
+  return np.frombuffer(base64.b64decode(data), dtype='<f4')
+
+
+def document_points(course_name: str, document: Dict[str, Any]) -> List[Tuple[str, List[float], Dict[str, Any]]]:
+  """(point id, embedding, payload) for each embedded context of a documents row."""
+  doc_groups = []
+  for group in document.get('doc_groups') or []:
+    name = group.get('name') if isinstance(group, dict) else group
+    if name:
+      doc_groups.append(name)
+
+  points = []
+  for i, context in enumerate(document.get('contexts') or []):
+    embedding = context.get('embedding') if isinstance(context, dict) else None
+    if not embedding:
+      continue
+    payload = {key: value for key, value in context.items() if key not in _CONTEXT_SKIP_FIELDS}
+    payload.update({key: document.get(key) for key in _DOCUMENT_FIELDS if document.get(key) is not None})
+    payload['page_content'] = context.get('text') or ''
+    payload['course_name'] = course_name
+    payload['doc_groups'] = doc_groups
+    point_id = f"{document.get('id')}:{context.get('chunk_index', i)}"
+    points.append((point_id, embedding, payload))
+  return points
+
+
+class CourseIndex:
+  """Vectors, payloads and doc-group membership of one course."""
+
+  def __init__(self, course_name: str, dim: Optional[int] = None, quantization_mode: str = 'none',
+               rescore_factor: int = 4):
+    self.course_name = course_name
+    self.dim = dim
+    self.quantization = quantization_mode
+    self.rescore_factor = rescore_factor
+    # Quantized copies of vectors (see quantization.py), built on first use
+    self.codes: Optional[np.ndarray] = None
+    self.scales: Optional[np.ndarray] = None
+    self.bits: Optional[np.ndarray] = None
+    self.vectors = np.zeros((0, dim or 0), dtype=np.float32)
+    self.alive = np.zeros(0, dtype=bool)
+    self.ids: List[str] = []
+    self.payloads: List[Dict[str, Any]] = []
+    self.generation = 0
+    # Retrieval generation of the course (see retrieval_cache.py) the index reflects, and when it was built
+    self.source_generation: Optional[int] = None
+    self.built_at = time.time()
+    self.checked_at = 0.0
+    self.refreshing = False
+    # Saved generation this index was loaded from or saved as, and how much of its journal has been applied
+    self.disk_generation: Optional[str] = None
+    self.journal_offset = 0
+    self.lock = threading.RLock()
+    self._row_by_id: Dict[str, int] = {}
+    self._group_rows: Optional[Dict[str, np.ndarray]] = None
+    self._masks: Dict[Tuple[Optional[Tuple[str, ...]], frozenset], np.ndarray] = {}
+    self._hnsw = None
+    self._hnsw_building = False
+    # Bumped whenever rows are renumbered, so a graph built from older rows is discarded
+    self._layout = 0
+    self.lexical = LexicalIndex()
+
+  def __len__(self) -> int:
+    return int(self.alive.sum())
+
+  # ----- mutation -----
+
+  def _has(self, point_id: str) -> bool:
+    row = self._row_by_id.get(point_id)
+    return row is not None and bool(self.alive[row])
+
+  def add(self, points: List[Tuple[str, List[float], Dict[str, Any]]]) -> int:
+    """Append points; ones already in the index or whose dimension doesn't match it are skipped."""
+    with self.lock:
+      if not points:
+        return 0
+      if self.dim is None:
+        self.dim = len(points[0][1])
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+      points = [p for p in points if len(p[1]) == self.dim and not self._has(p[0])]
+      if not points:
+        return 0
+      new_vectors = _normalize(np.asarray([p[1] for p in points], dtype=np.float32))
+      start = len(self.ids)
+      # Copies out of a memory-mapped array; the index is in memory until the next save
+      self.vectors = np.concatenate([self.vectors, new_vectors])
+      self.alive = np.concatenate([self.alive, np.ones(len(points), dtype=bool)])
+      self.ids.extend(p[0] for p in points)
+      self.payloads.extend(p[2] for p in points)
+      self._row_by_id.update((p[0], start + i) for i, p in enumerate(points))
+      self.lexical.add([p[2].get('page_content') or '' for p in points])
+      if self.codes is not None:
+        codes, scales = quantization.quantize_int8(new_vectors)
+        self.codes = np.concatenate([self.codes, codes])
+        self.scales = np.concatenate([self.scales, scales])
+      if self.bits is not None:
+        self.bits = np.concatenate([self.bits, quantization.quantize_binary(new_vectors)])
+      self._invalidate_filters()
+      if self._hnsw is not None:
+        self._hnsw.resize_index(len(self.ids))
+        self._hnsw.add_items(new_vectors, np.arange(start, len(self.ids)))
+      self.generation += 1
+      return len(points)
+
+  def delete_where(self, key: str, value: Any) -> int:
+    """Remove the points whose payload[key] == value."""
+    with self.lock:
+      rows = [i for i, payload in enumerate(self.payloads) if self.alive[i] and payload.get(key) == value]
+      if not rows:
+        return 0
+      self.alive = np.array(self.alive, copy=True)
+      self.alive[rows] = False
+      if self._hnsw is not None:
+        for row in rows:
+          self._hnsw.mark_deleted(row)
+      self._masks.clear()
+      self.generation += 1
+      if self.alive.size and (~self.alive).sum() > 0.25 * self.alive.size:
+        self.compact()
+      return len(rows)
+
+  def compact(self):
+    """Drop deleted points (renumbers rows, so the HNSW graph is rebuilt on demand)."""
+    with self.lock:
+      keep = np.flatnonzero(self.alive)
+      self.vectors = np.ascontiguousarray(self.vectors[keep])
+      if self.codes is not None:
+        self.codes, self.scales = self.codes[keep], self.scales[keep]
+      if self.bits is not None:
+        self.bits = self.bits[keep]
+      self.ids = [self.ids[i] for i in keep]
+      self.payloads = [self.payloads[i] for i in keep]
+      self._row_by_id = {point_id: row for row, point_id in enumerate(self.ids)}
+      self.alive = np.ones(len(keep), dtype=bool)
+      self._invalidate_filters()
+      self._hnsw = None
+      self._layout += 1
+      self._rebuild_lexical()
+
+  def _rebuild_lexical(self):
+    self.lexical = LexicalIndex()
+    self.lexical.add([payload.get('page_content') or '' for payload in self.payloads])
+
+  def lexical_search(self, query_text: str, mask: np.ndarray, top_n: int) -> List[Tuple[int, float]]:
+    """Top (row, BM25 score) pairs among the live rows selected by mask."""
+    with self.lock:
+      return self.lexical.search(query_text, mask & self.alive, top_n)
+
+  def set_doc_groups(self, doc_groups_by_document: Dict[str, List[str]]) -> int:
+    """Replace the doc groups of points by document id; returns the number of points changed."""
+    with self.lock:
+      changed = 0
+      for point_id, payload in zip(self.ids, self.payloads):
+        groups = doc_groups_by_document.get(point_id.split(':', 1)[0], [])
+        if payload.get('doc_groups') != groups:
+          payload['doc_groups'] = groups
+          changed += 1
+      if changed:
+        self._invalidate_filters()
+        self.generation += 1
+      return changed
+
+  def _invalidate_filters(self):
+    self._group_rows = None
+    self._masks.clear()
+
+  def apply(self, op: Dict[str, Any]) -> int:
+    """Apply a journal entry (see LocalVectorIndexStore); returns the number of points changed."""
+    with self.lock:
+      if op['op'] == 'add':
+        changed = self.add([(point_id, _decode_vector(vector), payload) for point_id, vector, payload in op['points']])
+      elif op['op'] == 'delete':
+        changed = self.delete_where(op['key'], op['value'])
+      elif op['op'] == 'doc_groups':
+        changed = self.set_doc_groups(op['groups'])
+      else:
+        raise ValueError(f"Unknown journal op: {op['op']}")
+      generation = op.get('generation')
+      if generation is not None and self.source_generation == generation - 1:
+        self.source_generation = generation
+      return changed
+
+  def replay(self, journal_path: str) -> int:
+    """Apply the complete journal entries past journal_offset; returns how many were applied."""
+    with self.lock:
+      try:
+        with open(journal_path, 'rb') as f:
+          f.seek(self.journal_offset)
+          data = f.read()
+      except FileNotFoundError:
+        return 0
+      # A line without its newline is still being written (or was torn by a crash)
+      end = data.rfind(b'\n') + 1
+      applied = 0
+      for line in data[:end].splitlines():
+        if line.strip():
+          self.apply(json.loads(line))
+          applied += 1
+      self.journal_offset += end
+      return applied
+
+  # ----- search -----
+
+  def _groups(self) -> Dict[str, np.ndarray]:
+    if self._group_rows is None:
+      rows: Dict[str, List[int]] = {}
+      for i, payload in enumerate(self.payloads):
+        for group in payload.get('doc_groups') or []:
+          rows.setdefault(group, []).append(i)
+      self._group_rows = {group: np.asarray(r, dtype=np.int64) for group, r in rows.items()}
+    return self._group_rows
+
+  def group_mask(self, groups: List[str]) -> np.ndarray:
+    """Rows in any of the given doc groups."""
+    mask = np.zeros(len(self.ids), dtype=bool)
+    group_rows = self._groups()
+    for group in groups:
+      rows = group_rows.get(group)
+      if rows is not None:
+        mask[rows] = True
+    return mask
+
+  def filter_mask(self, groups: Optional[Tuple[str, ...]], disabled: frozenset) -> np.ndarray:
+    """Rows in groups (every row if None) and in none of the disabled groups; cached until the index changes."""
+    key = (groups, disabled)
+    mask = self._masks.get(key)
+    if mask is None:
+      mask = np.ones(len(self.ids), dtype=bool) if groups is None else self.group_mask(list(groups))
+      if disabled:
+        mask &= ~self.group_mask(list(disabled))
+      mask &= self.alive
+      if len(self._masks) >= 64:
+        self._masks.clear()
+      self._masks[key] = mask
+    return mask
+
+  def _schedule_hnsw(self, threshold: int):
+    """Start building the HNSW graph on a background thread; searches stay exact until it's ready."""
+    if hnswlib is None or self._hnsw is not None or self._hnsw_building or len(self) < threshold:
+      return
+    self._hnsw_building = True
+    threading.Thread(target=self._build_hnsw, daemon=True).start()
+
+  def _build_hnsw(self):
+    try:
+      with self.lock:
+        layout, count, vectors = self._layout, len(self.ids), self.vectors
+      index = hnswlib.Index(space='ip', dim=self.dim)
+      index.init_index(max_elements=count, ef_construction=200, M=16)
+      index.add_items(np.asarray(vectors[:count]), np.arange(count))
+      with self.lock:
+        if layout != self._layout:
+          return
+        # Catch up with points added and deleted while the graph was built
+        if len(self.ids) > count:
+          index.resize_index(len(self.ids))
+          index.add_items(np.asarray(self.vectors[count:]), np.arange(count, len(self.ids)))
+        for row in np.flatnonzero(~self.alive):
+          index.mark_deleted(int(row))
+        self._hnsw = index
+    except Exception as e:
+      print(f"Could not build HNSW index for {self.course_name}: {e}")
+    finally:
+      self._hnsw_building = False
+
+  def set_quantization(self, mode: str, rescore_factor: Optional[int] = None):
+    """Switch the search representation (drops quantized copies that are no longer used)."""
+    with self.lock:
+      if mode not in quantization.MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+      self.quantization = mode
+      if rescore_factor is not None:
+        self.rescore_factor = rescore_factor
+      if mode != 'int8':
+        self.codes = self.scales = None
+      if mode != 'binary':
+        self.bits = None
+
+  def _approximate_scores(self, query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """Quantized scores of the candidate rows (builds the quantized copy on first use)."""
+    every_row = candidates.size == len(self.ids)
+    if self.quantization == 'int8':
+      if self.codes is None:
+        self.codes, self.scales = quantization.quantize_int8(self.vectors)
+      codes = self.codes if every_row else self.codes[candidates]
+      scales = self.scales if every_row else self.scales[candidates]
+      return quantization.int8_scores(codes, scales, query)
+    if self.bits is None:
+      self.bits = quantization.quantize_binary(self.vectors)
+    return quantization.binary_scores(self.bits if every_row else self.bits[candidates], query)
+
+  def search(self, query: np.ndarray, mask: np.ndarray, top_n: int,
+             hnsw_threshold: int) -> List[Tuple[int, float]]:
+    """Top (row, cosine score) pairs among the rows selected by mask."""
+    with self.lock:
+      mask = mask & self.alive
+      candidates = np.flatnonzero(mask)
+      if candidates.size == 0 or top_n <= 0:
+        return []
+
+      self._schedule_hnsw(hnsw_threshold)
+      if self._hnsw is not None and candidates.size > 0.1 * len(self.ids):
+        k = min(top_n, candidates.size)
+        self._hnsw.set_ef(max(2 * k, 64))
+        try:
+          labels, distances = self._hnsw.knn_query(query, k=k, filter=lambda label: bool(mask[label]))
+          # 'ip' distance is 1 - inner product
+          return [(int(label), float(1.0 - dist)) for label, dist in zip(labels[0], distances[0])]
+        except RuntimeError:
+          # hnswlib raises when the filtered walk finds fewer than k neighbours; scan exactly instead
+          pass
+
+      window = top_n * max(self.rescore_factor, 1)
+      if self.quantization != 'none' and candidates.size > window:
+        # Shortlist on the quantized copy, then rescore the shortlist exactly
+        approximate = self._approximate_scores(query, candidates)
+        candidates = candidates[np.argpartition(-approximate, window - 1)[:window]]
+        candidates.sort()
+
+      # Exact search over the candidates
+      vectors = self.vectors if candidates.size == len(self.ids) else self.vectors[candidates]
+      scores = vectors @ query
+      k = min(top_n, scores.size)
+      top = np.argpartition(-scores, k - 1)[:k]
+      top = top[np.argsort(-scores[top])]
+      return [(int(candidates[i]), float(scores[i])) for i in top]
+
+  # ----- persistence -----
+
+  def save(self, directory: str):
+    """Write a new generation (with an empty journal) under directory and point CURRENT at it."""
+    with self.lock:
+      generation_dir = os.path.join(directory, f"g{int(time.time() * 1000)}-{os.getpid()}")
+      os.makedirs(generation_dir, exist_ok=True)
+      np.save(os.path.join(generation_dir, 'vectors.npy'), np.ascontiguousarray(self.vectors))
+      np.save(os.path.join(generation_dir, 'alive.npy'), self.alive)
+      with open(os.path.join(generation_dir, 'points.json'), 'w') as f:
+        json.dump(
+            {
+                'course_name': self.course_name,
+                'dim': self.dim,
+                'source_generation': self.source_generation,
+                'built_at': self.built_at,
+                'ids': self.ids,
+                'payloads': self.payloads,
+            }, f)
+      self.lexical.save(generation_dir)
+      if self.codes is not None:
+        np.save(os.path.join(generation_dir, 'codes_int8.npy'), self.codes)
+        np.save(os.path.join(generation_dir, 'scales.npy'), self.scales)
+      if self.bits is not None:
+        np.save(os.path.join(generation_dir, 'codes_binary.npy'), self.bits)
+
+      current = os.path.join(directory, 'CURRENT')
+      previous = _read_current(directory)
+      tmp = f"{current}.{os.getpid()}.tmp"
+      with open(tmp, 'w') as f:
+        f.write(os.path.basename(generation_dir))
+      os.replace(tmp, current)
+      self.disk_generation = os.path.basename(generation_dir)
+      self.journal_offset = 0
+      if previous and previous != self.disk_generation:
+        # Readers that still map the old files keep them alive until they reload
+        shutil.rmtree(os.path.join(directory, previous), ignore_errors=True)
+
+  @classmethod
+  def load(cls, directory: str, quantization_mode: str = 'none', rescore_factor: int = 4) -> Optional['CourseIndex']:
+    """Load the CURRENT generation under directory and replay its journal."""
+    generation = _read_current(directory)
+    if not generation:
+      return None
+    generation_dir = os.path.join(directory, generation)
+    with open(os.path.join(generation_dir, 'points.json')) as f:
+      points = json.load(f)
+    index = cls(points['course_name'], points.get('dim'), quantization_mode, rescore_factor)
+    # Float vectors stay on disk; with quantization only rescored rows are paged in
+    index.vectors = np.load(os.path.join(generation_dir, 'vectors.npy'), mmap_mode='r')
+    codes_path = os.path.join(generation_dir, 'codes_int8.npy')
+    bits_path = os.path.join(generation_dir, 'codes_binary.npy')
+    if quantization_mode == 'int8' and os.path.exists(codes_path):
+      index.codes = np.load(codes_path)
+      index.scales = np.load(os.path.join(generation_dir, 'scales.npy'))
+    elif quantization_mode == 'binary' and os.path.exists(bits_path):
+      index.bits = np.load(bits_path)
+    index.alive = np.load(os.path.join(generation_dir, 'alive.npy'))
+    index.ids = points['ids']
+    index.payloads = points['payloads']
+    index._row_by_id = {point_id: row for row, point_id in enumerate(index.ids)}
+    # Generations saved before these were recorded are treated as stale
+    index.source_generation = points.get('source_generation')
+    index.built_at = points.get('built_at', 0.0)
+    lexical = LexicalIndex.load(generation_dir)
+    if lexical is None or len(lexical) != len(index.ids):
+      index._rebuild_lexical()
+    else:
+      index.lexical = lexical
+    index.disk_generation = generation
+    index.replay(os.path.join(generation_dir, JOURNAL_FILE))
+    return index
+
+
+def _read_current(directory: str) -> Optional[str]:
+  try:
+    with open(os.path.join(directory, 'CURRENT')) as f:
+      return f.read().strip() or None
+  except FileNotFoundError:
+    return None
+
+
+@contextlib.contextmanager
+def _flock(path: str, operation: int) -> Iterator[bool]:
+  """Hold an fcntl lock on path for the block; yields False if a LOCK_NB lock is held elsewhere."""
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, 'a') as f:
+    try:
+      fcntl.flock(f, operation)
+    except BlockingIOError:
+      yield False
+      return
+    try:
+      yield True
+    finally:
+      fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LocalVectorIndexStore:
+  """
+  Process-wide registry of CourseIndex instances (in memory, on disk, or built from Supabase).
+
+  On disk each course has a directory holding its saved generations, a CURRENT
+  file naming the live one, and two lock files: LOCK serializes writers of the
+  journal and CURRENT (readers take it shared), REBUILD keeps workers from
+  building the same course at once.
+  """
+
+  def __init__(self, index_dir: str, hnsw_threshold: int = 20000, hybrid: bool = True, rrf_k: int = 60,
+               lexical_weight: float = 1.0, quantization_mode: str = 'none', rescore_factor: int = 4,
+               staleness_check_seconds: float = 30, max_age_seconds: float = 3600,
+               journal_max_bytes: int = 64 * 2**20):
+    self.index_dir = index_dir
+    self.hnsw_threshold = hnsw_threshold
+    self.quantization = quantization_mode
+    self.rescore_factor = rescore_factor
+    self.hybrid = hybrid
+    self.rrf_k = rrf_k
+    self.lexical_weight = lexical_weight
+    self.staleness_check_seconds = staleness_check_seconds
+    self.max_age_seconds = max_age_seconds
+    self.journal_max_bytes = journal_max_bytes
+    self._indexes: Dict[str, CourseIndex] = {}
+    self._lock = threading.Lock()
+    self._build_locks: Dict[str, threading.Lock] = {}
+
+  def _course_dir(self, course_name: str) -> str:
+    slug = re.sub(r'[^A-Za-z0-9_-]', '_', course_name)[:64]
+    digest = hashlib.sha1(course_name.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(self.index_dir, f"{slug}-{digest}")
+
+  def _build_lock(self, course_name: str) -> threading.Lock:
+    with self._lock:
+      return self._build_locks.setdefault(course_name, threading.Lock())
+
+  def _journal_path(self, course_name: str, generation: str) -> str:
+    return os.path.join(self._course_dir(course_name), generation, JOURNAL_FILE)
+
+  def _journal_size(self, course_name: str, generation: Optional[str]) -> int:
+    if not generation:
+      return 0
+    try:
+      return os.path.getsize(self._journal_path(course_name, generation))
+    except OSError:
+      return 0
+
+  def _file_lock(self, course_name: str, operation: int):
+    return _flock(os.path.join(self._course_dir(course_name), 'LOCK'), operation)
+
+  def get(self, course_name: str, sql_db: Optional[SQLDatabase] = None, build: bool = True) -> Optional[CourseIndex]:
+    """
+    The course's index, caught up with what other workers saved or journaled.
+
+    With sql_db, a missing index is built, and a stale one (see _check_staleness)
+    keeps being returned while it is rebuilt in the background.
+    """
+    index = self._indexes.get(course_name)
+    if index is None or _read_current(self._course_dir(course_name)) not in (None, index.disk_generation) \
+        or self._journal_size(course_name, index.disk_generation) > index.journal_offset:
+      index = self._load(course_name, sql_db if build else None)
+    if index is not None and sql_db is not None:
+      self._check_staleness(index, sql_db)
+    return index
+
+  def _sync(self, course_name: str) -> Optional[CourseIndex]:
+    """Bring the in-memory index up to the saved generation and its journal (caller holds LOCK)."""
+    index = self._indexes.get(course_name)
+    on_disk = _read_current(self._course_dir(course_name))
+    if on_disk and (index is None or index.disk_generation != on_disk):
+      try:
+        loaded = CourseIndex.load(self._course_dir(course_name), self.quantization, self.rescore_factor)
+      except Exception as e:
+        print(f"Could not load vector index for {course_name}: {e}")
+        loaded = None
+      if loaded is not None:
+        index = self._indexes[course_name] = loaded
+    elif index is not None and index.disk_generation:
+      index.replay(self._journal_path(course_name, index.disk_generation))
+    return index
+
+  def _load(self, course_name: str, sql_db: Optional[SQLDatabase]) -> Optional[CourseIndex]:
+    if sql_db is None and not os.path.isdir(self._course_dir(course_name)):
+      return None
+    with self._build_lock(course_name):
+      with self._file_lock(course_name, fcntl.LOCK_SH):
+        index = self._sync(course_name)
+      if index is not None or sql_db is None:
+        return index
+      with _flock(os.path.join(self._course_dir(course_name), 'REBUILD'), fcntl.LOCK_EX):
+        # Another worker may have built it while we waited
+        with self._file_lock(course_name, fcntl.LOCK_SH):
+          index = self._sync(course_name)
+        if index is None:
+          generations = get_course_generations().get_many([course_name])
+          index = self._build(course_name, sql_db, generations[0] if generations else None)
+          with self._file_lock(course_name, fcntl.LOCK_EX):
+            self._save(index)
+      return index
+
+  def _check_staleness(self, index: CourseIndex, sql_db: SQLDatabase):
+    """Rebuild the index in the background if the course changed outside this backend, or it is too old."""
+    now = time.time()
+    if index.refreshing or now - index.checked_at < self.staleness_check_seconds:
+      return
+    index.checked_at = now
+    stale = bool(self.max_age_seconds) and now - index.built_at > self.max_age_seconds
+    if not stale:
+      generations = get_course_generations().get_many([index.course_name])
+      stale = generations is not None and generations[0] != index.source_generation
+    if stale:
+      index.refreshing = True
+      threading.Thread(target=self._refresh, args=(index, sql_db), daemon=True).start()
+
+  def _refresh(self, stale: CourseIndex, sql_db: SQLDatabase):
+    course_name = stale.course_name
+    try:
+      with _flock(os.path.join(self._course_dir(course_name), 'REBUILD'), fcntl.LOCK_EX | fcntl.LOCK_NB) as locked:
+        if not locked:
+          # Another worker is rebuilding; its generation is picked up by a later get()
+          return
+        # Read before building: changes made during the build leave the new index stale, not wrong
+        generations = get_course_generations().get_many([course_name])
+        with self._file_lock(course_name, fcntl.LOCK_SH):
+          base = _read_current(self._course_dir(course_name))
+          base_offset = self._journal_size(course_name, base)
+        index = self._build(course_name, sql_db, generations[0] if generations else None)
+        with self._file_lock(course_name, fcntl.LOCK_EX):
+          if base and _read_current(self._course_dir(course_name)) == base:
+            # Carry over what this backend journaled while the course was being read
+            index.journal_offset = base_offset
+            index.replay(self._journal_path(course_name, base))
+          self._save(index)
+    except Exception as e:
+      print(f"Could not refresh vector index for {course_name}: {e}")
+    finally:
+      stale.refreshing = False
+
+  def _save(self, index: CourseIndex):
+    """Save index as the course's new generation and serve it (caller holds LOCK exclusively)."""
+    try:
+      index.save(self._course_dir(index.course_name))
+    except OSError as e:
+      print(f"Could not persist vector index for {index.course_name}: {e}")
+    self._indexes[index.course_name] = index
+
+  def _build(self, course_name: str, sql_db: SQLDatabase, source_generation: Optional[int] = None,
+             page_size: int = 100) -> CourseIndex:
+    """Build a course index from the stored chunk embeddings."""
+    started = time.monotonic()
+    index = CourseIndex(course_name, quantization_mode=self.quantization, rescore_factor=self.rescore_factor)
+    index.source_generation = source_generation
+    chunk_store = ChunkStore(sql_db)
+    fields = 'id, s3_path, readable_filename, url, base_url, doc_groups(name)'
+    first_id = 0
+    while True:
+      try:
+        response = sql_db.getDocsForIdsGte(course_name, first_id, fields=fields, limit=page_size)
+      except Exception as e:
+        if 'doc_groups' not in fields:
+          raise
+        print(f"Building vector index without doc groups: {e}")
+        fields = 'id, s3_path, readable_filename, url, base_url'
+        continue
+      rows = response.data or []
+      for document in chunk_store.with_contexts(rows, with_vectors=True):
+        index.add(document_points(course_name, document))
+      if len(rows) < page_size:
+        break
+      first_id = rows[-1]['id'] + 1
+    print(f"Built vector index for {course_name}: {len(index)} points in {time.monotonic() - started:.2f}s")
+    return index
+
+  def _mutate(self, course_name: str, op: Dict[str, Any]) -> int:
+    """
+    Apply a journal op to the course index, if one exists, and append it to the
+    saved generation's journal. Callers bump the course's retrieval generation
+    afterwards; when the index was current, that bump is recorded up front so it
+    doesn't trigger a rebuild.
+    """
+    if course_name not in self._indexes and not os.path.isdir(self._course_dir(course_name)):
+      return 0
+    with self._build_lock(course_name), self._file_lock(course_name, fcntl.LOCK_EX):
+      index = self._sync(course_name)
+      if index is None:
+        return 0
+      generations = get_course_generations().get_many([course_name])
+      changed = index.apply(op)
+      if not changed:
+        return 0
+      if generations is not None and generations[0] == index.source_generation:
+        op = {**op, 'generation': generations[0] + 1}
+        index.source_generation = generations[0] + 1
+      if index.disk_generation is None:
+        self._save(index)
+        return changed
+      line = (json.dumps(op) + '\n').encode('utf-8')
+      try:
+        with open(self._journal_path(course_name, index.disk_generation), 'ab') as f:
+          # Everything past the offset is a line torn by a crashed writer
+          f.truncate(index.journal_offset)
+          f.write(line)
+        index.journal_offset += len(line)
+      except OSError as e:
+        print(f"Could not journal vector index change for {course_name}: {e}")
+        return changed
+      if index.journal_offset > self.journal_max_bytes:
+        self._save(index)
+      return changed
+
+  def add_document(self, course_name: str, document: Dict[str, Any]) -> int:
+    """Add an ingested document to the course index if one exists (otherwise it's picked up on first build)."""
+    points = document_points(course_name, document)
+    if not points:
+      return 0
+    return self._mutate(course_name, {
+        'op': 'add',
+        'points': [[point_id, _encode_vector(vector), payload] for point_id, vector, payload in points],
+    })
+
+  def refresh_doc_groups(self, course_name: str, sql_db: SQLDatabase, page_size: int = 1000) -> int:
+    """Re-read doc-group membership of an existing course index (after documents were (un)grouped)."""
+    if self.get(course_name, build=False) is None:
+      return 0
+    doc_groups_by_document: Dict[str, List[str]] = {}
+    first_id = 0
+    while True:
+      rows = sql_db.getDocsForIdsGte(course_name, first_id, fields='id, doc_groups(name)', limit=page_size).data or []
+      for row in rows:
+        doc_groups_by_document[str(row['id'])] = [group['name'] for group in row.get('doc_groups') or []]
+      if len(rows) < page_size:
+        break
+      first_id = rows[-1]['id'] + 1
+    return self._mutate(course_name, {'op': 'doc_groups', 'groups': doc_groups_by_document})
+
+  def delete(self, key: str, value: Any, course_name: Optional[str] = None) -> int:
+    """Remove points whose payload[key] == value, from one course or every loaded index."""
+    courses = [course_name] if course_name else list(self._indexes)
+    return sum(self._mutate(course, {'op': 'delete', 'key': key, 'value': value}) for course in courses)
+
+
+_index_store: Optional[LocalVectorIndexStore] = None
+_index_store_lock = threading.Lock()
+
+
+def get_local_vector_index_store() -> LocalVectorIndexStore:
+  """Return the process-wide local vector index store."""
+  global _index_store
+  if _index_store is None:
+    with _index_store_lock:
+      if _index_store is None:
+        _index_store = LocalVectorIndexStore(
+            index_dir=os.environ.get('LOCAL_VECTOR_INDEX_DIR', 'local_vector_index'),
+            hnsw_threshold=int(os.environ.get('LOCAL_VECTOR_HNSW_THRESHOLD', 20000)),
+            hybrid=os.environ.get('HYBRID_SEARCH', 'true').lower() == 'true',
+            rrf_k=int(os.environ.get('HYBRID_RRF_K', 60)),
+            lexical_weight=float(os.environ.get('HYBRID_LEXICAL_WEIGHT', 1.0)),
+            quantization_mode=os.environ.get('LOCAL_VECTOR_QUANTIZATION', 'none').lower(),
+            rescore_factor=int(os.environ.get('LOCAL_VECTOR_RESCORE_FACTOR', 4)),
+            staleness_check_seconds=float(os.environ.get('LOCAL_VECTOR_STALENESS_CHECK_SECONDS', 30)),
+            max_age_seconds=float(os.environ.get('LOCAL_VECTOR_MAX_AGE_SECONDS', 3600)),
+            journal_max_bytes=int(float(os.environ.get('LOCAL_VECTOR_JOURNAL_MAX_MB', 64)) * 2**20),
+        )
+  return _index_store
+
+
+class LocalVectorDatabase():
+  """
+  VectorDatabase backed by the embedded per-course index.
+  """
+
+  @inject
+  def __init__(self, sql_db: SQLDatabase):
+    self.sql_db = sql_db
+    self.store = get_local_vector_index_store()
+
+  def _filtered_search(self, search_query: str, course_name: str, doc_groups: List[str], user_query_embedding,
+                       top_n: int, disabled_doc_groups: List[str], public_doc_groups: List[dict],
+                       search_filter: Optional[DocGroupFilter] = None) -> List[ScoredChunk]:
+    if search_filter is None:
+      search_filter = DocGroupFilter(course_name, disabled_doc_groups or [], public_doc_groups or [])
+    hybrid = self.store.hybrid and bool(search_query)
+
+    query = _normalize(np.asarray(user_query_embedding, dtype=np.float32))
+    vector_hits: List[ScoredChunk] = []
+    lexical_hits: List[ScoredChunk] = []
+    hits: Dict[Tuple[str, str], ScoredChunk] = {}
+    for course, groups in search_filter.selections(doc_groups).items():
+      index = self.store.get(course, self.sql_db)
+      if index is None or not len(index) or index.dim != query.shape[-1]:
+        continue
+      with index.lock:
+        mask = index.filter_mask(groups, search_filter.disabled)
+        for row, score in index.search(query, mask, top_n, self.store.hnsw_threshold):
+          # Callers mutate payloads (e.g. pop page_content), so hand out copies
+          hit = ScoredChunk(id=index.ids[row], score=score, payload=dict(index.payloads[row]), vector_score=score)
+          hits[(course, hit.id)] = hit
+          vector_hits.append(hit)
+        if hybrid:
+          for row, score in index.lexical_search(search_query, mask, top_n):
+            hit = hits.get((course, index.ids[row]))
+            if hit is None:
+              hit = ScoredChunk(id=index.ids[row], score=0.0, payload=dict(index.payloads[row]))
+              hits[(course, hit.id)] = hit
+            hit.lexical_score = score
+            lexical_hits.append(hit)
+
+    vector_hits.sort(key=lambda hit: hit.vector_score, reverse=True)
+    if not hybrid:
+      return vector_hits[:top_n]
+
+    lexical_hits.sort(key=lambda hit: hit.lexical_score, reverse=True)
+    fused = reciprocal_rank_fusion([[id(hit) for hit in vector_hits], [id(hit) for hit in lexical_hits]],
+                                   k=self.store.rrf_k,
+                                   weights=[1.0, self.store.lexical_weight])
+    by_id = {id(hit): hit for hit in hits.values()}
+    results = []
+    for key, score in fused[:top_n]:
+      hit = by_id[key]
+      hit.score = score
+      results.append(hit)
+    return results
+
+  def vector_search(self, search_query, course_name, doc_groups: List[str], user_query_embedding, top_n,
+                    disabled_doc_groups: List[str], public_doc_groups: List[dict],
+                    search_filter: Optional[DocGroupFilter] = None):
+    """
+    Search the vector database for a given query.
+    """
+    return self._filtered_search(search_query, course_name, doc_groups, user_query_embedding, top_n,
+                                 disabled_doc_groups, public_doc_groups, search_filter)
+
+  def cropwizard_vector_search(self, search_query, course_name, doc_groups: List[str], user_query_embedding, top_n,
+                               disabled_doc_groups: List[str], public_doc_groups: List[dict],
+                               search_filter: Optional[DocGroupFilter] = None):
+    """
+    Search the vector database for a given query.
+    """
+    top_n = 120
+    return self._filtered_search(search_query, course_name, doc_groups, user_query_embedding, top_n,
+                                 disabled_doc_groups, public_doc_groups, search_filter)
+
+  def pubmed_vector_search(self, search_query, course_name, doc_groups: List[str], user_query_embedding, top_n,
+                           disabled_doc_groups: List[str], public_doc_groups: List[dict],
+                           search_filter: Optional[DocGroupFilter] = None):
+    """
+    PubMed embeddings live in the external Vyriad collection and aren't indexed locally.
+    """
+    print("pubmed_vector_search: the PubMed collection is not available in the local vector index")
+    return []
+
+  def vyriad_vector_search(self, search_query, course_name, doc_groups: List[str], user_query_embedding, top_n,
+                           disabled_doc_groups: List[str], public_doc_groups: List[dict],
+                           search_filter: Optional[DocGroupFilter] = None):
+    """
+    Vyriad embeddings live in the external Vyriad collection and aren't indexed locally.
+    """
+    print("vyriad_vector_search: the Vyriad collection is not available in the local vector index")
+    return []
+
+  def add_document(self, course_name: str, document: Dict[str, Any]) -> int:
+    """
+    Add an ingested documents row (with contexts[].embedding) to the course index.
+    """
+    return self.store.add_document(course_name, document)
+
+  def refresh_doc_groups(self, course_name: str) -> int:
+    """
+    Re-read doc-group membership for the course index after documents were added to or removed from groups.
+    """
+    return self.store.refresh_doc_groups(course_name, self.sql_db)
+
+  def delete_data(self, collection_name: str, key: str, value: str, course_name: Optional[str] = None):
+    """
+    Delete data from the vector database.
+    """
+    return self.store.delete(key, value, course_name)
+
+  def delete_data_cropwizard(self, key: str, value: str):
+    """
+    Delete data from the vector database.
+    """
+    return self.store.delete(key, value, 'cropwizard-1.5')
@@ -0,0 +1,60 @@
+"""
+Quantized copies of normalized embedding matrices for the local vector index.
+
+* int8: one signed byte per dimension plus a float32 scale per vector (~4x
+  smaller than float32).
+* binary: one sign bit per dimension, packed (32x smaller), compared by
+  Hamming distance.
+
+Quantized scores only pick candidates: CourseIndex rescans a window of
+top_n * rescore_factor of them against the exact float32 vectors, which stay
+memory-mapped on disk so only the rescored rows are paged in.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+MODES = ('none', 'int8', 'binary')
+
+# Set bits per byte value, for numpy versions without np.bitwise_count
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+  """Symmetric per-vector int8 codes and their scales."""
+  vectors = np.asarray(vectors, dtype=np.float32)
+  scales = np.abs(vectors).max(axis=-1) / 127.0
+  scales[scales == 0] = 1.0
+  codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+  return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+  """Sign bits, packed 8 dimensions per byte."""
+  return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+  """Approximate inner products of the query with int8-coded vectors."""
+  return (codes @ query.astype(np.float32)) * scales
+
+
+def binary_scores(bits: np.ndarray, query: np.ndarray) -> np.ndarray:
+  """Negated Hamming distance between the query's sign bits and the coded vectors (higher is closer)."""
+  query_bits = quantize_binary(query[None, :])[0]
+  xor = np.bitwise_xor(bits, query_bits)
+  if hasattr(np, 'bitwise_count'):
+    distances = np.bitwise_count(xor).sum(axis=-1, dtype=np.int32)
+  else:
+    distances = _POPCOUNT[xor].sum(axis=-1, dtype=np.int32)
+  return -distances.astype(np.float32)
+
+
+def nbytes(mode: str, count: int, dim: int) -> int:
+  """Resident size of the search representation of count vectors."""
+  if mode == 'int8':
+    return count * (dim + 4)
+  if mode == 'binary':
+    return count * ((dim + 7) // 8)
+  return count * dim * 4
@@ -26,6 +26,19 @@ class ModelUsage(TypedDict):
     count: int
     percentage: float
 
+
+# PostgREST "function not found in the schema cache" and Postgres undefined_function
+MISSING_FUNCTION_CODES = ('PGRST202', '42883')
+
+
+def is_missing_function_error(e: Exception) -> bool:
+  """Whether e comes from calling an RPC whose migration hasn't been applied."""
+  code = getattr(e, 'code', None)
+  if code:
+    return code in MISSING_FUNCTION_CODES
+  return any(missing in str(e) for missing in MISSING_FUNCTION_CODES)
+
+
 class SQLDatabase:
 
   @inject
@@ -43,20 +56,24 @@ class SQLDatabase:
         os.environ['SUPABASE_DOCUMENTS_TABLE']).select('course_name, s3_path, readable_filename, url, base_url').eq(
             'course_name', course_name).execute()
   
-  def getCSVFilesForCourse(self, course_name: str, limit: int = 10):
+  def getCSVFilesForCourse(self, course_name: str, limit: int = 10, include_metadata: bool = True):
     """Get CSV files for a course using the optimized index."""
+    columns = 'id, s3_path, readable_filename, url'
+    if include_metadata:
+      # shape/columns let the file agent register the file without downloading it
+      columns += ', row_count, column_headers, sidecar_s3_path'
     return self.supabase_client.table(
         os.environ.get('SUPABASE_DOCUMENTS_TABLE', 'documents')).select(
-            'id, s3_path, readable_filename, url').eq(
+            columns).eq(
             'course_name', course_name).eq('is_csv', True).order(
             'created_at', desc=True).limit(limit).execute()
 
   def getMaterialsForCourseAndS3Path(self, course_name: str, s3_path: str):
-    return self.supabase_client.from_(os.environ['SUPABASE_DOCUMENTS_TABLE']).select("id, s3_path, contexts").eq(
+    return self.supabase_client.from_(os.environ['SUPABASE_DOCUMENTS_TABLE']).select("id, s3_path").eq(
         's3_path', s3_path).eq('course_name', course_name).execute()
 
   def getMaterialsForCourseAndKeyAndValue(self, course_name: str, key: str, value: str):
-    return self.supabase_client.from_(os.environ['SUPABASE_DOCUMENTS_TABLE']).select("id, s3_path, contexts").eq(
+    return self.supabase_client.from_(os.environ['SUPABASE_DOCUMENTS_TABLE']).select("id, s3_path").eq(
         key, value).eq('course_name', course_name).execute()
 
   def deleteMaterialsForCourseAndKeyAndValue(self, course_name: str, key: str, value: str):
@@ -120,6 +137,17 @@ class SQLDatabase:
     return self.supabase_client.table("documents").select(fields).eq("course_name", course_name).gte(
         'id', first_id).order('id', desc=False).limit(limit).execute()
 
+  def getContextWindows(self, course_name: str, windows: List[Dict]):
+    """Text fields of the chunks inside each window; see migrations/add_context_window_rpc.sql."""
+    return self.supabase_client.rpc('get_context_windows', {
+        'p_course_name': course_name,
+        'p_windows': windows
+    }).execute()
+
+  def getDocumentsByKeys(self, course_name: str, key: str, values: List[str]):
+    return self.supabase_client.table("documents").select("id, s3_path, url, readable_filename, base_url").eq(
+        "course_name", course_name).in_(key, values).execute()
+
   def insertProjectInfo(self, project_info):
     return self.supabase_client.table("projects").insert(project_info).execute()
 
@@ -247,6 +275,23 @@ class SQLDatabase:
         print(f"Error in getConversationsCreatedAtByCourse for {course_name}: {str(e)}")
         return [], 0
   
+  def getConversationsCreatedAtSince(self, course_name: str, after_id: int, limit: int = 1000):
+    """Next page of (id, created_at) of the course's conversations with id > after_id, in id order."""
+    return self.supabase_client.table("llm-convo-monitor").select("id, created_at").eq("course_name", course_name).gt(
+        "id", after_id).order("id", desc=False).limit(limit).execute()
+
+  def getConversationStatsBuckets(self, course_name: str):
+    """{last_id, buckets}; see migrations/add_conversation_stats_buckets.sql."""
+    return self.supabase_client.rpc('get_conversation_stats', {'p_course_name': course_name}).execute()
+
+  def applyConversationStatsBuckets(self, course_name: str, from_id: int, to_id: int, buckets: List[Dict]):
+    return self.supabase_client.rpc('apply_conversation_stats', {
+        'p_course_name': course_name,
+        'p_from_id': from_id,
+        'p_to_id': to_id,
+        'p_buckets': buckets
+    }).execute()
+
   def getProjectStats(self, project_name: str) -> ProjectStats:
     try:
         response = self.supabase_client.table("project_stats").select("total_messages, total_conversations, unique_users")\
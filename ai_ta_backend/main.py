@@ -20,6 +20,7 @@ from flask_injector import FlaskInjector, RequestScope
 from injector import Binder, SingletonScope
 
 from ai_ta_backend.database.aws import AWSStorage
+from ai_ta_backend.database.local_vector import get_local_vector_index_store
 from ai_ta_backend.database.sql import SQLDatabase
 from ai_ta_backend.executors.flask_executor import (
     ExecutorInterface,
@@ -41,8 +42,13 @@ from ai_ta_backend.service.sentry_service import SentryService
 from ai_ta_backend.service.workflow_service import WorkflowService
 from ai_ta_backend.service.file_agent_service import FileAgentService
 from ai_ta_backend.service.vertex_ingestion_service import VertexIngestionService
-from ai_ta_backend.service.adk_llm_service import ADKLLMService, EventLogger
+from ai_ta_backend.service.adk_llm_service import SerializedEvent, get_event_logger
 from ai_ta_backend.service.conversation_service import ConversationService
+from ai_ta_backend.utils.doc_group_cache import get_doc_group_cache
+from ai_ta_backend.utils.retrieval_cache import (
+    bump_retrieval_generation,
+    get_retrieval_cache,
+)
 
 app = Flask(__name__)
 CORS(app, 
@@ -231,6 +237,40 @@ def createProject(service: ProjectService, flaskExecutor: ExecutorInterface) ->
   return response
 
 
+@app.route('/docGroupsChanged', methods=['POST'])
+def doc_groups_changed(sql_db: SQLDatabase, flaskExecutor: ExecutorInterface) -> Response:
+  """
+  Notify the backend that a project's doc groups changed (created, enabled/disabled,
+  shared, or documents added to / removed from a group), so retrieval stops using
+  cached doc-group rules and memberships.
+  """
+  data = request.get_json()
+  course_name = data.get('course_name', '')
+
+  if course_name == '':
+    abort(400, description="Missing required parameter: 'course_name' must be provided.")
+
+  doc_group_cache = get_doc_group_cache()
+  if doc_group_cache:
+    doc_group_cache.invalidate(course_name)
+  bump_retrieval_generation(course_name)
+  # Re-reading group memberships touches every document of the course
+  flaskExecutor.submit(get_local_vector_index_store().refresh_doc_groups, course_name, sql_db)
+
+  response = jsonify({'course_name': course_name, 'invalidated': True})
+  response.headers.add('Access-Control-Allow-Origin', '*')
+  return response
+
+
+@app.route('/retrievalCacheStats', methods=['GET'])
+def retrieval_cache_stats() -> Response:
+  """Hit rate and memory use of this worker's retrieval result cache."""
+  retrieval_cache = get_retrieval_cache()
+  response = jsonify(retrieval_cache.stats() if retrieval_cache else {'enabled': False})
+  response.headers.add('Access-Control-Allow-Origin', '*')
+  return response
+
+
 def _build_conversation_context(messages: list, max_messages: int = 10) -> str:
   """
   Build a lightweight conversation context string from recent messages.
@@ -342,7 +382,7 @@ def ingest_document(vertex_service: VertexIngestionService) -> Response:
 
 
 @app.route('/Chat', methods=['POST'])
-def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -> Response:
+def chat_llm_proxy(file_agent_service: FileAgentService, sql_db: SQLDatabase) -> Response:
   """
   ADK-powered chat endpoint with streaming SSE support.
   Accepts the identical JSON payload as the former Next.js route and streams
@@ -370,6 +410,7 @@ def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -
   print(f"Received model info: {model_info}")
   
   # Initialize conversation service for persistence
+  supabase_client = sql_db.supabase_client
   conversation_service = ConversationService(supabase_client)
   
   # If no messages provided or we need to rebuild from database
@@ -383,6 +424,7 @@ def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -
   # Prepare file agent with CSV and Drive files if course_name is provided
   file_agent_ready = False
   available_files = []
+  dataframes = {}
   if course_name and conversation_id:
     try:
       print(f"Preparing file agent for course: {course_name}, conversation: {conversation_id}")
@@ -392,7 +434,7 @@ def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -
         
         # Get the list of loaded files for agent context
         from ai_ta_backend.agents.tools.file.agent import get_current_dataframes
-        dataframes = get_current_dataframes()
+        dataframes = get_current_dataframes(conversation_id)
         if dataframes:
           available_files = [f"📊 {name}" for name in dataframes.keys()]
           print(f"Available files for agent context: {available_files}")
@@ -400,17 +442,15 @@ def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -
       print(f"Error preparing file agent: {e}")
       # Continue without file agent if preparation fails
   
-  # Create agent with the specified model and available files context
-  from ai_ta_backend.agents.agent import create_agent_with_model
-  agent = create_agent_with_model(model_info, available_files)
+  # Get (or build) the agent + runner for this model and file set from the process-wide pool
+  from ai_ta_backend.agents.agent_pool import get_agent_pool
+  adk_service = get_agent_pool().get_service(model_info, available_files, dataframes)
 
   # Get the last user message
   last_message = messages[-1]
   
-  # Initialize ADK service and logger with the dynamic agent
-  adk_service = ADKLLMService(agent)
-  event_logger = EventLogger()  # TODO: Pass Supabase client when available
-  event_logger.start_worker()
+  # Process-wide background writer for adk_events/messages
+  event_logger = get_event_logger(supabase_client)
   
   # ADK session parameters
   user_id = "user"  # TODO: Extract from auth/api_key
@@ -423,15 +463,15 @@ def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -
       
       if not session_had_history and len(messages) > 1:
         print(f"Session {session_id} was new/empty, created with {len(messages) - 1} messages in context")
-      else:
-        print(f"Session {session_id} already exists")
+      elif session_had_history:
+        print(f"Session {session_id} already holds the conversation history, reusing it")
       
       # Convert last message to ADK format
       new_message = adk_service.convert_message_to_content(last_message)
       
-      # If we have conversation history, include it as context in the new message
+      # If the session doesn't already hold the history, include it as context in the new message
       # This is much more efficient than replaying all messages through the LLM
-      if len(messages) > 1:
+      if len(messages) > 1 and not session_had_history:
         # Create a conversation context that includes recent history
         conversation_summary = _build_conversation_context(messages[:-1])
         if conversation_summary:
@@ -447,17 +487,13 @@ def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -
       event_ids = []
       streamed_events = []
       for event in adk_service.stream_events(user_id, session_id, new_message):
-        # Format as SSE
-        event_json = event.model_dump_json(by_alias=True, exclude_none=True)
-        yield f"data: {event_json}\n\n"
+        # Serialize once; the SSE frame, persistence and the logger share it
+        serialized = SerializedEvent(event)
+        yield serialized.sse
         
         # Collect events for database persistence
-        event_dict = json.loads(event_json)
-        streamed_events.append(event_dict)
-        
-        # Log event asynchronously
+        streamed_events.append(serialized)
         event_ids.append(event.id)
-        event_logger.log_event_async(event, conversation_id)
       
       # Log final message summary
       if event_ids:
@@ -479,9 +515,9 @@ def chat_llm_proxy(file_agent_service: FileAgentService, supabase_client=None) -
           course_name=course_name
         )
         
-        # Save ADK events to database for persistence
+        # Save ADK events to database for persistence (bulk insert, off the response path)
         if streamed_events and conversation_id:
-          conversation_service.save_adk_events(streamed_events, conversation_id)
+          event_logger.log_events_async(streamed_events, conversation_id)
       
       # After streaming completes, process file agent outputs if it was used
       if file_agent_ready and conversation_id:
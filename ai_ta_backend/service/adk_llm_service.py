@@ -1,24 +1,45 @@
 from __future__ import annotations
 
+import atexit
 import base64
+import json
 import logging
+import os
+import queue
+import time
 import uuid
-from typing import Generator, Dict, Any, Optional, List
+from typing import Generator, Dict, Any, Optional, List, Union
 import asyncio
 import threading
-from datetime import datetime
+from datetime import datetime, timezone
 
 from google.genai import types
 from google.adk.runners import Runner
 from google.adk.events.event import Event
 from google.adk.agents.run_config import RunConfig, StreamingMode
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
-from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
 from google.adk.agents.base_agent import BaseAgent
 
+from ai_ta_backend.service.adk_session_service import (
+    get_artifact_service,
+    get_memory_service,
+    get_session_service,
+)
+from ai_ta_backend.service.conversation_service import (
+    ADK_EVENTS_COALESCE_PARTIAL,
+    adk_event_row,
+    coalesce_partial_events,
+    insert_rows,
+)
+
 logger = logging.getLogger(__name__)
 
+# Session state key: user turns of the client history the session was created with
+HISTORY_USER_TURNS_KEY = 'history_user_turns'
+
+
+def _user_turns(messages: List[Dict]) -> int:
+    return sum(1 for msg in messages if msg.get('role', 'user') == 'user')
+
 
 class ADKLLMService:
     """Service for streaming ADK agent responses via SSE."""
@@ -26,18 +47,21 @@ class ADKLLMService:
     def __init__(self, base_agent: BaseAgent):
         """Initialize with the base agent."""
         self.base_agent = base_agent
+        # Session/memory/artifact services are process-wide so a conversation's
+        # session (and its event history) survives across /Chat requests.
         self.runner = Runner(
             app_name="aganswers",
             agent=base_agent,
-            session_service=InMemorySessionService(),
-            memory_service=InMemoryMemoryService(),
-            artifact_service=InMemoryArtifactService(),
+            session_service=get_session_service(),
+            memory_service=get_memory_service(),
+            artifact_service=get_artifact_service(),
         )
     
     def ensure_session(self, user_id: str, session_id: str, historical_messages: Optional[List[Dict]] = None) -> bool:
         """
         Ensure ADK session exists, create if needed.
-        Returns True if session already had history, False if it's new/empty.
+        Returns True if the stored session already holds the conversation's history,
+        False if it's new/empty (or out of sync) and the caller must supply context.
         
         NOTE: We no longer rebuild session history by replaying messages through the LLM
         as this causes exponential slowdown with complex conversation history.
@@ -56,22 +80,42 @@ class ADKLLMService:
                 )
             )
             
-            session_exists = session is not None
+            prior_messages = historical_messages[:-1] if historical_messages else []
+            has_history = session is not None and self._session_covers_history(session, prior_messages)
+            
+            if session is not None and not has_history and prior_messages:
+                # The stored session is stale (e.g. created by another worker or the
+                # history was edited client-side). Start over so the caller's context
+                # isn't mixed with diverging session events.
+                logger.info(f"Session {session_id} out of sync with client history, recreating")
+                loop.run_until_complete(
+                    self.runner.session_service.delete_session(
+                        app_name="aganswers",
+                        user_id=user_id,
+                        session_id=session_id
+                    )
+                )
+                session = None
             
             if not session:
                 # Create session with conversation history in state (for context)
                 # but DON'T replay messages through the LLM
-                conversation_context = {}
-                if historical_messages and len(historical_messages) > 1:
+                # The caller folds prior_messages into the next message, so from here on the
+                # session covers those turns plus one per user event
+                conversation_context = {
+                    'conversation_id': session_id,
+                    HISTORY_USER_TURNS_KEY: _user_turns(prior_messages),
+                }
+                if prior_messages:
                     # Store a summary of conversation history in session state
                     # This is much faster than replaying all messages
-                    conversation_context = {
-                        'message_count': len(historical_messages) - 1,
+                    conversation_context.update({
+                        'message_count': len(prior_messages),
                         'has_history': True,
                         # Store last few messages for context without replaying them
-                        'recent_context': self._extract_recent_context(historical_messages[:-1])
-                    }
-                    logger.info(f"Created session {session_id} with {len(historical_messages) - 1} messages in context (not replayed)")
+                        'recent_context': self._extract_recent_context(prior_messages)
+                    })
+                    logger.info(f"Created session {session_id} with {len(prior_messages)} messages in context (not replayed)")
                 
                 session = loop.run_until_complete(
                     self.runner.session_service.create_session(
@@ -84,12 +128,26 @@ class ADKLLMService:
                 logger.info(f"Created new ADK session: {session_id}")
             
             loop.close()
-            return session_exists
+            return has_history
             
         except Exception as e:
             logger.error(f"Error ensuring session {session_id}: {e}")
             raise
     
+    def _session_covers_history(self, session, prior_messages: List[Dict]) -> bool:
+        """
+        Check whether a stored session already contains every prior user turn.
+        Each message run through the Runner becomes exactly one user-authored event;
+        the first one may also carry the client history the session was created
+        without (counted in HISTORY_USER_TURNS_KEY). Matching counts means the
+        session history can be reused.
+        """
+        user_turns = _user_turns(prior_messages)
+        if user_turns == 0:
+            return False
+        session_turns = sum(1 for event in session.events if event.author == 'user')
+        return session.state.get(HISTORY_USER_TURNS_KEY, 0) + session_turns == user_turns
+    
     def _extract_recent_context(self, historical_messages: List[Dict], max_messages: int = 10) -> List[Dict]:
         """
         Extract recent conversation context without replaying through LLM.
@@ -213,113 +271,193 @@ class ADKLLMService:
             yield error_event
 
 
+class SerializedEvent:
+    """
+    An ADK event serialized exactly once.
+    
+    The SSE writer sends `sse` as is; the EventLogger parses `data` from the
+    same JSON on first use, in its writer thread, off the response path.
+    """
+    
+    __slots__ = ('event', 'json', '_data')
+    
+    def __init__(self, event: Event):
+        self.event = event
+        self.json: bytes = event.model_dump_json(by_alias=True, exclude_none=True).encode('utf-8')
+        self._data: Optional[Dict[str, Any]] = None
+    
+    @property
+    def sse(self) -> bytes:
+        """The event as an SSE frame."""
+        return b"data: " + self.json + b"\n\n"
+    
+    @property
+    def data(self) -> Dict[str, Any]:
+        """The event as a JSON-compatible dict (camelCase aliases, no None fields)."""
+        if self._data is None:
+            self._data = json.loads(self.json)
+        return self._data
+
+
 class EventLogger:
-    """Async logger for ADK events and messages to Supabase."""
+    """
+    Process-wide background writer for ADK events and messages.
     
-    def __init__(self, supabase_client=None):
+    Records go on a bounded thread-safe queue and are written to Supabase
+    (adk_events, messages) by a single daemon thread in bulk requests, flushed
+    once batch_size records are waiting or flush_seconds after the oldest one
+    was queued. Queueing never blocks a request: when the queue is full the
+    record is dropped and counted. Pending records are flushed at exit.
+    
+    Use get_event_logger() rather than creating one per request.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, supabase_client=None, max_queue_size: int = 10000,
+                 batch_size: int = 200, flush_seconds: float = 1.0):
         self.supabase = supabase_client
-        self.log_queue = asyncio.Queue()
-        self.worker_task = None
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.log_queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self.worker_task: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'queued': 0,
+            'dropped': 0,
+            'written_rows': 0,
+            'failed_rows': 0,
+            'batches': 0,
+            'max_queue_depth': 0,
+            'last_flush_seconds': 0.0,
+        }
     
     def start_worker(self):
-        """Start background worker for async logging."""
-        if self.worker_task is None:
-            loop = asyncio.new_event_loop()
-            def run_worker():
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(self._log_worker())
-            
-            self.worker_task = threading.Thread(target=run_worker, daemon=True)
-            self.worker_task.start()
+        """Start the background writer thread (once)."""
+        if self.worker_task is not None:
+            return
+        with self._worker_lock:
+            if self.worker_task is None:
+                self.worker_task = threading.Thread(target=self._log_worker, name='adk-event-logger', daemon=True)
+                self.worker_task.start()
     
-    async def _log_worker(self):
-        """Background worker to process log queue."""
-        while True:
-            try:
-                log_data = await self.log_queue.get()
-                if log_data is None:  # Shutdown signal
-                    break
-                await self._write_to_supabase(log_data)
-            except Exception as e:
-                logger.error(f"Error in log worker: {e}")
+    def _count(self, **deltas):
+        with self._metrics_lock:
+            for name, delta in deltas.items():
+                self._metrics[name] += delta
     
-    async def _write_to_supabase(self, log_data: Dict[str, Any]):
-        """Write log data to Supabase."""
+    def _enqueue(self, record: Dict[str, Any]) -> bool:
         if not self.supabase:
-            return
-            
+            return False
+        self.start_worker()
         try:
-            table_name = log_data.get('table')
-            data = log_data.get('data')
+            self.log_queue.put_nowait(record)
+        except queue.Full:
+            self._count(dropped=1)
+            logger.warning("Event log queue full, dropping %s record", record.get('table'))
+            return False
+        depth = self.log_queue.qsize()
+        with self._metrics_lock:
+            self._metrics['queued'] += 1
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], depth)
+        return True
+    
+    def _log_worker(self):
+        """Collect records into batches and flush them by size or age."""
+        batch: List[Dict[str, Any]] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                record = self.log_queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
             
-            if table_name == 'adk_events':
-                self.supabase.table('adk_events').insert(data).execute()
-            elif table_name == 'messages':
-                self.supabase.table('messages').upsert(data).execute()
-                
-        except Exception as e:
-            logger.error(f"Error writing to Supabase: {e}")
+            if record is self._STOP:
+                self._flush(batch)
+                break
+            if record is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_seconds
+                batch.append(record)
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+    
+    def _flush(self, batch: List[Dict[str, Any]]):
+        """Write a batch: one bulk insert for its events, one upsert per shape of message row."""
+        if not batch:
+            return
+        started = time.monotonic()
+        
+        event_rows = []
+        message_rows: Dict[tuple, List[Dict[str, Any]]] = {}
+        for record in batch:
+            try:
+                if record['table'] == 'adk_events':
+                    events = [e.data if isinstance(e, SerializedEvent) else e for e in record['events']]
+                    if record['coalesce']:
+                        events = coalesce_partial_events(events)
+                    event_rows.extend(adk_event_row(e, record['conversation_id'], record['message_id'])
+                                      for e in events)
+                elif record['table'] == 'messages':
+                    row = record['data']
+                    message_rows.setdefault(tuple(sorted(row)), []).append(row)
+            except Exception as e:
+                logger.error(f"Error preparing log record: {e}")
+        
+        writes = [('adk_events', event_rows, False)]
+        writes += [('messages', rows, True) for rows in message_rows.values()]
+        for table, rows, upsert in writes:
+            if not rows:
+                continue
+            try:
+                insert_rows(self.supabase, table, rows, upsert=upsert, batch_size=self.batch_size)
+                self._count(written_rows=len(rows))
+            except Exception as e:
+                self._count(failed_rows=len(rows))
+                logger.error(f"Error writing {len(rows)} rows to {table}: {e}")
+        
+        with self._metrics_lock:
+            self._metrics['batches'] += 1
+            self._metrics['last_flush_seconds'] = time.monotonic() - started
     
     def log_event_async(
         self, 
-        event: Event, 
+        event: Union[Event, SerializedEvent], 
         conversation_id: str, 
         message_id: Optional[str] = None
     ):
-        """Queue an ADK event for async logging."""
-        if not self.supabase:
-            return
-            
-        try:
-            # Determine event type from content
-            event_type = 'unknown'
-            if event.content and event.content.parts:
-                for part in event.content.parts:
-                    if part.text:
-                        event_type = 'thought' if getattr(part, 'thought', False) else 'text'
-                        break
-                    elif part.function_call:
-                        event_type = 'function_call'
-                        break
-                    elif part.function_response:
-                        event_type = 'function_response'
-                        break
-                    elif part.code_execution_result:
-                        event_type = 'code_execution'
-                        break
-            
-            if event.actions and event.actions.artifact_delta:
-                event_type = 'artifact'
-            elif event.actions and event.actions.state_delta:
-                event_type = 'state_delta'
-            
-            log_data = {
-                'table': 'adk_events',
-                'data': {
-                    'adk_event_id': event.id,
-                    'conversation_id': conversation_id,
-                    'message_id': message_id,
-                    'author': event.author,
-                    'invocation_id': event.invocation_id,
-                    'event_ts': datetime.fromtimestamp(event.timestamp),
-                    'event_type': event_type,
-                    'partial': getattr(event, 'partial', False),
-                    'is_final': event.is_final_response(),
-                    'long_running_tool_ids': list(event.long_running_tool_ids) if event.long_running_tool_ids else None,
-                    'actions': event.actions.model_dump() if event.actions else None,
-                    'content': event.content.model_dump() if event.content else None,
-                    'event': event.model_dump(by_alias=True, exclude_none=True)
-                }
-            }
-            
-            # Queue for async processing
-            asyncio.run_coroutine_threadsafe(
-                self.log_queue.put(log_data),
-                asyncio.get_event_loop()
-            )
-            
-        except Exception as e:
-            logger.error(f"Error queuing event log: {e}")
+        """Queue an ADK event for async logging (pass the SerializedEvent the SSE writer used)."""
+        if not isinstance(event, SerializedEvent):
+            event = SerializedEvent(event)
+        self._enqueue({
+            'table': 'adk_events',
+            'events': [event],
+            'conversation_id': conversation_id,
+            'message_id': message_id,
+            'coalesce': False,
+        })
+    
+    def log_events_async(
+        self,
+        events: List[Union[SerializedEvent, Dict[str, Any]]],
+        conversation_id: str,
+        message_id: Optional[str] = None,
+        coalesce: Optional[bool] = None
+    ):
+        """
+        Queue the events of a turn for async logging. With coalesce (default:
+        ADK_EVENTS_COALESCE_PARTIAL) only the final form of streamed events is stored.
+        """
+        self._enqueue({
+            'table': 'adk_events',
+            'events': list(events),
+            'conversation_id': conversation_id,
+            'message_id': message_id,
+            'coalesce': ADK_EVENTS_COALESCE_PARTIAL if coalesce is None else coalesce,
+        })
     
     def log_message_async(
         self,
@@ -331,29 +469,63 @@ class EventLogger:
         **kwargs
     ):
         """Queue a message for async logging."""
-        if not self.supabase:
+        now = datetime.now(timezone.utc).isoformat()
+        self._enqueue({
+            'table': 'messages',
+            'data': {
+                'id': message_id,
+                'conversation_id': conversation_id,
+                'role': role,
+                'content_text': content_text,
+                'event_ids': event_ids,
+                'created_at': now,
+                'updated_at': now,
+                **kwargs
+            }
+        })
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Counters for monitoring backpressure (queue depth, drops, write failures)."""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['queue_depth'] = self.log_queue.qsize()
+        metrics['queue_capacity'] = self.log_queue.maxsize
+        return metrics
+    
+    def shutdown(self, timeout: float = 10.0):
+        """Flush pending records and stop the writer thread."""
+        if self.worker_task is None:
             return
-            
         try:
-            log_data = {
-                'table': 'messages',
-                'data': {
-                    'id': message_id,
-                    'conversation_id': conversation_id,
-                    'role': role,
-                    'content_text': content_text,
-                    'event_ids': event_ids,
-                    'created_at': datetime.now(),
-                    'updated_at': datetime.now(),
-                    **kwargs
-                }
-            }
-            
-            # Queue for async processing
-            asyncio.run_coroutine_threadsafe(
-                self.log_queue.put(log_data),
-                asyncio.get_event_loop()
-            )
-            
-        except Exception as e:
-            logger.error(f"Error queuing message log: {e}")
+            self.log_queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Event log queue full at shutdown, pending records are lost")
+            return
+        self.worker_task.join(timeout)
+        m = self.metrics()
+        logger.info(f"Event logger stopped: {m['written_rows']} rows written, "
+                    f"{m['failed_rows']} failed, {m['dropped']} dropped")
+
+
+_event_logger: Optional[EventLogger] = None
+_event_logger_lock = threading.Lock()
+
+
+def get_event_logger(supabase_client=None) -> EventLogger:
+    """
+    Return the process-wide EventLogger. The first Supabase client passed in
+    is the one it writes with; until then records are discarded.
+    """
+    global _event_logger
+    if _event_logger is None:
+        with _event_logger_lock:
+            if _event_logger is None:
+                _event_logger = EventLogger(
+                    max_queue_size=int(os.environ.get('ADK_EVENT_LOG_QUEUE_SIZE', 10000)),
+                    batch_size=int(os.environ.get('ADK_EVENT_LOG_BATCH_SIZE', 200)),
+                    flush_seconds=float(os.environ.get('ADK_EVENT_LOG_FLUSH_SECONDS', 1.0)),
+                )
+                atexit.register(_event_logger.shutdown)
+    if supabase_client is not None and _event_logger.supabase is None:
+        _event_logger.supabase = supabase_client
+    return _event_logger
@@ -0,0 +1,173 @@
+"""
+Process-wide ADK session storage.
+
+The /Chat endpoint used to build a fresh InMemorySessionService per request, so
+every follow-up turn started from an empty session. The services here outlive
+a single request so stored session events can be reused across turns.
+
+Backends (selected with ADK_SESSION_BACKEND):
+    * "memory"   - LRUSessionService: per-process LRU with TTL eviction (default)
+    * "database" - ADK DatabaseSessionService on SQLite/Postgres, shared by all
+                   gunicorn workers (ADK_SESSION_DB_URL, e.g. sqlite:///adk_sessions.db)
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
+from google.adk.events.event import Event
+from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
+from google.adk.sessions.base_session_service import (
+    BaseSessionService,
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+from google.adk.sessions.session import Session
+
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class LRUSessionService(BaseSessionService):
+    """In-memory ADK session service bounded by an LRU with TTL eviction."""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: Optional[float] = 60 * 60):
+        self._sessions = LRUCache(
+            max_items=max_sessions,
+            ttl_seconds=ttl_seconds,
+            on_evict=lambda key, _: logger.info(f"Evicted ADK session {key[2]}"),
+        )
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=copy.deepcopy(state) if state else {},
+            last_update_time=time.time(),
+        )
+        self._sessions.set((app_name, user_id, session_id), session)
+        return session.model_copy(deep=True)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        stored = self._sessions.get((app_name, user_id, session_id))
+        if stored is None:
+            return None
+
+        session = stored.model_copy(deep=True)
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [e for e in session.events if e.timestamp >= config.after_timestamp]
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        sessions = []
+        for key in self._sessions.keys():
+            if key[0] == app_name and key[1] == user_id:
+                stored = self._sessions.get(key)
+                if stored is not None:
+                    sessions.append(stored.model_copy(update={'events': []}, deep=True))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._sessions.pop((app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        # Base implementation applies state_delta and appends to the caller's copy.
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        if event.partial:
+            return event
+
+        key = (session.app_name, session.user_id, session.id)
+        stored = self._sessions.get(key)
+        if stored is None:
+            logger.warning(f"append_event: session {session.id} was evicted, re-storing caller's copy")
+            self._sessions.set(key, session.model_copy(deep=True))
+            return event
+
+        await super().append_event(session=stored, event=event)
+        stored.last_update_time = event.timestamp
+        self._sessions.touch(key)
+        return event
+
+    def stats(self) -> Dict[str, Any]:
+        return self._sessions.stats()
+
+
+_session_service: Optional[BaseSessionService] = None
+_memory_service: Optional[InMemoryMemoryService] = None
+_artifact_service: Optional[InMemoryArtifactService] = None
+_services_lock = threading.Lock()
+
+
+def _create_session_service() -> BaseSessionService:
+    backend = os.environ.get('ADK_SESSION_BACKEND', 'memory').lower()
+
+    if backend == 'database':
+        db_url = os.environ.get('ADK_SESSION_DB_URL', 'sqlite:///adk_sessions.db')
+        try:
+            from google.adk.sessions.database_session_service import DatabaseSessionService
+            service = DatabaseSessionService(db_url=db_url)
+            logger.info(f"Using DatabaseSessionService for ADK sessions ({db_url.split('://')[0]})")
+            return service
+        except Exception as e:
+            logger.error(f"Could not start DatabaseSessionService, falling back to in-memory sessions: {e}")
+
+    max_sessions = int(os.environ.get('ADK_SESSION_CACHE_SIZE', 1000))
+    ttl_seconds = float(os.environ.get('ADK_SESSION_TTL_SECONDS', 60 * 60))
+    logger.info(f"Using LRUSessionService for ADK sessions (max={max_sessions}, ttl={ttl_seconds}s)")
+    return LRUSessionService(max_sessions=max_sessions, ttl_seconds=ttl_seconds)
+
+
+def get_session_service() -> BaseSessionService:
+    """Return the process-wide ADK session service, creating it on first use."""
+    global _session_service
+    if _session_service is None:
+        with _services_lock:
+            if _session_service is None:
+                _session_service = _create_session_service()
+    return _session_service
+
+
+def get_memory_service() -> InMemoryMemoryService:
+    global _memory_service
+    if _memory_service is None:
+        with _services_lock:
+            if _memory_service is None:
+                _memory_service = InMemoryMemoryService()
+    return _memory_service
+
+
+def get_artifact_service() -> InMemoryArtifactService:
+    global _artifact_service
+    if _artifact_service is None:
+        with _services_lock:
+            if _artifact_service is None:
+                _artifact_service = InMemoryArtifactService()
+    return _artifact_service
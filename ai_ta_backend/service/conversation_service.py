@@ -1,12 +1,107 @@
 """Service for managing conversation persistence and history."""
 
 import logging
+import os
 from typing import List, Dict, Optional, Any
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+
 logger = logging.getLogger(__name__)
 
+# Rows per adk_events insert request
+ADK_EVENTS_BATCH_SIZE = int(os.environ.get('ADK_EVENTS_BATCH_SIZE', 200))
+# Attempts per batch before it is dropped
+ADK_EVENTS_WRITE_ATTEMPTS = int(os.environ.get('ADK_EVENTS_WRITE_ATTEMPTS', 4))
+# Store only the final form of streamed (partial) events
+ADK_EVENTS_COALESCE_PARTIAL = os.environ.get('ADK_EVENTS_COALESCE_PARTIAL', 'true').lower() == 'true'
+
+
+def insert_rows(supabase, table: str, rows: List[Dict[str, Any]], upsert: bool = False,
+                batch_size: Optional[int] = None):
+    """Bulk insert (or upsert) rows, batch_size per request, retrying each batch with exponential backoff."""
+    batch_size = batch_size or ADK_EVENTS_BATCH_SIZE
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        for attempt in Retrying(stop=stop_after_attempt(ADK_EVENTS_WRITE_ATTEMPTS),
+                                wait=wait_exponential(multiplier=0.5, min=0.5, max=8),
+                                reraise=True):
+            with attempt:
+                query = supabase.table(table)
+                (query.upsert(batch) if upsert else query.insert(batch)).execute()
+
+
+def coalesce_partial_events(events: List[Dict]) -> List[Dict]:
+    """
+    Drop partial (streamed chunk) events that are followed by a final event from
+    the same author in the same invocation; the final event carries the full content.
+    Partial events of an interrupted stream are kept.
+    """
+    finalized = set()
+    kept = []
+    for event in reversed(events):
+        key = (event.get('invocationId'), event.get('author'))
+        if event.get('partial'):
+            if key in finalized:
+                continue
+        else:
+            finalized.add(key)
+        kept.append(event)
+    kept.reverse()
+    return kept
+
+
+def determine_event_type(event: Dict) -> str:
+    """Determine the type of ADK event."""
+    content = event.get('content', {})
+    if not content:
+        return 'unknown'
+    
+    parts = content.get('parts', [])
+    for part in parts:
+        if 'thoughtSignature' in part:
+            return 'thinking'
+        elif 'functionCall' in part:
+            return 'tool_call'
+        elif 'functionResponse' in part:
+            return 'tool_response'
+        elif 'text' in part:
+            return 'text'
+    
+    return 'other'
+
+
+def adk_event_row(event: Dict, conversation_id: str, message_id: Optional[str] = None) -> Dict[str, Any]:
+    """Build the adk_events row for an event dict."""
+    timestamp = event.get('timestamp')
+    # The event's own timestamp keeps rows of a bulk insert in stream order
+    event_ts = (datetime.fromtimestamp(timestamp, tz=timezone.utc)
+                if isinstance(timestamp, (int, float)) else datetime.now(timezone.utc))
+    event_data = {
+        'adk_event_id': event.get('id'),
+        'conversation_id': conversation_id,
+        'message_id': message_id,
+        'author': event.get('author', 'unknown'),
+        'invocation_id': event.get('invocationId', ''),
+        'event_ts': event_ts.isoformat(),
+        'event_type': determine_event_type(event),
+        'partial': event.get('partial', False),
+        'is_final': not event.get('partial', False),
+        'long_running_tool_ids': event.get('longRunningToolIds', []),
+        'event': event,  # Store full event as JSONB
+        # Bulk inserts need the same keys on every row
+        'input_tokens': None,
+        'output_tokens': None,
+    }
+    
+    # Extract token usage if available
+    usage = event.get('usageMetadata', {})
+    if usage:
+        event_data['input_tokens'] = usage.get('promptTokenCount')
+        event_data['output_tokens'] = usage.get('candidatesTokenCount')
+    return event_data
+
 
 class ConversationService:
     """Service for managing conversation history and persistence."""
@@ -74,40 +169,35 @@ class ConversationService:
             logger.error(f"Error retrieving conversation messages: {e}")
             return []
     
-    def save_adk_events(self, events: List[Dict], conversation_id: str, message_id: Optional[str] = None) -> bool:
+    def save_adk_events(
+        self,
+        events: List[Any],
+        conversation_id: str,
+        message_id: Optional[str] = None,
+        coalesce: Optional[bool] = None,
+        batch_size: Optional[int] = None
+    ) -> bool:
         """
         Save ADK events to the database for persistence.
+        
+        Events (dicts, or SerializedEvents from the SSE stream) are written with one
+        bulk insert per batch_size rows, each retried with exponential backoff.
+        With coalesce, partial events superseded by their final event are skipped.
+        
+        This writes synchronously; /Chat goes through the background EventLogger.
         """
         if not self.supabase:
             logger.warning("No Supabase client available, skipping event save")
             return False
         
         try:
-            for event in events:
-                event_data = {
-                    'adk_event_id': event.get('id'),
-                    'conversation_id': conversation_id,
-                    'message_id': message_id,
-                    'author': event.get('author', 'unknown'),
-                    'invocation_id': event.get('invocationId', ''),
-                    'event_ts': datetime.now().isoformat(),
-                    'event_type': self._determine_event_type(event),
-                    'partial': event.get('partial', False),
-                    'is_final': not event.get('partial', False),
-                    'long_running_tool_ids': event.get('longRunningToolIds', []),
-                    'event': event  # Store full event as JSONB
-                }
-                
-                # Extract token usage if available
-                usage = event.get('usageMetadata', {})
-                if usage:
-                    event_data['input_tokens'] = usage.get('promptTokenCount')
-                    event_data['output_tokens'] = usage.get('candidatesTokenCount')
-                
-                # Save to database
-                self.supabase.table('adk_events').insert(event_data).execute()
+            events = [getattr(event, 'data', event) for event in events]
+            if ADK_EVENTS_COALESCE_PARTIAL if coalesce is None else coalesce:
+                events = coalesce_partial_events(events)
+            rows = [adk_event_row(event, conversation_id, message_id) for event in events]
+            insert_rows(self.supabase, 'adk_events', rows, batch_size=batch_size)
             
-            logger.info(f"Saved {len(events)} ADK events for conversation {conversation_id}")
+            logger.info(f"Saved {len(rows)} ADK events for conversation {conversation_id}")
             return True
             
         except Exception as e:
@@ -140,25 +230,6 @@ class ConversationService:
             logger.error(f"Error retrieving ADK events: {e}")
             return []
     
-    def _determine_event_type(self, event: Dict) -> str:
-        """Determine the type of ADK event."""
-        content = event.get('content', {})
-        if not content:
-            return 'unknown'
-        
-        parts = content.get('parts', [])
-        for part in parts:
-            if 'thoughtSignature' in part:
-                return 'thinking'
-            elif 'functionCall' in part:
-                return 'tool_call'
-            elif 'functionResponse' in part:
-                return 'tool_response'
-            elif 'text' in part:
-                return 'text'
-        
-        return 'other'
-    
     def rebuild_session_from_database(self, conversation_id: str) -> List[Dict]:
         """
         Rebuild a conversation session from stored messages and events.
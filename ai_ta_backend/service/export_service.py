@@ -12,6 +12,7 @@ import xlsxwriter
 from injector import inject
 
 from ai_ta_backend.database.aws import AWSStorage
+from ai_ta_backend.database.chunk_store import ChunkStore
 from ai_ta_backend.database.sql import SQLDatabase
 from ai_ta_backend.executors.process_pool_executor import ProcessPoolExecutorAdapter
 from ai_ta_backend.service.sentry_service import SentryService
@@ -93,7 +94,7 @@ class ExportService:
           print("Fetching data from id: ", first_id)
 
           response = self.sql.getDocsForIdsGte(course_name, first_id)
-          df = pd.DataFrame(response.data)
+          df = pd.DataFrame(ChunkStore(self.sql).with_contexts(response.data, with_vectors=True))
           curr_doc_count += len(response.data)
 
           # writing to file
@@ -594,7 +595,10 @@ def export_data_in_bg(response, download_type, course_name, s3_path):
   while curr_doc_count < total_doc_count:
     print("Fetching data from id: ", first_id)
     response = sql.getAllFromTableForDownloadType(course_name, download_type, first_id)
-    df = pd.DataFrame(response.data)
+    rows = response.data
+    if download_type == 'documents':
+      rows = ChunkStore(sql).with_contexts(rows, with_vectors=True)
+    df = pd.DataFrame(rows)
     curr_doc_count += len(response.data)
 
     # writing to file
@@ -703,7 +707,10 @@ def export_data_in_bg_emails(response, download_type, course_name, s3_path, emai
   while curr_doc_count < total_doc_count:
     print("Fetching data from id: ", first_id)
     response = sql.getAllFromTableForDownloadType(course_name, download_type, first_id)
-    df = pd.DataFrame(response.data)
+    rows = response.data
+    if download_type == 'documents':
+      rows = ChunkStore(sql).with_contexts(rows, with_vectors=True)
+    df = pd.DataFrame(rows)
     curr_doc_count += len(response.data)
 
     # writing to file
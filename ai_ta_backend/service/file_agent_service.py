@@ -11,14 +11,19 @@ from typing import List, Dict, Any, Optional
 from injector import inject
 from tempfile import NamedTemporaryFile
 import asyncio
+import functools
 from concurrent.futures import ThreadPoolExecutor
 
+from ai_ta_backend.database.chunk_store import ChunkStore
 from ai_ta_backend.database.sql import SQLDatabase
+from ai_ta_backend.agents.tools.file.code_executor import describe_frame
+from ai_ta_backend.agents.tools.file.frame_cache import get_frame_cache
+from ai_ta_backend.agents.tools.file.lazy_frame import LazyFrame
+from ai_ta_backend.utils.tabular_sidecar import read_sidecar
 from ai_ta_backend.agents.tools.file.agent import (
     prepare_file_agent,
     update_agent_dataframes,
     add_dataframe,
-    clear_dataframes,
     get_current_dataframes
 )
 
@@ -63,34 +68,53 @@ class FileAgentService:
         """
         try:
             # Use the optimized SQL method
-            response = self.sql_db.getCSVFilesForCourse(course_name, limit=10)
+            try:
+                response = self.sql_db.getCSVFilesForCourse(course_name, limit=10)
+            except Exception as e:
+                # metadata/sidecar columns not migrated yet
+                print(f"Querying CSV files without metadata columns: {e}")
+                response = self.sql_db.getCSVFilesForCourse(course_name, limit=10, include_metadata=False)
             return response.data if response.data else []
         except Exception as e:
             print(f"Error querying CSV files: {e}")
             return []
     
-    def load_csv_from_r2(self, s3_path: str, readable_filename: str) -> Optional[pd.DataFrame]:
-        """Load a single CSV file from R2 S3."""
+    def load_csv_from_r2(self, s3_path: str, readable_filename: str,
+                         sidecar_s3_path: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """
+        Load a single CSV file from R2 S3, preferring its typed Parquet sidecar.
+        Parsed frames are cached per worker and revalidated against the object's ETag.
+        """
+        if sidecar_s3_path:
+            try:
+                return get_frame_cache().get_r2_frame(
+                    self.r2_client,
+                    self.r2_bucket_name,
+                    sidecar_s3_path,
+                    read_sidecar
+                )
+            except Exception as e:
+                print(f"Error loading Parquet sidecar {sidecar_s3_path}, falling back to CSV: {e}")
         try:
-            # Get object from R2
-            response = self.r2_client.get_object(
-                Bucket=self.r2_bucket_name,
-                Key=s3_path
+            return get_frame_cache().get_r2_frame(
+                self.r2_client,
+                self.r2_bucket_name,
+                s3_path,
+                pd.read_csv,
+                stream=True
             )
-            
-            # Read CSV directly from bytes
-            csv_content = response['Body'].read()
-            df = pd.read_csv(io.BytesIO(csv_content))
-            
-            return df
         except Exception as e:
             print(f"Error loading CSV from R2 {s3_path}: {e}")
             return None
     
-    async def load_csvs_for_course_async(self, course_name: str) -> Dict[str, pd.DataFrame]:
+    async def load_csvs_for_course_async(self, course_name: str) -> Dict[str, Any]:
         """
         Asynchronously load all CSV files for a course.
-        Returns a dictionary mapping filename to dataframe.
+        Returns a dictionary mapping filename to LazyFrame.
+        
+        Files whose shape and columns are on their documents row are only
+        downloaded when the agent's code uses them; the others are loaded
+        now, in parallel, so the agent prompt can describe them.
         """
         csv_files = self.get_csv_files_for_course(course_name)
         
@@ -100,33 +124,41 @@ class FileAgentService:
         
         print(f"Found {len(csv_files)} CSV files for course: {course_name}")
         
-        # Create tasks for parallel loading
-        loop = asyncio.get_event_loop()
-        tasks = []
-        
+        frames = {}
         for csv_file in csv_files[:10]:  # Limit to first 10 CSVs for performance
             s3_path = csv_file['s3_path']
             readable_filename = csv_file['readable_filename'] or os.path.basename(s3_path)
             
-            task = loop.run_in_executor(
-                self.executor,
-                self.load_csv_from_r2,
-                s3_path,
-                readable_filename
+            columns = csv_file.get('column_headers')
+            row_count = csv_file.get('row_count')
+            shape = (row_count, len(columns)) if isinstance(columns, list) and row_count is not None else None
+            frames[readable_filename] = LazyFrame(
+                readable_filename,
+                functools.partial(self.load_csv_from_r2, s3_path, readable_filename, csv_file.get('sidecar_s3_path')),
+                shape=shape,
+                columns=columns if shape else None,
+                source=('r2', self.r2_bucket_name, s3_path, csv_file.get('id'))
             )
-            tasks.append((readable_filename, task))
         
-        # Wait for all tasks to complete
-        loaded_dataframes = {}
+        return await self._load_undescribed_async(frames)
+    
+    async def _load_undescribed_async(self, frames: Dict[str, LazyFrame]) -> Dict[str, LazyFrame]:
+        """Load, in parallel, the lazy frames whose shape isn't known; drops the ones that fail to load."""
+        loop = asyncio.get_event_loop()
+        tasks = [(filename, loop.run_in_executor(self.executor, frame.load))
+                 for filename, frame in frames.items() if not frame.described]
+        
         for filename, task in tasks:
-            df = await task
-            if df is not None:
-                loaded_dataframes[filename] = df
+            try:
+                df = await task
                 print(f"Loaded CSV: {filename} with shape {df.shape}")
+            except Exception as e:
+                print(f"Error loading CSV {filename}: {e}")
+                frames.pop(filename)
         
-        return loaded_dataframes
+        return frames
     
-    def load_csvs_for_course(self, course_name: str) -> Dict[str, pd.DataFrame]:
+    def load_csvs_for_course(self, course_name: str) -> Dict[str, Any]:
         """
         Synchronous wrapper for loading CSV files.
         """
@@ -135,12 +167,10 @@ class FileAgentService:
     def prepare_file_agent(self, course_name: str, conversation_id: str) -> bool:
         """
         Prepare the file agent with CSV files and Google Drive files for a course.
-        Sets up the plot save directory for the conversation.
+        Files are loaded into the conversation's own execution sandbox, which also
+        sets up the plot save directory for the conversation.
         """
         try:
-            # Clear any existing dataframes
-            clear_dataframes()
-            
             # Load CSV files from R2
             dataframes = self.load_csvs_for_course(course_name)
 
@@ -199,8 +229,9 @@ class FileAgentService:
             
             # Print dataframes info for debugging
             for filename, df in dataframes.items():
-                df_type = "GeoDataFrame" if hasattr(df, 'crs') else "DataFrame"
-                print(f"  - Loaded: {filename} ({df_type}, {df.shape})")
+                df_type, shape, _ = describe_frame(df)
+                state = "Registered (lazy)" if isinstance(df, LazyFrame) and not df.loaded else "Loaded"
+                print(f"  - {state}: {filename} ({df_type}, {shape})")
             
             return True
             
@@ -208,19 +239,20 @@ class FileAgentService:
             print(f"Error preparing file agent: {e}")
             return False
 
-    def _load_digidocs_texts_for_course(self, course_name: str, limit: int = 5) -> Dict[str, pd.DataFrame]:
+    def _load_digidocs_texts_for_course(self, course_name: str, limit: int = 5) -> Dict[str, Any]:
         """
         Load recent OCR HTML ingested documents from Supabase and convert their contexts
         to pandas DataFrames so the file_agent can use them in chat.
 
         The resulting DataFrame has columns: ['chunk_index', 'text', 's3_path', 'readable_filename']
-        and is named using the readable filename.
+        and is named using the readable filename. Documents whose frame shape is known from an
+        earlier load are returned as LazyFrames and their contexts fetched on first use.
         """
         try:
             docs_table = os.environ.get('SUPABASE_DOCUMENTS_TABLE', 'documents')
-            # Fetch recent DigiDocs HTML documents for the course
+            # Fetch recent DigiDocs HTML documents for the course (without the heavy contexts)
             resp = self.sql_db.supabase_client.table(docs_table) \
-                .select('readable_filename,s3_path,contexts') \
+                .select('id,readable_filename,s3_path,created_at') \
                 .eq('course_name', course_name) \
                 .like('s3_path', 'courses/' + course_name + '/%html') \
                 .order('created_at', desc=True) \
@@ -228,26 +260,38 @@ class FileAgentService:
                 .execute()
 
             rows = resp.data or []
-            frames: Dict[str, pd.DataFrame] = {}
+            if not rows:
+                return {}
+
+            # Contexts are only fetched for documents that aren't cached at their current version,
+            # and only now for those that have never been loaded (the prompt needs their shape)
+            cache = get_frame_cache()
+            versions = {row['id']: f"{row['id']}:{row.get('created_at')}" for row in rows}
+            loaded = {row['id']: cache.peek(('digidocs', row['id']), versions[row['id']]) for row in rows}
             for row in rows:
-                contexts = row.get('contexts') or []
-                if not isinstance(contexts, list):
-                    continue
-                # Build a DataFrame from contexts array
-                records = []
-                for c in contexts:
-                    try:
-                        records.append({
-                            'chunk_index': c.get('chunk_index'),
-                            'text': c.get('text') or '',
-                            's3_path': row.get('s3_path'),
-                            'readable_filename': row.get('readable_filename') or os.path.basename(row.get('s3_path') or ''),
-                        })
-                    except Exception:
-                        continue
-                if not records:
+                key = ('digidocs', row['id'])
+                description = cache.describe(key, versions[row['id']]) if loaded[row['id']] is None else None
+                if description:
+                    loaded[row['id']] = LazyFrame(
+                        row.get('readable_filename') or row.get('s3_path'),
+                        functools.partial(self._load_digidocs_frame, docs_table, row, versions[row['id']]),
+                        *description,
+                        source=(key, versions[row['id']])
+                    )
+            missing = [doc_id for doc_id, df in loaded.items() if df is None]
+            if missing:
+                contexts_by_id = ChunkStore(self.sql_db).get_contexts(missing)
+                for row in rows:
+                    if row['id'] in contexts_by_id:
+                        df = self._digidocs_frame(row, contexts_by_id[row['id']])
+                        cache.put(('digidocs', row['id']), versions[row['id']], df)
+                        loaded[row['id']] = df
+
+            frames: Dict[str, Any] = {}
+            for row in rows:
+                df = loaded.get(row['id'])
+                if df is None:
                     continue
-                df = pd.DataFrame.from_records(records)
                 # Use a clean filename key for the agent environment
                 rf = row.get('readable_filename') or os.path.basename(row.get('s3_path') or '')
                 key = f"{rf.replace('/', '_')}_text"
@@ -256,6 +300,32 @@ class FileAgentService:
         except Exception as e:
             print(f"Error loading DigiDocs texts: {e}")
             return {}
+
+    def _load_digidocs_frame(self, docs_table: str, row: Dict[str, Any], version: str) -> Optional[pd.DataFrame]:
+        """Fetch one DigiDocs document's contexts and build its DataFrame (through the frame cache)."""
+        def load():
+            contexts = ChunkStore(self.sql_db).get_contexts([row['id']]).get(row['id'])
+            return self._digidocs_frame(row, contexts or [])
+        return get_frame_cache().get_versioned(('digidocs', row['id']), version, load)
+
+    def _digidocs_frame(self, row: Dict[str, Any], contexts: Any) -> Optional[pd.DataFrame]:
+        """Build a DataFrame from a DigiDocs document's contexts array."""
+        if not isinstance(contexts, list):
+            return None
+        records = []
+        for c in contexts:
+            try:
+                records.append({
+                    'chunk_index': c.get('chunk_index'),
+                    'text': c.get('text') or '',
+                    's3_path': row.get('s3_path'),
+                    'readable_filename': row.get('readable_filename') or os.path.basename(row.get('s3_path') or ''),
+                })
+            except Exception:
+                continue
+        if not records:
+            return None
+        return pd.DataFrame.from_records(records)
     
     def save_plot_to_supabase(self, plot_path: str, conversation_id: str) -> Optional[str]:
         """
@@ -10,6 +10,7 @@ from injector import inject
 from nomic import AtlasDataset, atlas
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from ai_ta_backend.database.chunk_store import ChunkStore
 from ai_ta_backend.database.sql import SQLDatabase
 from ai_ta_backend.service.sentry_service import SentryService
 
@@ -24,6 +25,7 @@ class NomicService():
     self.ollama_client = Client(host=os.environ['OLLAMA_SERVER_URL'])
     self.sentry = sentry
     self.sql = sql
+    self.chunk_store = ChunkStore(sql)
 
   def get_nomic_map(self, course_name: str, type: str):
     """
@@ -200,7 +202,7 @@ class NomicService():
             if not response.data:
               break
 
-            df = pd.DataFrame(response.data)
+            df = pd.DataFrame(self.chunk_store.with_contexts(response.data, with_vectors=True))
             combined_dfs.append(df)
             current_doc_count += len(response.data)
             doc_count += len(response.data)
@@ -416,7 +418,7 @@ class NomicService():
           print("No data found.")
           break
 
-        df = pd.DataFrame(response.data)
+        df = pd.DataFrame(self.chunk_store.with_contexts(response.data, with_vectors=True))
         combined_dfs.append(df)
         current_doc_count += len(response.data)
         doc_count += len(response.data)
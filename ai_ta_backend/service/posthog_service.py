@@ -1,18 +1,14 @@
-import os
-
 from injector import inject
-from posthog import Posthog
+
+from ai_ta_backend.utils.analytics_dispatcher import get_analytics_dispatcher
 
 
 class PosthogService:
 
   @inject
   def __init__(self):
-    self.posthog = Posthog(
-        sync_mode=False,
-        project_api_key=os.environ["POSTHOG_API_KEY"],
-        host="https://app.posthog.com",
-    )
+    # Events are queued and sent in batches off the request path
+    self.posthog = get_analytics_dispatcher()
 
   def capture(self, event_name, properties):
-    self.posthog.capture("distinct_id_of_the_user", event=event_name, properties=properties)
\ No newline at end of file
+    self.posthog.capture("distinct_id_of_the_user", event=event_name, properties=properties)
@@ -3,12 +3,9 @@ import inspect
 import os
 import time
 import traceback
-from collections import defaultdict
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 import openai
-import pytz
-from dateutil import parser
 from injector import inject
 from langchain_community.embeddings import OllamaEmbeddings
 
@@ -29,6 +26,15 @@ from ai_ta_backend.executors.thread_pool_executor import ThreadPoolExecutorAdapt
 # from ai_ta_backend.service.nomic_service import NomicService
 from ai_ta_backend.service.posthog_service import PosthogService
 from ai_ta_backend.service.sentry_service import SentryService
+from ai_ta_backend.utils.conversation_stats import empty_stats, get_conversation_stats
+from ai_ta_backend.utils.doc_group_cache import DocGroupFilter, get_doc_group_cache
+from ai_ta_backend.utils.embedding_cache import get_embedding_cache
+from ai_ta_backend.utils.llm_monitor import get_llm_monitor, message_text
+from ai_ta_backend.utils.retrieval_cache import (
+    bump_retrieval_generation,
+    get_retrieval_cache,
+)
+from ai_ta_backend.utils.tabular_sidecar import may_have_sidecar, sidecar_path
 
 
 class RetrievalService:
@@ -111,19 +117,44 @@ class RetrievalService:
       else:
         embedding_client = self.embeddings
 
+      # Doc-group rules change rarely; only fetch them on a cache miss
+      doc_group_cache = get_doc_group_cache()
+      search_filter = doc_group_cache.get(course_name) if doc_group_cache else None
+
+      # Repeated searches are answered from the result cache before embedding the query
+      retrieval_cache = get_retrieval_cache()
+      cache_key = None
+      if retrieval_cache and search_filter is not None:
+        cache_key = retrieval_cache.key(search_filter, doc_groups, search_query, top_n)
+        cached_results = retrieval_cache.get(cache_key)
+        if cached_results is not None:
+          print(f"Course: {course_name} ||| search_query: {search_query}\n"
+                f"⏰ Runtime of getTopContexts (cached): {(time.monotonic() - start_time_overall):.2f} seconds")
+          return cached_results
+
       # Create tasks for parallel execution
       with self.thread_pool_executor as executor:
         loop = asyncio.get_event_loop()
-        tasks = [
-            loop.run_in_executor(executor, self.sqlDb.getDisabledDocGroups, course_name),
-            loop.run_in_executor(executor, self.sqlDb.getPublicDocGroups, course_name),
-            loop.run_in_executor(executor, self._embed_query_and_measure_latency, search_query, embedding_client)
-        ]
-
-      disabled_doc_groups_response, public_doc_groups_response, user_query_embedding = await asyncio.gather(*tasks)
-
-      disabled_doc_groups = [doc_group['name'] for doc_group in disabled_doc_groups_response.data]
-      public_doc_groups = [doc_group['doc_groups'] for doc_group in public_doc_groups_response.data]
+        tasks = [loop.run_in_executor(executor, self._embed_query_and_measure_latency, search_query, embedding_client)]
+        if search_filter is None:
+          tasks += [
+              loop.run_in_executor(executor, self.sqlDb.getDisabledDocGroups, course_name),
+              loop.run_in_executor(executor, self.sqlDb.getPublicDocGroups, course_name),
+          ]
+
+      results = await asyncio.gather(*tasks)
+      user_query_embedding = results[0]
+      if search_filter is None:
+        disabled_doc_groups_response, public_doc_groups_response = results[1:]
+        search_filter = DocGroupFilter.from_rows(course_name, disabled_doc_groups_response.data,
+                                                 public_doc_groups_response.data)
+        if doc_group_cache:
+          doc_group_cache.put(course_name, search_filter)
+        if retrieval_cache:
+          cache_key = retrieval_cache.key(search_filter, doc_groups, search_query, top_n)
+          cached_results = retrieval_cache.get(cache_key)
+          if cached_results is not None:
+            return cached_results
 
       time_for_parallel_operations = time.monotonic() - start_time_overall
       start_time_vector_search = time.monotonic()
@@ -133,9 +164,10 @@ class RetrievalService:
                                                       course_name=course_name,
                                                       doc_groups=doc_groups,
                                                       user_query_embedding=user_query_embedding,
-                                                      disabled_doc_groups=disabled_doc_groups,
-                                                      public_doc_groups=public_doc_groups,
-                                                      top_n=top_n)
+                                                      disabled_doc_groups=search_filter.disabled_doc_groups,
+                                                      public_doc_groups=search_filter.public_doc_groups,
+                                                      top_n=top_n,
+                                                      search_filter=search_filter)
 
       time_to_retrieve_docs = time.monotonic() - start_time_vector_search
 
@@ -148,6 +180,8 @@ class RetrievalService:
             f"Runtime for parallel operations: {time_for_parallel_operations:.2f} seconds, "
             f"Runtime to complete vector_search: {time_to_retrieve_docs:.2f} seconds")
       if len(valid_docs) == 0:
+        if retrieval_cache:
+          retrieval_cache.put(cache_key, [])
         return []
 
       self.posthog.capture(
@@ -162,7 +196,10 @@ class RetrievalService:
           },
       )
 
-      return self.format_for_json(valid_docs)
+      results = self.format_for_json(valid_docs)
+      if retrieval_cache:
+        retrieval_cache.put(cache_key, results)
+      return results
     except Exception as e:
       # return full traceback to front end
       # err: str = f"ERROR: In /getTopContexts. Course: {course_name} ||| search_query: {search_query}\nTraceback: {traceback.extract_tb(e.__traceback__)}❌❌ Error in {inspect.currentframe().f_code.co_name}:\n{e}"  # type: ignore
@@ -201,120 +238,13 @@ class RetrievalService:
     """
     Will store categories in DB, send email if an alert is triggered.
     """
-    # initialize the Ollama client
     import json
 
-    from ollama import Client as OllamaClient
-
     from ai_ta_backend.utils.email.send_transactional_email import send_email
 
-    client = OllamaClient(os.environ['OLLAMA_SERVER_URL'])
-
-    # analyze message using Ollama
-    for message in messages:
-      try:
-        message_content = message['content'][0]['text'] if isinstance(message.get('content'),
-                                                                      list) else message['content']
-      except:
-        message_content = message['content']
-
-      analysis_result = client.chat(
-          model='qwen2.5:14b-instruct-fp16',
-          messages=[{
-              'role':
-                  'system',
-              'content':
-                  '''Analyze each message for multiple categories simultaneously. A message can and should trigger multiple categories if it meets multiple criteria. Use the provided tools to flag any and all applicable categories based on their descriptions.'''
-          }, {
-              'role': 'user',
-              'content': message_content
-          }],
-          tools=[
-              {
-                  'type': 'function',
-                  'function': {
-                      'name':
-                          'categorize_as_NSFW',
-                      'description':
-                          'Flag content containing explicit threats of harm, violence, sexual content, hate speech, discriminatory language, or other inappropriate material that would be unsafe for work or general audiences.',
-                      'parameters': {
-                          'type': 'object',
-                          'properties': {
-                              'keyword_that_triggers_NSFW_tag': {
-                                  'type': 'string',
-                                  'description': 'The specific word or phrase that indicates prohibited content',
-                              },
-                          },
-                          'required': ['keyword_that_triggers_NSFW_tag'],
-                      },
-                  },
-              },
-              {
-                  'type': 'function',
-                  'function': {
-                      'name':
-                          'categorize_as_anger',
-                      'description':
-                          'Identify content expressing clear anger through aggressive language, hostile tone, multiple exclamation marks, ALL CAPS YELLING, or explicitly angry statements.',
-                      'parameters': {
-                          'type': 'object',
-                          'properties': {
-                              'keyword_that_triggers_anger_tag': {
-                                  'type':
-                                      'string',
-                                  'description':
-                                      'The exact word, phrase, or punctuation that shows anger or aggression',
-                              },
-                          },
-                          'required': ['keyword_that_triggers_anger_tag'],
-                      },
-                  },
-              },
-              {
-                  'type': 'function',
-                  'function': {
-                      'name':
-                          'categorize_as_incorrect',
-                      'description':
-                          'Flag content where the user indicates that the chatbot provided wrong, incorrect, or false information. This includes statements about inaccuracies, mistakes, or errors in the bot\'s responses.',
-                      'parameters': {
-                          'type': 'object',
-                          'properties': {
-                              'keyword_that_triggers_incorrect_tag': {
-                                  'type':
-                                      'string',
-                                  'description':
-                                      'The specific phrase that indicates the bot was incorrect (e.g. "that\'s wrong", "incorrect", "that\'s not true")',
-                              },
-                          },
-                          'required': ['keyword_that_triggers_incorrect_tag'],
-                      },
-                  },
-              },
-              {
-                  'type': 'function',
-                  'function': {
-                      'name':
-                          'categorize_as_good',
-                      'description':
-                          'Classify content as appropriate and constructive if it contains normal questions, feedback, discussion, or requests without triggering any of the above categories.',
-                  },
-              },
-          ],
-      )
-
-      # extract the triggered categories
-      triggered = []
-      if 'tool_calls' in analysis_result.get('message', {}):
-        for tool_call in analysis_result['message']['tool_calls']:
-          category = tool_call.function.name.replace('categorize_as_', '')
-
-          if category in ['NSFW', 'anger', 'incorrect']:
-            trigger_key = f'keyword_that_triggers_{category}_tag'
-            trigger = tool_call.function.arguments.get(trigger_key, 'No trigger specified')
-
-            triggered.append({'category': category, 'trigger': trigger})
-
+    # Messages classified before are skipped; the rest are classified concurrently
+    texts = [message_text(message) for message in messages]
+    for message_content, triggered in get_llm_monitor().classify(texts):
       # Only send email if alerts were triggered
       if triggered:
         # Construct detailed email body with alert info
@@ -342,7 +272,7 @@ class RetrievalService:
                    recipients=["kvday2@illinois.edu", "hbroome@illinois.edu", "rohan13@illinois.edu"],
                    bcc_recipients=[])
 
-      return "Success"
+    return "Success"
 
   def delete_data(self, course_name: str, s3_path: str, source_url: str):
     """Delete file from S3, Qdrant, and Supabase."""
@@ -367,6 +297,9 @@ class RetrievalService:
       # Delete from Nomic and Supabase
       self.delete_from_nomic_and_supabase(course_name, identifier_key, identifier_value)
 
+      # Doc group counts changed
+      self.invalidate_doc_groups(course_name)
+
       return "Success"
     except Exception as e:
       err: str = f"ERROR IN delete_data: Traceback: {traceback.extract_tb(e.__traceback__)}❌❌ Error in {inspect.currentframe().f_code.co_name}:{e}"  # type: ignore
@@ -374,11 +307,20 @@ class RetrievalService:
       self.sentry.capture_exception(e)
       return err
 
+  def invalidate_doc_groups(self, course_name: str):
+    """Call after doc groups of a course change (created, toggled, shared, documents added/removed)."""
+    doc_group_cache = get_doc_group_cache()
+    if doc_group_cache:
+      doc_group_cache.invalidate(course_name)
+    bump_retrieval_generation(course_name)
+
   def delete_from_s3(self, bucket_name: str, s3_path: str):
     try:
       print("Deleting from S3")
       response = self.aws.delete_file(bucket_name, s3_path)
       print(f"AWS response: {response}")
+      if may_have_sidecar(s3_path):
+        self.aws.delete_file(bucket_name, sidecar_path(s3_path))
     except Exception as e:
       print("Error in deleting file from s3:", e)
       self.sentry.capture_exception(e)
@@ -390,7 +332,10 @@ class RetrievalService:
         # delete from cw db
         response = self.vdb.delete_data_cropwizard(identifier_key, identifier_value)
       else:
-        response = self.vdb.delete_data(os.environ['QDRANT_COLLECTION_NAME'], identifier_key, identifier_value)
+        response = self.vdb.delete_data(os.environ.get('QDRANT_COLLECTION_NAME'),
+                                        identifier_key,
+                                        identifier_value,
+                                        course_name=course_name)
       print(f"Qdrant response: {response}")
     except Exception as e:
       if "timed out" in str(e):
@@ -447,7 +392,7 @@ class RetrievalService:
     #     return []
 
     #   # 5. TOP DOC CONTEXT PADDING // parent document retriever
-    #   final_docs = context_parent_doc_padding(filtered_docs, search_query, course_name)
+    #   final_docs = context_parent_doc_padding(filtered_docs, search_query, course_name, self.sqlDb)
     #   print(f"Number of final docs after context padding: {len(final_docs)}")
 
     #   pre_prompt = "Please answer the following question. Use the context below, called your documents, only if it's helpful and don't use parts that are very irrelevant. It's good to quote from your documents directly, when you do always use Markdown footnotes for citations. Use react-markdown superscript to number the sources at the end of sentences (1, 2, 3...) and use react-markdown Footnotes to list the full document names for each number. Use ReactMarkdown aka 'react-markdown' formatting for super script citations, use semi-formal style. Feel free to say you don't know. \nHere's a few passages of the high quality documents:\n"
@@ -500,7 +445,7 @@ class RetrievalService:
     #   response = self.sqlDb.getMaterialsForCourseAndKeyAndValue(course_name, identifier_key, identifier_value)
     #   if not response.data:
     #     raise Exception(f"No materials found for {course_name} using {identifier_key}: {identifier_value}")
-    #   data = response.data[0]  # single record fetched
+    #   data = ChunkStore(self.sqlDb).with_contexts(response.data[:1])[0]  # single record fetched
     #   nomic_ids_to_delete = [str(data['id']) + "_" + str(i) for i in range(1, len(data['contexts']) + 1)]
 
     # delete from Nomic
@@ -527,7 +472,8 @@ class RetrievalService:
                     user_query_embedding,
                     disabled_doc_groups,
                     public_doc_groups,
-                    top_n: int = 100):
+                    top_n: int = 100,
+                    search_filter: Optional[DocGroupFilter] = None):
     """
     Search the vector database for a given query, course name, and document groups.
     """
@@ -551,16 +497,16 @@ class RetrievalService:
     # ----------------------------
     if course_name == "vyriad":
       search_results = self.vdb.vyriad_vector_search(search_query, course_name, doc_groups, user_query_embedding, top_n,
-                                                     disabled_doc_groups, public_doc_groups)
+                                                     disabled_doc_groups, public_doc_groups, search_filter)
     elif course_name == "cropwizard":
       search_results = self.vdb.cropwizard_vector_search(search_query, course_name, doc_groups, user_query_embedding,
-                                                         top_n, disabled_doc_groups, public_doc_groups)
+                                                         top_n, disabled_doc_groups, public_doc_groups, search_filter)
     elif course_name == "pubmed":
       search_results = self.vdb.pubmed_vector_search(search_query, course_name, doc_groups, user_query_embedding, top_n,
-                                                     disabled_doc_groups, public_doc_groups)
+                                                     disabled_doc_groups, public_doc_groups, search_filter)
     else:
       search_results = self.vdb.vector_search(search_query, course_name, doc_groups, user_query_embedding, top_n,
-                                              disabled_doc_groups, public_doc_groups)
+                                              disabled_doc_groups, public_doc_groups, search_filter)
     self.qdrant_latency_sec = time.monotonic() - start_time_vector_search
 
     # Process the search results by extracting the page content and metadata
@@ -581,7 +527,15 @@ class RetrievalService:
 
   def _embed_query_and_measure_latency(self, search_query, embedding_client):
     openai_start_time = time.monotonic()
-    user_query_embedding = embedding_client.embed_query(search_query)
+    cache = get_embedding_cache()
+    if cache is None:
+      user_query_embedding = embedding_client.embed_query(search_query)
+      self.embedding_cache_hit = False
+    else:
+      # Repeated questions skip the embedding API round trip
+      model = getattr(embedding_client, 'model', None) or type(embedding_client).__name__
+      user_query_embedding, self.embedding_cache_hit = cache.get_or_compute(
+          model, search_query, lambda: embedding_client.embed_query(search_query))
     self.openai_embedding_latency = time.monotonic() - openai_start_time
     return user_query_embedding
 
@@ -623,6 +577,7 @@ class RetrievalService:
             "course_name": course_name,
             "qdrant_latency_sec": self.qdrant_latency_sec,
             "openai_embedding_latency_sec": self.openai_embedding_latency,
+            "embedding_cache_hit": getattr(self, 'embedding_cache_hit', False),
             # "max_vector_score": max_vector_score,
             # "min_vector_score": min_vector_score,
             # "avg_vector_score": avg_vector_score,
@@ -666,89 +621,16 @@ class RetrievalService:
 
   def getConversationStats(self, course_name: str):
     """
-    Fetches conversation data from the database and groups them by day, hour, and weekday.
+    Conversation counts of a course grouped by day, hour, and weekday, maintained
+    incrementally (see ai_ta_backend/utils/conversation_stats.py).
     """
     try:
-      conversations, total_count = self.sqlDb.getConversationsCreatedAtByCourse(course_name)
-
-      # Initialize with empty data (all zeros)
-      response_data = {
-          'per_day': {},
-          'per_hour': {
-              str(hour): 0 for hour in range(24)
-          },  # Convert hour to string for consistency
-          'per_weekday': {
-              day: 0 for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-          },
-          'heatmap': {
-              day: {
-                  str(hour): 0 for hour in range(24)
-              } for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-          },
-          'total_count': 0
-      }
-
-      if not conversations:
-        return response_data
-
-      central_tz = pytz.timezone('America/Chicago')
-      grouped_data = {
-          'per_day': defaultdict(int),
-          'per_hour': defaultdict(int),
-          'per_weekday': defaultdict(int),
-          'heatmap': defaultdict(lambda: defaultdict(int)),
-      }
-
-      for record in conversations:
-        try:
-          created_at = record['created_at']
-          parsed_date = parser.parse(created_at).astimezone(central_tz)
-
-          day = parsed_date.date()
-          hour = parsed_date.hour
-          day_of_week = parsed_date.strftime('%A')
-
-          grouped_data['per_day'][str(day)] += 1
-          grouped_data['per_hour'][str(hour)] += 1  # Convert hour to string
-          grouped_data['per_weekday'][day_of_week] += 1
-          grouped_data['heatmap'][day_of_week][str(hour)] += 1  # Convert hour to string
-        except Exception as e:
-          print(f"Error processing record: {str(e)}")
-          continue
-
-      return {
-          'per_day': dict(grouped_data['per_day']),
-          'per_hour': {
-              str(k): v for k, v in grouped_data['per_hour'].items()
-          },
-          'per_weekday': dict(grouped_data['per_weekday']),
-          'heatmap': {
-              day: {
-                  str(h): count for h, count in hours.items()
-              } for day, hours in grouped_data['heatmap'].items()
-          },
-          'total_count': total_count
-      }
-
+      return get_conversation_stats(self.sqlDb, course_name)
     except Exception as e:
       print(f"Error in getConversationStats for course {course_name}: {str(e)}")
       self.sentry.capture_exception(e)
       # Return empty data structure on error
-      return {
-          'per_day': {},
-          'per_hour': {
-              str(hour): 0 for hour in range(24)
-          },
-          'per_weekday': {
-              day: 0 for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-          },
-          'heatmap': {
-              day: {
-                  str(hour): 0 for hour in range(24)
-              } for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-          },
-          'total_count': 0
-      }
+      return empty_stats()
 
   def getProjectStats(self, project_name: str) -> ProjectStats:
     """
@@ -19,7 +19,6 @@ from google.api_core import exceptions as google_exceptions
 import vertexai
 from vertexai import rag
 from vertexai.generative_models import GenerativeModel
-import pandas as pd
 from bs4 import BeautifulSoup
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
@@ -27,6 +26,11 @@ from pydantic import SecretStr
 
 from ai_ta_backend.database.sql import SQLDatabase
 from ai_ta_backend.database.aws import AWSStorage
+from ai_ta_backend.database.chunk_store import ChunkStore, chunk_store_enabled
+from ai_ta_backend.database.local_vector import get_local_vector_index_store
+from ai_ta_backend.utils.content_hashes import document_hash_columns
+from ai_ta_backend.utils.retrieval_cache import bump_retrieval_generation
+from ai_ta_backend.utils.tabular_sidecar import read_table_file, sidecars_enabled, write_sidecar
 
 
 class VertexIngestionService:
@@ -369,56 +373,75 @@ KEYWORDS: keyword1, keyword2, keyword3, keyword4, keyword5"""
         Returns:
             Dictionary with column_headers, row_count, and sample data
         """
+        return self.extract_tabular_metadata(s3_path, 'csv')
+
+    def extract_tabular_metadata(self, s3_path: str, file_type: str) -> Dict[str, Any]:
+        """Extract metadata from a CSV/Excel file and write its Parquet sidecar.
+        
+        The file is parsed once; the typed Parquet copy lets the file agent skip
+        re-parsing the raw file.
+        
+        Args:
+            s3_path: S3 path to the file
+            file_type: 'csv', 'xlsx' or 'xls'
+            
+        Returns:
+            Dictionary with column_headers, row_count, summary, keywords and sidecar fields
+        """
         try:
-            print(f"📊 Extracting CSV metadata: {s3_path}")
+            print(f"📊 Extracting {file_type.upper()} metadata: {s3_path}")
             
             bucket_name = self._get_bucket_name()
             
-            # Download CSV from S3
-            with NamedTemporaryFile(suffix='.csv') as tmp_file:
+            # Download file from S3
+            with NamedTemporaryFile(suffix=f'.{file_type}') as tmp_file:
                 self.aws_storage.s3_client.download_fileobj(
                     Bucket=bucket_name,
                     Key=s3_path,
                     Fileobj=tmp_file
                 )
                 tmp_file.flush()
-                tmp_file.seek(0)
                 
-                # Read CSV with pandas
+                # Read the file with pandas (once)
                 try:
-                    df = pd.read_csv(tmp_file.name, nrows=5)  # Read first 5 rows for sample
+                    df = read_table_file(tmp_file.name, file_type)
                     
-                    column_headers = df.columns.tolist()
-                    
-                    # Get actual row count
-                    tmp_file.seek(0)
-                    df_full = pd.read_csv(tmp_file.name)
-                    row_count = len(df_full)
+                    column_headers = [str(c) for c in df.columns]
+                    row_count = len(df)
                     
                     # Generate summary
-                    summary = f"CSV file with {row_count} rows and {len(column_headers)} columns"
+                    summary = f"{file_type.upper()} file with {row_count} rows and {len(column_headers)} columns"
                     
                     # Generate keywords from column names
                     keywords = [col.lower().replace('_', ' ') for col in column_headers[:10]]
                     
-                    return {
+                    metadata = {
                         'column_headers': column_headers,
                         'row_count': row_count,
                         'summary': summary,
                         'keywords': keywords
                     }
                     
+                    if sidecars_enabled():
+                        try:
+                            metadata.update(write_sidecar(df, self.aws_storage.s3_client, bucket_name, s3_path))
+                            print(f"✅ Wrote Parquet sidecar: {metadata['sidecar_s3_path']}")
+                        except Exception as e:
+                            print(f"⚠️ Could not write Parquet sidecar for {s3_path}: {e}")
+                    
+                    return metadata
+                    
                 except Exception as e:
-                    print(f"⚠️ Error parsing CSV: {e}")
+                    print(f"⚠️ Error parsing {file_type.upper()}: {e}")
                     return {
                         'column_headers': [],
                         'row_count': 0,
-                        'summary': f"CSV file (parsing error: {str(e)[:100]})",
-                        'keywords': ['csv', 'data']
+                        'summary': f"{file_type.upper()} file (parsing error: {str(e)[:100]})",
+                        'keywords': [file_type, 'data']
                     }
                     
         except Exception as e:
-            print(f"❌ Error extracting CSV metadata: {e}")
+            print(f"❌ Error extracting {file_type.upper()} metadata: {e}")
             traceback.print_exc()
             raise
 
@@ -514,9 +537,14 @@ KEYWORDS: keyword1, keyword2, keyword3, keyword4, keyword5"""
                 'vertex_document_id': metadata.get('vertex_document_id'),
                 'column_headers': metadata.get('column_headers'),
                 'row_count': metadata.get('row_count'),
+                'sidecar_s3_path': metadata.get('sidecar_s3_path'),
+                'sidecar_schema': metadata.get('sidecar_schema'),
+                'column_stats': metadata.get('column_stats'),
                 'url': '',
                 'base_url': '',
-                'contexts': contexts,
+                # With the chunk store, chunks go to document_chunks once the document id is known
+                'contexts': [] if chunk_store_enabled() else contexts,
+                **document_hash_columns(s3_path, None, [context.get('text') or '' for context in contexts]),
             }
             
             # Remove None values
@@ -525,6 +553,17 @@ KEYWORDS: keyword1, keyword2, keyword3, keyword4, keyword5"""
             response = self.sql_db.supabase_client.table('documents').insert(document_data).execute()
             
             print(f"✅ Stored metadata in Supabase for: {readable_filename}")
+
+            if chunk_store_enabled() and contexts and response.data:
+                ChunkStore(self.sql_db).write_chunks(response.data[0]['id'], course_name, contexts)
+
+            # Keep an already-built local vector index current (new courses are indexed on first search)
+            try:
+                stored = response.data[0] if response.data else document_data
+                get_local_vector_index_store().add_document(course_name, {**stored, 'contexts': contexts})
+            except Exception as e:
+                print(f"Could not add {readable_filename} to the local vector index: {e}")
+            bump_retrieval_generation(course_name)
             return response
             
         except Exception as e:
@@ -566,6 +605,8 @@ KEYWORDS: keyword1, keyword2, keyword3, keyword4, keyword5"""
                 print(f"📊 Processing as structured data ({file_type})")
                 if file_type == 'csv':
                     metadata = self.extract_csv_metadata(s3_path)
+                elif file_type in ('xlsx', 'xls'):
+                    metadata = self.extract_tabular_metadata(s3_path, file_type)
                 else:
                     # For other structured formats, basic metadata
                     metadata = {
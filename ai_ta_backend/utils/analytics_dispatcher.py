@@ -0,0 +1,143 @@
+"""
+Background dispatcher for PostHog analytics events.
+
+capture() only timestamps the event and puts it on a bounded in-memory queue,
+so analytics never add latency to search or ingest. A daemon thread drains the
+queue and sends events to PostHog's /batch endpoint, batch_size at a time or
+every flush_interval seconds. When the queue is full (PostHog slow or down)
+new events are dropped and counted rather than blocking the caller. Queued
+events are flushed at interpreter exit.
+
+Configuration:
+    ANALYTICS_QUEUE_SIZE               events buffered before dropping (default 10000)
+    ANALYTICS_BATCH_SIZE               events per PostHog request (default 100)
+    ANALYTICS_FLUSH_INTERVAL_SECONDS   longest an event waits before being sent (default 1)
+"""
+
+import atexit
+import datetime
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+POSTHOG_HOST = 'https://app.posthog.com'
+
+
+def posthog_batch_sender(api_key: str, host: str = POSTHOG_HOST, timeout: int = 15) -> Callable[[List[dict]], None]:
+  """send_batch function that posts events with the posthog client's batch request."""
+  from posthog.request import batch_post
+  from posthog.utils import clean
+
+  def send_batch(events: List[dict]):
+    batch_post(api_key, host=host, timeout=timeout, batch=[clean(event) for event in events])
+
+  return send_batch
+
+
+class AnalyticsDispatcher:
+  """Queue-backed stand-in for a Posthog client's capture()."""
+
+  def __init__(self,
+               send_batch: Callable[[List[dict]], None],
+               max_queue_size: int = 10_000,
+               batch_size: int = 100,
+               flush_interval: float = 1.0):
+    self.send_batch = send_batch
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_queue_size)
+    self._stopped = threading.Event()
+    self.sent = 0
+    self.dropped = 0
+    self.failed = 0
+    self._thread = threading.Thread(target=self._run, name='analytics-dispatcher', daemon=True)
+    self._thread.start()
+
+  def capture(self, distinct_id: str, event: str, properties: Optional[Dict[str, Any]] = None) -> bool:
+    """Queue an event; False if it was dropped because the queue is full."""
+    message = {
+        'type': 'capture',
+        'event': event,
+        'distinct_id': distinct_id,
+        'properties': {
+            **(properties or {}), '$lib': 'posthog-python'
+        },
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'uuid': str(uuid.uuid4()),
+    }
+    try:
+      self._queue.put_nowait(message)
+      return True
+    except queue.Full:
+      self.dropped += 1
+      return False
+
+  def _next_batch(self) -> List[dict]:
+    batch: List[dict] = []
+    deadline = time.monotonic() + self.flush_interval
+    while len(batch) < self.batch_size:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        break
+      try:
+        batch.append(self._queue.get(timeout=remaining))
+      except queue.Empty:
+        break
+    return batch
+
+  def _send(self, batch: List[dict]):
+    try:
+      self.send_batch(batch)
+      self.sent += len(batch)
+    except Exception as e:
+      self.failed += len(batch)
+      print(f"Failed to send {len(batch)} analytics events: {e}")
+    finally:
+      for _ in batch:
+        self._queue.task_done()
+
+  def _run(self):
+    while not self._stopped.is_set():
+      batch = self._next_batch()
+      if batch:
+        self._send(batch)
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
+    """Wait until every queued event was sent (or failed); False on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while self._queue.unfinished_tasks:
+      if deadline is not None and time.monotonic() >= deadline:
+        return False
+      time.sleep(0.05)
+    return True
+
+  def shutdown(self, timeout: float = 10.0):
+    """Flush queued events and stop the worker thread."""
+    self.flush(timeout)
+    self._stopped.set()
+    self._thread.join(timeout=self.flush_interval + 1)
+
+  def stats(self) -> Dict[str, int]:
+    return {'queued': self._queue.qsize(), 'sent': self.sent, 'dropped': self.dropped, 'failed': self.failed}
+
+
+_analytics_dispatcher: Optional[AnalyticsDispatcher] = None
+_analytics_dispatcher_lock = threading.Lock()
+
+
+def get_analytics_dispatcher() -> AnalyticsDispatcher:
+  """Return the process-wide dispatcher for POSTHOG_API_KEY, started on first use."""
+  global _analytics_dispatcher
+  if _analytics_dispatcher is None:
+    with _analytics_dispatcher_lock:
+      if _analytics_dispatcher is None:
+        _analytics_dispatcher = AnalyticsDispatcher(
+            posthog_batch_sender(os.environ['POSTHOG_API_KEY']),
+            max_queue_size=int(os.environ.get('ANALYTICS_QUEUE_SIZE', 10_000)),
+            batch_size=int(os.environ.get('ANALYTICS_BATCH_SIZE', 100)),
+            flush_interval=float(os.environ.get('ANALYTICS_FLUSH_INTERVAL_SECONDS', 1)))
+        atexit.register(_analytics_dispatcher.shutdown)
+  return _analytics_dispatcher
@@ -0,0 +1,100 @@
+"""
+Copy documents.contexts arrays into the document_chunks table.
+
+Resumable: documents are processed in id order and ones that already have
+chunk_count set are skipped, so an interrupted run can simply be restarted
+(or continued with --start-id).
+
+  python -m ai_ta_backend.utils.backfill_document_chunks [--course COURSE] [--clear-contexts]
+  python -m ai_ta_backend.utils.backfill_document_chunks --restore-contexts [--course COURSE]
+
+--clear-contexts empties documents.contexts after the chunks are written,
+which is where the storage and read savings come from. Only use it once every
+reader runs a version that goes through ChunkStore (including the Beam ingest
+duplicate check). --restore-contexts rebuilds contexts from document_chunks
+for a rollback.
+"""
+
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+from ai_ta_backend.database.chunk_store import ChunkStore
+from ai_ta_backend.database.sql import SQLDatabase
+
+load_dotenv()
+
+
+def _documents(sql_db: SQLDatabase, table: str, course_name, start_id: int, fields: str, batch_size: int):
+  """Yield pages of documents in id order."""
+  first_id = start_id
+  while True:
+    query = sql_db.supabase_client.table(table).select(fields).gte('id', first_id)
+    if course_name:
+      query = query.eq('course_name', course_name)
+    rows = query.order('id').limit(batch_size).execute().data or []
+    if not rows:
+      return
+    yield rows
+    first_id = rows[-1]['id'] + 1
+
+
+def backfill(course_name=None, clear_contexts: bool = False, start_id: int = 0, batch_size: int = 20):
+  sql_db = SQLDatabase()
+  chunk_store = ChunkStore(sql_db)
+  table = os.environ.get('SUPABASE_DOCUMENTS_TABLE', 'documents')
+  start_time = time.monotonic()
+  documents = chunks = skipped = failed = 0
+
+  for rows in _documents(sql_db, table, course_name, start_id, 'id, course_name, chunk_count', batch_size):
+    todo = [row['id'] for row in rows if row.get('chunk_count') is None]
+    skipped += len(rows) - len(todo)
+    if not todo:
+      continue
+    # Contexts (with embeddings) are only fetched for the documents being migrated
+    full_rows = sql_db.supabase_client.table(table).select('id, course_name, contexts').in_('id', todo).execute().data
+    for row in full_rows or []:
+      try:
+        chunks += chunk_store.migrate_document(row, clear_contexts=clear_contexts)
+        documents += 1
+      except Exception as e:
+        failed += 1
+        print(f"Failed to migrate document {row['id']}: {e}")
+    print(f"Migrated {documents} documents ({chunks} chunks), skipped {skipped}, failed {failed}; "
+          f"last id {rows[-1]['id']}, {(time.monotonic() - start_time):.0f}s")
+
+  print(f"Backfill done: {documents} documents, {chunks} chunks, {skipped} skipped, {failed} failed")
+
+
+def restore_contexts(course_name=None, start_id: int = 0, batch_size: int = 20):
+  sql_db = SQLDatabase()
+  chunk_store = ChunkStore(sql_db)
+  table = os.environ.get('SUPABASE_DOCUMENTS_TABLE', 'documents')
+  restored = 0
+
+  for rows in _documents(sql_db, table, course_name, start_id, 'id, chunk_count', batch_size):
+    ids = [row['id'] for row in rows if row.get('chunk_count') is not None]
+    for document_id, contexts in chunk_store.get_contexts(ids, with_vectors=True).items():
+      sql_db.supabase_client.table(table).update({
+          'contexts': contexts,
+          'chunk_count': None
+      }).eq('id', document_id).execute()
+      restored += 1
+    print(f"Restored contexts of {restored} documents; last id {rows[-1]['id']}")
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--course', help='Only migrate this course')
+  parser.add_argument('--clear-contexts', action='store_true', help='Empty documents.contexts after migrating')
+  parser.add_argument('--restore-contexts', action='store_true', help='Rebuild documents.contexts from chunks')
+  parser.add_argument('--start-id', type=int, default=0, help='Resume from this document id')
+  parser.add_argument('--batch-size', type=int, default=20, help='Documents per page')
+  args = parser.parse_args()
+
+  if args.restore_contexts:
+    restore_contexts(args.course, args.start_id, args.batch_size)
+  else:
+    backfill(args.course, args.clear_contexts, args.start_id, args.batch_size)
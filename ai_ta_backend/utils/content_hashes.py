@@ -0,0 +1,55 @@
+"""
+Content hashes stored with each document for duplicate detection at ingest.
+
+* source_key: what identifies "the same file" across re-uploads: the S3
+  filename without its upload UUID prefix, or the URL. Indexed together with
+  course_name.
+* content_hash: SHA-256 of the concatenated chunk texts, so a re-ingest is a
+  duplicate exactly when the stored and incoming hashes match.
+* chunk_hashes: SHA-256 of each chunk text, in chunk order.
+
+See migrations/add_document_content_hashes.sql. Writers only set the columns
+when DOCUMENT_CONTENT_HASHES=true, i.e. after the migration has been applied.
+
+NOTE: ai_ta_backend/beam/ingest*.py are deployed standalone and keep their own
+copy of these helpers; keep the definitions in sync (the migration's backfill
+computes the same hashes in SQL).
+"""
+
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+# Uploads are stored as "<uuid4>-<original filename>"
+_UUID4 = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}', re.I)
+
+
+def content_hashes_enabled() -> bool:
+  return os.environ.get('DOCUMENT_CONTENT_HASHES', 'false').lower() == 'true'
+
+
+def source_key(s3_path: Optional[str], url: Optional[str]) -> Optional[str]:
+  if s3_path:
+    filename = s3_path.split('/')[-1]
+    return filename[37:] if _UUID4.search(filename) else filename
+  return url or None
+
+
+def sha256_text(text: str) -> str:
+  return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def document_hashes(chunk_texts: Sequence[str]) -> Dict[str, object]:
+  """content_hash and chunk_hashes columns for a document with these chunk texts."""
+  return {
+      'content_hash': sha256_text(''.join(chunk_texts)),
+      'chunk_hashes': [sha256_text(text) for text in chunk_texts],
+  }
+
+
+def document_hash_columns(s3_path: Optional[str], url: Optional[str], chunk_texts: List[str]) -> Dict[str, object]:
+  """The hash columns to insert with a document, or {} when they are disabled."""
+  if not content_hashes_enabled():
+    return {}
+  return {'source_key': source_key(s3_path, url), **document_hashes(chunk_texts)}
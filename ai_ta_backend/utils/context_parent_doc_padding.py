@@ -1,134 +1,204 @@
-import os
+"""
+Parent-document padding for retrieved contexts.
+
+The top hits are padded with their neighbouring chunks in the parent document
+(chunk_index ± window, or the whole page when chunks aren't indexed); the
+remaining hits are passed through as-is.
+
+Hits are grouped by parent document and every window is fetched in a single
+`get_context_windows` RPC call (migrations/add_context_window_rpc.sql), which
+returns only the text fields of the chunks in range. Where the RPC isn't
+installed, parent documents are looked up with one batched query per key type
+(s3_path / url) on threads and their chunks read through the ChunkStore.
+Results are de-duplicated by (document, chunk).
+"""
+
+import asyncio
 import time
-from concurrent.futures import ProcessPoolExecutor
-from functools import partial
-from multiprocessing import Manager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
-DOCUMENTS_TABLE = os.environ['SUPABASE_DOCUMENTS_TABLE']
-# SUPABASE_CLIENT = supabase.create_client(supabase_url=os.environ['SUPABASE_URL'],
-#  supabase_key=os.environ['SUPABASE_API_KEY'])  # type: ignore
+from ai_ta_backend.database.chunk_store import ChunkStore
+from ai_ta_backend.database.sql import SQLDatabase, is_missing_function_error
 
+# Set to False once the RPC turns out not to be installed (other errors only fall back for that call)
+_rpc_available = True
 
-def context_parent_doc_padding(found_docs, search_query, course_name):
-  """
-    Takes top N contexts acquired from QRANT similarity search and pads them
-    """
-  print("inside main context padding")
-  start_time = time.monotonic()
 
-  with Manager() as manager:
-    qdrant_contexts = manager.list()
-    supabase_contexts = manager.list()
-    partial_func1 = partial(qdrant_context_processing, course_name=course_name, result_contexts=qdrant_contexts)
-    partial_func2 = partial(supabase_context_padding, course_name=course_name, result_docs=supabase_contexts)
+def _doc_key(metadata: Dict[str, Any]) -> Tuple[str, str]:
+  """(column, value) identifying a hit's parent document; url wins like it always has."""
+  if metadata.get('url'):
+    return 'url', metadata['url']
+  return 's3_path', metadata.get('s3_path') or ''
 
-    with ProcessPoolExecutor() as executor:
-      executor.map(partial_func1, found_docs[5:])
-      executor.map(partial_func2, found_docs[:5])
 
-    supabase_contexts_no_duplicates = []
-    for context in supabase_contexts:
-      if context not in supabase_contexts_no_duplicates:
-        supabase_contexts_no_duplicates.append(context)
+def _page(value: Any) -> Optional[str]:
+  if value is None or value == '':
+    return None
+  try:
+    return str(int(value))
+  except (TypeError, ValueError):
+    return str(value)
 
-    result_contexts = supabase_contexts_no_duplicates + list(qdrant_contexts)
 
-    print(f"⏰ Context padding runtime: {(time.monotonic() - start_time):.2f} seconds")
+def _hit_window(metadata: Dict[str, Any], window: int) -> Optional[Tuple[str, Any, Any]]:
+  """('chunk', first, last) or ('page', page, None) for a padded hit; None if it can't be padded."""
+  chunk_index = metadata.get('chunk_index')
+  if isinstance(chunk_index, int):
+    return 'chunk', chunk_index - window, chunk_index + window
+  page = _page(metadata.get('pagenumber'))
+  if page is not None:
+    return 'page', page, None
+  return None
 
-    return result_contexts
 
+def _in_window(row: Dict[str, Any], hit_window: Tuple[str, Any, Any]) -> bool:
+  kind, first, last = hit_window
+  if kind == 'chunk':
+    return row.get('chunk_index') is not None and first <= row['chunk_index'] <= last
+  return _page(row.get('pagenumber')) == first
 
-def qdrant_context_processing(doc, course_name, result_contexts):
-  """
-    Re-factor QDRANT objects into Supabase objects and append to result_docs
-    """
-  context_dict = {
+
+def _hit_context(doc, course_name: str) -> Dict[str, Any]:
+  """A search hit in the context shape used for padded chunks."""
+  metadata = doc.metadata
+  return {
       'text': doc.page_content,
       'embedding': '',
-      'pagenumber': doc.metadata['pagenumber'],
-      'readable_filename': doc.metadata['readable_filename'],
+      'pagenumber': metadata.get('pagenumber', ''),
+      'chunk_index': metadata.get('chunk_index'),
+      'readable_filename': metadata.get('readable_filename', ''),
       'course_name': course_name,
-      's3_path': doc.metadata['s3_path'],
-      'base_url': doc.metadata['base_url']
+      's3_path': metadata.get('s3_path', ''),
+      'url': metadata.get('url') or '',
+      'base_url': metadata.get('base_url', ''),
   }
-  if 'url' in doc.metadata.keys():
-    context_dict['url'] = doc.metadata['url']
-  else:
-    context_dict['url'] = ''
-
-  result_contexts.append(context_dict)
-  return result_contexts
 
 
-def supabase_context_padding(doc, course_name, result_docs):
+def _fetch_windows_rpc(sql_db: SQLDatabase, course_name: str,
+                       windows: Dict[Tuple[str, str], List[Tuple[str, Any, Any]]]) -> Dict[Tuple[str, str], List[dict]]:
+  payload = []
+  for (column, value), doc_windows in windows.items():
+    for kind, first, last in doc_windows:
+      payload.append({
+          'doc_column': column,
+          'doc_key': value,
+          'chunk_from': first if kind == 'chunk' else None,
+          'chunk_to': last if kind == 'chunk' else None,
+          'pagenumber': first if kind == 'page' else None,
+      })
+  rows = sql_db.getContextWindows(course_name, payload).data or []
+  chunks: Dict[Tuple[str, str], List[dict]] = {}
+  for row in rows:
+    chunks.setdefault((row['doc_column'], row['doc_key']), []).append(row)
+  return chunks
+
+
+def _fetch_windows_fallback(sql_db: SQLDatabase, course_name: str,
+                            windows: Dict[Tuple[str, str], List[Tuple[str, Any, Any]]]) -> Dict[Tuple[str, str], List[dict]]:
+  by_column: Dict[str, List[str]] = {}
+  for column, value in windows:
+    by_column.setdefault(column, []).append(value)
+
+  def fetch(column: str) -> List[dict]:
+    return sql_db.getDocumentsByKeys(course_name, column, by_column[column]).data or []
+
+  with ThreadPoolExecutor(max_workers=len(by_column) or 1) as executor:
+    documents = [doc for docs in executor.map(fetch, list(by_column)) for doc in docs]
+  contexts = ChunkStore(sql_db).get_contexts([doc['id'] for doc in documents])
+
+  chunks: Dict[Tuple[str, str], List[dict]] = {}
+  for doc in documents:
+    for column in ('url', 's3_path'):
+      doc_windows = windows.get((column, doc.get(column)))
+      if not doc_windows:
+        continue
+      for context in contexts.get(doc['id'], []):
+        row = {
+            'text': context.get('text', ''),
+            'chunk_index': context.get('chunk_index'),
+            'pagenumber': context.get('pagenumber', ''),
+            'readable_filename': doc.get('readable_filename', ''),
+            's3_path': doc.get('s3_path', ''),
+            'url': doc.get('url') or '',
+            'base_url': doc.get('base_url', ''),
+        }
+        if any(_in_window(row, w) for w in doc_windows):
+          chunks.setdefault((column, doc[column]), []).append(row)
+  return chunks
+
+
+def fetch_context_windows(sql_db: SQLDatabase, course_name: str,
+                          windows: Dict[Tuple[str, str], List[Tuple[str, Any, Any]]]) -> Dict[Tuple[str, str], List[dict]]:
+  """(column, value) of a parent document -> its chunks inside any of the given windows."""
+  global _rpc_available
+  if not windows:
+    return {}
+  if _rpc_available:
+    try:
+      return _fetch_windows_rpc(sql_db, course_name, windows)
+    except Exception as e:
+      print(f"get_context_windows RPC failed, fetching parent documents instead: {e}")
+      if is_missing_function_error(e):
+        _rpc_available = False
+  return _fetch_windows_fallback(sql_db, course_name, windows)
+
+
+def context_parent_doc_padding(found_docs, search_query, course_name, sql_db: SQLDatabase, top_k: int = 5,
+                               window: int = 3) -> List[Dict[str, Any]]:
   """
-    Does context padding for given doc.
+    Takes top N contexts acquired from vector similarity search and pads the top_k
+    with neighbouring chunks of their parent documents.
     """
+  start_time = time.monotonic()
+
+  padded_hits = found_docs[:top_k]
+  windows: Dict[Tuple[str, str], List[Tuple[str, Any, Any]]] = {}
+  hit_windows = []
+  for doc in padded_hits:
+    hit_window = _hit_window(doc.metadata, window)
+    hit_windows.append(hit_window)
+    if hit_window is not None:
+      windows.setdefault(_doc_key(doc.metadata), []).append(hit_window)
+
+  try:
+    chunks = fetch_context_windows(sql_db, course_name, windows)
+  except Exception as e:
+    print(f"Context padding failed, using unpadded contexts: {e}")
+    chunks = {}
+
+  result_contexts = []
+  seen = set()
+
+  def add(context: Dict[str, Any], key: Tuple[str, str]):
+    ident = (key, context.get('chunk_index')) if context.get('chunk_index') is not None else (key, context['text'])
+    if ident not in seen:
+      seen.add(ident)
+      result_contexts.append(context)
+
+  for doc, hit_window in zip(padded_hits, hit_windows):
+    key = _doc_key(doc.metadata)
+    rows = [row for row in chunks.get(key, []) if hit_window is not None and _in_window(row, hit_window)]
+    if not rows:
+      add(_hit_context(doc, course_name), key)
+      continue
+    for row in sorted(rows, key=lambda r: (r.get('chunk_index') is None, r.get('chunk_index') or 0)):
+      context = dict(row)
+      context.pop('doc_column', None)
+      context.pop('doc_key', None)
+      context['embedding'] = ''
+      context['course_name'] = course_name
+      add(context, key)
+
+  for doc in found_docs[top_k:]:
+    add(_hit_context(doc, course_name), _doc_key(doc.metadata))
+
+  print(f"⏰ Context padding runtime: {(time.monotonic() - start_time):.2f} seconds")
+  return result_contexts
+
 
-  # query by url or s3_path
-  if 'url' in doc.metadata.keys() and doc.metadata['url']:
-    parent_doc_id = doc.metadata['url']
-    response = SUPABASE_CLIENT.table(DOCUMENTS_TABLE).select('*').eq('course_name',
-                                                                     course_name).eq('url', parent_doc_id).execute()
-
-  else:
-    parent_doc_id = doc.metadata['s3_path']
-    response = SUPABASE_CLIENT.table(DOCUMENTS_TABLE).select('*').eq('course_name',
-                                                                     course_name).eq('s3_path',
-                                                                                     parent_doc_id).execute()
-
-  data = response.data
-
-  if len(data) > 0:
-    # do the padding
-    filename = data[0]['readable_filename']
-    contexts = data[0]['contexts']
-    #print("no of contexts within the og doc: ", len(contexts))
-
-    if 'chunk_index' in doc.metadata and 'chunk_index' in contexts[0].keys():
-      #print("inside chunk index")
-      # pad contexts by chunk index + 3 and - 3
-      target_chunk_index = doc.metadata['chunk_index']
-      for context in contexts:
-        curr_chunk_index = context['chunk_index']
-        if (target_chunk_index - 3 <= curr_chunk_index <= target_chunk_index + 3):
-          context['readable_filename'] = filename
-          context['course_name'] = course_name
-          context['s3_path'] = data[0]['s3_path']
-          context['url'] = data[0]['url']
-          context['base_url'] = data[0]['base_url']
-          result_docs.append(context)
-
-    elif doc.metadata['pagenumber'] != '':
-      #print("inside page number")
-      # pad contexts belonging to same page number
-      pagenumber = doc.metadata['pagenumber']
-
-      for context in contexts:
-        # pad contexts belonging to same page number
-        if int(context['pagenumber']) == pagenumber:
-          context['readable_filename'] = filename
-          context['course_name'] = course_name
-          context['s3_path'] = data[0]['s3_path']
-          context['url'] = data[0]['url']
-          context['base_url'] = data[0]['base_url']
-          result_docs.append(context)
-
-    else:
-      #print("inside else")
-      # refactor as a Supabase object and append
-      context_dict = {
-          'text': doc.page_content,
-          'embedding': '',
-          'pagenumber': doc.metadata['pagenumber'],
-          'readable_filename': doc.metadata['readable_filename'],
-          'course_name': course_name,
-          's3_path': doc.metadata['s3_path'],
-          'base_url': doc.metadata['base_url']
-      }
-      if 'url' in doc.metadata.keys():
-        context_dict['url'] = doc.metadata['url']
-      else:
-        context_dict['url'] = ''
-
-      result_docs.append(context_dict)
+async def context_parent_doc_padding_async(found_docs, search_query, course_name, sql_db: SQLDatabase, top_k: int = 5,
+                                           window: int = 3) -> List[Dict[str, Any]]:
+  """context_parent_doc_padding without blocking the event loop."""
+  return await asyncio.to_thread(context_parent_doc_padding, found_docs, search_query, course_name, sql_db, top_k,
+                                 window)
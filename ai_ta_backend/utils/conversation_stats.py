@@ -0,0 +1,160 @@
+"""
+Incrementally maintained conversation statistics for the analytics dashboard.
+
+getConversationStats used to page through the created_at of every
+conversation of a course and bucket them in Python on each dashboard load.
+Now conversation counts are kept per (day, hour) in America/Chicago time in
+conversation_stats_buckets, together with the highest llm-convo-monitor id
+already counted (migrations/add_conversation_stats_buckets.sql). A load reads
+the buckets, counts only the conversations above that watermark (usually
+none), applies them with a compare-and-set on the watermark so concurrent
+workers never double count, and derives the per-day / per-hour / per-weekday
+/ heatmap views from the buckets with pandas.
+
+Each worker also keeps the buckets of recently viewed courses in memory, so a
+repeat load costs a single "anything newer?" query.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ai_ta_backend.database.sql import SQLDatabase, is_missing_function_error
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+TIMEZONE = 'America/Chicago'
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+_BUCKET_COLUMNS = ['day', 'hour', 'count']
+
+# Set to False once the RPCs turn out not to be installed (other errors only fall back for that load)
+_rpc_available = True
+
+
+def empty_stats() -> Dict[str, Any]:
+  return {
+      'per_day': {},
+      'per_hour': {str(hour): 0 for hour in range(24)},
+      'per_weekday': {day: 0 for day in WEEKDAYS},
+      'heatmap': {day: {str(hour): 0 for hour in range(24)} for day in WEEKDAYS},
+      'total_count': 0
+  }
+
+
+def bucket_conversations(created_at: List[str]) -> pd.DataFrame:
+  """Count created_at timestamps per local (day, hour); unparseable ones are skipped."""
+  timestamps = pd.to_datetime(pd.Series(created_at, dtype=object), utc=True, errors='coerce', format='ISO8601')
+  local = timestamps.dropna().dt.tz_convert(TIMEZONE)
+  if local.empty:
+    return pd.DataFrame(columns=_BUCKET_COLUMNS)
+  frame = pd.DataFrame({'day': local.dt.strftime('%Y-%m-%d'), 'hour': local.dt.hour})
+  return frame.groupby(['day', 'hour']).size().reset_index(name='count')
+
+
+def merge_buckets(*frames: pd.DataFrame) -> pd.DataFrame:
+  frames = tuple(frame for frame in frames if not frame.empty)
+  if not frames:
+    return pd.DataFrame(columns=_BUCKET_COLUMNS)
+  merged = pd.concat(frames, ignore_index=True)
+  return merged.groupby(['day', 'hour'], as_index=False)['count'].sum()
+
+
+def stats_from_buckets(buckets: pd.DataFrame) -> Dict[str, Any]:
+  """The getConversationStats response for a frame of (day, hour, count) buckets."""
+  if buckets.empty:
+    return empty_stats()
+  buckets = buckets.astype({'hour': int, 'count': int})
+  buckets = buckets.assign(weekday=pd.to_datetime(buckets['day']).dt.day_name())
+  per_day = buckets.groupby('day')['count'].sum().sort_index()
+  per_hour = buckets.groupby('hour')['count'].sum().reindex(range(24), fill_value=0)
+  per_weekday = buckets.groupby('weekday')['count'].sum().reindex(WEEKDAYS, fill_value=0)
+  heatmap = buckets.pivot_table(index='weekday', columns='hour', values='count', aggfunc='sum',
+                                fill_value=0).reindex(index=WEEKDAYS, columns=range(24), fill_value=0)
+  return {
+      'per_day': {day: int(count) for day, count in per_day.items()},
+      'per_hour': {str(hour): int(count) for hour, count in per_hour.items()},
+      'per_weekday': {day: int(count) for day, count in per_weekday.items()},
+      'heatmap': {day: {str(hour): int(count) for hour, count in row.items()} for day, row in heatmap.iterrows()},
+      'total_count': int(buckets['count'].sum())
+  }
+
+
+class ConversationStatsAggregator:
+  """Thread-safe course -> (watermark, buckets, response) cache in front of the bucket tables."""
+
+  def __init__(self, max_courses: int = 256):
+    self._courses = LRUCache(max_items=max_courses)
+    self._locks: Dict[str, threading.Lock] = {}
+    self._locks_lock = threading.Lock()
+
+  def _lock(self, course_name: str) -> threading.Lock:
+    with self._locks_lock:
+      return self._locks.setdefault(course_name, threading.Lock())
+
+  def _load(self, sql_db: SQLDatabase, course_name: str) -> Tuple[int, pd.DataFrame]:
+    stored = sql_db.getConversationStatsBuckets(course_name).data or {}
+    buckets = pd.DataFrame(stored.get('buckets') or [], columns=_BUCKET_COLUMNS)
+    return int(stored.get('last_id') or 0), buckets
+
+  def _new_conversations(self, sql_db: SQLDatabase, course_name: str, after_id: int) -> Tuple[int, List[str]]:
+    """(highest id, created_at values) of the conversations above after_id."""
+    created_at: List[str] = []
+    while True:
+      rows = sql_db.getConversationsCreatedAtSince(course_name, after_id).data or []
+      if not rows:
+        return after_id, created_at
+      created_at.extend(row['created_at'] for row in rows)
+      after_id = rows[-1]['id']
+
+  def get(self, sql_db: SQLDatabase, course_name: str) -> Dict[str, Any]:
+    with self._lock(course_name):
+      state: Optional[tuple] = self._courses.get(course_name)
+      last_id, buckets, response = state if state is not None else (*self._load(sql_db, course_name), None)
+
+      to_id, created_at = self._new_conversations(sql_db, course_name, last_id)
+      if created_at:
+        delta = bucket_conversations(created_at)
+        applied = sql_db.applyConversationStatsBuckets(
+            course_name, last_id, to_id, [{
+                'day': day,
+                'hour': int(hour),
+                'count': int(count)
+            } for day, hour, count in delta[_BUCKET_COLUMNS].itertuples(index=False, name=None)]).data
+        buckets, response = merge_buckets(buckets, delta), None
+        last_id = to_id
+        if not applied:
+          # Another worker counted (some of) these first; our view is still exact, but reload next time
+          self._courses.pop(course_name)
+          return stats_from_buckets(buckets)
+
+      if response is None:
+        response = stats_from_buckets(buckets)
+      self._courses.set(course_name, (last_id, buckets, response))
+      return response
+
+
+def conversation_stats_full_scan(sql_db: SQLDatabase, course_name: str) -> Dict[str, Any]:
+  """Stats from every conversation of the course, for databases without the bucket tables."""
+  conversations, _ = sql_db.getConversationsCreatedAtByCourse(course_name)
+  return stats_from_buckets(bucket_conversations([record['created_at'] for record in conversations]))
+
+
+_aggregator: Optional[ConversationStatsAggregator] = None
+_aggregator_lock = threading.Lock()
+
+
+def get_conversation_stats(sql_db: SQLDatabase, course_name: str) -> Dict[str, Any]:
+  """getConversationStats response for course_name, from the incremental buckets when installed."""
+  global _aggregator, _rpc_available
+  if _rpc_available:
+    if _aggregator is None:
+      with _aggregator_lock:
+        if _aggregator is None:
+          _aggregator = ConversationStatsAggregator()
+    try:
+      return _aggregator.get(sql_db, course_name)
+    except Exception as e:
+      print(f"Conversation stats buckets failed, counting every conversation instead: {e}")
+      if is_missing_function_error(e):
+        _rpc_available = False
+  return conversation_stats_full_scan(sql_db, course_name)
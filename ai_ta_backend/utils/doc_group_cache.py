@@ -0,0 +1,128 @@
+"""
+Per-course cache of doc-group access rules for retrieval.
+
+Every search used to fetch the course's disabled doc groups and the public doc
+groups shared into it (two PostgREST round trips) and rebuild the search
+filter from them. Both change rarely, so the compiled DocGroupFilter is cached
+per course with a short TTL, and dropped explicitly by the paths that change
+doc groups (document delete, the /docGroupsChanged route).
+
+Configuration:
+    DOC_GROUP_CACHE_TTL_SECONDS  lifetime of a cached filter (default 60, 0 disables the cache)
+    DOC_GROUP_CACHE_SIZE         courses kept in memory (default 1024)
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+ALL_DOCUMENTS = 'All Documents'
+
+
+class DocGroupFilter:
+  """
+  Compiled doc-group rules of one course: the course's own documents
+  (optionally restricted to the requested doc groups), plus enabled public doc
+  groups shared from other courses, minus admin-disabled doc groups.
+  """
+
+  def __init__(self, course_name: str, disabled_doc_groups: Iterable[str], public_doc_groups: Iterable[dict]):
+    self.course_name = course_name
+    # Lists in the shape the VectorDatabase search methods take
+    self.disabled_doc_groups: List[str] = list(disabled_doc_groups)
+    self.public_doc_groups: List[dict] = [group for group in public_doc_groups if group]
+    self.disabled = frozenset(self.disabled_doc_groups)
+
+    shared: Dict[str, List[str]] = {}
+    for group in self.public_doc_groups:
+      if group.get('enabled'):
+        shared.setdefault(group['course_name'], []).append(group['name'])
+    self.shared_courses: Dict[str, Tuple[str, ...]] = {course: tuple(names) for course, names in shared.items()}
+    self._selections: Dict[Optional[Tuple[str, ...]], Dict[str, Optional[Tuple[str, ...]]]] = {}
+    self._compiled: Dict[Hashable, Any] = {}
+
+  @classmethod
+  def from_rows(cls, course_name: str, disabled_rows: List[dict], public_rows: List[dict]) -> 'DocGroupFilter':
+    """Build from the rows of sqlDb.getDisabledDocGroups / getPublicDocGroups."""
+    return cls(course_name, [row['name'] for row in disabled_rows], [row['doc_groups'] for row in public_rows])
+
+  def selections(self, doc_groups: Optional[List[str]]) -> Dict[str, Optional[Tuple[str, ...]]]:
+    """
+    course -> doc groups to search in it (None: every document of the course)
+    for a query restricted to doc_groups.
+    """
+    key = self.selection_key(doc_groups)
+    selections = self._selections.get(key)
+    if selections is None:
+      selections = {self.course_name: key}
+      for course, names in self.shared_courses.items():
+        if course in selections and selections[course] is None:
+          continue
+        selections[course] = tuple(sorted(set(selections.get(course) or ()) | set(names)))
+      if len(self._selections) >= 64:
+        self._selections.clear()
+      self._selections[key] = selections
+    return selections
+
+  @staticmethod
+  def selection_key(doc_groups: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    """The requested doc groups in canonical form (None: every document of the course)."""
+    return tuple(sorted(doc_groups)) if doc_groups and ALL_DOCUMENTS not in doc_groups else None
+
+  def compiled(self, key: Hashable, build: Callable[[], Any]) -> Any:
+    """build() cached under key for as long as this filter is, e.g. a backend's native filter object."""
+    if key not in self._compiled:
+      if len(self._compiled) >= 64:
+        self._compiled.clear()
+      self._compiled[key] = build()
+    return self._compiled[key]
+
+  def references(self, course_name: str) -> bool:
+    """Whether doc-group changes in course_name affect this filter."""
+    return course_name == self.course_name or course_name in self.shared_courses
+
+
+class DocGroupCache:
+  """Thread-safe course -> DocGroupFilter cache."""
+
+  def __init__(self, max_items: int = 1024, ttl_seconds: Optional[float] = 60):
+    self._filters = LRUCache(max_items=max_items, ttl_seconds=ttl_seconds)
+
+  def get(self, course_name: str) -> Optional[DocGroupFilter]:
+    return self._filters.get(course_name)
+
+  def put(self, course_name: str, search_filter: DocGroupFilter):
+    self._filters.set(course_name, search_filter)
+
+  def invalidate(self, course_name: Optional[str] = None):
+    """Drop the filters that depend on course_name's doc groups (all of them if None)."""
+    if course_name is None:
+      self._filters.clear()
+      return
+    for key in self._filters.keys():
+      search_filter = self._filters.get(key)
+      if key == course_name or (search_filter is not None and search_filter.references(course_name)):
+        self._filters.pop(key)
+
+  def stats(self) -> Dict[str, int]:
+    return {'hits': self._filters.hits, 'misses': self._filters.misses, 'entries': len(self._filters)}
+
+
+_doc_group_cache: Optional[DocGroupCache] = None
+_doc_group_cache_lock = threading.Lock()
+
+
+def get_doc_group_cache() -> Optional[DocGroupCache]:
+  """Return the process-wide doc-group cache, or None if disabled."""
+  global _doc_group_cache
+  if _doc_group_cache is None:
+    ttl_seconds = float(os.environ.get('DOC_GROUP_CACHE_TTL_SECONDS', 60))
+    if ttl_seconds <= 0:
+      return None
+    with _doc_group_cache_lock:
+      if _doc_group_cache is None:
+        _doc_group_cache = DocGroupCache(max_items=int(os.environ.get('DOC_GROUP_CACHE_SIZE', 1024)),
+                                         ttl_seconds=ttl_seconds)
+  return _doc_group_cache
@@ -0,0 +1,155 @@
+"""
+Two-tier cache of query embeddings.
+
+Users ask the same questions over and over, and every retrieval used to pay an
+embedding API round trip for them. Embeddings are cached by
+(embedding model, normalized query text):
+
+* an in-process LRU with a TTL, and
+* optionally a SQLite file shared by all workers on the host (float32 blobs),
+  consulted on an in-process miss.
+
+Configuration:
+    QUERY_EMBEDDING_CACHE_SIZE         in-process entries (default 10000, 0 disables the cache)
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS  entry lifetime in both tiers (default 7 days)
+    QUERY_EMBEDDING_CACHE_PATH         SQLite file for the on-disk tier (unset: memory only)
+"""
+
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+
+def normalize_query(text: str) -> str:
+  """
+  NFKC-normalize and collapse whitespace so trivially different spellings share an entry.
+  Case is kept: the embedding model distinguishes "US" from "us".
+  """
+  return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+class EmbeddingCache:
+  """Thread-safe (model, query) -> embedding cache with an optional on-disk tier."""
+
+  def __init__(self, max_items: int = 10000, ttl_seconds: Optional[float] = 7 * 24 * 3600,
+               sqlite_path: Optional[str] = None):
+    self.ttl_seconds = ttl_seconds
+    self._memory = LRUCache(max_items=max_items, ttl_seconds=ttl_seconds)
+    self._db: Optional[sqlite3.Connection] = None
+    self._db_lock = threading.Lock()
+    self._stats_lock = threading.Lock()
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    if sqlite_path:
+      try:
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS query_embeddings ('
+                         'key TEXT PRIMARY KEY, model TEXT NOT NULL, created_at REAL NOT NULL, embedding BLOB NOT NULL)')
+      except sqlite3.Error as e:
+        print(f"Query embedding cache: on-disk tier disabled ({sqlite_path}): {e}")
+        self._db = None
+
+  @staticmethod
+  def key(model: str, text: str) -> str:
+    # v2: keys before it were case-folded, so on-disk entries under them may belong to another spelling
+    return hashlib.sha256(f"v2\0{model}\0{normalize_query(text)}".encode('utf-8')).hexdigest()
+
+  def _count(self, name: str):
+    with self._stats_lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def _disk_get(self, key: str) -> Optional[List[float]]:
+    if self._db is None:
+      return None
+    try:
+      with self._db_lock:
+        row = self._db.execute('SELECT created_at, embedding FROM query_embeddings WHERE key = ?', (key,)).fetchone()
+    except sqlite3.Error as e:
+      print(f"Query embedding cache read failed: {e}")
+      return None
+    if row is None or (self.ttl_seconds is not None and time.time() - row[0] > self.ttl_seconds):
+      return None
+    values = array.array('f')
+    values.frombytes(row[1])
+    return values.tolist()
+
+  def _disk_put(self, key: str, model: str, embedding: List[float]):
+    if self._db is None:
+      return
+    try:
+      blob = array.array('f', embedding).tobytes()
+      with self._db_lock:
+        self._db.execute('INSERT OR REPLACE INTO query_embeddings (key, model, created_at, embedding) VALUES (?, ?, ?, ?)',
+                         (key, model, time.time(), blob))
+    except sqlite3.Error as e:
+      print(f"Query embedding cache write failed: {e}")
+
+  def get(self, model: str, text: str) -> Optional[List[float]]:
+    key = self.key(model, text)
+    embedding = self._memory.get(key)
+    if embedding is not None:
+      self._count('hits')
+      return embedding
+    embedding = self._disk_get(key)
+    if embedding is not None:
+      self._count('hits')
+      self._count('disk_hits')
+      self._memory.set(key, embedding)
+      return embedding
+    self._count('misses')
+    return None
+
+  def put(self, model: str, text: str, embedding: List[float]):
+    key = self.key(model, text)
+    self._memory.set(key, embedding)
+    self._disk_put(key, model, embedding)
+
+  def get_or_compute(self, model: str, text: str, compute: Callable[[], List[float]]) -> Tuple[List[float], bool]:
+    """Return (embedding, cache_hit), calling compute() on a miss."""
+    embedding = self.get(model, text)
+    if embedding is not None:
+      return embedding, True
+    embedding = compute()
+    self.put(model, text, embedding)
+    return embedding, False
+
+  def stats(self) -> Dict[str, Any]:
+    lookups = self.hits + self.misses
+    return {
+        'hits': self.hits,
+        'disk_hits': self.disk_hits,
+        'misses': self.misses,
+        'hit_rate': self.hits / lookups if lookups else 0.0,
+        'memory_entries': len(self._memory),
+        'disk_enabled': self._db is not None,
+    }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+  """Return the process-wide query embedding cache, or None if disabled."""
+  global _embedding_cache
+  if _embedding_cache is None:
+    max_items = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 10000))
+    if max_items <= 0:
+      return None
+    with _embedding_cache_lock:
+      if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            max_items=max_items,
+            ttl_seconds=float(os.environ.get('QUERY_EMBEDDING_CACHE_TTL_SECONDS', 7 * 24 * 3600)),
+            sqlite_path=os.environ.get('QUERY_EMBEDDING_CACHE_PATH') or None,
+        )
+  return _embedding_cache
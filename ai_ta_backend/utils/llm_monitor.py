@@ -0,0 +1,256 @@
+"""
+Moderation pipeline behind RetrievalService.llm_monitor_message.
+
+Each conversation update re-sends the whole conversation, and every message
+used to be classified by a sequential call to the 14B model with the tool
+schema rebuilt per call. Now:
+
+* messages already classified are skipped, keyed by a hash of their content
+  (so alerts are not sent again for old messages either);
+* the rest are classified concurrently, bounded by a process-wide semaphore
+  so simultaneous conversations share the Ollama server's capacity;
+* short messages are grouped several to a prompt, each numbered, and the
+  tools take the number of the message they flag;
+* one Ollama client and the two tool specs (single / batched) are reused.
+
+Configuration:
+    LLM_MONITOR_CONCURRENCY   classification calls in flight per process (default 4)
+    LLM_MONITOR_BATCH_SIZE    short messages per prompt (default 4, 1 disables batching)
+    LLM_MONITOR_BATCH_CHARS   messages up to this length are batched (default 500)
+    LLM_MONITOR_CACHE_SIZE    classified message hashes remembered (default 10000)
+"""
+
+import copy
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+MODEL = 'qwen2.5:14b-instruct-fp16'
+ALERT_CATEGORIES = ('NSFW', 'anger', 'incorrect')
+
+SYSTEM_PROMPT = '''Analyze each message for multiple categories simultaneously. A message can and should trigger multiple categories if it meets multiple criteria. Use the provided tools to flag any and all applicable categories based on their descriptions.'''
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + ''' You are given several numbered messages. Analyze each one separately and pass the number of the message you are flagging as message_number.'''
+
+TOOLS = [
+    {
+        'type': 'function',
+        'function': {
+            'name':
+                'categorize_as_NSFW',
+            'description':
+                'Flag content containing explicit threats of harm, violence, sexual content, hate speech, discriminatory language, or other inappropriate material that would be unsafe for work or general audiences.',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'keyword_that_triggers_NSFW_tag': {
+                        'type': 'string',
+                        'description': 'The specific word or phrase that indicates prohibited content',
+                    },
+                },
+                'required': ['keyword_that_triggers_NSFW_tag'],
+            },
+        },
+    },
+    {
+        'type': 'function',
+        'function': {
+            'name':
+                'categorize_as_anger',
+            'description':
+                'Identify content expressing clear anger through aggressive language, hostile tone, multiple exclamation marks, ALL CAPS YELLING, or explicitly angry statements.',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'keyword_that_triggers_anger_tag': {
+                        'type': 'string',
+                        'description': 'The exact word, phrase, or punctuation that shows anger or aggression',
+                    },
+                },
+                'required': ['keyword_that_triggers_anger_tag'],
+            },
+        },
+    },
+    {
+        'type': 'function',
+        'function': {
+            'name':
+                'categorize_as_incorrect',
+            'description':
+                'Flag content where the user indicates that the chatbot provided wrong, incorrect, or false information. This includes statements about inaccuracies, mistakes, or errors in the bot\'s responses.',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'keyword_that_triggers_incorrect_tag': {
+                        'type':
+                            'string',
+                        'description':
+                            'The specific phrase that indicates the bot was incorrect (e.g. "that\'s wrong", "incorrect", "that\'s not true")',
+                    },
+                },
+                'required': ['keyword_that_triggers_incorrect_tag'],
+            },
+        },
+    },
+    {
+        'type': 'function',
+        'function': {
+            'name':
+                'categorize_as_good',
+            'description':
+                'Classify content as appropriate and constructive if it contains normal questions, feedback, discussion, or requests without triggering any of the above categories.',
+        },
+    },
+]
+
+
+def _batched_tools() -> List[dict]:
+  """TOOLS with a required message_number argument."""
+  tools = copy.deepcopy(TOOLS)
+  for tool in tools:
+    parameters = tool['function'].setdefault('parameters', {'type': 'object', 'properties': {}})
+    parameters['properties']['message_number'] = {
+        'type': 'integer',
+        'description': 'The number of the message this category applies to',
+    }
+    parameters['required'] = parameters.get('required', []) + ['message_number']
+  return tools
+
+
+BATCHED_TOOLS = _batched_tools()
+
+
+def message_text(message: Dict[str, Any]) -> str:
+  try:
+    return message['content'][0]['text'] if isinstance(message.get('content'), list) else message['content']
+  except Exception:
+    return message['content']
+
+
+def content_hash(text: str) -> str:
+  return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _tool_calls(analysis_result) -> list:
+  message = analysis_result.get('message', {})
+  return (message['tool_calls'] or []) if 'tool_calls' in message else []
+
+
+def _alert(tool_call) -> Optional[Dict[str, str]]:
+  category = tool_call.function.name.replace('categorize_as_', '')
+  if category not in ALERT_CATEGORIES:
+    return None
+  trigger = tool_call.function.arguments.get(f'keyword_that_triggers_{category}_tag', 'No trigger specified')
+  return {'category': category, 'trigger': trigger}
+
+
+class LLMMonitor:
+  """Process-wide moderation classifier; see the module docstring."""
+
+  def __init__(self, client, concurrency: int = 4, batch_size: int = 4, batch_chars: int = 500,
+               cache_size: int = 10_000):
+    self.client = client
+    self.concurrency = max(1, concurrency)
+    self.batch_size = max(1, batch_size)
+    self.batch_chars = batch_chars
+    self._semaphore = threading.BoundedSemaphore(self.concurrency)
+    # content hash -> alerts of an already classified message
+    self._classified = LRUCache(max_items=cache_size)
+
+  def _chat(self, system_prompt: str, content: str, tools: List[dict]):
+    with self._semaphore:
+      return self.client.chat(model=MODEL,
+                              messages=[{
+                                  'role': 'system',
+                                  'content': system_prompt
+                              }, {
+                                  'role': 'user',
+                                  'content': content
+                              }],
+                              tools=tools)
+
+  def _classify_one(self, text: str) -> List[List[Dict[str, str]]]:
+    alerts = [_alert(tool_call) for tool_call in _tool_calls(self._chat(SYSTEM_PROMPT, text, TOOLS))]
+    return [[alert for alert in alerts if alert]]
+
+  def _classify_batch(self, texts: List[str]) -> List[List[Dict[str, str]]]:
+    if len(texts) == 1:
+      return self._classify_one(texts[0])
+    prompt = '\n\n'.join(f"Message {i}:\n{text}" for i, text in enumerate(texts, start=1))
+    alerts: List[List[Dict[str, str]]] = [[] for _ in texts]
+    for tool_call in _tool_calls(self._chat(BATCH_SYSTEM_PROMPT, prompt, BATCHED_TOOLS)):
+      alert = _alert(tool_call)
+      if alert is None:
+        continue
+      try:
+        alerts[int(tool_call.function.arguments.get('message_number')) - 1].append(alert)
+      except (TypeError, ValueError, IndexError):
+        print(f"LLM monitor flagged an unknown message number: {tool_call.function.arguments}")
+    return alerts
+
+  def _groups(self, texts: List[str]) -> List[List[str]]:
+    """Long messages alone, short ones batch_size to a group."""
+    groups, short = [], []
+    for text in texts:
+      if len(text) > self.batch_chars or self.batch_size == 1:
+        groups.append([text])
+        continue
+      short.append(text)
+      if len(short) == self.batch_size:
+        groups.append(short)
+        short = []
+    if short:
+      groups.append(short)
+    return groups
+
+  def classify(self, texts: List[str]) -> List[Tuple[str, List[Dict[str, str]]]]:
+    """
+    (text, alerts) for each message not classified before; distinct messages
+    with the same content are classified once.
+    """
+    pending: Dict[str, str] = {}
+    for text in texts:
+      if not text:
+        continue
+      key = content_hash(text)
+      if key not in pending and self._classified.get(key) is None:
+        pending[key] = text
+    if not pending:
+      return []
+
+    groups = self._groups(list(pending.values()))
+    results: List[Tuple[str, List[Dict[str, str]]]] = []
+    with ThreadPoolExecutor(max_workers=min(self.concurrency, len(groups))) as executor:
+      for group, future in [(group, executor.submit(self._classify_batch, group)) for group in groups]:
+        try:
+          group_alerts = future.result()
+        except Exception as e:
+          print(f"LLM monitor classification failed for {len(group)} messages: {e}")
+          continue
+        for text, alerts in zip(group, group_alerts):
+          self._classified.set(content_hash(text), alerts)
+          results.append((text, alerts))
+    return results
+
+
+_llm_monitor: Optional[LLMMonitor] = None
+_llm_monitor_lock = threading.Lock()
+
+
+def get_llm_monitor() -> LLMMonitor:
+  """Return the process-wide LLMMonitor, with one Ollama client for OLLAMA_SERVER_URL."""
+  global _llm_monitor
+  if _llm_monitor is None:
+    with _llm_monitor_lock:
+      if _llm_monitor is None:
+        from ollama import Client as OllamaClient
+
+        _llm_monitor = LLMMonitor(OllamaClient(os.environ['OLLAMA_SERVER_URL']),
+                                  concurrency=int(os.environ.get('LLM_MONITOR_CONCURRENCY', 4)),
+                                  batch_size=int(os.environ.get('LLM_MONITOR_BATCH_SIZE', 4)),
+                                  batch_chars=int(os.environ.get('LLM_MONITOR_BATCH_CHARS', 500)),
+                                  cache_size=int(os.environ.get('LLM_MONITOR_CACHE_SIZE', 10_000)))
+  return _llm_monitor
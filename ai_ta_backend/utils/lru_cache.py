@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+  """
+  Thread-safe, process-wide LRU cache with optional TTL and memory budget.
+
+  Entries are evicted when any of these limits is exceeded:
+    * max_items: number of entries
+    * ttl_seconds: time since the entry was last written
+    * max_bytes: sum of sizeof(value) over all entries
+
+  on_evict(key, value) is called (outside the lock) for every entry dropped by
+  the cache itself, but not for explicit pop() / clear() calls.
+  """
+
+  def __init__(self,
+               max_items: int = 1024,
+               ttl_seconds: Optional[float] = None,
+               max_bytes: Optional[int] = None,
+               sizeof: Optional[Callable[[Any], int]] = None,
+               on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+    self.max_items = max_items
+    self.ttl_seconds = ttl_seconds
+    self.max_bytes = max_bytes
+    self.sizeof = sizeof
+    self.on_evict = on_evict
+
+    self._lock = threading.RLock()
+    # key -> (value, written_at, size_bytes)
+    self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+    self._total_bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key: Hashable, default: Any = None) -> Any:
+    evicted = []
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and self._is_expired(entry):
+        evicted.append((key, self._remove(key)))
+        self.evictions += 1
+        entry = None
+      if entry is None:
+        self.misses += 1
+        value = default
+      else:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        value = entry[0]
+    self._notify(evicted)
+    return value
+
+  def set(self, key: Hashable, value: Any) -> None:
+    size = self.sizeof(value) if self.sizeof else 0
+    with self._lock:
+      if key in self._entries:
+        self._remove(key)
+      self._entries[key] = (value, time.monotonic(), size)
+      self._total_bytes += size
+      evicted = self._enforce_limits(protect=key)
+    self._notify(evicted)
+
+  def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+    """Return the cached value for key, building it with factory() on a miss."""
+    sentinel = object()
+    value = self.get(key, sentinel)
+    if value is not sentinel:
+      return value
+    value = factory()
+    with self._lock:
+      # Another thread may have populated the key while we were building.
+      entry = self._entries.get(key)
+      if entry is not None and not self._is_expired(entry):
+        self._entries.move_to_end(key)
+        return entry[0]
+    self.set(key, value)
+    return value
+
+  def touch(self, key: Hashable) -> bool:
+    """Mark key as recently used (and refresh its TTL) without counting a hit."""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return False
+      self._entries[key] = (entry[0], time.monotonic(), entry[2])
+      self._entries.move_to_end(key)
+      return True
+
+  def resize(self, key: Hashable) -> None:
+    """Recompute the size of an entry whose value grew or shrank in place."""
+    if not self.sizeof:
+      return
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return
+      size = self.sizeof(entry[0])
+      self._total_bytes += size - entry[2]
+      self._entries[key] = (entry[0], entry[1], size)
+      evicted = self._enforce_limits(protect=key)
+    self._notify(evicted)
+
+  def pop(self, key: Hashable, default: Any = None) -> Any:
+    with self._lock:
+      if key not in self._entries:
+        return default
+      return self._remove(key)
+
+  def evict_expired(self) -> int:
+    with self._lock:
+      expired = [k for k, entry in self._entries.items() if self._is_expired(entry)]
+      evicted = [(k, self._remove(k)) for k in expired]
+      self.evictions += len(evicted)
+    self._notify(evicted)
+    return len(evicted)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self._total_bytes = 0
+
+  def keys(self) -> list:
+    with self._lock:
+      return list(self._entries.keys())
+
+  def values(self) -> list:
+    with self._lock:
+      return [entry[0] for entry in self._entries.values()]
+
+  def __contains__(self, key: Hashable) -> bool:
+    with self._lock:
+      entry = self._entries.get(key)
+      return entry is not None and not self._is_expired(entry)
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._entries)
+
+  @property
+  def total_bytes(self) -> int:
+    return self._total_bytes
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      lookups = self.hits + self.misses
+      return {
+          'items': len(self._entries),
+          'bytes': self._total_bytes,
+          'hits': self.hits,
+          'misses': self.misses,
+          'evictions': self.evictions,
+          'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+      }
+
+  # ----- internals (caller holds the lock) -----
+
+  def _is_expired(self, entry: tuple) -> bool:
+    return self.ttl_seconds is not None and time.monotonic() - entry[1] > self.ttl_seconds
+
+  def _remove(self, key: Hashable) -> Any:
+    value, _, size = self._entries.pop(key)
+    self._total_bytes -= size
+    return value
+
+  def _enforce_limits(self, protect: Hashable) -> list:
+    evicted = []
+    for key in [k for k, entry in self._entries.items() if self._is_expired(entry) and k != protect]:
+      evicted.append((key, self._remove(key)))
+    while len(self._entries) > self.max_items or (self.max_bytes is not None and
+                                                  self._total_bytes > self.max_bytes):
+      oldest = next(iter(self._entries))
+      if oldest == protect:
+        # Never evict the entry that was just written, even if it alone exceeds the budget.
+        if len(self._entries) == 1:
+          break
+        self._entries.move_to_end(oldest)
+        continue
+      evicted.append((oldest, self._remove(oldest)))
+    self.evictions += len(evicted)
+    return evicted
+
+  def _notify(self, evicted: list) -> None:
+    if not self.on_evict:
+      return
+    for key, value in evicted:
+      try:
+        self.on_evict(key, value)
+      except Exception as e:
+        logger.error(f"Error in LRUCache eviction callback for {key}: {e}")
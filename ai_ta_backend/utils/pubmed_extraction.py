@@ -17,7 +17,8 @@ import pandas as pd
 import requests
 import supabase
 from minio import Minio
-from posthog import Posthog
+
+from ai_ta_backend.utils.analytics_dispatcher import get_analytics_dispatcher
 
 # POSTHOG = Posthog(sync_mode=False, project_api_key=os.environ['POSTHOG_API_KEY'], host="https://app.posthog.com")
 
@@ -40,9 +41,7 @@ def extractPubmedData():
     
   # Initialize only if not already initialized
   if 'POSTHOG' not in globals():
-        POSTHOG = Posthog(sync_mode=False, 
-                         project_api_key=os.environ['POSTHOG_API_KEY'], 
-                         host="https://app.posthog.com")
+        POSTHOG = get_analytics_dispatcher()
 
   if 'SUPABASE_CLIENT' not in globals():
         SUPABASE_CLIENT = supabase.create_client(  # type: ignore
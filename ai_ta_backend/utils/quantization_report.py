@@ -0,0 +1,80 @@
+"""
+Recall vs. latency of quantized local vector search for one course.
+
+Uses stored chunk embeddings as queries (the query chunk itself is excluded
+from its results), takes exact float32 search as ground truth, and reports
+recall@k, mean/p95 latency and the resident size of the search
+representation for each quantization mode and rescore factor.
+
+  python -m ai_ta_backend.utils.quantization_report --course COURSE [--queries 200] [--top-n 20] [--factors 1,2,4,8]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from ai_ta_backend.database import quantization
+from ai_ta_backend.database.local_vector import get_local_vector_index_store
+from ai_ta_backend.database.sql import SQLDatabase
+
+load_dotenv()
+
+# Brute force only, so the numbers describe quantization rather than HNSW
+_NO_HNSW = 1 << 62
+
+
+def _run(index, queries, rows, top_n):
+  results, latencies = [], []
+  for query, row in zip(queries, rows):
+    start = time.perf_counter()
+    hits = index.search(query, index.alive, top_n + 1, _NO_HNSW)
+    latencies.append(time.perf_counter() - start)
+    results.append([hit_row for hit_row, _ in hits if hit_row != row][:top_n])
+  return results, np.asarray(latencies) * 1000
+
+
+def report(course_name: str, num_queries: int = 200, top_n: int = 20, factors=(1, 2, 4, 8), seed: int = 0):
+  index = get_local_vector_index_store().get(course_name, SQLDatabase())
+  if index is None or not len(index):
+    print(f"No vectors indexed for {course_name}")
+    return
+
+  alive_rows = np.flatnonzero(index.alive)
+  rng = np.random.default_rng(seed)
+  rows = rng.choice(alive_rows, size=min(num_queries, alive_rows.size), replace=False)
+  queries = [np.asarray(index.vectors[row], dtype=np.float32) for row in rows]
+  count = int(alive_rows.size)
+  print(f"Course {course_name}: {count} vectors, dim {index.dim}, {len(rows)} queries, recall@{top_n}\n")
+
+  original = (index.quantization, index.rescore_factor)
+  try:
+    index.set_quantization('none')
+    exact, latencies = _run(index, queries, rows, top_n)
+    header = f"{'mode':<8}{'rescore':>8}{'recall':>9}{'mean ms':>10}{'p95 ms':>9}{'memory MB':>12}"
+    print(header)
+    print('-' * len(header))
+    print(f"{'float32':<8}{'-':>8}{1.0:>9.3f}{latencies.mean():>10.2f}{np.percentile(latencies, 95):>9.2f}"
+          f"{quantization.nbytes('none', count, index.dim) / 2**20:>12.1f}")
+
+    for mode in ('int8', 'binary'):
+      for factor in factors:
+        index.set_quantization(mode, factor)
+        index._approximate_scores(queries[0], alive_rows)  # build the quantized copy outside the timings
+        found, latencies = _run(index, queries, rows, top_n)
+        recall = np.mean([len(set(f) & set(e)) / max(len(e), 1) for f, e in zip(found, exact)])
+        print(f"{mode:<8}{factor:>8}{recall:>9.3f}{latencies.mean():>10.2f}{np.percentile(latencies, 95):>9.2f}"
+              f"{quantization.nbytes(mode, count, index.dim) / 2**20:>12.1f}")
+  finally:
+    index.set_quantization(*original)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--course', required=True, help='Course to measure')
+  parser.add_argument('--queries', type=int, default=200, help='Number of sampled queries')
+  parser.add_argument('--top-n', type=int, default=20, help='Results per query')
+  parser.add_argument('--factors', default='1,2,4,8', help='Comma-separated rescore factors')
+  args = parser.parse_args()
+  report(args.course, args.queries, args.top_n, tuple(int(f) for f in args.factors.split(',')))
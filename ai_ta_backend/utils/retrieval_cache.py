@@ -0,0 +1,165 @@
+"""
+Cache of getTopContexts results.
+
+Identical searches are common (the canned example_questions of a project are
+asked over and over), and each one used to repeat query embedding, vector
+search, payload hydration and result formatting. Results are cached under
+(doc-group selection, query, top_n) plus the current *generation* of every
+course the selection searches.
+
+A course's generation is a counter bumped whenever its searchable content
+changes: documents ingested (Beam split_and_upload, Vertex ingest), documents
+deleted, and doc-group changes. A bump makes every cached result that touched
+the course unreachable, so results are never served stale; the unreachable
+entries age out of the LRU. Counters live in Upstash Redis
+(retrieval_generation:<course>) so that bumps from Beam and from other workers
+are seen here; without Redis credentials they are kept per process, and only
+the TTL bounds staleness after out-of-process ingests.
+
+Configuration:
+    RETRIEVAL_CACHE_MAX_MB        memory budget for cached results (default 128, 0 disables the cache)
+    RETRIEVAL_CACHE_TTL_SECONDS   lifetime of a cached result (default 3600)
+"""
+
+import os
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from ai_ta_backend.utils.doc_group_cache import DocGroupFilter
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+GENERATION_KEY_PREFIX = 'retrieval_generation:'
+
+
+def _results_size(results: List[Dict[str, Any]]) -> int:
+  """Rough resident size of a formatted result list: its text plus a fixed overhead per result."""
+  return sum(len(result.get('text') or '') + 512 for result in results) + 64
+
+
+def normalize_query(search_query: str) -> str:
+  return ' '.join(search_query.split())
+
+
+class CourseGenerations:
+  """Per-course content generation counters, shared through Redis when configured."""
+
+  def __init__(self, redis_client=None):
+    self.redis = redis_client
+    self._local: Dict[str, int] = {}
+    self._lock = threading.Lock()
+
+  def get_many(self, course_names: Sequence[str]) -> Optional[tuple]:
+    """Current generations of course_names, or None if they can't be read."""
+    if self.redis is None:
+      with self._lock:
+        return tuple(self._local.get(course, 0) for course in course_names)
+    try:
+      values = self.redis.mget(*[GENERATION_KEY_PREFIX + course for course in course_names])
+      return tuple(int(value or 0) for value in values)
+    except Exception as e:
+      print(f"Failed to read retrieval generations, bypassing retrieval cache: {e}")
+      return None
+
+  def bump(self, course_name: str):
+    if self.redis is not None:
+      try:
+        self.redis.incr(GENERATION_KEY_PREFIX + course_name)
+        return
+      except Exception as e:
+        print(f"Failed to bump retrieval generation of {course_name}: {e}")
+    with self._lock:
+      self._local[course_name] = self._local.get(course_name, 0) + 1
+
+
+class RetrievalResultCache:
+  """Thread-safe cache of formatted getTopContexts results."""
+
+  def __init__(self, generations: CourseGenerations, max_bytes: int, ttl_seconds: Optional[float] = 3600):
+    self.generations = generations
+    self._results = LRUCache(max_items=100_000, ttl_seconds=ttl_seconds, max_bytes=max_bytes, sizeof=_results_size)
+    self.bypassed = 0
+
+  def key(self, search_filter: DocGroupFilter, doc_groups: Optional[List[str]], search_query: str,
+          top_n: int) -> Optional[Hashable]:
+    """Cache key of a search, or None if the generations of its courses can't be read."""
+    selections = tuple(sorted(search_filter.selections(doc_groups).items()))
+    generations = self.generations.get_many([course for course, _ in selections])
+    if generations is None:
+      self.bypassed += 1
+      return None
+    return (search_filter.course_name, selections, generations, tuple(search_filter.disabled_doc_groups),
+            normalize_query(search_query), top_n)
+
+  def get(self, key: Optional[Hashable]) -> Optional[List[Dict[str, Any]]]:
+    if key is None:
+      return None
+    results = self._results.get(key)
+    # Callers own the returned dicts
+    return [dict(result) for result in results] if results is not None else None
+
+  def put(self, key: Optional[Hashable], results: List[Dict[str, Any]]):
+    if key is not None:
+      self._results.set(key, [dict(result) for result in results])
+
+  def bump(self, course_name: str):
+    """Call after the searchable content or doc groups of course_name change."""
+    self.generations.bump(course_name)
+
+  def stats(self) -> Dict[str, Any]:
+    lookups = self._results.hits + self._results.misses
+    return {
+        'hits': self._results.hits,
+        'misses': self._results.misses,
+        'hit_rate': self._results.hits / lookups if lookups else 0.0,
+        'bypassed': self.bypassed,
+        'entries': len(self._results),
+        'bytes': self._results.total_bytes,
+        'evictions': self._results.evictions,
+    }
+
+
+_course_generations: Optional[CourseGenerations] = None
+_course_generations_lock = threading.Lock()
+_retrieval_cache: Optional[RetrievalResultCache] = None
+_retrieval_cache_lock = threading.Lock()
+
+
+def _redis_client():
+  if not (os.environ.get('UPSTASH_REDIS_REST_URL') and os.environ.get('UPSTASH_REDIS_REST_TOKEN')):
+    return None
+  try:
+    from upstash_redis import Redis
+    return Redis(url=os.environ['UPSTASH_REDIS_REST_URL'], token=os.environ['UPSTASH_REDIS_REST_TOKEN'])
+  except Exception as e:
+    print(f"Retrieval cache generations are per process, Redis unavailable: {e}")
+    return None
+
+
+def get_course_generations() -> CourseGenerations:
+  """Return the process-wide course generation counters (also used by the local vector index)."""
+  global _course_generations
+  if _course_generations is None:
+    with _course_generations_lock:
+      if _course_generations is None:
+        _course_generations = CourseGenerations(_redis_client())
+  return _course_generations
+
+
+def get_retrieval_cache() -> Optional[RetrievalResultCache]:
+  """Return the process-wide retrieval result cache, or None if disabled."""
+  global _retrieval_cache
+  if _retrieval_cache is None:
+    max_mb = float(os.environ.get('RETRIEVAL_CACHE_MAX_MB', 128))
+    if max_mb <= 0:
+      return None
+    with _retrieval_cache_lock:
+      if _retrieval_cache is None:
+        _retrieval_cache = RetrievalResultCache(get_course_generations(),
+                                                max_bytes=int(max_mb * 2**20),
+                                                ttl_seconds=float(os.environ.get('RETRIEVAL_CACHE_TTL_SECONDS', 3600)))
+  return _retrieval_cache
+
+
+def bump_retrieval_generation(course_name: str):
+  """Invalidate cached retrieval results that searched course_name, and mark its local vector index stale."""
+  get_course_generations().bump(course_name)
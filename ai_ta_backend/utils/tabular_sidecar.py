@@ -0,0 +1,120 @@
+"""
+Columnar Parquet sidecars for ingested CSV/Excel files.
+
+At ingest a typed Parquet copy of the table is written next to the original
+(`<s3_path>.parquet`), and its schema, row count and column statistics are
+recorded on the `documents` row (see migrations/add_tabular_sidecar_columns.sql).
+Writers only do this when DOCUMENT_TABULAR_SIDECARS=true, i.e. after the
+migration has been applied. Readers load the sidecar instead of re-parsing the
+raw file, and whatever deletes or replaces the original deletes its sidecar too.
+
+NOTE: ai_ta_backend/beam/ingest*.py are deployed standalone and keep their own
+copy of the writer; keep the formats in sync.
+"""
+
+import io
+import math
+import os
+from typing import Any, Dict
+
+import pandas as pd
+
+SIDECAR_SUFFIX = '.parquet'
+TABULAR_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+def sidecars_enabled() -> bool:
+  return os.environ.get('DOCUMENT_TABULAR_SIDECARS', 'false').lower() == 'true'
+
+
+def sidecar_path(s3_path: str) -> str:
+  return s3_path + SIDECAR_SUFFIX
+
+
+def may_have_sidecar(s3_path: str) -> bool:
+  """Whether s3_path is a CSV/Excel file, which may have a sidecar next to it."""
+  return bool(s3_path) and s3_path.lower().endswith(TABULAR_EXTENSIONS)
+
+
+def read_table_file(path: str, file_type: str) -> pd.DataFrame:
+  """Parse a local CSV/Excel file (first sheet) into a DataFrame."""
+  if file_type in ('xlsx', 'xls'):
+    return pd.read_excel(path)
+  return pd.read_csv(path)
+
+
+def _json_safe(value: Any) -> Any:
+  if value is None:
+    return None
+  if hasattr(value, 'item'):  # numpy scalar
+    value = value.item()
+  if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+    return None
+  if isinstance(value, (int, float, bool, str)):
+    return value
+  return str(value)
+
+
+def column_stats(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+  """Per-column dtype, null count, distinct count and min/max/mean for numeric columns."""
+  stats: Dict[str, Dict[str, Any]] = {}
+  for name in df.columns:
+    series = df[name]
+    col: Dict[str, Any] = {
+        'dtype': str(series.dtype),
+        'null_count': int(series.isna().sum()),
+    }
+    try:
+      col['distinct_count'] = int(series.nunique(dropna=True))
+    except TypeError:  # unhashable values
+      pass
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+      col['min'] = _json_safe(series.min())
+      col['max'] = _json_safe(series.max())
+      col['mean'] = _json_safe(series.mean())
+    elif pd.api.types.is_datetime64_any_dtype(series):
+      col['min'] = _json_safe(series.min())
+      col['max'] = _json_safe(series.max())
+    stats[str(name)] = col
+  return stats
+
+
+def _normalize_for_parquet(df: pd.DataFrame) -> pd.DataFrame:
+  """Parquet needs string column names and consistent types within object columns."""
+  df = df.copy(deep=False)
+  df.columns = [str(c) for c in df.columns]
+  for name in df.columns:
+    if df[name].dtype == object:
+      inferred = pd.api.types.infer_dtype(df[name], skipna=True)
+      if inferred not in ('string', 'empty'):
+        df[name] = df[name].astype('string')
+  return df
+
+
+def write_sidecar(df: pd.DataFrame, s3_client, bucket: str, s3_path: str) -> Dict[str, Any]:
+  """
+  Upload a Parquet sidecar for the table at s3_path and return the
+  documents-row fields describing it.
+  """
+  table_df = _normalize_for_parquet(df)
+  buffer = io.BytesIO()
+  table_df.to_parquet(buffer, engine='pyarrow', index=False, compression='zstd')
+  buffer.seek(0)
+
+  key = sidecar_path(s3_path)
+  s3_client.upload_fileobj(buffer, bucket, key, ExtraArgs={'ContentType': 'application/vnd.apache.parquet'})
+
+  return {
+      'sidecar_s3_path': key,
+      'sidecar_schema': [{'name': str(name), 'type': str(dtype)} for name, dtype in table_df.dtypes.items()],
+      'row_count': int(len(df)),
+      'column_headers': [str(c) for c in df.columns],
+      'column_stats': column_stats(df),
+  }
+
+
+def read_sidecar(data: bytes) -> pd.DataFrame:
+  """Load a downloaded Parquet sidecar without copying its bytes."""
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+  return pq.read_table(pa.BufferReader(data)).to_pandas()
@@ -0,0 +1,50 @@
+-- Migration: Add get_context_windows RPC
+-- Date: 2026-10-16
+-- Description: Returns only the text fields of the chunks around retrieved hits, for parent-document
+-- context padding (ai_ta_backend/utils/context_parent_doc_padding.py), in one call for all hits
+
+-- p_windows: [{doc_column: 'url' | 's3_path', doc_key, chunk_from, chunk_to, pagenumber}]
+-- A window selects chunk_index BETWEEN chunk_from AND chunk_to, or (when chunk_from is null) one page.
+CREATE OR REPLACE FUNCTION public.get_context_windows(p_course_name TEXT, p_windows JSONB)
+RETURNS TABLE (
+  doc_column TEXT,
+  doc_key TEXT,
+  s3_path TEXT,
+  url TEXT,
+  readable_filename TEXT,
+  base_url TEXT,
+  chunk_index INTEGER,
+  pagenumber TEXT,
+  text TEXT
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT DISTINCT ON (w.doc_column, w.doc_key, c.position)
+    w.doc_column,
+    w.doc_key,
+    d.s3_path,
+    COALESCE(d.url, ''),
+    d.readable_filename,
+    COALESCE(d.base_url, ''),
+    (c.value->>'chunk_index')::INTEGER,
+    COALESCE(c.value->>'pagenumber', ''),
+    c.value->>'text'
+  FROM jsonb_to_recordset(p_windows)
+    AS w(doc_column TEXT, doc_key TEXT, chunk_from INTEGER, chunk_to INTEGER, pagenumber TEXT)
+  JOIN public.documents d
+    ON d.course_name = p_course_name
+   AND ((w.doc_column = 'url' AND d.url = w.doc_key) OR (w.doc_column = 's3_path' AND d.s3_path = w.doc_key))
+  CROSS JOIN LATERAL jsonb_array_elements(d.contexts) WITH ORDINALITY AS c(value, position)
+  WHERE (w.chunk_from IS NOT NULL AND (c.value->>'chunk_index')::INTEGER BETWEEN w.chunk_from AND w.chunk_to)
+     OR (w.chunk_from IS NULL AND c.value->>'pagenumber' = w.pagenumber)
+  ORDER BY w.doc_column, w.doc_key, c.position;
+$$;
+
+-- Parent documents are looked up by (course_name, s3_path) and (course_name, url)
+CREATE INDEX IF NOT EXISTS idx_documents_course_s3_path ON public.documents (course_name, s3_path);
+CREATE INDEX IF NOT EXISTS idx_documents_course_url ON public.documents (course_name, url);
+
+-- Verification query
+-- Uncomment to run after migration:
+-- SELECT * FROM public.get_context_windows('your-course',
+--   '[{"doc_column": "s3_path", "doc_key": "courses/your-course/file.pdf", "chunk_from": 0, "chunk_to": 3}]'::jsonb);
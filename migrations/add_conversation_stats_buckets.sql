@@ -0,0 +1,73 @@
+-- Migration: Add Conversation Stats Buckets
+-- Date: 2026-10-16
+-- Description: Per-course hourly conversation counts (America/Chicago local time) with a high-water-mark
+-- id, maintained incrementally by ai_ta_backend/utils/conversation_stats.py for getConversationStats
+
+CREATE TABLE IF NOT EXISTS public.conversation_stats_buckets (
+  course_name TEXT NOT NULL,
+  day DATE NOT NULL,
+  hour SMALLINT NOT NULL CHECK (hour BETWEEN 0 AND 23),
+  count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (course_name, day, hour)
+);
+
+-- Highest llm-convo-monitor id already counted into the buckets, per course
+CREATE TABLE IF NOT EXISTS public.conversation_stats_watermarks (
+  course_name TEXT PRIMARY KEY,
+  last_id BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Keyset reads of the conversations newer than the watermark
+CREATE INDEX IF NOT EXISTS idx_llm_convo_monitor_course_id ON public."llm-convo-monitor" (course_name, id);
+
+-- Watermark and buckets of a course in one round trip: {last_id, buckets: [{day, hour, count}]}
+CREATE OR REPLACE FUNCTION public.get_conversation_stats(p_course_name TEXT)
+RETURNS JSONB
+LANGUAGE sql STABLE
+AS $$
+  SELECT jsonb_build_object(
+    'last_id', COALESCE((SELECT last_id FROM public.conversation_stats_watermarks WHERE course_name = p_course_name), 0),
+    'buckets', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object('day', b.day, 'hour', b.hour, 'count', b.count))
+      FROM public.conversation_stats_buckets b
+      WHERE b.course_name = p_course_name
+    ), '[]'::jsonb)
+  );
+$$;
+
+-- Adds p_buckets ([{day, hour, count}]) to the course's buckets and moves its watermark from p_from_id to
+-- p_to_id, atomically. Returns false without changing anything if the watermark is no longer p_from_id
+-- (another worker already counted those conversations).
+CREATE OR REPLACE FUNCTION public.apply_conversation_stats(p_course_name TEXT, p_from_id BIGINT, p_to_id BIGINT,
+                                                           p_buckets JSONB)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  current_id BIGINT;
+BEGIN
+  INSERT INTO public.conversation_stats_watermarks (course_name) VALUES (p_course_name)
+  ON CONFLICT (course_name) DO NOTHING;
+
+  SELECT last_id INTO current_id
+  FROM public.conversation_stats_watermarks
+  WHERE course_name = p_course_name
+  FOR UPDATE;
+
+  IF current_id <> p_from_id THEN
+    RETURN FALSE;
+  END IF;
+
+  INSERT INTO public.conversation_stats_buckets (course_name, day, hour, count)
+  SELECT p_course_name, (b->>'day')::DATE, (b->>'hour')::SMALLINT, (b->>'count')::INTEGER
+  FROM jsonb_array_elements(p_buckets) AS b
+  ON CONFLICT (course_name, day, hour) DO UPDATE
+  SET count = public.conversation_stats_buckets.count + EXCLUDED.count;
+
+  UPDATE public.conversation_stats_watermarks
+  SET last_id = p_to_id, updated_at = now()
+  WHERE course_name = p_course_name;
+  RETURN TRUE;
+END;
+$$;
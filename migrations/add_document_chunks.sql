@@ -0,0 +1,77 @@
+-- Migration: Add document_chunks Table
+-- Date: 2026-10-16
+-- Description: Stores document chunks one row per (document_id, chunk_index), with embeddings as
+-- float32 BYTEA, instead of one documents.contexts JSONB array per document
+
+CREATE TABLE IF NOT EXISTS public.document_chunks (
+  document_id BIGINT NOT NULL REFERENCES public.documents (id) ON DELETE CASCADE,
+  chunk_index INTEGER NOT NULL,
+  course_name TEXT NOT NULL,
+  text TEXT NOT NULL DEFAULT '',
+  pagenumber TEXT NOT NULL DEFAULT '',
+  metadata JSONB NOT NULL DEFAULT '{}'::jsonb,
+  embedding BYTEA,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (document_id, chunk_index)
+);
+
+-- Keep embeddings out of line so text-only reads don't touch them
+ALTER TABLE public.document_chunks ALTER COLUMN embedding SET STORAGE EXTERNAL;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_course ON public.document_chunks (course_name);
+
+-- NULL: the document still uses the legacy contexts array
+ALTER TABLE public.documents
+ADD COLUMN IF NOT EXISTS chunk_count INTEGER;
+
+COMMENT ON TABLE public.document_chunks IS 'Document chunks; embedding is little-endian float32';
+COMMENT ON COLUMN public.documents.chunk_count IS 'Number of rows in document_chunks; NULL if the document still stores chunks in contexts';
+
+-- Context padding reads chunk windows from document_chunks, or from contexts for unmigrated documents
+-- (replaces the function from add_context_window_rpc.sql; same signature)
+CREATE OR REPLACE FUNCTION public.get_context_windows(p_course_name TEXT, p_windows JSONB)
+RETURNS TABLE (
+  doc_column TEXT,
+  doc_key TEXT,
+  s3_path TEXT,
+  url TEXT,
+  readable_filename TEXT,
+  base_url TEXT,
+  chunk_index INTEGER,
+  pagenumber TEXT,
+  text TEXT
+)
+LANGUAGE sql STABLE
+AS $$
+  WITH windows AS (
+    SELECT w.*, d.id, d.s3_path, d.url, d.readable_filename, d.base_url, d.chunk_count
+    FROM jsonb_to_recordset(p_windows)
+      AS w(doc_column TEXT, doc_key TEXT, chunk_from INTEGER, chunk_to INTEGER, pagenumber TEXT)
+    JOIN public.documents d
+      ON d.course_name = p_course_name
+     AND ((w.doc_column = 'url' AND d.url = w.doc_key) OR (w.doc_column = 's3_path' AND d.s3_path = w.doc_key))
+  )
+  SELECT w.doc_column, w.doc_key, w.s3_path, COALESCE(w.url, ''), w.readable_filename, COALESCE(w.base_url, ''),
+         c.chunk_index, c.pagenumber, c.text
+  FROM windows w
+  JOIN public.document_chunks c
+    ON c.document_id = w.id
+   AND ((w.chunk_from IS NOT NULL AND c.chunk_index BETWEEN w.chunk_from AND w.chunk_to)
+     OR (w.chunk_from IS NULL AND c.pagenumber = w.pagenumber))
+  WHERE w.chunk_count IS NOT NULL
+  UNION ALL
+  SELECT w.doc_column, w.doc_key, w.s3_path, COALESCE(w.url, ''), w.readable_filename, COALESCE(w.base_url, ''),
+         (c.value->>'chunk_index')::INTEGER, COALESCE(c.value->>'pagenumber', ''), c.value->>'text'
+  FROM windows w
+  JOIN public.documents d ON d.id = w.id
+  CROSS JOIN LATERAL jsonb_array_elements(d.contexts) AS c(value)
+  WHERE w.chunk_count IS NULL
+    AND ((w.chunk_from IS NOT NULL AND (c.value->>'chunk_index')::INTEGER BETWEEN w.chunk_from AND w.chunk_to)
+      OR (w.chunk_from IS NULL AND c.value->>'pagenumber' = w.pagenumber));
+$$;
+
+-- Verification query
+-- Uncomment to run after migration:
+-- SELECT count(*) FILTER (WHERE chunk_count IS NULL) AS legacy_documents,
+--        count(*) FILTER (WHERE chunk_count IS NOT NULL) AS chunked_documents
+-- FROM public.documents;
@@ -0,0 +1,64 @@
+-- Migration: Add Document Content Hashes
+-- Date: 2026-10-16
+-- Description: Adds source_key / content_hash / chunk_hashes to documents so ingest duplicate detection is one
+-- indexed lookup instead of a LIKE scan that downloads every candidate's contexts (ai_ta_backend/utils/content_hashes.py)
+
+ALTER TABLE public.documents
+ADD COLUMN IF NOT EXISTS source_key TEXT,
+ADD COLUMN IF NOT EXISTS content_hash TEXT,
+ADD COLUMN IF NOT EXISTS chunk_hashes TEXT[];
+
+CREATE INDEX IF NOT EXISTS idx_documents_course_source_key
+ON public.documents (course_name, source_key, id DESC)
+INCLUDE (content_hash);
+
+-- ----------------------------------------------------------------------------
+-- Backfill. Safe to re-run; only touches rows that are still NULL.
+-- ----------------------------------------------------------------------------
+
+-- S3 filename without the "<uuid4>-" upload prefix, or the URL
+UPDATE public.documents
+SET source_key = CASE
+  WHEN COALESCE(s3_path, '') <> '' THEN
+    CASE
+      WHEN regexp_replace(s3_path, '^.*/', '') ~* '[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}'
+      THEN substr(regexp_replace(s3_path, '^.*/', ''), 38)
+      ELSE regexp_replace(s3_path, '^.*/', '')
+    END
+  ELSE NULLIF(url, '')
+END
+WHERE source_key IS NULL;
+
+-- Hashes of documents that keep their chunks in contexts
+UPDATE public.documents d
+SET content_hash = h.content_hash, chunk_hashes = h.chunk_hashes
+FROM (
+  SELECT doc.id,
+         encode(sha256(convert_to(string_agg(COALESCE(c.value->>'text', ''), '' ORDER BY c.ordinality), 'UTF8')), 'hex') AS content_hash,
+         array_agg(encode(sha256(convert_to(COALESCE(c.value->>'text', ''), 'UTF8')), 'hex') ORDER BY c.ordinality) AS chunk_hashes
+  FROM public.documents doc
+  CROSS JOIN LATERAL jsonb_array_elements(doc.contexts) WITH ORDINALITY AS c(value, ordinality)
+  WHERE doc.content_hash IS NULL AND jsonb_typeof(doc.contexts) = 'array'
+  GROUP BY doc.id
+) h
+WHERE d.id = h.id;
+
+-- Hashes of documents stored in document_chunks (add_document_chunks.sql), if that table exists
+DO $$
+BEGIN
+  IF to_regclass('public.document_chunks') IS NOT NULL THEN
+    UPDATE public.documents d
+    SET content_hash = h.content_hash, chunk_hashes = h.chunk_hashes
+    FROM (
+      SELECT dc.document_id AS id,
+             encode(sha256(convert_to(string_agg(dc.text, '' ORDER BY dc.chunk_index), 'UTF8')), 'hex') AS content_hash,
+             array_agg(encode(sha256(convert_to(dc.text, 'UTF8')), 'hex') ORDER BY dc.chunk_index) AS chunk_hashes
+      FROM public.document_chunks dc
+      JOIN public.documents doc ON doc.id = dc.document_id
+      WHERE doc.content_hash IS NULL
+      GROUP BY dc.document_id
+    ) h
+    WHERE d.id = h.id;
+  END IF;
+END;
+$$;
@@ -0,0 +1,15 @@
+-- Migration: Add Embedding Cache
+-- Date: 2026-10-16
+-- Description: Content-addressed embedding cache shared by all Beam ingest workers, keyed by
+-- (model, sha256 of the chunk text) (ai_ta_backend/beam/embedding_cache.py)
+
+CREATE TABLE IF NOT EXISTS public.embedding_cache (
+  model TEXT NOT NULL,
+  text_hash TEXT NOT NULL,
+  -- float32 little-endian, like document_chunks.embedding
+  embedding BYTEA NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (model, text_hash)
+);
+
+COMMENT ON TABLE public.embedding_cache IS 'Embeddings by (model, sha256(text)); rows can be deleted at any time, they are re-embedded on the next miss';
@@ -0,0 +1,22 @@
+-- Migration: Add Parquet Sidecar Columns to Documents Table
+-- Date: 2026-10-16
+-- Description: Records the typed Parquet sidecar written next to ingested CSV/Excel files,
+-- so readers can load it instead of re-parsing the raw file
+
+ALTER TABLE public.documents
+ADD COLUMN IF NOT EXISTS sidecar_s3_path TEXT,
+ADD COLUMN IF NOT EXISTS sidecar_schema JSONB,
+ADD COLUMN IF NOT EXISTS column_stats JSONB,
+ADD COLUMN IF NOT EXISTS row_count INTEGER;
+
+COMMENT ON COLUMN public.documents.sidecar_s3_path IS 'For CSV/Excel files: S3/R2 key of the Parquet sidecar (<s3_path>.parquet)';
+COMMENT ON COLUMN public.documents.sidecar_schema IS 'For CSV/Excel files: sidecar schema as [{name, type}]';
+COMMENT ON COLUMN public.documents.column_stats IS 'For CSV/Excel files: per-column dtype, null_count, distinct_count and min/max/mean';
+
+-- Verification query to check new columns
+-- Uncomment to run after migration:
+-- SELECT column_name, data_type, is_nullable
+-- FROM information_schema.columns
+-- WHERE table_name = 'documents'
+--   AND column_name IN ('sidecar_s3_path', 'sidecar_schema', 'column_stats', 'row_count')
+-- ORDER BY column_name;
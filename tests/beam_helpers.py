@@ -0,0 +1,29 @@
+"""
+Load single methods out of the Beam ingest modules.
+
+ai_ta_backend/beam/ingest*.py are deployed standalone and import the Beam SDK
+(which needs credentials) and their heavy dependencies at module level, so
+tests compile just the method under test against the names it uses.
+"""
+
+import ast
+import os
+import typing
+
+BEAM_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_ta_backend', 'beam')
+
+
+def load_method(module_file: str, class_name: str, method_name: str, **namespace):
+  path = os.path.join(BEAM_DIR, module_file)
+  with open(path) as f:
+    tree = ast.parse(f.read(), filename=path)
+  for node in tree.body:
+    if isinstance(node, ast.ClassDef) and node.name == class_name:
+      for item in node.body:
+        if isinstance(item, ast.FunctionDef) and item.name == method_name:
+          module = ast.Module(body=[item], type_ignores=[])
+          scope = {name: getattr(typing, name) for name in typing.__all__}
+          scope.update(namespace)
+          exec(compile(module, path, 'exec'), scope)
+          return scope[method_name]
+  raise LookupError(f"{class_name}.{method_name} not found in {module_file}")
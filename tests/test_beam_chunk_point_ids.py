@@ -0,0 +1,39 @@
+import uuid
+
+import pytest
+
+from tests.beam_helpers import load_method
+
+
+@pytest.fixture(params=['ingest.py', 'ingest_aganswers.py'])
+def chunk_point_ids(request):
+  method = load_method(request.param, 'Ingest', '_chunk_point_ids', uuid=uuid)
+  return lambda *args: method(None, *args)
+
+
+def test_ids_are_stable_across_reingests(chunk_point_ids):
+  first = chunk_point_ids('corn', 'guide.pdf', ['h1', 'h2', 'h3'])
+  # A re-ingest that inserts a chunk keeps the ids of the unchanged ones
+  second = chunk_point_ids('corn', 'guide.pdf', ['h1', 'new', 'h2', 'h3'])
+  assert len(set(first)) == 3
+  assert set(first) <= set(second)
+  assert first[0] == str(uuid.uuid5(uuid.NAMESPACE_URL, 'corn/guide.pdf/h1/0'))
+
+
+def test_repeated_chunks_get_distinct_ids(chunk_point_ids):
+  ids = chunk_point_ids('corn', 'guide.pdf', ['same', 'same', 'other'])
+  assert len(set(ids)) == 3
+  assert ids[:2] == chunk_point_ids('corn', 'guide.pdf', ['same', 'same'])
+
+
+def test_ids_depend_on_course_and_source(chunk_point_ids):
+  ids = chunk_point_ids('corn', 'guide.pdf', ['h1'])
+  assert ids != chunk_point_ids('soy', 'guide.pdf', ['h1'])
+  assert ids != chunk_point_ids('corn', 'other.pdf', ['h1'])
+
+
+def test_copies_agree():
+  hashes = ['h1', 'h2', 'h1']
+  ingest = load_method('ingest.py', 'Ingest', '_chunk_point_ids', uuid=uuid)
+  aganswers = load_method('ingest_aganswers.py', 'Ingest', '_chunk_point_ids', uuid=uuid)
+  assert ingest(None, 'corn', 'guide.pdf', hashes) == aganswers(None, 'corn', 'guide.pdf', hashes)
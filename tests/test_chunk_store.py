@@ -0,0 +1,30 @@
+from ai_ta_backend.database.chunk_store import ChunkStore, chunk_rows, row_to_context
+
+
+def _store(contexts):
+  store = ChunkStore.__new__(ChunkStore)
+  calls = []
+
+  def get_contexts(document_ids, with_vectors=False):
+    calls.append((list(document_ids), with_vectors))
+    return {document_id: contexts[document_id] for document_id in document_ids if document_id in contexts}
+
+  store.get_contexts = get_contexts
+  return store, calls
+
+
+def test_row_round_trip():
+  context = {'text': 'corn', 'pagenumber': 3, 'embedding': [1.0, 0.5], 'readable_filename': 'guide.pdf'}
+  row = chunk_rows(7, 'course', [context])[0]
+  assert row_to_context(row) == {'readable_filename': 'guide.pdf', 'text': 'corn', 'chunk_index': 0,
+                                 'pagenumber': '3', 'embedding': [1.0, 0.5]}
+
+
+def test_with_contexts_fills_only_documents_without_contexts():
+  legacy = [{'text': 'legacy'}]
+  store, calls = _store({2: [{'text': 'chunked'}]})
+  documents = store.with_contexts([{'id': 1, 'contexts': legacy}, {'id': 2, 'contexts': []}, {'id': 3}],
+                                  with_vectors=True)
+  assert calls == [([2, 3], True)]
+  assert [document['contexts'] for document in documents] == [legacy, [{'text': 'chunked'}], []]
+  assert documents[1]['id'] == 2
@@ -0,0 +1,38 @@
+import hashlib
+
+from ai_ta_backend.utils.content_hashes import document_hash_columns, document_hashes, source_key
+
+UUID = '3f2b8c4e-1a2b-4c3d-9e8f-0123456789ab'
+
+
+def test_source_key_strips_upload_uuid():
+  assert source_key(f'courses/corn/{UUID}-Field Guide.pdf', None) == 'Field Guide.pdf'
+  assert source_key(f'courses/corn/{UUID.upper()}-guide.pdf', 'https://ignored') == 'guide.pdf'
+
+
+def test_source_key_without_uuid():
+  assert source_key('courses/corn/guide.pdf', None) == 'guide.pdf'
+  assert source_key('guide.pdf', None) == 'guide.pdf'
+
+
+def test_source_key_falls_back_to_url():
+  assert source_key(None, 'https://extension.edu/corn') == 'https://extension.edu/corn'
+  assert source_key('', 'https://extension.edu/corn') == 'https://extension.edu/corn'
+  assert source_key(None, '') is None
+  assert source_key(None, None) is None
+
+
+def test_document_hashes():
+  hashes = document_hashes(['first chunk', 'second chunk'])
+  assert hashes['content_hash'] == hashlib.sha256(b'first chunksecond chunk').hexdigest()
+  assert hashes['chunk_hashes'] == [hashlib.sha256(b'first chunk').hexdigest(), hashlib.sha256(b'second chunk').hexdigest()]
+
+
+def test_hash_columns_are_gated(monkeypatch):
+  monkeypatch.delenv('DOCUMENT_CONTENT_HASHES', raising=False)
+  assert document_hash_columns('courses/corn/guide.pdf', None, ['text']) == {}
+
+  monkeypatch.setenv('DOCUMENT_CONTENT_HASHES', 'true')
+  columns = document_hash_columns(f'courses/corn/{UUID}-guide.pdf', None, ['text'])
+  assert columns['source_key'] == 'guide.pdf'
+  assert columns['content_hash'] == hashlib.sha256(b'text').hexdigest()
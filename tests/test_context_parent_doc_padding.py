@@ -0,0 +1,54 @@
+import pytest
+
+from ai_ta_backend.utils import context_parent_doc_padding as padding
+
+WINDOWS = {('s3_path', 'courses/corn/guide.pdf'): [('chunk_index', 2, 8)]}
+
+
+class PostgrestError(Exception):
+
+  def __init__(self, message, code):
+    super().__init__(message)
+    self.code = code
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+  monkeypatch.setattr(padding, '_rpc_available', True)
+  monkeypatch.setattr(padding, '_fetch_windows_fallback', lambda sql_db, course_name, windows: {'fallback': []})
+  calls = []
+
+  def use(error):
+
+    def fetch(sql_db, course_name, windows):
+      calls.append(course_name)
+      if error:
+        raise error
+      return {'rpc': []}
+
+    monkeypatch.setattr(padding, '_fetch_windows_rpc', fetch)
+    return calls
+
+  return use
+
+
+def test_transient_rpc_error_falls_back_for_that_call_only(rpc):
+  calls = rpc(TimeoutError('read timed out'))
+  assert padding.fetch_context_windows(None, 'corn', WINDOWS) == {'fallback': []}
+  assert padding.fetch_context_windows(None, 'corn', WINDOWS) == {'fallback': []}
+  assert len(calls) == 2
+  assert padding._rpc_available
+
+
+def test_missing_rpc_disables_it(rpc):
+  calls = rpc(PostgrestError('Could not find the function public.get_context_windows', 'PGRST202'))
+  assert padding.fetch_context_windows(None, 'corn', WINDOWS) == {'fallback': []}
+  assert padding.fetch_context_windows(None, 'corn', WINDOWS) == {'fallback': []}
+  assert len(calls) == 1
+  assert not padding._rpc_available
+
+
+def test_rpc_result(rpc):
+  rpc(None)
+  assert padding.fetch_context_windows(None, 'corn', WINDOWS) == {'rpc': []}
+  assert padding.fetch_context_windows(None, 'corn', {}) == {}
@@ -0,0 +1,39 @@
+from ai_ta_backend.service.conversation_service import coalesce_partial_events
+
+
+def _event(event_id, author='model', invocation='inv-1', partial=False):
+  return {'id': event_id, 'author': author, 'invocationId': invocation, 'partial': partial}
+
+
+def test_partials_followed_by_final_are_dropped():
+  events = [
+      _event('p1', partial=True),
+      _event('p2', partial=True),
+      _event('final'),
+  ]
+  assert [e['id'] for e in coalesce_partial_events(events)] == ['final']
+
+
+def test_partials_of_interrupted_stream_are_kept():
+  events = [
+      _event('final-1'),
+      _event('p1', partial=True),
+      _event('p2', partial=True),
+  ]
+  assert [e['id'] for e in coalesce_partial_events(events)] == ['final-1', 'p1', 'p2']
+
+
+def test_coalescing_is_per_author_and_invocation():
+  events = [
+      _event('tool-partial', author='tool', partial=True),
+      _event('model-partial', partial=True),
+      _event('other-invocation-partial', invocation='inv-2', partial=True),
+      _event('model-final'),
+      _event('user', author='user'),
+  ]
+  kept = [e['id'] for e in coalesce_partial_events(events)]
+  assert kept == ['tool-partial', 'other-invocation-partial', 'model-final', 'user']
+
+
+def test_empty():
+  assert coalesce_partial_events([]) == []
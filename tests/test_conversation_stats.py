@@ -0,0 +1,159 @@
+from collections import defaultdict
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pytest
+from dateutil import parser
+
+from ai_ta_backend.utils import conversation_stats
+from ai_ta_backend.utils.conversation_stats import (
+    WEEKDAYS,
+    bucket_conversations,
+    empty_stats,
+    merge_buckets,
+    stats_from_buckets,
+)
+
+CREATED_AT = [
+    '2026-03-02T15:04:05+00:00',  # Monday 09:04 in Chicago (CST)
+    '2026-03-02T15:59:59.123456+00:00',
+    '2026-03-03T03:30:00+00:00',  # Monday 21:30 in Chicago
+    '2026-07-04T12:00:00Z',  # Saturday 07:00 in Chicago (CDT)
+    'not a timestamp',
+]
+
+
+def _full_scan_stats(created_at):
+  """Response of the per-conversation loop getConversationStats used before the buckets."""
+  grouped = {'per_day': defaultdict(int), 'per_hour': defaultdict(int), 'per_weekday': defaultdict(int),
+             'heatmap': defaultdict(lambda: defaultdict(int))}
+  total = 0
+  for value in created_at:
+    try:
+      parsed = parser.parse(value).astimezone(ZoneInfo('America/Chicago'))
+    except (ValueError, OverflowError):
+      continue
+    total += 1
+    grouped['per_day'][str(parsed.date())] += 1
+    grouped['per_hour'][str(parsed.hour)] += 1
+    grouped['per_weekday'][parsed.strftime('%A')] += 1
+    grouped['heatmap'][parsed.strftime('%A')][str(parsed.hour)] += 1
+  return grouped, total
+
+
+def test_bucket_conversations_uses_chicago_time():
+  buckets = bucket_conversations(CREATED_AT)
+  assert sorted(buckets.itertuples(index=False, name=None)) == [
+      ('2026-03-02', 9, 2),
+      ('2026-03-02', 21, 1),
+      ('2026-07-04', 7, 1),
+  ]
+
+
+def test_stats_match_full_scan():
+  stats = stats_from_buckets(bucket_conversations(CREATED_AT))
+  grouped, total = _full_scan_stats(CREATED_AT)
+
+  assert set(stats) == {'per_day', 'per_hour', 'per_weekday', 'heatmap', 'total_count'}
+  assert stats['total_count'] == total == 4
+  assert stats['per_day'] == dict(grouped['per_day'])
+  # Hours, weekdays and heatmap cells without conversations are reported as 0
+  assert list(stats['per_hour']) == [str(hour) for hour in range(24)]
+  assert {hour: count for hour, count in stats['per_hour'].items() if count} == dict(grouped['per_hour'])
+  assert list(stats['per_weekday']) == WEEKDAYS
+  assert {day: count for day, count in stats['per_weekday'].items() if count} == dict(grouped['per_weekday'])
+  assert list(stats['heatmap']) == WEEKDAYS
+  for day, hours in stats['heatmap'].items():
+    assert list(hours) == [str(hour) for hour in range(24)]
+    assert {hour: count for hour, count in hours.items() if count} == dict(grouped['heatmap'].get(day, {}))
+  assert all(type(count) is int for count in stats['per_hour'].values())
+
+
+def test_merge_buckets_adds_counts():
+  first = bucket_conversations(CREATED_AT[:2])
+  second = bucket_conversations(CREATED_AT[1:4])
+  merged = merge_buckets(first, second, pd.DataFrame(columns=['day', 'hour', 'count']))
+  assert stats_from_buckets(merged)['total_count'] == 5
+  assert stats_from_buckets(merged)['per_day'] == {'2026-03-02': 4, '2026-07-04': 1}
+
+
+def test_empty_inputs():
+  assert stats_from_buckets(bucket_conversations([])) == empty_stats()
+  assert stats_from_buckets(merge_buckets()) == empty_stats()
+
+
+class FakeSQL:
+
+  def __init__(self, error):
+    self.error = error
+    self.full_scans = 0
+
+  def getConversationStatsBuckets(self, course_name):
+    raise self.error
+
+  def getConversationsCreatedAtByCourse(self, course_name):
+    self.full_scans += 1
+    return [{'created_at': value} for value in CREATED_AT], len(CREATED_AT)
+
+
+class PostgrestError(Exception):
+
+  def __init__(self, message, code):
+    super().__init__(message)
+    self.code = code
+
+
+@pytest.fixture
+def fresh_module(monkeypatch):
+  monkeypatch.setattr(conversation_stats, '_rpc_available', True)
+  monkeypatch.setattr(conversation_stats, '_aggregator', None)
+
+
+def test_transient_error_keeps_buckets_enabled(fresh_module):
+  sql_db = FakeSQL(TimeoutError('statement timeout'))
+  assert conversation_stats.get_conversation_stats(sql_db, 'corn')['total_count'] == 4
+  assert conversation_stats._rpc_available
+
+
+def test_missing_rpc_disables_buckets(fresh_module):
+  sql_db = FakeSQL(PostgrestError('Could not find the function public.get_conversation_stats', 'PGRST202'))
+  assert conversation_stats.get_conversation_stats(sql_db, 'corn')['total_count'] == 4
+  assert not conversation_stats._rpc_available
+
+
+class Response:
+
+  def __init__(self, data):
+    self.data = data
+
+
+class BucketSQL:
+  """Stored buckets up to conversation id 2, and conversations 3 and 4 not counted yet."""
+
+  def __init__(self):
+    self.applied = []
+
+  def getConversationStatsBuckets(self, course_name):
+    return Response({'last_id': 2, 'buckets': [{'day': '2026-03-02', 'hour': 9, 'count': 2}]})
+
+  def getConversationsCreatedAtSince(self, course_name, after_id):
+    rows = [{'id': 3, 'created_at': CREATED_AT[2]}, {'id': 4, 'created_at': CREATED_AT[3]}]
+    return Response([row for row in rows if row['id'] > after_id])
+
+  def applyConversationStatsBuckets(self, course_name, from_id, to_id, buckets):
+    self.applied.append((from_id, to_id, buckets))
+    return Response(True)
+
+
+def test_aggregator_applies_new_conversations_once():
+  sql_db = BucketSQL()
+  aggregator = conversation_stats.ConversationStatsAggregator()
+  stats = aggregator.get(sql_db, 'corn')
+  assert stats['total_count'] == 4
+  assert stats['per_day'] == {'2026-03-02': 3, '2026-07-04': 1}
+  assert sql_db.applied == [(2, 4, [{'day': '2026-03-02', 'hour': 21, 'count': 1},
+                                    {'day': '2026-07-04', 'hour': 7, 'count': 1}])]
+
+  # The watermark moved to 4, so a repeat load applies nothing
+  assert aggregator.get(sql_db, 'corn') == stats
+  assert len(sql_db.applied) == 1
@@ -0,0 +1,74 @@
+from ai_ta_backend.utils.doc_group_cache import DocGroupCache, DocGroupFilter
+
+
+def _filter():
+  return DocGroupFilter.from_rows(
+      'corn',
+      disabled_rows=[{'name': 'drafts'}],
+      public_rows=[
+          {'doc_groups': {'course_name': 'extension', 'name': 'pests', 'enabled': True}},
+          {'doc_groups': {'course_name': 'extension', 'name': 'weeds', 'enabled': True}},
+          {'doc_groups': {'course_name': 'soy', 'name': 'old', 'enabled': False}},
+          {'doc_groups': None},
+      ])
+
+
+def test_from_rows():
+  search_filter = _filter()
+  assert search_filter.disabled == frozenset({'drafts'})
+  assert search_filter.disabled_doc_groups == ['drafts']
+  assert len(search_filter.public_doc_groups) == 3
+  assert search_filter.shared_courses == {'extension': ('pests', 'weeds')}
+
+
+def test_selections_all_documents():
+  expected = {'corn': None, 'extension': ('pests', 'weeds')}
+  assert _filter().selections(None) == expected
+  assert _filter().selections([]) == expected
+  assert _filter().selections(['All Documents', 'notes']) == expected
+
+
+def test_selections_restricted_to_doc_groups():
+  assert _filter().selections(['syllabus', 'notes']) == {'corn': ('notes', 'syllabus'), 'extension': ('pests', 'weeds')}
+
+
+def test_public_groups_of_own_course():
+  search_filter = DocGroupFilter('corn', [], [{'course_name': 'corn', 'name': 'shared', 'enabled': True}])
+  assert search_filter.selections(None) == {'corn': None}
+  assert search_filter.selections(['notes']) == {'corn': ('notes', 'shared')}
+
+
+def test_references():
+  search_filter = _filter()
+  assert search_filter.references('corn')
+  assert search_filter.references('extension')
+  assert not search_filter.references('soy')
+
+
+def test_cache_invalidation_follows_references():
+  cache = DocGroupCache()
+  cache.put('corn', _filter())
+  cache.put('wheat', DocGroupFilter('wheat', [], []))
+
+  cache.invalidate('extension')
+  assert cache.get('corn') is None
+  assert cache.get('wheat') is not None
+
+  cache.invalidate()
+  assert cache.get('wheat') is None
+
+
+def test_compiled_is_built_once_per_key():
+  search_filter = _filter()
+  builds = []
+
+  def build():
+    builds.append(1)
+    return object()
+
+  first = search_filter.compiled(('backend', None), build)
+  assert search_filter.compiled(('backend', None), build) is first
+  assert search_filter.compiled(('backend', ('notes',)), build) is not first
+  assert len(builds) == 2
+  assert DocGroupFilter.selection_key(['b', 'a']) == ('a', 'b')
+  assert DocGroupFilter.selection_key(['All Documents', 'a']) is None
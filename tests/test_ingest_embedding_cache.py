@@ -0,0 +1,104 @@
+import hashlib
+
+import pytest
+
+from ai_ta_backend.beam import embedding_cache
+from ai_ta_backend.beam.embedding_cache import (
+    EmbeddingCache,
+    SQLiteEmbeddingCache,
+    decode_vector,
+    encode_vector,
+    text_hash,
+)
+
+
+class MemoryCache(EmbeddingCache):
+
+  def __init__(self):
+    super().__init__()
+    self.stored = {}
+
+  def _get(self, model, hashes):
+    return {h: self.stored[(model, h)] for h in hashes if (model, h) in self.stored}
+
+  def _put(self, model, vectors):
+    self.stored.update({(model, h): embedding for h, embedding in vectors.items()})
+
+
+class BrokenCache(EmbeddingCache):
+
+  def _get(self, model, hashes):
+    raise ConnectionError('down')
+
+  def _put(self, model, vectors):
+    raise ConnectionError('down')
+
+
+def fake_embed(calls):
+
+  def embed(texts):
+    calls.append(list(texts))
+    return {text: [float(len(text)), 0.5] for text in texts}
+
+  return embed
+
+
+def test_missing_override_fails_at_construction():
+
+  class Incomplete(EmbeddingCache):
+
+    def _get(self, model, hashes):
+      return {}
+
+  with pytest.raises(TypeError):
+    Incomplete()
+
+
+def test_vector_encoding_round_trip():
+  assert decode_vector(encode_vector([0.25, -1.5, 3.0])) == [0.25, -1.5, 3.0]
+  assert len(encode_vector([0.0] * 1536)) == 1536 * 4
+  assert text_hash('corn') == hashlib.sha256(b'corn').hexdigest()
+
+
+def test_embed_only_sends_misses():
+  cache = MemoryCache()
+  calls = []
+  first = cache.embed('m', ['a', 'bb', 'a'], fake_embed(calls))
+  second = cache.embed('m', ['bb', 'ccc'], fake_embed(calls))
+
+  assert calls == [['a', 'bb'], ['ccc']]
+  assert first == {'a': [1.0, 0.5], 'bb': [2.0, 0.5]}
+  assert second == {'bb': [2.0, 0.5], 'ccc': [3.0, 0.5]}
+  assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_entries_are_per_model():
+  cache = MemoryCache()
+  calls = []
+  cache.embed('small', ['a'], fake_embed(calls))
+  cache.embed('large', ['a'], fake_embed(calls))
+  assert calls == [['a'], ['a']]
+
+
+def test_cache_errors_are_misses():
+  calls = []
+  assert BrokenCache().embed('m', ['a'], fake_embed(calls)) == {'a': [1.0, 0.5]}
+  assert calls == [['a']]
+
+
+def test_sqlite_backend_persists(tmp_path):
+  path = str(tmp_path / 'embeddings.sqlite')
+  SQLiteEmbeddingCache(path).put_many('m', {'a': [0.5, 0.25]})
+  reopened = SQLiteEmbeddingCache(path)
+  assert reopened.get_many('m', ['a', 'b']) == {'a': [0.5, 0.25]}
+  assert reopened.get_many('other', ['a']) == {}
+
+
+def test_get_embedding_cache_backends(tmp_path, monkeypatch):
+  monkeypatch.setattr(embedding_cache, '_embedding_cache', None)
+  monkeypatch.setenv('EMBEDDING_CACHE_BACKEND', 'none')
+  assert embedding_cache.get_embedding_cache() is None
+
+  monkeypatch.setenv('EMBEDDING_CACHE_BACKEND', 'sqlite')
+  monkeypatch.setenv('EMBEDDING_CACHE_PATH', str(tmp_path / 'embeddings.sqlite'))
+  assert isinstance(embedding_cache.get_embedding_cache(), SQLiteEmbeddingCache)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from ai_ta_backend.database.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def _index(texts):
+  index = LexicalIndex()
+  index.add(texts)
+  return index
+
+
+def _all(index):
+  return np.ones(len(index), dtype=bool)
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+  assert tokenize('What is 2,4-D used for?') == ['2,4-d', '2', '4', 'd', 'used']
+  assert tokenize('Plant NK603 corn') == ['plant', 'nk603', 'corn']
+  assert tokenize('EPA Reg. No. 100-1234') == ['epa', 'reg', 'no', '100-1234', '100', '1234']
+
+
+def test_search_ranks_exact_identifier_first():
+  index = _index(['apply 2,4-D to broadleaf weeds', 'glyphosate resistant corn', 'corn hybrid NK603 yields'])
+  results = index.search('NK603 corn', _all(index), 3)
+  assert [row for row, _ in results] == [2, 1]
+  assert results[0][1] > results[1][1] > 0
+
+
+def test_search_respects_mask_and_top_n():
+  index = _index(['corn', 'corn corn', 'soybean'])
+  mask = np.array([True, False, True])
+  assert [row for row, _ in index.search('corn', mask, 3)] == [0]
+  assert len(index.search('corn', _all(index), 1)) == 1
+  assert index.search('wheat', _all(index), 3) == []
+  assert index.search('the', _all(index), 3) == []
+
+
+def test_rows_added_after_a_search_are_found():
+  index = _index(['corn'])
+  assert index.search('soybean', _all(index), 3) == []
+  index.add(['soybean rust'])
+  assert len(index) == 2
+  assert [row for row, _ in index.search('soybean', _all(index), 3)] == [1]
+
+
+def test_save_load_round_trip(tmp_path):
+  index = _index(['apply 2,4-D to broadleaf weeds', 'corn hybrid NK603', 'soybean rust'])
+  index.save(str(tmp_path))
+  loaded = LexicalIndex.load(str(tmp_path))
+  assert len(loaded) == 3
+  for query in ('2,4-D', 'nk603 hybrid', 'rust'):
+    assert loaded.search(query, _all(loaded), 3) == index.search(query, _all(index), 3)
+  loaded.add(['more soybean'])
+  assert sorted(row for row, _ in loaded.search('soybean', _all(loaded), 3)) == [2, 3]
+
+
+def test_load_missing_index(tmp_path):
+  assert LexicalIndex.load(str(tmp_path)) is None
+
+
+def test_reciprocal_rank_fusion():
+  fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'a']], k=60)
+  assert [key for key, _ in fused] == ['a', 'c', 'b']
+  assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+def test_reciprocal_rank_fusion_weights():
+  fused = reciprocal_rank_fusion([['a'], ['b']], k=1, weights=[1.0, 3.0])
+  assert fused == [('b', 1.5), ('a', 0.5)]
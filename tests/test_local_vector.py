@@ -0,0 +1,216 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from ai_ta_backend.database import local_vector
+from ai_ta_backend.database.local_vector import CourseIndex, LocalVectorIndexStore, document_points
+from ai_ta_backend.utils.retrieval_cache import CourseGenerations
+
+
+def _point(point_id, vector, text='', **payload):
+  return (point_id, vector, {'page_content': text, 'doc_groups': [], **payload})
+
+
+def _index(course='course'):
+  index = CourseIndex(course)
+  index.add([
+      _point('1:0', [1.0, 0.0, 0.0], 'apple orchard', s3_path='a'),
+      _point('1:1', [0.0, 1.0, 0.0], 'banana split', s3_path='a'),
+      _point('2:0', [0.0, 0.0, 1.0], 'cherry pie', s3_path='b'),
+  ])
+  return index
+
+
+def _all(index):
+  return np.ones(len(index.ids), dtype=bool)
+
+
+def _search_ids(index, query, top_n=3):
+  query = np.asarray(query, dtype=np.float32)
+  return [index.ids[row] for row, _ in index.search(query, _all(index), top_n, hnsw_threshold=10**9)]
+
+
+@pytest.fixture
+def generations(monkeypatch):
+  generations = CourseGenerations()
+  monkeypatch.setattr(local_vector, 'get_course_generations', lambda: generations)
+  return generations
+
+
+def _builder(builds):
+
+  def build(course_name, sql_db, source_generation=None):
+    builds.append(source_generation)
+    index = _index(course_name)
+    index.source_generation = source_generation
+    return index
+
+  return build
+
+
+def _wait_for_refresh(index, timeout=5.0):
+  deadline = time.monotonic() + timeout
+  while index.refreshing and time.monotonic() < deadline:
+    time.sleep(0.01)
+  assert not index.refreshing
+
+
+def test_document_points_skip_unembedded_contexts():
+  document = {
+      'id': 7,
+      's3_path': 'courses/c/f.pdf',
+      'doc_groups': [{'name': 'g'}],
+      'contexts': [{'text': 'a', 'embedding': [1.0, 0.0], 'pagenumber': 3}, {'text': 'b'}],
+  }
+  points = document_points('c', document)
+  assert len(points) == 1
+  point_id, embedding, payload = points[0]
+  assert point_id == '7:0'
+  assert payload == {'pagenumber': 3, 's3_path': 'courses/c/f.pdf', 'page_content': 'a', 'course_name': 'c',
+                     'doc_groups': ['g']}
+
+
+def test_search_ranks_by_cosine():
+  index = _index()
+  assert _search_ids(index, [0.1, 0.9, 0.0], top_n=2) == ['1:1', '1:0']
+
+
+def test_add_skips_live_duplicates_and_wrong_dimensions():
+  index = _index()
+  assert index.add([_point('1:0', [1.0, 1.0, 0.0]), _point('3:0', [1.0, 0.0])]) == 0
+  assert len(index) == 3
+
+
+def test_delete_where_then_readd():
+  index = _index()
+  assert index.delete_where('s3_path', 'b') == 1
+  assert '2:0' not in _search_ids(index, [0.0, 0.0, 1.0])
+  assert index.add([_point('2:0', [0.0, 0.0, 1.0], s3_path='b')]) == 1
+  assert _search_ids(index, [0.0, 0.0, 1.0], top_n=1) == ['2:0']
+
+
+def test_delete_compacts_when_mostly_dead():
+  index = _index()
+  assert index.delete_where('s3_path', 'a') == 2
+  assert index.ids == ['2:0']
+  assert index.alive.tolist() == [True]
+  assert index.lexical_search('cherry', _all(index), 3)[0][0] == 0
+  assert index.add([_point('1:0', [1.0, 0.0, 0.0])]) == 1
+
+
+def test_search_falls_back_to_exact_when_hnsw_fails():
+
+  class FailingGraph:
+
+    def set_ef(self, ef):
+      pass
+
+    def knn_query(self, query, k, filter=None):
+      raise RuntimeError('Cannot return the results in a contiguous 2D array')
+
+  index = _index()
+  index._hnsw = FailingGraph()
+  assert _search_ids(index, [0.0, 0.0, 1.0], top_n=1) == ['2:0']
+
+
+def test_save_and_load_round_trip(tmp_path):
+  index = _index()
+  index.source_generation = 4
+  index.delete_where('s3_path', 'b')
+  index.save(str(tmp_path))
+
+  loaded = CourseIndex.load(str(tmp_path))
+  assert loaded.disk_generation == index.disk_generation
+  assert loaded.source_generation == 4
+  assert loaded.ids == index.ids
+  assert len(loaded) == 2
+  assert _search_ids(loaded, [0.0, 1.0, 0.0], top_n=1) == ['1:1']
+  assert loaded.lexical_search('banana', _all(loaded), 3)[0][0] == 1
+
+
+def test_save_replaces_previous_generation(tmp_path):
+  index = _index()
+  index.save(str(tmp_path))
+  first = index.disk_generation
+  time.sleep(0.002)
+  index.save(str(tmp_path))
+  assert index.disk_generation != first
+  assert not os.path.exists(tmp_path / first)
+
+
+def test_replay_ignores_partial_lines(tmp_path):
+  index = _index()
+  journal = tmp_path / 'journal.jsonl'
+  journal.write_bytes(b'{"op": "delete", "key": "s3_path", "value": "b"}\n{"op": "del')
+  assert index.replay(str(journal)) == 1
+  assert len(index) == 2
+  assert index.journal_offset == journal.read_bytes().index(b'\n') + 1
+
+
+def test_mutations_are_journaled_and_replayed_by_other_workers(tmp_path, generations):
+  writer = LocalVectorIndexStore(str(tmp_path))
+  reader = LocalVectorIndexStore(str(tmp_path))
+  with writer._file_lock('course', local_vector.fcntl.LOCK_EX):
+    writer._save(_index())
+  assert len(reader.get('course', build=False)) == 3
+
+  document = {'id': 3, 's3_path': 'c', 'contexts': [{'text': 'date loaf', 'embedding': [1.0, 1.0, 0.0]}]}
+  assert writer.add_document('course', document) == 1
+  assert writer.delete('s3_path', 'b', 'course') == 1
+  journal = tmp_path / os.path.basename(writer._course_dir('course')) / writer._indexes['course'].disk_generation
+  assert len((journal / local_vector.JOURNAL_FILE).read_text().splitlines()) == 2
+
+  index = reader.get('course', build=False)
+  assert sorted(index.ids[row] for row in np.flatnonzero(index.alive)) == ['1:0', '1:1', '3:0']
+  assert index.lexical_search('date', index.alive, 1)[0][0] == index.ids.index('3:0')
+
+
+def test_large_journal_is_folded_into_a_new_generation(tmp_path, generations):
+  store = LocalVectorIndexStore(str(tmp_path), journal_max_bytes=1)
+  with store._file_lock('course', local_vector.fcntl.LOCK_EX):
+    store._save(_index())
+  first = store._indexes['course'].disk_generation
+  time.sleep(0.002)
+  assert store.delete('s3_path', 'b', 'course') == 1
+  index = store._indexes['course']
+  assert index.disk_generation != first and index.journal_offset == 0
+  assert len(LocalVectorIndexStore(str(tmp_path)).get('course', build=False)) == 2
+
+
+def test_missing_course_is_not_created_without_sql_db(tmp_path, generations):
+  store = LocalVectorIndexStore(str(tmp_path))
+  assert store.get('course', build=False) is None
+  assert store.delete('s3_path', 'a', 'course') == 0
+  assert not os.listdir(tmp_path)
+
+
+def test_stale_index_is_rebuilt_in_the_background(tmp_path, generations, monkeypatch):
+  store = LocalVectorIndexStore(str(tmp_path), staleness_check_seconds=0)
+  builds = []
+  monkeypatch.setattr(store, '_build', _builder(builds))
+  sql_db = object()
+  index = store.get('course', sql_db)
+  assert builds == [0]
+  assert store.get('course', sql_db) is index
+
+  generations.bump('course')
+  assert store.get('course', sql_db) is index  # served while rebuilding
+  _wait_for_refresh(index)
+  assert builds == [0, 1]
+  assert store.get('course', sql_db).source_generation == 1
+
+
+def test_own_mutation_does_not_trigger_rebuild(tmp_path, generations, monkeypatch):
+  store = LocalVectorIndexStore(str(tmp_path), staleness_check_seconds=0)
+  builds = []
+  monkeypatch.setattr(store, '_build', _builder(builds))
+  index = store.get('course', object())
+
+  assert store.delete('s3_path', 'b', 'course') == 1
+  generations.bump('course')
+  assert store.get('course', object()) is index
+  assert not index.refreshing
+  assert builds == [0]
+  assert LocalVectorIndexStore(str(tmp_path)).get('course', build=False).source_generation == 1
@@ -0,0 +1,102 @@
+from ai_ta_backend.utils import lru_cache
+from ai_ta_backend.utils.lru_cache import LRUCache
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+def test_evicts_least_recently_used():
+  evicted = []
+  cache = LRUCache(max_items=2, on_evict=lambda key, value: evicted.append(key))
+  cache.set('a', 1)
+  cache.set('b', 2)
+  assert cache.get('a') == 1
+  cache.set('c', 3)
+
+  assert 'b' not in cache
+  assert cache.keys() == ['a', 'c']
+  assert evicted == ['b']
+  assert cache.evictions == 1
+
+
+def test_ttl_expiry(monkeypatch):
+  clock = FakeClock()
+  monkeypatch.setattr(lru_cache.time, 'monotonic', clock)
+  cache = LRUCache(ttl_seconds=10)
+  cache.set('a', 1)
+  clock.now += 5
+  assert cache.touch('a')
+  clock.now += 8
+  assert cache.get('a') == 1
+
+  clock.now += 11
+  assert cache.get('a', 'missing') == 'missing'
+  assert len(cache) == 0
+  assert cache.stats()['hits'] == 1
+  assert cache.stats()['misses'] == 1
+
+
+def test_byte_budget_keeps_newest_entry():
+  cache = LRUCache(max_items=100, max_bytes=10, sizeof=len)
+  cache.set('a', 'xxxx')
+  cache.set('b', 'yyyy')
+  cache.set('c', 'zzzzzzzzzzzz')
+
+  # The newest entry is kept even though it alone exceeds the budget
+  assert cache.keys() == ['c']
+  assert cache.total_bytes == 12
+
+
+def test_resize_reenforces_budget():
+  cache = LRUCache(max_bytes=10, sizeof=len)
+  value = ['x'] * 4
+  cache.set('a', value)
+  cache.set('b', ['y'] * 4)
+  value.extend(['x'] * 4)
+  cache.resize('a')
+
+  assert cache.keys() == ['a']
+  assert cache.total_bytes == 8
+
+
+def test_get_or_create_builds_once():
+  calls = []
+  cache = LRUCache()
+
+  def factory():
+    calls.append(1)
+    return 'value'
+
+  assert cache.get_or_create('k', factory) == 'value'
+  assert cache.get_or_create('k', factory) == 'value'
+  assert len(calls) == 1
+
+
+def test_pop_and_clear_skip_eviction_callback():
+  evicted = []
+  cache = LRUCache(on_evict=lambda key, value: evicted.append(key))
+  cache.set('a', 1)
+  cache.set('b', 2)
+  assert cache.pop('a') == 1
+  cache.clear()
+
+  assert evicted == []
+  assert len(cache) == 0
+  assert cache.total_bytes == 0
+
+
+def test_failing_eviction_callback_is_contained():
+
+  def on_evict(key, value):
+    raise RuntimeError('boom')
+
+  cache = LRUCache(max_items=1, on_evict=on_evict)
+  cache.set('a', 1)
+  cache.set('b', 2)
+  assert cache.keys() == ['b']
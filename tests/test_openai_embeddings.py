@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from ai_ta_backend.beam import OpenaiEmbeddings
+from ai_ta_backend.beam.OpenaiEmbeddings import APIRequest, OpenAIAPIProcessor, StatusTracker
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+  """One token per word, so tests don't need the tiktoken encoding files."""
+
+  def count(request_json, api_endpoint, token_encoding_name):
+    inputs = request_json['input']
+    return sum(len(text.split()) for text in ([inputs] if isinstance(inputs, str) else inputs))
+
+  monkeypatch.setattr(OpenaiEmbeddings, 'num_tokens_consumed_from_request', count)
+
+
+def _processor(prompts, **kwargs):
+  return OpenAIAPIProcessor(input_prompts_list=prompts,
+                            request_url='https://api.openai.com/v1/embeddings',
+                            api_key='test',
+                            max_requests_per_minute=100,
+                            max_tokens_per_minute=1000,
+                            token_encoding_name='cl100k_base',
+                            max_attempts=2,
+                            logging_level=30,
+                            **kwargs)
+
+
+def _prompt(text, model='text-embedding-ada-002', **extra):
+  return {'model': model, 'input': text, **extra}
+
+
+def test_requests_batch_prompts_with_same_parameters():
+  prompts = [_prompt('a b'), _prompt('c'), _prompt('d', model='other'), _prompt(['already', 'a list'])]
+  requests = list(_processor(prompts)._requests('embeddings'))
+
+  # Prompts that already carry a list are sent on their own, without waiting for the open batch
+  assert [(request['input'], tokens) for request, _, tokens in requests] == [
+      (['a b', 'c'], 3),
+      (['already', 'a list'], 3),
+      (['d'], 1),
+  ]
+  assert requests[0][1] == prompts[:2]
+  assert requests[1][1] == []
+  assert requests[2][0]['model'] == 'other'
+
+
+def test_requests_respect_input_and_token_limits():
+  prompts = [_prompt('one two three') for _ in range(5)]
+  by_inputs = list(_processor(prompts, max_inputs_per_request=2)._requests('embeddings'))
+  assert [len(items) for _, items, _ in by_inputs] == [2, 2, 1]
+
+  by_tokens = list(_processor(prompts, max_tokens_per_request=7)._requests('embeddings'))
+  assert [tokens for _, _, tokens in by_tokens] == [6, 6, 3]
+
+
+def test_requests_ignore_metadata_when_batching():
+  prompts = [_prompt('a', metadata={'chunk': 0}), _prompt('b', metadata={'chunk': 1})]
+  [(request, items, _)] = list(_processor(prompts)._requests('embeddings'))
+  assert 'metadata' not in request
+  assert [item['metadata'] for item in items] == [{'chunk': 0}, {'chunk': 1}]
+
+
+def _batch(texts, metadata=None):
+  items = [_prompt(text, **({'metadata': metadata[i]} if metadata else {})) for i, text in enumerate(texts)]
+  return APIRequest(task_id=1,
+                    request_json=OpenaiEmbeddings._batched_request(items),
+                    token_consumption=len(texts),
+                    attempts_left=1,
+                    metadata=None,
+                    items=items)
+
+
+def _response(indices):
+  return {'object': 'list', 'model': 'm', 'data': [{'index': i, 'embedding': [float(i)]} for i in indices]}
+
+
+def test_results_split_batched_response_by_index():
+  request = _batch(['a', 'b', 'c'], metadata=[{'n': 0}, None, {'n': 2}])
+  results = request._results(_response([2, 0, 1]))
+
+  assert [result[0]['input'] for result in results] == ['a', 'b', 'c']
+  assert [result[1]['data'][0]['embedding'] for result in results] == [[0.0], [1.0], [2.0]]
+  assert results[0][2] == {'n': 0}
+  assert len(results[1]) == 2
+  assert results[1][1]['model'] == 'm'
+
+
+def test_results_never_reuse_another_inputs_embedding():
+  results = _batch(['a', 'b'])._results(_response([0]))
+  assert results[0][1]['data'] == [{'index': 0, 'embedding': [0.0]}]
+  assert isinstance(results[1][1], list)
+  assert 'no embedding for input 1' in results[1][1][0]
+
+
+def test_results_of_failed_request():
+  results = _batch(['a', 'b'])._results(['timeout', 'timeout'])
+  assert [result[1] for result in results] == [['timeout', 'timeout'], ['timeout', 'timeout']]
+
+  single = APIRequest(task_id=2, request_json=_prompt('a'), token_consumption=1, attempts_left=1, metadata={'n': 1})
+  assert single._results(_response([0])) == [[_prompt('a'), _response([0]), {'n': 1}]]
+
+
+class FakeResponse:
+
+  def __init__(self, body):
+    self.body = body
+    self.headers = {}
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *args):
+    return False
+
+  async def json(self):
+    return self.body
+
+
+class FakeSession:
+
+  def __init__(self, bodies):
+    self.bodies = list(bodies)
+
+  def post(self, url, headers, json):
+    return FakeResponse(self.bodies.pop(0))
+
+
+def _call(request, bodies):
+  retry_queue = asyncio.Queue()
+  tracker = StatusTracker(num_tasks_in_progress=1)
+  results = asyncio.run(request.call_api(FakeSession(bodies), 'url', {}, retry_queue, tracker))
+  return results, retry_queue, tracker
+
+
+def test_incomplete_batched_response_is_retried():
+  request = _batch(['a', 'b'])
+  request.attempts_left = 1
+  results, retry_queue, tracker = _call(request, [_response([0])])
+  assert results is None
+  assert retry_queue.get_nowait() is request
+  assert tracker.num_api_errors == 1
+
+
+def test_incomplete_batched_response_fails_after_last_attempt():
+  request = _batch(['a', 'b'])
+  request.attempts_left = 0
+  results, _, tracker = _call(request, [_response([1])])
+  assert tracker.num_tasks_failed == 1
+  assert all(isinstance(result[1], list) for result in results)
+
+
+def test_complete_batched_response():
+  results, _, tracker = _call(_batch(['a', 'b']), [_response([1, 0])])
+  assert tracker.num_tasks_succeeded == 1
+  assert [result[1]['data'][0]['embedding'] for result in results] == [[0.0], [1.0]]
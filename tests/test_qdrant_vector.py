@@ -0,0 +1,25 @@
+from ai_ta_backend.database.vector import QdrantVectorDatabase
+from ai_ta_backend.utils.doc_group_cache import DocGroupFilter
+
+
+def _vdb():
+  # Filter building needs no Qdrant connection
+  return QdrantVectorDatabase.__new__(QdrantVectorDatabase)
+
+
+def _filter():
+  return DocGroupFilter('corn', ['drafts'], [{'course_name': 'extension', 'name': 'pests', 'enabled': True}])
+
+
+def test_query_filter_is_compiled_once_per_selection():
+  vdb, search_filter = _vdb(), _filter()
+  qdrant_filter = vdb._query_filter('corn', ['notes'], [], [], search_filter)
+  assert vdb._query_filter('corn', ['notes'], [], [], search_filter) is qdrant_filter
+  assert vdb._query_filter('corn', None, [], [], search_filter) is not qdrant_filter
+  assert qdrant_filter == vdb._create_search_filter('corn', ['notes'], ['drafts'], search_filter.public_doc_groups)
+
+
+def test_query_filter_without_doc_group_filter():
+  qdrant_filter = _vdb()._query_filter('corn', None, ['drafts'], [], None)
+  assert [condition.match.any for condition in qdrant_filter.must_not] == [['drafts']]
+  assert len(qdrant_filter.should) == 1
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from ai_ta_backend.database import quantization
+
+
+def _unit_vectors(count, dim, seed=0):
+  vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+  return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_int8_round_trip_is_close():
+  vectors = _unit_vectors(50, 64)
+  codes, scales = quantization.quantize_int8(vectors)
+  assert codes.dtype == np.int8 and scales.dtype == np.float32
+  assert codes.shape == (50, 64)
+  assert np.abs(codes).max() == 127
+  np.testing.assert_allclose(codes * scales[:, None], vectors, atol=scales.max() / 2 + 1e-6)
+
+
+def test_int8_zero_vector():
+  codes, scales = quantization.quantize_int8(np.zeros((1, 8), dtype=np.float32))
+  assert not codes.any()
+  assert scales[0] == 1.0
+
+
+def test_int8_scores_approximate_inner_products():
+  vectors = _unit_vectors(200, 128)
+  query = _unit_vectors(1, 128, seed=1)[0]
+  codes, scales = quantization.quantize_int8(vectors)
+  exact = vectors @ query
+  approximate = quantization.int8_scores(codes, scales, query)
+  np.testing.assert_allclose(approximate, exact, atol=0.02)
+  assert np.argmax(approximate) == np.argmax(exact)
+
+
+def test_binary_codes_and_hamming_scores():
+  vectors = np.array([[1, -1, 1, -1, 1, -1, 1, -1, 1], [-1] * 9, [1] * 9], dtype=np.float32)
+  bits = quantization.quantize_binary(vectors)
+  assert bits.shape == (3, 2)
+  assert bits.dtype == np.uint8
+
+  scores = quantization.binary_scores(bits, np.ones(9, dtype=np.float32))
+  # Negated Hamming distance to the all-positive query
+  assert scores.tolist() == [-4.0, -9.0, 0.0]
+
+
+def test_binary_scores_without_bitwise_count(monkeypatch):
+  vectors = _unit_vectors(20, 70)
+  query = _unit_vectors(1, 70, seed=2)[0]
+  bits = quantization.quantize_binary(vectors)
+  expected = quantization.binary_scores(bits, query)
+  if hasattr(np, 'bitwise_count'):
+    monkeypatch.delattr(np, 'bitwise_count')
+  np.testing.assert_array_equal(quantization.binary_scores(bits, query), expected)
+
+
+@pytest.mark.parametrize('mode, expected', [('none', 10 * 768 * 4), ('int8', 10 * (768 + 4)), ('binary', 10 * 96)])
+def test_nbytes(mode, expected):
+  assert quantization.nbytes(mode, 10, 768) == expected
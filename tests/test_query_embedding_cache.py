@@ -0,0 +1,45 @@
+from ai_ta_backend.utils import embedding_cache
+from ai_ta_backend.utils.embedding_cache import EmbeddingCache, normalize_query
+
+
+def test_normalize_query_keeps_case():
+  assert normalize_query('  What   is\tthe\nUS  yield? ') == 'What is the US yield?'
+  assert normalize_query('US') != normalize_query('us')
+  # NFKC folds compatibility forms (full-width letters, ligatures)
+  assert normalize_query('ＮＫ６０３ ﬁeld') == 'NK603 field'
+
+
+def test_key_depends_on_model_and_case():
+  assert EmbeddingCache.key('m', 'corn  yield') == EmbeddingCache.key('m', 'corn yield')
+  assert EmbeddingCache.key('m', 'US') != EmbeddingCache.key('m', 'us')
+  assert EmbeddingCache.key('m1', 'corn') != EmbeddingCache.key('m2', 'corn')
+
+
+def test_get_or_compute_counts_hits_and_misses():
+  cache = EmbeddingCache(max_items=10)
+  calls = []
+
+  def compute():
+    calls.append(1)
+    return [0.1, 0.2]
+
+  assert cache.get_or_compute('m', 'corn', compute) == ([0.1, 0.2], False)
+  assert cache.get_or_compute('m', ' corn ', compute) == ([0.1, 0.2], True)
+  assert cache.get('m', 'Corn') is None
+  assert len(calls) == 1
+  assert cache.stats()['hits'] == 1
+  assert cache.stats()['misses'] == 2
+
+
+def test_disk_tier_is_shared_and_expires(tmp_path, monkeypatch):
+  path = str(tmp_path / 'query_embeddings.sqlite')
+  writer = EmbeddingCache(sqlite_path=path, ttl_seconds=60)
+  writer.put('m', 'corn', [0.5, -0.25])
+
+  reader = EmbeddingCache(sqlite_path=path, ttl_seconds=60)
+  assert reader.get('m', 'corn') == [0.5, -0.25]
+  assert reader.stats()['disk_hits'] == 1
+
+  now = embedding_cache.time.time()
+  monkeypatch.setattr(embedding_cache.time, 'time', lambda: now + 120)
+  assert EmbeddingCache(sqlite_path=path, ttl_seconds=60).get('m', 'corn') is None
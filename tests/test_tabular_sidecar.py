@@ -0,0 +1,37 @@
+import pytest
+
+from ai_ta_backend.utils.tabular_sidecar import may_have_sidecar, sidecar_path
+from tests.beam_helpers import load_method
+
+
+class FakeS3:
+
+  def __init__(self):
+    self.deleted = []
+
+  def delete_object(self, Bucket, Key):
+    self.deleted.append((Bucket, Key))
+
+
+def test_sidecar_path():
+  assert sidecar_path('courses/corn/yields.csv') == 'courses/corn/yields.csv.parquet'
+
+
+def test_may_have_sidecar():
+  assert may_have_sidecar('courses/corn/yields.CSV')
+  assert may_have_sidecar('courses/corn/plots.xlsx')
+  assert not may_have_sidecar('courses/corn/guide.pdf')
+  assert not may_have_sidecar('')
+
+
+@pytest.mark.parametrize('module_file', ['ingest.py', 'ingest_aganswers.py'])
+def test_beam_deletes_sidecar_of_tabular_files(module_file):
+  delete_sidecar = load_method(module_file, 'Ingest', '_delete_tabular_sidecar', sentry_sdk=None)
+
+  class Ingest:
+    s3_client = FakeS3()
+
+  ingest = Ingest()
+  delete_sidecar(ingest, 'bucket', 'courses/corn/yields.csv')
+  delete_sidecar(ingest, 'bucket', 'courses/corn/guide.pdf')
+  assert ingest.s3_client.deleted == [('bucket', 'courses/corn/yields.csv.parquet')]